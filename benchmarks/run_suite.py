@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Run every benchmark script in this directory on each backend and record
+  - compile time, split into frontend, pipeline, codegen and gcc
+  - latency of the first call (which includes compiling)
+  - steady state time per call, from repeated timings after some warmup calls
+
+Each benchmark/backend pair runs in its own process, so that every first
+call really compiles from scratch and a crash or timeout only loses that
+one measurement.
+
+Usage:
+  python run_suite.py --output results.json
+  python run_suite.py --baseline baseline.json --threshold 0.1
+  python run_suite.py --only julia kmeans --backends c openmp
+
+With --baseline the results get compared against an earlier run, and the
+exit status is non-zero if any benchmark got slower by more than the
+threshold. Use --update-baseline to overwrite the baseline file with the
+new results.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+if benchmark_dir not in sys.path:
+  sys.path.insert(0, benchmark_dir)
+
+not_benchmarks = set(['__init__.py', 'compare_perf.py', 'timer.py', 'run_suite.py'])
+
+result_marker = "BENCHMARK RESULT: "
+
+def find_benchmark_scripts(only = None):
+  scripts = []
+  for filename in sorted(os.listdir(benchmark_dir)):
+    if not filename.endswith(".py") or filename in not_benchmarks:
+      continue
+    name = filename[:-3]
+    if only and name not in only:
+      continue
+    scripts.append(name)
+  return scripts
+
+def collect_benchmarks(script):
+  """
+  Import a benchmark script with compare_perf just recording what it
+  would have run, returns a list of (function, args) pairs
+  """
+  import imp
+  import compare_perf
+  compare_perf.collected = []
+  try:
+    imp.load_source("benchmark_" + script, os.path.join(benchmark_dir, script + ".py"))
+    return compare_perf.collected
+  finally:
+    compare_perf.collected = None
+
+def summarize(times):
+  n = len(times)
+  ordered = sorted(times)
+  if n % 2 == 1:
+    median = ordered[n / 2]
+  else:
+    median = 0.5 * (ordered[n / 2 - 1] + ordered[n / 2])
+  mean = sum(times) / n
+  stdev = math.sqrt(sum((t - mean) ** 2 for t in times) / n)
+  return {'min' : ordered[0],
+          'max' : ordered[-1],
+          'median' : median,
+          'mean' : mean,
+          'stdev' : stdev,
+          'throughput' : (1.0 / median) if median > 0 else None}
+
+def measure(fn, args, backend, warmup, repeat, min_repeat_time):
+  from parakeet import config, jit, profiling
+  config.collect_compile_times = True
+  profiling.reset_compile_times()
+  parakeet_fn = jit(fn)
+  timer = timeit.default_timer
+
+  start = timer()
+  parakeet_fn(*args, _backend = backend)
+  first_call = timer() - start
+  compile_times = profiling.compile_time_snapshot()
+  config.collect_compile_times = False
+
+  for _ in xrange(warmup):
+    parakeet_fn(*args, _backend = backend)
+
+  # fast functions get called several times per repetition
+  # so that the timer's resolution doesn't matter
+  start = timer()
+  parakeet_fn(*args, _backend = backend)
+  one_call = timer() - start
+  number = 1
+  if one_call < min_repeat_time:
+    number = int(min_repeat_time / max(one_call, 1e-6)) + 1
+
+  times = []
+  for _ in xrange(repeat):
+    start = timer()
+    for _ in xrange(number):
+      parakeet_fn(*args, _backend = backend)
+    times.append((timer() - start) / number)
+
+  compile_times['total'] = sum(compile_times.values())
+  result = {'compile' : compile_times,
+            'first_call' : first_call,
+            'warmup' : warmup,
+            'repeat' : repeat,
+            'number' : number}
+  result.update(summarize(times))
+  return result
+
+def run_child(script, index, backend, warmup, repeat, min_repeat_time):
+  """
+  Runs in the subprocess: measure a single benchmark on one backend and print
+  the results as JSON after the result marker
+  """
+  fn, args = collect_benchmarks(script)[index]
+  try:
+    result = measure(fn, args, backend, warmup, repeat, min_repeat_time)
+  except Exception, e:
+    result = {'error' : "%s: %s" % (e.__class__.__name__, e)}
+  sys.stdout.flush()
+  print result_marker + json.dumps(result)
+
+def run_in_subprocess(script, index, backend, options):
+  cmd = [sys.executable, os.path.abspath(__file__),
+         "--child", script, str(index), backend,
+         "--warmup", str(options.warmup),
+         "--repeat", str(options.repeat),
+         "--min-repeat-time", str(options.min_repeat_time)]
+  # the output goes to a file rather than a pipe, since nothing reads
+  # from a pipe while we wait and it could fill up
+  with tempfile.TemporaryFile() as output_file:
+    proc = subprocess.Popen(cmd, stdout = output_file, stderr = subprocess.STDOUT)
+    # Python 2's subprocess doesn't have a timeout, so poll
+    deadline = time.time() + options.timeout
+    while proc.poll() is None:
+      if time.time() > deadline:
+        proc.kill()
+        proc.wait()
+        return {'error' : 'timed out after %.0fs' % options.timeout}
+      time.sleep(0.05)
+    output_file.seek(0)
+    output = output_file.read()
+  for line in reversed(output.splitlines()):
+    if line.startswith(result_marker):
+      return json.loads(line[len(result_marker):])
+  lines = output.strip().splitlines()
+  return {'error' : "exited with status %d: %s" % \
+                    (proc.returncode, lines[-1] if lines else "no output")}
+
+def run_suite(options):
+  results = {}
+  for script in find_benchmark_scripts(options.only):
+    benchmarks = collect_benchmarks(script)
+    for (index, (fn, _)) in enumerate(benchmarks):
+      for backend in options.backends:
+        key = "%s.%s/%s" % (script, fn.__name__, backend)
+        result = run_in_subprocess(script, index, backend, options)
+        results[key] = result
+        if not options.quiet:
+          print format_result(key, result)
+          sys.stdout.flush()
+  return results
+
+def format_result(key, result):
+  if 'error' in result:
+    return "%-60s FAILED (%s)" % (key, result['error'])
+  compile_times = result['compile']
+  return "%-60s first call %8.4fs (compile %.4fs = frontend %.4f + pipeline %.4f + codegen %.4f + gcc %.4f), " \
+         "steady state %.6fs +/- %.6f" % \
+         (key, result['first_call'], compile_times['total'],
+          compile_times.get('frontend', 0.0), compile_times.get('pipeline', 0.0),
+          compile_times.get('codegen', 0.0), compile_times.get('gcc', 0.0),
+          result['median'], result['stdev'])
+
+def metadata():
+  import numpy
+  from parakeet.c_backend import compile_util
+  from parakeet.version import __version__
+  return {'time' : time.strftime("%Y-%m-%d %H:%M:%S"),
+          'python' : sys.version.split()[0],
+          'numpy' : numpy.__version__,
+          'parakeet' : __version__,
+          'compiler' : compile_util.get_compiler(),
+          'machine' : platform.machine(),
+          'node' : platform.node()}
+
+def find_regressions(results, baseline,
+                     threshold = 0.1,
+                     compile_threshold = 0.25,
+                     metric = 'min',
+                     min_delta = 0.0005):
+  """
+  Compare the results of a run against a baseline run, returning a list of
+  (benchmark, measurement, old value, new value) for every measurement which got
+  slower by more than the given relative threshold. Differences smaller than
+  min_delta seconds are treated as noise.
+  """
+  regressions = []
+  for key, new in sorted(results.iteritems()):
+    old = baseline.get(key)
+    if old is None or 'error' in old:
+      continue
+    if 'error' in new:
+      regressions.append((key, 'error', None, new['error']))
+      continue
+    checks = [(metric, old[metric], new[metric], threshold),
+              ('first_call', old['first_call'], new['first_call'], compile_threshold),
+              ('compile', old['compile']['total'], new['compile']['total'], compile_threshold)]
+    for (name, old_value, new_value, limit) in checks:
+      if new_value - old_value > min_delta and new_value > old_value * (1.0 + limit):
+        regressions.append((key, name, old_value, new_value))
+  return regressions
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(description = "Run Parakeet's benchmarks")
+  parser.add_argument("--backends", nargs = "+", default = ['c', 'openmp', 'interp'])
+  parser.add_argument("--only", nargs = "+", default = None,
+                      help = "names of benchmark scripts to run")
+  parser.add_argument("--warmup", type = int, default = 2)
+  parser.add_argument("--repeat", type = int, default = 5)
+  parser.add_argument("--min-repeat-time", type = float, default = 0.05,
+                      help = "call fast functions repeatedly until each timing takes this long")
+  parser.add_argument("--timeout", type = float, default = 600.0,
+                      help = "seconds to allow for each benchmark on each backend")
+  parser.add_argument("--output", default = None, help = "write results to this JSON file")
+  parser.add_argument("--baseline", default = None, help = "JSON results to compare against")
+  parser.add_argument("--update-baseline", action = "store_true")
+  parser.add_argument("--threshold", type = float, default = 0.1,
+                      help = "allowed relative slowdown of steady state time")
+  parser.add_argument("--compile-threshold", type = float, default = 0.25,
+                      help = "allowed relative slowdown of compile time and first call latency")
+  parser.add_argument("--metric", default = "min", choices = ["min", "median", "mean"],
+                      help = "which steady state statistic to compare")
+  parser.add_argument("--min-delta", type = float, default = 0.0005,
+                      help = "ignore differences smaller than this many seconds")
+  parser.add_argument("--quiet", action = "store_true")
+  parser.add_argument("--child", nargs = 3, default = None, help = argparse.SUPPRESS)
+  return parser.parse_args(argv)
+
+def main(argv = None):
+  options = parse_args(sys.argv[1:] if argv is None else argv)
+  if options.child:
+    script, index, backend = options.child
+    run_child(script, int(index), backend,
+              options.warmup, options.repeat, options.min_repeat_time)
+    return 0
+
+  results = run_suite(options)
+  output = {'metadata' : metadata(), 'results' : results}
+  if options.output:
+    with open(options.output, 'w') as f:
+      json.dump(output, f, indent = 2, sort_keys = True)
+
+  status = 0
+  if options.baseline and os.path.exists(options.baseline) and not options.update_baseline:
+    with open(options.baseline) as f:
+      baseline = json.load(f)['results']
+    regressions = find_regressions(results, baseline,
+                                   threshold = options.threshold,
+                                   compile_threshold = options.compile_threshold,
+                                   metric = options.metric,
+                                   min_delta = options.min_delta)
+    for (key, name, old_value, new_value) in regressions:
+      if name == 'error':
+        print "REGRESSION %s: now fails with %s" % (key, new_value)
+      else:
+        print "REGRESSION %s: %s went from %.6fs to %.6fs (%+.1f%%)" % \
+          (key, name, old_value, new_value, 100.0 * (new_value - old_value) / old_value)
+    if regressions:
+      status = 1
+    else:
+      print "No regressions compared to %s" % options.baseline
+  elif options.baseline:
+    with open(options.baseline, 'w') as f:
+      json.dump(output, f, indent = 2, sort_keys = True)
+    print "Saved baseline to %s" % options.baseline
+  return status
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -14,7 +14,9 @@ from transforms import clone_function, Transform
 from lib import * 
 from prims import *
 
-from frontend import jit, macro, run_python_fn, run_untyped_fn, run_typed_fn
+from frontend import jit, macro, run_python_fn, run_untyped_fn, run_typed_fn, warmup
 from frontend import typed_repr, specialize, find_broken_transform
 
+from profiling import stats_snapshot, reset_stats, region_profile
+
 
@@ -4,7 +4,8 @@ from collect_vars import (collect_binding_names,
                           collect_var_names_from_exprs, 
                           collect_var_names_list)
 from contains import (contains_adverbs, contains_calls, contains_functions, 
-                      contains_loops, contains_slices, contains_structs)
+                      contains_loops, contains_scans, contains_slices, 
+                      contains_structs)
  
 from escape_analysis import may_alias, may_escape, escape_analysis 
 import find_constant_strides
@@ -14,6 +15,8 @@ from index_elim_analysis import IndexElimAnalysis
 from inline_allowed import can_inline
 from mutability_analysis import find_mutable_types, TypeBasedMutabilityAnalysis
 from offset_analysis import OffsetAnalysis 
+from shard_plan import (cached_shard_plan, init_is_idempotent, preallocated_result_shape, 
+                        shard_length, shard_plan, ShardPlan)
 from syntax_visitor import SyntaxVisitor 
 from use_analysis import find_live_vars, use_count
 from usedef import StmtPath, UseDefAnalysis
@@ -1,5 +1,5 @@
 from ..ndtypes import ScalarT, PtrT, NoneT, TupleT, FnT, ClosureT 
-from .. syntax import Adverb, ParFor, Closure, UntypedFn, TypedFn 
+from .. syntax import Adverb, ParFor, Closure, UntypedFn, TypedFn, IndexScan 
 
 from syntax_visitor import SyntaxVisitor
 
@@ -112,6 +112,22 @@ def contains_parfor(fn):
   except Yes:
     return True 
 
+class ContainsScans(SyntaxVisitor):
+  def visit_IndexScan(self, expr):
+    raise Yes()
+  
+  def visit_TypedFn(self, expr):
+    if contains_scans(expr):
+      raise Yes()
+
+@memoize 
+def contains_scans(fn):
+  try:
+    ContainsScans().visit_fn(fn)
+    return False 
+  except Yes:
+    return True 
+
 class ContainsFunctions(SyntaxVisitor):
   def visit_expr(self, expr):
     if isinstance(expr, (UntypedFn, TypedFn, Closure)) or isinstance(expr.type, (FnT, ClosureT)):
@@ -213,6 +213,7 @@ class EscapeAnalysis(SyntaxVisitor):
       combined = []
       for elt in expr.elts:
         combined.extend(self.collect_lhs_names(elt))
+      return combined
     else:
       return []
   
@@ -1,7 +1,8 @@
 
 import numpy as np 
 
-from .. ndtypes import ArrayT, StructT, TupleT, type_conv   
+from .. import config 
+from .. ndtypes import ArrayT, BoolT, IntT, StructT, TupleT, type_conv   
 from .. syntax import TypedFn, Var
 from syntax_visitor import SyntaxVisitor
 
@@ -26,22 +27,28 @@ class Tuple(AbstractValue):
     return "Tuple(%s)" % ", ".join(str(elt) for elt in self.elts)
   
   def __eq__(self, other):
-    return other.__class__ is Tuple and \
-      len(self.elts) == len(other.elts) and \
-      all(e1 == e2 for (e1,e2) in zip(self.elts, other.elts))
+    return other.__class__ is Tuple and self.elts == other.elts 
+  
+  def __hash__(self):
+    return hash(self.elts)
   
 class Array(AbstractValue):
-  # mark known strides with integer constants 
-  # and all others as unknown
-  def __init__(self, strides):
+  # mark known strides and small dimensions with integer 
+  # constants and all others as unknown
+  def __init__(self, strides, shape = unknown):
     self.strides = strides
+    self.shape = shape 
   
   def __str__(self):
-    return "Array(strides = %s)" % self.strides
+    return "Array(strides = %s, shape = %s)" % (self.strides, self.shape)
   
   def __eq__(self, other):
     return other.__class__ is Array and \
-      self.strides == other.strides
+      self.strides == other.strides and \
+      self.shape == other.shape 
+  
+  def __hash__(self):
+    return hash((self.strides, self.shape))
 
 class Struct(AbstractValue):
   def __init__(self, fields):
@@ -76,6 +83,9 @@ class Const(AbstractValue):
   
   def __eq__(self, other):
     return other.__class__ is Const and self.value == other.value
+  
+  def __hash__(self):
+    return hash(self.value)
 
 zero = Const(0)
 one = Const(1)
@@ -90,11 +100,23 @@ def specialization_const(x, specialize_all = False):
   else:
     return unknown
 
+def small_const(x):
+  """
+  Array dimensions and integer arguments only get specialized when they're 
+  small enough that knowing them lets loops over them be unrolled 
+  """
+  if config.small_const_specialization and 0 <= x <= config.max_small_const:
+    return specialization_const(x, specialize_all = True)
+  else:
+    return unknown 
+
 def abstract_tuple(elts):
   return Tuple(tuple(elts))
 
-def abstract_array(strides):
-  return Array(abstract_tuple(strides))
+def abstract_array(strides, shape = None):
+  if shape is None:
+    return Array(abstract_tuple(strides))
+  return Array(abstract_tuple(strides), abstract_tuple(shape))
 
 def from_internal_repr(parakeet_type, v):
   if v is None:
@@ -110,11 +132,14 @@ def from_internal_repr(parakeet_type, v):
     return abstract_tuple(elts)
   elif parakeet_type.__class__ is ArrayT:
     strides_field = getattr(v, 'strides').contents
+    shape_field = getattr(v, 'shape').contents
     strides = []
+    shape = []
     for i in xrange(parakeet_type.rank):
       s = int(getattr(strides_field, 'elt%d'%i))
       strides.append(specialization_const(s))
-    return abstract_array(strides)  
+      shape.append(small_const(int(getattr(shape_field, 'elt%d'%i))))
+    return abstract_array(strides, shape)  
   elif isinstance(parakeet_type, StructT):
     fields = {}
     for (field_name, field_type) in parakeet_type._fields_:
@@ -122,6 +147,8 @@ def from_internal_repr(parakeet_type, v):
       abstract_field = from_internal_repr(field_type, field_value)
       fields[field_name] = abstract_field
     return Struct(fields)        
+  elif isinstance(parakeet_type, IntT) and not isinstance(parakeet_type, BoolT):
+    return small_const(int(getattr(v, 'value', v)))
   return unknown
 
 def from_python(python_value):
@@ -130,9 +157,13 @@ def from_python(python_value):
     strides = []
     for s in python_value.strides:
       strides.append(specialization_const(s/elt_size)) 
-    return abstract_array(strides)
+    shape = [small_const(d) for d in python_value.shape]
+    return abstract_array(strides, shape)
   elif isinstance(python_value, tuple):
     return abstract_tuple(from_python_list(python_value))
+  elif isinstance(python_value, (int, long, np.integer)) and \
+       not isinstance(python_value, (bool, np.bool_)):
+    return small_const(int(python_value))
   else:
     parakeet_type = type_conv.typeof(python_value)
     parakeet_value = type_conv.from_python(python_value)
@@ -178,7 +209,10 @@ class FindConstantStrides(SyntaxVisitor):
     return self.env.get(expr.name, unknown)
   
   def visit_Const(self, expr):
-    if expr.value == 0:
+    # floats like 0.0 or 1.0 would otherwise get folded with integer semantics
+    if not isinstance(expr.type, IntT):
+      return unknown 
+    elif expr.value == 0:
       return zero
     elif expr.value == 1:
       return one 
@@ -195,6 +229,12 @@ class FindConstantStrides(SyntaxVisitor):
       return value.elts[pos]
     elif value.__class__ is Array and expr.name == 'strides':
       return value.strides
+    elif value.__class__ is Array and expr.name == 'shape':
+      return value.shape
+    elif value.__class__ is Array and expr.name == 'size' and \
+         value.shape.__class__ is Tuple and \
+         all(d.__class__ is Const for d in value.shape.elts):
+      return Const(int(np.prod([d.value for d in value.shape.elts])))
     elif value.__class__ is Struct and expr.name in value.fields:
       return value.fields[expr.name]
     else:
@@ -209,7 +249,8 @@ class FindConstantStrides(SyntaxVisitor):
     
   def visit_PrimCall(self, expr):
     abstract_values = self.visit_expr_list(expr.args)
-    if all(v.__class__ is Const for v in abstract_values):
+    if isinstance(expr.type, IntT) and \
+       all(v.__class__ is Const for v in abstract_values):
       ints = [v.value for v in abstract_values]
       return Const(expr.prim.fn(*ints))
     else:
@@ -222,7 +263,9 @@ class FindConstantStrides(SyntaxVisitor):
       stride_pos = expr.type.field_pos("strides")
       stride_arg = expr.args[stride_pos]
       stride_val = self.visit_expr(stride_arg)
-      return Array(stride_val)
+      shape_pos = expr.type.field_pos("shape")
+      shape_val = self.visit_expr(expr.args[shape_pos])
+      return Array(stride_val, shape_val)
     else:
       return unknown   
     
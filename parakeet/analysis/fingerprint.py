@@ -0,0 +1,103 @@
+"""
+Cheap structural digest of a typed function, used by the pass manager to
+tell whether a transform actually changed anything (most of them don't) so
+that cleanups, verification and cached analyses only get rerun for
+functions which have been modified.
+
+Two functions with the same fingerprint have the same statements,
+expressions and types. Other functions which get referenced (i.e. callees)
+only contribute their names, since changing a callee doesn't require
+cleaning up its caller. The type environment is left out, since entries
+only get added or dropped (i.e. by DCE) along with changes to the body.
+"""
+
+import weakref
+
+from .. syntax import Expr, Stmt, TypedFn, UntypedFn, Var, Const
+
+_LEAF, _SEQ, _DICT, _FN = range(4)
+
+# for each class either one of the tags above or the tuple of fields 
+# which make up that kind of node (leaving out source_info)
+_class_kinds = {Var : _LEAF, Const : _LEAF}
+def _kind(c):
+  if c in _class_kinds:
+    return _class_kinds[c]
+  if c is list or c is tuple:
+    kind = _SEQ
+  elif c is dict:
+    kind = _DICT
+  elif c is TypedFn or c is UntypedFn:
+    kind = _FN
+  elif issubclass(c, Expr):
+    kind = tuple(f for f in c.fields() if f != 'source_info')
+  elif issubclass(c, Stmt):
+    kind = tuple(f for f in c._fields if f != 'source_info')
+  else:
+    kind = _LEAF
+  _class_kinds[c] = kind
+  return kind
+
+def _digest(v):
+  c = v.__class__
+  if c is Var:
+    return (c, v.name, v.type)
+  elif c is Const:
+    return (c, v.value, v.type)
+  kind = _class_kinds.get(c)
+  if kind is None:
+    kind = _kind(c)
+  if kind is _LEAF:
+    return v
+  elif kind is _SEQ:
+    return tuple([_digest(elt) for elt in v])
+  elif kind is _DICT:
+    return tuple([(k, _digest(elt)) for (k, elt) in v.iteritems()])
+  elif kind is _FN:
+    return (c, v.name)
+  parts = [c]
+  for field in kind:
+    parts.append(_digest(getattr(v, field, None)))
+  return tuple(parts)
+
+def fingerprint(fn):
+  """
+  Nested tuple which only compares equal to the fingerprint of a function 
+  with the same structure. The types and values inside are the function's
+  own objects, so comparing two fingerprints of an unchanged function 
+  only has to check object identities. 
+  """
+  return (tuple(fn.arg_names),
+          fn.input_types,
+          fn.return_type,
+          _digest(fn.body))
+
+class AnalysisCache(object):
+  """
+  Remember the results of analyses, along with the fingerprint of the
+  function they were computed on, and discard them once the function
+  has changed
+  """
+  def __init__(self):
+    self.results = {}
+
+  def lookup(self, fn, analysis_name, fn_fingerprint):
+    entry = self.results.get((id(fn), analysis_name))
+    if entry is None:
+      return None
+    (fn_ref, saved_fingerprint, value) = entry
+    if fn_ref() is not fn or saved_fingerprint != fn_fingerprint:
+      return None
+    return value
+
+  def store(self, fn, analysis_name, fn_fingerprint, value):
+    key = (id(fn), analysis_name)
+    def discard(_, results = self.results, key = key):
+      results.pop(key, None)
+    self.results[key] = (weakref.ref(fn, discard), fn_fingerprint, value)
+
+  def clear(self):
+    self.results.clear()
+
+# fingerprints of functions at the point where they were last verified
+verified = AnalysisCache()
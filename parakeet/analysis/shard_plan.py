@@ -0,0 +1,155 @@
+import collections
+
+from ..ndtypes import ArrayT, ScalarT
+from ..syntax import Assign, Const, Map, Reduce, Return, TypedFn, Var
+from ..syntax.helpers import return_type, unwrap_constant
+from use_analysis import use_count
+
+ShardPlan = collections.namedtuple("ShardPlan",
+                                   ("kind",            # 'map' or 'reduce'
+                                    "sliced",          # positions of the inputs split along axis 0
+                                    "axis",
+                                    "elementwise_result", # does each element of a map produce a scalar?
+                                    "combine",         # TypedFn merging partial reductions
+                                    "init"))           # Python value of the reduction's init or None
+
+def returned_adverb(fn):
+  """
+  The Map or Reduce whose result the function returns, either directly
+  or through a variable which it's assigned to at the top level
+  """
+  if len(fn.body) == 0 or not isinstance(fn.body[-1], Return):
+    return None
+  value = fn.body[-1].value
+  if isinstance(value, Var):
+    assignments = [stmt for stmt in fn.body
+                   if isinstance(stmt, Assign) and
+                      isinstance(stmt.lhs, Var) and
+                      stmt.lhs.name == value.name]
+    if len(assignments) != 1:
+      return None
+    value = assignments[0].rhs
+  if isinstance(value, (Map, Reduce)):
+    return value
+  return None
+
+def shard_plan(fn):
+  """
+  Can the given (high level) function be computed by splitting its inputs
+  along their outermost axis, running it on each piece and then either
+  concatenating the pieces of its result (for maps) or merging them with
+  the reduction's combine function? Returns a ShardPlan or None.
+  """
+  adverb = returned_adverb(fn)
+  if adverb is None:
+    return None
+  axis = unwrap_constant(adverb.axis)
+  if axis not in (None, 0):
+    return None
+
+  uses = use_count(fn)
+  positions = dict((name, i) for (i, name) in enumerate(fn.arg_names))
+  occurrences = {}
+  for arg in adverb.args:
+    if isinstance(arg.type, ScalarT):
+      continue
+    if not isinstance(arg, Var) or arg.name not in positions or \
+       not isinstance(arg.type, ArrayT):
+      return None
+    occurrences[arg.name] = occurrences.get(arg.name, 0) + 1
+  if len(occurrences) == 0:
+    return None
+  for (name, count) in occurrences.iteritems():
+    # a split input can't be used anywhere else, since other uses would
+    # only see a piece of it (the name itself counts as one use)
+    if uses.get(name, 0) != count + 1:
+      return None
+  sliced = sorted(positions[name] for name in occurrences)
+  if axis is None and len(set(fn.input_types[i].rank for i in sliced)) != 1:
+    # elementwise maps over arrays of different ranks broadcast them
+    return None
+
+  if isinstance(adverb, Map):
+    elementwise = isinstance(return_type(adverb.fn), ScalarT)
+    return ShardPlan(kind = 'map', sliced = sliced, axis = axis,
+                     elementwise_result = elementwise,
+                     combine = None, init = None)
+
+  combine = adverb.combine
+  result_t = fn.return_type
+  if not isinstance(combine, TypedFn) or \
+     tuple(combine.input_types) != (result_t, result_t) or \
+     combine.return_type != result_t:
+    return None
+  if adverb.init is None:
+    init = None
+  elif isinstance(adverb.init, Const):
+    init = adverb.init.value
+  else:
+    return None
+  return ShardPlan(kind = 'reduce', sliced = sliced, axis = axis,
+                   elementwise_result = False,
+                   combine = combine, init = init)
+
+def shard_length(plan, args):
+  """
+  Length of the dimension which gets split, or None if the inputs
+  to split don't line up (args have to be arrays at the sliced positions)
+  """
+  shapes = [args[i].shape for i in plan.sliced]
+  if plan.axis is None:
+    # elementwise maps only line up shard by shard if nothing gets broadcast
+    if any(shape != shapes[0] for shape in shapes):
+      return None
+  elif any(shape[0] != shapes[0][0] for shape in shapes):
+    return None
+  return shapes[0][0]
+
+def preallocated_result_shape(plan, fn, args):
+  """
+  Shape of a map's result if each shard's piece of it can be written
+  straight into a result allocated up front, otherwise None
+  """
+  result_t = fn.return_type
+  if plan.kind != 'map' or not plan.elementwise_result or \
+     not isinstance(result_t, ArrayT):
+    return None
+  if plan.axis is None:
+    shape = args[plan.sliced[0]].shape
+  else:
+    shape = (args[plan.sliced[0]].shape[0],)
+  if result_t.rank != len(shape):
+    return None
+  return shape
+
+# typed function's cache key -> ShardPlan or None
+_plans = {}
+
+def cached_shard_plan(fn):
+  """
+  Shard plan of a typed function once the high level optimizations have
+  turned its array expressions into adverbs
+  """
+  from ..compile_lock import compile_lock
+  from ..transforms.pipeline import high_level_optimizations
+  with compile_lock:
+    key = fn.cache_key
+    if key not in _plans:
+      _plans[key] = shard_plan(high_level_optimizations(fn))
+    return _plans[key]
+
+# (combine's cache key, init) -> can init get folded into every shard?
+_idempotent_inits = {}
+
+def init_is_idempotent(plan, run):
+  """
+  Every shard of a reduction starts from its init value, so splitting only
+  gives the same answer if combining init with itself doesn't change it
+  (like 0 for addition). Uses the given run function to call the combine.
+  """
+  if plan.init is None:
+    return True
+  key = (plan.combine.cache_key, plan.init)
+  if key not in _idempotent_inits:
+    _idempotent_inits[key] = bool(run(plan.combine, [plan.init, plan.init]) == plan.init)
+  return _idempotent_inits[key]
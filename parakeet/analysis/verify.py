@@ -1,9 +1,11 @@
+from .. import config 
 from .. ndtypes import ArrayT, NoneT, NoneType, ScalarT, ClosureT, TupleT, FnT, Type, SliceT, PtrT
 from .. ndtypes import lower_rank 
 
 from .. syntax import Expr, Tuple, Var, Index, Closure, TypedFn 
 from .. syntax.helpers import get_types, get_elt_types 
 from collect_vars import collect_binding_names
+from fingerprint import fingerprint, verified
 from syntax_visitor import SyntaxVisitor
 
 class Verify(SyntaxVisitor):
@@ -276,7 +278,15 @@ class Verify(SyntaxVisitor):
   def visit_TypedFn(self, fn):
     return verify(fn)
 
-def verify(fn):
+def verify(fn, fn_fingerprint = None):
+  if config.opt_track_changes:
+    # skip functions which haven't changed since they were last verified
+    if fn_fingerprint is None:
+      fn_fingerprint = fingerprint(fn)
+    key = (fn_fingerprint, len(fn.type_env))
+    if verified.lookup(fn, 'verify', key):
+      return 
+    
   n_input_types = len(fn.input_types)
   n_arg_names = len(fn.arg_names)
   assert n_input_types == n_arg_names, \
@@ -302,4 +312,6 @@ def verify(fn):
       print "...called from:"
     print fn
     print 
-    raise 
+    raise
+  if config.opt_track_changes:
+    verified.store(fn, 'verify', key, True)
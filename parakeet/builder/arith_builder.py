@@ -179,7 +179,7 @@ class ArithBuilder(CoreBuilder):
     cond = self.gte(x, y)
     expr = Select(cond, x, y, type = x.type)
     if name is None: return expr 
-    else: self.assign_name(expr, name)
+    else: return self.assign_name(expr, name)
     
   def or_(self, x, y, name = None):
     if x.__class__ is Const and x.value:
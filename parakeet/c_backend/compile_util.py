@@ -1,15 +1,16 @@
 import collections 
-import distutils 
+import hashlib
 import imp 
-import numpy.distutils as npdist 
-import numpy.distutils.system_info as np_sysinfo 
+import json 
 import os
 import platform
 import subprocess  
+import sys 
 import time 
 
 from tempfile import NamedTemporaryFile
 from .. import config as root_config 
+from ..profiling import compile_timer
 import config 
 
 CompiledPyFn = collections.namedtuple("CompiledPyFn",
@@ -30,7 +31,7 @@ CompiledObject = collections.namedtuple("CompiledObject",
                                          "fn_signature"))
 
   
-c_headers = ["stdint.h",  "math.h",  "signal.h"]
+c_headers = ["stdint.h",  "math.h",  "signal.h", "time.h"]
 core_python_headers = ["Python.h"]
 numpy_headers = ['numpy/arrayobject.h', 'numpy/arrayscalars.h']
 
@@ -38,8 +39,90 @@ python_headers = core_python_headers + numpy_headers
 
 cpp_defs = [] #"#define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION"]
 
-config_vars = distutils.sysconfig.get_config_vars()
-
+compiler_names = ['gcc', 'g++', 'icc', 'clang']
+
+def probe_toolchain():
+  """
+  Ask distutils and numpy.distutils where the Python and NumPy headers live, 
+  what shared libraries are called and which compilers are on the path. 
+  """
+  import distutils.spawn
+  import distutils.sysconfig 
+  import numpy.distutils.misc_util 
+  import numpy.distutils.system_info
+  compilers = {}
+  for name in compiler_names:
+    compilers[name] = distutils.spawn.find_executable(name)
+  return {
+    'python_include_dirs' : [distutils.sysconfig.get_python_inc()],  
+    'numpy_include_dirs' : numpy.distutils.misc_util.get_numpy_include_dirs(),
+    'shared_extension' : numpy.distutils.system_info.get_shared_lib_extension(True),
+    'python_lib_dir' : distutils.sysconfig.get_python_lib() + "/../../", 
+    'python_version' : distutils.sysconfig.get_python_version(), 
+    'compilers' : compilers, 
+  }
+
+def toolchain_cache_key():
+  import numpy 
+  h = hashlib.md5()
+  for part in (sys.executable, sys.version, numpy.__version__, numpy.__file__, 
+               os.environ.get('PATH', '')):
+    h.update(part)
+    h.update(";")
+  return h.hexdigest()
+
+def toolchain_cache_filename():
+  if config.toolchain_cache_file:
+    return config.toolchain_cache_file
+  return os.path.join(os.path.expanduser("~"), ".parakeet", "toolchain.json")
+  
+def _valid_toolchain(info):
+  if not isinstance(info, dict):
+    return False 
+  for path in info.get('python_include_dirs', []) + info.get('numpy_include_dirs', []):
+    if not os.path.exists(path):
+      return False 
+  for path in info.get('compilers', {}).values():
+    if path and not os.path.exists(path):
+      return False 
+  return 'shared_extension' in info 
+
+def load_toolchain():
+  key = toolchain_cache_key()
+  filename = toolchain_cache_filename()
+  try:
+    with open(filename) as f:
+      cached = json.load(f)
+    if cached.get('key') == key and _valid_toolchain(cached.get('toolchain')):
+      return cached['toolchain']
+  except (IOError, ValueError, AttributeError):
+    pass 
+  info = probe_toolchain()
+  try:
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+      os.makedirs(dirname)
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp_filename, 'w') as f:
+      json.dump({'key' : key, 'toolchain' : info}, f)
+    os.rename(tmp_filename, filename)
+  except (IOError, OSError):
+    # not being able to save the probe results just makes the next run slower
+    pass 
+  return info 
+
+def toolchain(_cache = []):
+  """
+  Probing the toolchain means importing numpy.distutils, which is slow, 
+  so it's only done the first time something actually gets compiled and 
+  the results are kept on disk for later processes (see config.cache_toolchain) 
+  """
+  if not _cache:
+    if config.cache_toolchain:
+      _cache.append(load_toolchain())
+    else:
+      _cache.append(probe_toolchain())
+  return _cache[0]
 
 def get_compiler(_cache = {}):
   if config.compiler_path:
@@ -49,7 +132,7 @@ def get_compiler(_cache = {}):
   for compiler in [('gcc' if config.pure_c else 'g++'), 
                    'icc', 
                    'clang']:
-    path = distutils.spawn.find_executable(compiler)
+    path = toolchain()['compilers'].get(compiler)
     if path:
       _cache[config.pure_c] = path
       return path 
@@ -60,27 +143,30 @@ def get_source_extension():
   return ".c" if config.pure_c else ".cpp"
 
 object_extension = ".o"
-shared_extension = np_sysinfo.get_shared_lib_extension(True)
 
+def get_shared_extension():
+  return toolchain()['shared_extension']
 
 mac_os = platform.system() == 'Darwin'
 windows = platform.system() == 'Windows'
 
-python_include_dirs = [distutils.sysconfig.get_python_inc()]
+def get_include_dirs():
+  info = toolchain()
+  return info['python_include_dirs'] + info['numpy_include_dirs']
 
-numpy_include_dirs = npdist.misc_util.get_numpy_include_dirs()
-include_dirs = python_include_dirs + numpy_include_dirs 
-
-def get_opt_flags():
-  opt_flags = [config.opt_level] 
+def get_opt_flags(opt_level = None):
+  if opt_level is None:
+    opt_level = config.opt_level 
+  opt_flags = [opt_level] 
   if config.sse2:
     opt_flags.append('-msse2')
   if config.fast_math:
     opt_flags.append('-ffast-math')
   return opt_flags 
 
-def get_compiler_flags(compiler, extra_flags = [], compiler_flag_prefix = None):
-  compiler_flags = ['-I%s' % path for path in include_dirs]
+def get_compiler_flags(compiler, extra_flags = [], compiler_flag_prefix = None, 
+                         opt_flags = None):
+  compiler_flags = ['-I%s' % path for path in get_include_dirs()]
   
   def add_flag(flag):
     if compiler_flag_prefix is not None:
@@ -93,7 +179,9 @@ def get_compiler_flags(compiler, extra_flags = [], compiler_flag_prefix = None):
     # nvcc understands debug mode flags
     compiler_flags.extend(['-g', '-O0'])
   else:
-    for flag in get_opt_flags():
+    if opt_flags is None:
+      opt_flags = get_opt_flags()
+    for flag in opt_flags:
       add_flag(flag)
 
   if not config.pure_c: 
@@ -104,9 +192,6 @@ def get_compiler_flags(compiler, extra_flags = [], compiler_flag_prefix = None):
     
   return compiler_flags   
 
-python_lib_dir = distutils.sysconfig.get_python_lib() + "/../../"
-python_version = distutils.sysconfig.get_python_version()
-
 def get_linker_flags(compiler, extra_flags = [], linker_flag_prefix = None):
   # for whatever reason nvcc is OK with the -shared linker flag
   # but not with the -fPIC compiler flag 
@@ -122,6 +207,7 @@ def get_linker_flags(compiler, extra_flags = [], linker_flag_prefix = None):
     # crazy stupid hack for exposing Python symbols
     # even though we're compiling a shared library, why does Windows care?
     # why does windows even exist? 
+    import distutils.sysconfig 
     inc_dir = distutils.sysconfig.get_python_inc()
     base = os.path.split(inc_dir)[0]
     lib_dir = base + "\libs"
@@ -203,6 +289,7 @@ def create_source_file(src,
   
   return src_file 
 
+@compile_timer('gcc')
 def run_cmd(cmd, env = None, label = ""):
   if config.print_commands: 
     print " ".join(cmd)
@@ -239,7 +326,8 @@ def compile_object(src,
                    print_source = None, 
                    print_commands = None, 
                    compiler = None, 
-                   compiler_flag_prefix  = None):
+                   compiler_flag_prefix  = None, 
+                   opt_flags = None):
   
   if print_source is None: 
     print_source = root_config.print_generated_code
@@ -260,7 +348,8 @@ def compile_object(src,
                                 src_extension = src_extension)
   src_filename = src_file.name
   object_name = src_filename.replace(src_extension, object_extension)
-  compiler_flags = get_compiler_flags(compiler, extra_compile_flags, compiler_flag_prefix)
+  compiler_flags = get_compiler_flags(compiler, extra_compile_flags, compiler_flag_prefix, 
+                                      opt_flags = opt_flags)
   if isinstance(compiler, (list,tuple)):
     compiler_cmd = list(compiler)
   else:
@@ -277,6 +366,7 @@ def compile_object(src,
                         fn_signature = fn_signature)
   
   
+@compile_timer('gcc')
 def compile_module(src, 
                      fn_name,
                      fn_signature = None,  
@@ -292,17 +382,29 @@ def compile_module(src,
                      print_commands = None, 
                      compiler = None, 
                      compiler_flag_prefix = None, 
-                     linker_flag_prefix = None):
+                     linker_flag_prefix = None, 
+                     opt_flags = None, 
+                     extra_methods = [], 
+                     keep_shared_file = False):
+  """
+  Compile a Python extension module whose function 'fn_name' (along with 
+  any functions named in extra_methods) can be called with a tuple of args.
+  If keep_shared_file is set then the shared object stays on disk even when
+  the other temporary files get deleted, so other processes can load it too. 
+  """
   
   if print_source is None:
     print_source = root_config.print_generated_code 
   if print_commands is None:
     print_commands = config.print_commands
 
+  extra_method_entries = "".join('\n      {"%s", %s, METH_VARARGS, "%s"},' % (m, m, m)
+                                 for m in extra_methods)
   src += """
     static PyMethodDef %(fn_name)sMethods[] = {
       {"%(fn_name)s",  %(fn_name)s, METH_VARARGS,
        "%(fn_name)s"},
+      %(extra_method_entries)s
 
       {NULL, NULL, 0, NULL}        /* Sentinel */
     };
@@ -331,11 +433,12 @@ def compile_module(src,
                                    print_source = print_source, 
                                    print_commands = print_commands, 
                                    compiler = compiler, 
-                                   compiler_flag_prefix = compiler_flag_prefix)
+                                   compiler_flag_prefix = compiler_flag_prefix, 
+                                   opt_flags = opt_flags)
   
   src_filename = compiled_object.src_filename
   object_name = compiled_object.object_filename
-  shared_name = src_filename.replace(src_extension, shared_extension)
+  shared_name = src_filename.replace(src_extension, get_shared_extension())
   linker_flags = get_linker_flags(compiler, extra_link_flags, linker_flag_prefix) 
   
   if isinstance(compiler, (list,tuple)):
@@ -348,7 +451,7 @@ def compile_module(src,
   linker_cmd += ['-o', shared_name]
 
   env = os.environ.copy()
-  env["LD_LIBRARY_PATH"] = python_lib_dir
+  env["LD_LIBRARY_PATH"] = toolchain()['python_lib_dir']
   run_cmd(linker_cmd, env = env, label = "Linking")
   
 
@@ -368,7 +471,7 @@ def compile_module(src,
     os.remove(object_name)
     # window's can't just untether inodes like a UNIX
     # ...have to eventually think of a plan to clean these things up
-    if not windows: os.remove(shared_name)
+    if not windows and not keep_shared_file: os.remove(shared_name)
     
   compiled_fn = CompiledPyFn(c_fn = c_fn, 
                              module = module, 
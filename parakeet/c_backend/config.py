@@ -7,6 +7,55 @@ opt_level = '-O2'
 # overload the default compiler path  
 compiler_path = None
 
+# remember where the Python & NumPy headers and the compilers are between 
+# runs, since finding them means importing numpy.distutils 
+cache_toolchain = True 
+
+# defaults to ~/.parakeet/toolchain.json 
+toolchain_cache_file = None
+
+# nogil mode: release the GIL for the whole body of each compiled function, 
+# from after its arguments are unboxed until its result gets boxed, so that 
+# several Python threads can run compiled code at once (otherwise only the 
+# outermost parallel loops of the OpenMP backend run without the GIL) 
+nogil = True 
+
+# before a loop nest which only touches arrays through element indexing, 
+# check once whether the arrays it writes overlap any others, whether every 
+# array is contiguous along its last dimension and whether the loop bounds 
+# keep all the indices within the arrays' shapes; if so, run a copy of the 
+# nest which uses restrict pointers and unit strides 
+loop_versioning = True 
+
+##########################
+#  Tiered Compilation    #
+##########################
+
+# compile each specialization quickly first (with quick_opt_level and without 
+# the final loop optimizations) and only rebuild it with loop unrolling 
+# and hot_opt_level once it's been called hot_call_count times or has spent 
+# hot_total_time seconds running (scalar replacement still follows 
+# ..config.opt_scalar_replacement) 
+tiered_compilation = False
+quick_opt_level = '-O1'
+hot_opt_level = '-O3'
+hot_extra_flags = ['-march=native']
+hot_call_count = 100
+hot_total_time = 0.25 
+
+# run the compiler for the hot version on a separate thread and keep 
+# calling the quick version until it's ready 
+background_recompile = True 
+
+##########################
+#  Profiling             #
+##########################
+
+# wrap every ParFor, ForLoop, IndexReduce and array allocation in timers 
+# and trip counters, which get added up per source line by 
+# parakeet.region_profile()
+instrument_regions = False
+
 ##########################
 # Insert Debugging Code  #
 ##########################
@@ -7,8 +7,11 @@ from ..ndtypes import (IntT, FloatT, TupleT, FnT, Type, BoolT, NoneT, Float32, F
 from ..syntax import (Const, Var,  PrimCall, Attribute, TupleProj, Tuple, ArrayView,
                       Expr, Closure, TypedFn)
 # from ..syntax.helpers import get_types   
+import config 
+import instrumentation 
 import type_mappings
 from base_compiler import BaseCompiler
+from loop_versioning import versioning_plan
 
 
 CompiledFlatFn = namedtuple("CompiledFlatFn", 
@@ -16,7 +19,8 @@ CompiledFlatFn = namedtuple("CompiledFlatFn",
                              "extra_objects",
                              "extra_functions",
                              "extra_function_signatures", 
-                             "declarations"))
+                             "declarations", 
+                             "region_ids"))
 
 
 # mapping from (field_types, struct_name, field_names) to type names 
@@ -44,16 +48,64 @@ class FnCompiler(BaseCompiler):
     self.extra_functions = {}
     self.extra_function_signatures = []
     
+    # instrumented regions in this function and the ones it calls 
+    self.region_ids = []
+    
+    # source location of the statement being compiled 
+    self.source_info = None 
+    
       
     # are we actually compiling the entry-point into a Python module?
     # if so, expect some of the methods like visit_Return to be overloaded 
     # to return PyObjects
     self.module_entry = module_entry
+    
+    # arrays which the fast copy of a versioned loop nest accesses through 
+    # restrict pointers, mapped to those pointers and the arrays' outer strides
+    self.fast_arrays = {}
+    
+    # don't version the loops inside of a nest which already got versioned 
+    self.in_versioned_nest = False 
      
   def add_decl(self, decl):
     if decl not in self.declarations:
       self.declarations.append(decl)
   
+  def add_extra_function(self, sig, src):
+    if sig not in self.extra_function_signatures:
+      self.extra_function_signatures.append(sig)
+      self.extra_functions[sig] = src 
+  
+  def enter_region(self, kind, source_info = None):
+    """
+    Declare the counters of a new instrumented region and start its timer, 
+    returns the region's variable and start time to pass to exit_region 
+    """
+    if source_info is None:
+      source_info = self.source_info
+    for decl in instrumentation.declarations:
+      self.add_decl(decl)
+    for sig in instrumentation.helper_signatures:
+      self.add_extra_function(sig, instrumentation.helper_sources[sig])
+    region_id = instrumentation.new_region(kind, source_info)
+    self.add_decl(instrumentation.region_decl(region_id))
+    self.region_ids.append(region_id)
+    start = self.fresh_var("int64_t", "region_start", "parakeet_now_ns()")
+    return instrumentation.region_var(region_id), start 
+  
+  def exit_region(self, region, trips = "1"):
+    region_var, start = region 
+    return "parakeet_region_exit(&%s, %s, (int64_t) (%s));" % (region_var, start, trips)
+  
+  def visit_stmt(self, stmt):
+    old_source_info = self.source_info
+    if stmt.source_info is not None:
+      self.source_info = stmt.source_info
+    try:
+      return BaseCompiler.visit_stmt(self, stmt)
+    finally:
+      self.source_info = old_source_info 
+  
   def ptr_struct_type(self, elt_t):
     # need both an actual data pointer 
     # and an optional PyObject base
@@ -159,9 +211,14 @@ class FnCompiler(BaseCompiler):
     nelts = self.fresh_var("npy_intp", "nelts", self.visit_expr(expr.count))
     bytes_per_elt = elt_t.nbytes
     nbytes = self.mul(nelts, bytes_per_elt)#"%s * %d" % (nelts, bytes_per_elt)
+    if config.instrument_regions:
+      region = self.enter_region("Alloc", expr.source_info)
     raw_ptr = "(%s) malloc(%s)" % (type_mappings.to_ctype(expr.type), nbytes)
     struct_type = self.to_ctype(expr.type)
-    return self.fresh_var(struct_type, "new_ptr", "{%s, NULL}" % raw_ptr)
+    result = self.fresh_var(struct_type, "new_ptr", "{%s, NULL}" % raw_ptr)
+    if config.instrument_regions:
+      self.append(self.exit_region(region, nbytes))
+    return result 
     
   def visit_Const(self, expr):
     t = expr.type 
@@ -322,7 +379,12 @@ class FnCompiler(BaseCompiler):
     assert all(isinstance(idx_expr.type, ScalarT) for idx_expr in index_exprs), \
       "Expected all indices to be scalars but got %s" % (index_exprs,)
     indices = [self.visit_expr(idx_expr) for idx_expr in index_exprs]
-    if isinstance(expr.value.type, PtrT):
+    if expr.value.__class__ is Var and expr.value.name in self.fast_arrays:
+      # the innermost stride is known to be 1 
+      raw_ptr, strides = self.fast_arrays[expr.value.name]
+      terms = ["%s * %s" % (idx, stride) for (idx, stride) in zip(indices[:-1], strides)]
+      offset = " + ".join(terms + [indices[-1]])
+    elif isinstance(expr.value.type, PtrT):
       assert len (indices) == 1, \
         "Can't index into pointer using %d indices (%s)" % (len(indices), index_exprs)
       raw_ptr = "%s.raw_ptr" % arr
@@ -449,17 +511,36 @@ class FnCompiler(BaseCompiler):
   def visit_ExprStmt(self, stmt):
     return self.visit_expr(stmt.value) + ";"
   
-  def visit_ForLoop(self, stmt):
-    s = self.visit_merge_left(stmt.merge, fresh_vars = True)
+  def loop_trip_count(self, stmt, start, stop, step):
+    up = "(%(stop)s > %(start)s ? ((%(stop)s) - (%(start)s) + (%(step)s) - 1) / (%(step)s) : 0)"
+    down = "(%(start)s > %(stop)s ? ((%(start)s) - (%(stop)s) - (%(step)s) - 1) / (-(%(step)s)) : 0)"
+    if stmt.step.__class__ is Const:
+      if stmt.step.value > 0:
+        count = up
+      elif stmt.step.value < 0:
+        count = down 
+      else:
+        count = "0"
+    else:
+      count = "((%(step)s) > 0 ? " + up + " : ((%(step)s) < 0 ? " + down + " : 0))"
+    return self.fresh_var("int64_t", "trips", count % locals())
+  
+  def compile_for_loop(self, stmt, fresh_vars = True):
+    s = self.visit_merge_left(stmt.merge, fresh_vars = fresh_vars)
     start = self.visit_expr(stmt.start)
     stop = self.visit_expr(stmt.stop)
     step = self.visit_expr(stmt.step)
+    if config.instrument_regions:
+      trips = self.loop_trip_count(stmt, start, stop, step)
+    else:
+      trips = None 
     var = self.visit_expr(stmt.var)
     t = self.to_ctype(stmt.var.type)
     body =  self.visit_block(stmt.body)
     body += self.visit_merge_right(stmt.merge)
     body = self.indent("\n" + body) 
-    s += "\n %(t)s %(var)s;"
+    if fresh_vars:
+      s += "\n %(t)s %(var)s;"
     up_loop = \
         "\nfor (%(var)s = %(start)s; %(var)s < %(stop)s; %(var)s += %(step)s) {%(body)s}"
     down_loop = \
@@ -476,7 +557,109 @@ class FnCompiler(BaseCompiler):
       s += "\n} else {\n"
       s += down_loop
       s += "\n}"
-    return s % locals()
+    return s % locals(), trips 
+  
+  def array_extent(self, arr, rank):
+    """
+    Addresses of the first byte of an array's lowest element and 
+    one past the last byte of its highest element 
+    """
+    lower = ["%s.data.raw_ptr" % arr, "%s.offset" % arr]
+    upper = ["%s.data.raw_ptr" % arr, "%s.offset" % arr, "1"]
+    for i in xrange(rank):
+      span = "(%s.shape[%d] - 1) * %s.strides[%d]" % (arr, i, arr, i)
+      lower.append("(%s.strides[%d] < 0 ? %s : 0)" % (arr, i, span))
+      upper.append("(%s.strides[%d] > 0 ? %s : 0)" % (arr, i, span))
+    lo = self.fresh_var("char*", "lower_addr", "(char*) (%s)" % " + ".join(lower))
+    hi = self.fresh_var("char*", "upper_addr", "(char*) (%s)" % " + ".join(upper))
+    return lo, hi
+  
+  def versioning_condition(self, plan):
+    """
+    Runtime check for whether the fast copy of a versioned loop nest can run 
+    """
+    arrays = {}
+    conds = []
+    for (name, t) in sorted(plan.arrays.iteritems()):
+      arr = self.visit_expr(Var(name, type = t))
+      arrays[name] = arr 
+      conds.append("%s.strides[%d] == 1" % (arr, t.rank - 1))
+    for (name, dim, idx) in plan.index_checks:
+      shape = "%s.shape[%d]" % (arrays[name], dim)
+      if idx.__class__ is Var and idx.name in plan.loop_ranges:
+        start_expr, stop_expr = plan.loop_ranges[idx.name]
+        start, stop = self.visit_expr(start_expr), self.visit_expr(stop_expr)
+        if start_expr.__class__ is Const and start_expr.value >= 0:
+          in_bounds = "%s <= %s" % (stop, shape)
+        else:
+          in_bounds = "%s >= 0 && %s <= %s" % (start, stop, shape)
+        # the loop might also not run at all 
+        conds.append("(%s >= %s || (%s))" % (start, stop, in_bounds))
+      else:
+        idx = self.visit_expr(idx)
+        conds.append("(%s >= 0 && %s < %s)" % (idx, idx, shape))
+    if len(plan.written) == 0:
+      return " && ".join(conds)
+    extents = {}
+    for name in sorted(plan.arrays):
+      extents[name] = self.array_extent(arrays[name], plan.arrays[name].rank)
+    checked = set([])
+    for name in sorted(plan.written):
+      for other in sorted(plan.arrays):
+        if other == name or (other, name) in checked:
+          continue
+        checked.add((name, other))
+        lo, hi = extents[name]
+        other_lo, other_hi = extents[other]
+        conds.append("(%s <= %s || %s <= %s)" % (hi, other_lo, other_hi, lo))
+    return " && ".join(conds)
+  
+  def declare_fast_arrays(self, plan):
+    fast_arrays = {}
+    for (name, t) in sorted(plan.arrays.iteritems()):
+      arr = self.visit_expr(Var(name, type = t))
+      ptr_t = "%s* __restrict__" % self.to_ctype(t.elt_type)
+      ptr = self.fresh_var(ptr_t, "fast_ptr", "%s.data.raw_ptr + %s.offset" % (arr, arr))
+      strides = [self.fresh_var("int64_t", "stride", "%s.strides[%d]" % (arr, i)) 
+                 for i in xrange(t.rank - 1)]
+      fast_arrays[name] = (ptr, strides)
+    return fast_arrays
+  
+  def visit_versioned_loop(self, stmt, plan):
+    """
+    Compile the loop nest twice, guarded by a check of whether the arrays 
+    it writes overlap any others, whether they're all contiguous along 
+    their last dimension and whether all of its indices are in bounds 
+    """
+    self.declare_merge_vars(stmt.merge)
+    self.declare(stmt.var.name, stmt.var.type)
+    cond = self.versioning_condition(plan)
+    self.in_versioned_nest = True 
+    try:
+      self.push()
+      self.fast_arrays = self.declare_fast_arrays(plan)
+      fast_loop, _ = self.compile_for_loop(stmt, fresh_vars = False)
+      self.append(fast_loop)
+      fast = self.pop()
+      self.fast_arrays = {}
+      generic, _ = self.compile_for_loop(stmt, fresh_vars = False)
+    finally:
+      self.fast_arrays = {}
+      self.in_versioned_nest = False 
+    return "if (%s) {\n%s\n} else {%s\n}" % (cond, fast, self.indent(generic))
+  
+  def visit_ForLoop(self, stmt):
+    if config.loop_versioning and not config.instrument_regions and \
+       not self.in_versioned_nest:
+      plan = versioning_plan(stmt)
+      if plan is not None:
+        return self.visit_versioned_loop(stmt, plan)
+    if config.instrument_regions:
+      region = self.enter_region("ForLoop", stmt.source_info)
+    s, trips = self.compile_for_loop(stmt)
+    if config.instrument_regions:
+      s += "\n" + self.exit_region(region, trips)
+    return s 
 
   def visit_Return(self, stmt):
     assert not self.return_by_ref, "Returning multiple values by ref not yet implemented: %s" % stmt
@@ -522,6 +705,10 @@ class FnCompiler(BaseCompiler):
       for decl in compiled.declarations:
         self.add_decl(decl)
       
+      for region_id in compiled.region_ids:
+        if region_id not in self.region_ids:
+          self.region_ids.append(region_id)
+      
       #add any external objects it wants to be linked against 
       self.extra_objects.update(compiled.extra_objects)
       
@@ -616,7 +803,10 @@ class FnCompiler(BaseCompiler):
     
     if inline:
       # "__attribute__((always_inline))",
-      attributes = attributes + ["inline"]
+      # C99 doesn't emit an external definition for plain 'inline' functions 
+      # so they'd be undefined symbols whenever the C compiler doesn't 
+      # inline them (i.e. at -O0 or -O1)
+      attributes = attributes + ["static inline"]
     attr_str = " ".join(attributes)
     sig = "%s %s(%s)" % (return_type, c_fn_name, args_str)
     src = "%s %s {\n\n%s}" % (attr_str, sig, body_str) 
@@ -641,7 +831,8 @@ class FnCompiler(BaseCompiler):
     
     # include your own class in the cache key so that we get distinct code 
     # for derived compilers like OpenMP and CUDA 
-    key = parakeet_fn.cache_key, frozenset(struct_types), self.cache_key, tuple(attributes)
+    key = parakeet_fn.cache_key, frozenset(struct_types), self.cache_key, tuple(attributes), \
+      config.instrument_regions, config.loop_versioning
     
     if key in self._flat_compile_cache:
       return self._flat_compile_cache[key]
@@ -656,6 +847,7 @@ class FnCompiler(BaseCompiler):
       extra_objects = self.extra_objects, 
       extra_functions = self.extra_functions,
       extra_function_signatures = self.extra_function_signatures,
-      declarations = self.declarations)
+      declarations = self.declarations, 
+      region_ids = self.region_ids)
     self._flat_compile_cache[key] = result
     return result
@@ -0,0 +1,119 @@
+"""
+When config.instrument_regions is on, the C compilers wrap every ParFor,
+ForLoop, IndexReduce and array allocation in a timer and count how often
+it runs and how many iterations (or bytes, for allocations) it covers.
+
+Every region gets a process-wide id, which maps back to the Python
+source line it was generated from. The counters are static variables
+of each compiled module, and each instrumented module exports a
+function which reads them (and optionally zeroes them).
+region_profile adds up the counters from all modules.
+"""
+
+import itertools
+
+region_type = "parakeet_region_t"
+read_regions_name = "parakeet_read_regions"
+
+declarations = [
+  "typedef struct { int64_t calls; int64_t trips; int64_t total_ns; } %s" % region_type,
+]
+
+# helper functions, keyed by their signatures like the compiler's extra functions
+helper_signatures = [
+  "static inline int64_t parakeet_now_ns(void)",
+  "static inline void parakeet_region_exit(%s* region, int64_t start, int64_t trips)" % region_type,
+]
+
+helper_sources = {
+  helper_signatures[0] : """
+%s {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return ((int64_t) ts.tv_sec) * 1000000000LL + ts.tv_nsec;
+}""" % helper_signatures[0],
+  # regions inside the body of a ParFor get updated by several threads
+  helper_signatures[1] : """
+%s {
+  __sync_fetch_and_add(&region->calls, 1);
+  __sync_fetch_and_add(&region->trips, trips);
+  __sync_fetch_and_add(&region->total_ns, parakeet_now_ns() - start);
+}""" % helper_signatures[1],
+}
+
+# region id -> (kind, source_info)
+_regions = {}
+_region_ids = itertools.count()
+
+def new_region(kind, source_info):
+  region_id = _region_ids.next()
+  _regions[region_id] = (kind, source_info)
+  return region_id
+
+def region_var(region_id):
+  return "parakeet_region_%d" % region_id
+
+def region_decl(region_id):
+  return "static %s %s = {0, 0, 0}" % (region_type, region_var(region_id))
+
+def read_regions_source(region_ids):
+  """
+  C source of the module function which returns a list of
+  (region id, calls, trips, nanoseconds) and zeroes the counters
+  if it's given a true argument
+  """
+  lines = ["static PyObject* %s(PyObject* self, PyObject* args) {" % read_regions_name,
+           "  int reset = 0;",
+           "  if (!PyArg_ParseTuple(args, \"|i\", &reset)) { return NULL; }",
+           "  PyObject* result = PyList_New(%d);" % len(region_ids)]
+  for i, region_id in enumerate(region_ids):
+    var = region_var(region_id)
+    lines.append("  PyList_SET_ITEM(result, %d, Py_BuildValue(\"(iLLL)\", %d, "
+                 "(long long) %s.calls, (long long) %s.trips, (long long) %s.total_ns));" % \
+                 (i, region_id, var, var, var))
+  lines.append("  if (reset) {")
+  for region_id in region_ids:
+    var = region_var(region_id)
+    lines.append("    %s.calls = 0; %s.trips = 0; %s.total_ns = 0;" % (var, var, var))
+  lines.append("  }")
+  lines.append("  return result;")
+  lines.append("}")
+  return "\n".join(lines)
+
+# functions which read the counters of each instrumented module
+_readers = []
+
+def register_module(compiled_fn):
+  reader = getattr(compiled_fn.module, read_regions_name, None)
+  if reader is not None and reader not in _readers:
+    _readers.append(reader)
+
+def region_profile(reset = False):
+  """
+  Counters of every region which has run, summed over all the modules
+  that contain it, with the most expensive regions first
+  """
+  totals = {}
+  for reader in _readers:
+    for (region_id, calls, trips, total_ns) in reader(1 if reset else 0):
+      if calls == 0:
+        continue
+      old_calls, old_trips, old_ns = totals.get(region_id, (0, 0, 0))
+      totals[region_id] = (old_calls + calls, old_trips + trips, old_ns + total_ns)
+  profile = []
+  for region_id, (calls, trips, total_ns) in totals.iteritems():
+    kind, source_info = _regions[region_id]
+    profile.append({'region' : region_id,
+                    'kind' : kind,
+                    'filename' : source_info.filename if source_info else None,
+                    'line' : source_info.line if source_info else None,
+                    'function' : source_info.function if source_info else None,
+                    'calls' : int(calls),
+                    'trips' : int(trips),
+                    'total_time' : total_ns / 1e9})
+  profile.sort(key = lambda region: region['total_time'], reverse = True)
+  return profile
+
+def reset_region_profile():
+  for reader in _readers:
+    reader(1)
@@ -0,0 +1,163 @@
+"""
+Find the loop nests which the C backend can compile twice: once generically
+and once assuming that the arrays it writes don't overlap any others, that
+the innermost dimension of every array is contiguous and that all the
+indices stay within the arrays' shapes. The generated code checks those
+assumptions once before the nest and picks which copy to run.
+"""
+
+from ..analysis.syntax_visitor import SyntaxVisitor
+from ..ndtypes import ArrayT, ClosureT, PtrT, ScalarT, TupleT
+from ..syntax import Assign, Comment, Const, ExprStmt, ForLoop, If, Tuple, Var, While
+
+class VersioningPlan(object):
+  def __init__(self, arrays, written, index_checks, loop_ranges):
+    # array name -> array type, for every array the nest accesses
+    self.arrays = arrays
+
+    # names of the arrays the nest writes into
+    self.written = written
+
+    # (array name, dimension, index) triples whose indices need to be in bounds
+    self.index_checks = index_checks
+
+    # loop variable name -> (start, stop) of the loops in the nest
+    self.loop_ranges = loop_ranges
+
+class NotVersionable(Exception):
+  pass
+
+# array attributes which don't touch the array's elements
+metadata_attrs = ('shape', 'strides', 'offset', 'size')
+
+def holds_memory(t):
+  if isinstance(t, (ArrayT, PtrT)):
+    return True
+  elif isinstance(t, TupleT):
+    return any(holds_memory(elt_t) for elt_t in t.elt_types)
+  elif isinstance(t, ClosureT):
+    return any(holds_memory(arg_t) for arg_t in t.arg_types)
+  return False
+
+class NestAccesses(SyntaxVisitor):
+  """
+  Collect the element accesses of a loop nest, giving up on the whole nest as soon
+  as an array gets used in any other way (passed to a function, sliced, aliased)
+  since restrict pointers would make such uses undefined
+  """
+
+  def __init__(self):
+    SyntaxVisitor.__init__(self)
+    self.arrays = {}
+    self.written = set([])
+    self.accesses = []
+    self.bound = set([])
+    self.loops = {}
+
+  def visit_stmt(self, stmt):
+    if stmt.__class__ not in (Assign, ExprStmt, If, ForLoop, While, Comment):
+      raise NotVersionable()
+    SyntaxVisitor.visit_stmt(self, stmt)
+
+  def visit_Var(self, expr):
+    if holds_memory(expr.type):
+      raise NotVersionable()
+
+  def visit_Attribute(self, expr):
+    if expr.value.__class__ is Var and isinstance(expr.value.type, ArrayT) and \
+       expr.name in metadata_attrs:
+      return
+    self.visit_expr(expr.value)
+
+  def access(self, expr, written):
+    if expr.value.__class__ is not Var or not isinstance(expr.value.type, ArrayT) or \
+       not isinstance(expr.type, ScalarT):
+      raise NotVersionable()
+    if isinstance(expr.index.type, TupleT):
+      if expr.index.__class__ is not Tuple:
+        raise NotVersionable()
+      indices = expr.index.elts
+    else:
+      indices = [expr.index]
+    array_t = expr.value.type
+    if len(indices) != array_t.rank:
+      raise NotVersionable()
+    for idx in indices:
+      if idx.__class__ not in (Var, Const) or not isinstance(idx.type, ScalarT):
+        raise NotVersionable()
+    name = expr.value.name
+    self.arrays[name] = array_t
+    if written:
+      self.written.add(name)
+    for (dim, idx) in enumerate(indices):
+      self.accesses.append((name, dim, idx))
+
+  def visit_Index(self, expr):
+    self.access(expr, written = False)
+
+  def visit_lhs_Index(self, lhs):
+    self.access(lhs, written = True)
+
+  def visit_lhs_Var(self, lhs):
+    self.bound.add(lhs.name)
+    self.visit_Var(lhs)
+
+  def visit_lhs_Tuple(self, lhs):
+    for elt in lhs.elts:
+      self.visit_lhs(elt)
+
+  def visit_lhs_Attribute(self, lhs):
+    raise NotVersionable()
+
+  def visit_merge(self, phi_nodes):
+    self.bound.update(phi_nodes.iterkeys())
+    SyntaxVisitor.visit_merge(self, phi_nodes)
+
+  def visit_merge_loop_start(self, phi_nodes):
+    self.visit_merge(phi_nodes)
+
+  def visit_ForLoop(self, stmt):
+    self.loops[stmt.var.name] = stmt
+    SyntaxVisitor.visit_ForLoop(self, stmt)
+
+def invariant(expr, bound):
+  return expr.__class__ is Const or (expr.__class__ is Var and expr.name not in bound)
+
+def versioning_plan(stmt):
+  """
+  Return a VersioningPlan for the loop nest starting at the given ForLoop,
+  or None if the nest can't be versioned
+  """
+  accesses = NestAccesses()
+  try:
+    accesses.visit_stmt(stmt)
+  except NotVersionable:
+    return None
+  if len(accesses.arrays) == 0:
+    return None
+  bound = accesses.bound
+  if any(name in bound for name in accesses.arrays):
+    return None
+
+  loop_ranges = {}
+  for (name, loop) in accesses.loops.iteritems():
+    if loop.step.__class__ is Const and loop.step.value > 0 and \
+       invariant(loop.start, bound) and invariant(loop.stop, bound):
+      loop_ranges[name] = (loop.start, loop.stop)
+
+  index_checks = []
+  seen = set([])
+  for (name, dim, idx) in accesses.accesses:
+    if idx.__class__ is Const:
+      if idx.value < 0:
+        return None
+      key = name, dim, idx.value
+    elif idx.name in loop_ranges or idx.name not in bound:
+      key = name, dim, idx.name
+    else:
+      # computed inside the nest, so there's no single range to check up front
+      return None
+    if key not in seen:
+      seen.add(key)
+      index_checks.append((name, dim, idx))
+  return VersioningPlan(accesses.arrays, accesses.written, index_checks, loop_ranges)
@@ -1,12 +1,42 @@
 import numpy as np
-from ..ndtypes import (type_conv, ScalarT, ArrayT, FnT, ClosureT, SliceT, NoneT, TupleT, TypeValueT)
+import types 
+from ..ndtypes import (as_ndarray, type_conv, ScalarT, ArrayT, FnT, ClosureT, SliceT, NoneT, TupleT, TypeValueT)
 from ..syntax import TypedFn, UntypedFn
 
 
+def _unchanged_if_same(value):
+  """
+  Can the prepared version of this value be reused as long as it's 
+  still the same object? Not true of lists, which get copied into arrays 
+  and might have been modified since.  
+  """
+  if isinstance(value, tuple):
+    return all(_unchanged_if_same(elt) for elt in value)
+  return value is None or \
+    isinstance(value, (np.ndarray, np.generic, int, long, float, bool, complex, 
+                       slice, type, types.FunctionType, types.BuiltinFunctionType))
+
+# for each untyped function, the values of its Python nonlocals the last time
+# it was passed to compiled code along with their prepared representation 
+_closure_args_cache = {}
+
 def prepare_closure_args(untyped_fn):
   closure_args = untyped_fn.python_nonlocals()
+  if len(closure_args) == 0:
+    return ()
+  cached = _closure_args_cache.get(untyped_fn.name)
+  if cached is not None:
+    old_args, prepared = cached
+    # only reuse the prepared values if every nonlocal is still 
+    # bound to the same object 
+    if len(old_args) == len(closure_args) and \
+       all(old is new for (old, new) in zip(old_args, closure_args)):
+      return prepared
   closure_arg_types = [type_conv.typeof(v) for v in closure_args]
-  return prepare_args(closure_args, closure_arg_types)
+  prepared = prepare_args(closure_args, closure_arg_types)
+  if all(_unchanged_if_same(v) for v in closure_args):
+    _closure_args_cache[untyped_fn.name] = (closure_args, prepared)
+  return prepared
       
 
 def prepare_arg(arg, t):
@@ -18,9 +48,8 @@ def prepare_arg(arg, t):
   elif isinstance(t, TypeValueT):
     return ()
   elif isinstance(t, ArrayT):
-    if isinstance(arg, np.ndarray):
-      return arg
-    return np.asarray(arg)
+    # no copies unless the argument is something like a list 
+    return as_ndarray(arg)
   elif isinstance(t, TupleT):
     arg = tuple(arg)
     assert len(arg) == len(t.elt_types)
@@ -15,7 +15,10 @@ from ..ndtypes import (TupleT,  ArrayT,
 import type_mappings
 from fn_compiler import FnCompiler
 from compile_util import compile_module
+import instrumentation
 from .. import config as root_config 
+from ..compile_lock import compile_lock, InFlight
+from ..profiling import compile_timer
 import config 
 
 def attr_from_kwargs(obj, kwargs, attr, value = None):
@@ -31,6 +34,30 @@ def attr_from_kwargs(obj, kwargs, attr, value = None):
     setattr(obj, attr, value)
 
 
+# types whose values get unboxed on entry into a compiled function, 
+# arguments of any other type stay PyObjects 
+unboxed_types = (TupleT, NoneT, PtrT, ClosureT, ScalarT, ArrayT, SliceT)
+
+def boxed_args_used(fn, uses = None):
+  """
+  Names of arguments which the function's body uses while they're 
+  still boxed as PyObjects
+  """
+  if uses is None:
+    uses = use_count(fn)
+  # an argument's name counts as one use
+  return [name for name in fn.arg_names
+          if uses.get(name, 0) > 1 and 
+             not isinstance(fn.type_env[name], unboxed_types)]
+
+def can_release_gil(fn, uses = None):
+  """
+  Once its arguments are unboxed, the generated code of a function only
+  touches Python objects when it boxes its result on the way out, unless
+  it has to hang on to arguments which never got unboxed
+  """
+  return len(boxed_args_used(fn, uses)) == 0
+
 class PyModuleCompiler(FnCompiler):
   """
   Compile a Parakeet function into a Python module with an 
@@ -43,6 +70,11 @@ class PyModuleCompiler(FnCompiler):
     attr_from_kwargs(self, kwargs, 'linker_flag_prefix')  
     attr_from_kwargs(self, kwargs, 'src_extension')
     FnCompiler.__init__(self, module_entry = module_entry, *args, **kwargs)
+    # entry points start out holding the GIL, and in nogil mode the 
+    # functions they call can assume it's already been released 
+    self.holding_gil = module_entry or not config.nogil 
+    # name of the saved thread state while the GIL is released 
+    self.gil_state = None 
     
   def unbox_scalar(self, x, t, target = None):
     assert isinstance(t, ScalarT), "Expected scalar type, got %s" % t
@@ -525,6 +557,12 @@ class PyModuleCompiler(FnCompiler):
     
     if config.debug:
       print "[Debug] Allocating array : %s " % expr.type  
+    if config.instrument_regions:
+      region = self.enter_region("Alloc", expr.source_info)
+      result = self.alloc_array(expr.type, expr.shape)
+      nbytes = "%s.size * %d" % (result, expr.type.elt_type.dtype.itemsize)
+      self.append(self.exit_region(region, nbytes))
+      return result 
     return self.alloc_array(expr.type, expr.shape)
      
   def visit_Tuple(self, expr):
@@ -661,8 +699,15 @@ class PyModuleCompiler(FnCompiler):
     v = self.visit_expr(expr.value) 
     return self.attribute(v, attr, expr.type)
   
+  def release_gil(self):
+    self.gil_state = self.fresh_var("PyThreadState*", "gil_state", "PyEval_SaveThread()")
+    self.holding_gil = False 
+  
   def visit_Return(self, stmt):
     if self.module_entry:
+      if self.gil_state is not None:
+        # boxing the result creates Python objects 
+        self.append("PyEval_RestoreThread(%s);" % self.gil_state)
       v = self.as_pyobj(stmt.value)
       if config.debug: 
         self.print_pyobj_type(v, "Return type: ")
@@ -723,7 +768,7 @@ class PyModuleCompiler(FnCompiler):
         self.print_pyobj_type(c_name, text = "Type: ")
         self.print_pyobj(c_name, text = "Value: ")
       
-      if isinstance(t, (TupleT, NoneT, PtrT, ClosureT, ScalarT, ArrayT, SliceT)):
+      if isinstance(t, unboxed_types):
         #new_name = self.name(argname, overwrite = True)
         self.comment("Unboxing %s : %s" % (argname, t))
         var = self.unbox(c_name, t, target = argname)
@@ -731,6 +776,10 @@ class PyModuleCompiler(FnCompiler):
         self.name_mappings[argname] = var
       
 
+    if config.nogil and can_release_gil(fn, uses):
+      # nothing between here and the return touches Python objects, 
+      # so other threads can run while this one computes 
+      self.release_gil()
     self.enter_module_body()
     c_body = self.visit_block(fn.body, push=False)
     self.exit_module_body()
@@ -740,34 +789,147 @@ class PyModuleCompiler(FnCompiler):
     fndef = "%s {\n\n %s}" % (c_sig, c_body)
     return c_fn_name, c_sig, fndef 
   
+  @compile_timer('codegen')
+  def entry_module_args(self, parakeet_fn):
+    """
+    Generate the C source of a module wrapping the given function, 
+    returned as the keyword arguments for compile_module
+    """
+    _, module_args = self.batch_module_args([parakeet_fn])
+    return module_args 
+  
+  @compile_timer('codegen')
+  def batch_module_args(self, parakeet_fns):
+    """
+    Generate the C source of a single module with an entry point for each 
+    of the given functions. Helper functions and declarations which several 
+    entries share only get emitted once. 
+    
+    Returns the (name, signature) of each entry, in order, along with the 
+    keyword arguments for compile_module. The first entry is the module's 
+    main function and the others become extra methods of the module.  
+    """
+    entries = []
+    srcs = []
+    function_sigs = []
+    function_sources = {}
+    declarations = []
+    extra_objects = set([])
+    compile_flags = []
+    link_flags = []
+    region_ids = []
+    for (i, parakeet_fn) in enumerate(parakeet_fns):
+      # every entry needs its own mapping from variables to C names, but 
+      # sharing the name counters keeps the entries from clashing 
+      if i == 0:
+        compiler = self 
+      else:
+        compiler = self.__class__()
+        compiler.name_versions = self.name_versions 
+      name, sig, src = compiler.visit_fn(parakeet_fn)
+      if config.print_function_source: 
+        print "Generated C source for %s: %s" %(name, src)
+      entries.append((name, sig))
+      srcs.append(src)
+      for extra_sig in compiler.extra_function_signatures:
+        if extra_sig not in function_sources:
+          function_sigs.append(extra_sig)
+          function_sources[extra_sig] = compiler.extra_functions[extra_sig]
+      for decl in compiler.declarations:
+        if decl not in declarations:
+          declarations.append(decl)
+      extra_objects.update(compiler.extra_objects)
+      for flag in compiler.extra_compile_flags:
+        if flag not in compile_flags:
+          compile_flags.append(flag)
+      for flag in compiler.extra_link_flags:
+        if flag not in link_flags:
+          link_flags.append(flag)
+      for region_id in compiler.region_ids:
+        if region_id not in region_ids:
+          region_ids.append(region_id)
+    
+    ordered_function_sources = [function_sources[extra_sig] 
+                                for extra_sig in function_sigs]
+    extra_methods = [name for (name, _) in entries[1:]]
+    if region_ids:
+      # let Python read back the counters of instrumented regions 
+      ordered_function_sources.append(instrumentation.read_regions_source(region_ids))
+      extra_methods.append(instrumentation.read_regions_name)
+    main_name, main_sig = entries[0]
+    module_args = dict(src = "\n\n".join(srcs), 
+                       extra_methods = extra_methods, 
+                       fn_name = main_name,
+                       fn_signature = main_sig, 
+                       src_extension = self.src_extension,
+                       extra_objects = extra_objects,
+                       extra_function_sources = ordered_function_sources, 
+                       declarations = declarations, 
+                       extra_compile_flags = compile_flags, 
+                       extra_link_flags = link_flags, 
+                       print_source = root_config.print_generated_code, 
+                       compiler = self.compiler_cmd, 
+                       compiler_flag_prefix = self.compiler_flag_prefix, 
+                       linker_flag_prefix = self.linker_flag_prefix)
+    return entries, module_args 
+  
   _entry_compile_cache = {} 
-  def compile_entry(self, parakeet_fn):  
+  _entries_in_flight = InFlight(_entry_compile_cache)
+  
+  def entry_cache_key(self, parakeet_fn, opt_flags = None):
     # we include the compiler's class as part of the key
     # since this function might get reused by descendant backends like OpenMP and CUDA
-    key = parakeet_fn.cache_key, self.__class__ 
-    if key in self._entry_compile_cache:
-      return self._entry_compile_cache[key]
-    
-    name, sig, src = self.visit_fn(parakeet_fn)
-    
-    if config.print_function_source: 
-      print "Generated C source for %s: %s" %(name, src)
-    ordered_function_sources = [self.extra_functions[extra_sig] for 
-                                extra_sig in self.extra_function_signatures]
-
-    compiled_fn = compile_module(src, 
-                                 fn_name = name,
-                                 fn_signature = sig, 
-                                 src_extension = self.src_extension,
-                                 extra_objects = set(self.extra_objects),
-                                 extra_function_sources = ordered_function_sources, 
-                                 declarations =  self.declarations, 
-                                 extra_compile_flags = self.extra_compile_flags, 
-                                 extra_link_flags = self.extra_link_flags, 
-                                 print_source = root_config.print_generated_code, 
-                                 compiler = self.compiler_cmd, 
-                                 compiler_flag_prefix = self.compiler_flag_prefix, 
-                                 linker_flag_prefix = self.linker_flag_prefix)
-    self._entry_compile_cache[key]  = compiled_fn
-    return compiled_fn
-
+    return parakeet_fn.cache_key, self.__class__, \
+      (tuple(opt_flags) if opt_flags is not None else None), \
+      config.instrument_regions, config.nogil, config.loop_versioning
+  
+  def compile_entry(self, parakeet_fn, opt_flags = None):
+    """
+    Compile (or find in the cache) the extension module wrapping a function.
+    Only code generation holds the compile lock, so threads compiling 
+    different functions can run the C compiler at the same time. 
+    """
+    def compile():
+      with compile_lock:
+        module_args = self.entry_module_args(parakeet_fn)
+      compiled_fn = compile_module(opt_flags = opt_flags, **module_args)
+      instrumentation.register_module(compiled_fn)
+      return compiled_fn
+    key = self.entry_cache_key(parakeet_fn, opt_flags)
+    return self._entries_in_flight.get(key, compile)
+  
+  def compile_entries(self, parakeet_fns, opt_flags = None):
+    """
+    Like compile_entry but builds the entry points of all the given functions
+    which aren't compiled yet as one extension module, so the C compiler 
+    and linker only run once and only one shared object gets loaded. 
+    Returns the compiled entry of each function. 
+    """
+    keys = [self.entry_cache_key(fn, opt_flags) for fn in parakeet_fns]
+    pending_fns = []
+    pending_keys = []
+    for (fn, key) in zip(parakeet_fns, keys):
+      # entries which other threads are already compiling get waited for below
+      if key not in pending_keys and self._entries_in_flight.claim(key):
+        pending_fns.append(fn)
+        pending_keys.append(key)
+    if pending_fns:
+      # every claimed key has to be finished one way or another, 
+      # otherwise threads waiting on it would block forever
+      finished = set([])
+      try:
+        with compile_lock:
+          entries, module_args = self.batch_module_args(pending_fns)
+        compiled_module = compile_module(opt_flags = opt_flags, **module_args)
+        instrumentation.register_module(compiled_module)
+        for ((name, sig), key) in zip(entries, pending_keys):
+          c_fn = getattr(compiled_module.module, name)
+          compiled_fn = compiled_module._replace(c_fn = c_fn, fn_name = name, fn_signature = sig)
+          self._entries_in_flight.finish(key, compiled_fn)
+          finished.add(key)
+      except:
+        for key in pending_keys:
+          if key not in finished:
+            self._entries_in_flight.finish(key, failed = True)
+        raise 
+    return [self.compile_entry(fn, opt_flags) for fn in parakeet_fns]
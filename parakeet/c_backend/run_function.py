@@ -1,19 +1,83 @@
+import time 
+
 from prepare_args import prepare_args
+from ..compile_lock import compile_lock
+from ..profiling import current_fn_stats, record_native_call
 from ..transforms.pipeline  import loopify, final_loop_optimizations, flatten  
 from ..transforms.stride_specialization import specialize
-from ..config import stride_specialization
+from ..transforms.unused_arg_elim import eliminate_unused_args
+from .. import config as parakeet_config 
 from pymodule_compiler import PyModuleCompiler 
+import config 
 
-def run(fn, args):
-  args = prepare_args(args, fn.input_types)
-  fn = loopify.apply(fn)
-  # TODO: finish debuggin flattening 
-  # fn = flatten(fn)
-  fn = final_loop_optimizations.apply(fn)
+def optimize_with(fn, first_phase, backend_config, flatten_structs = True):
+  """
+  Run the part of the optimization pipeline which doesn't depend on the
+  argument values. Backends differ in the phase which starts their part
+  of the pipeline and in the config which says whether compilation is tiered.
+  """
+  with compile_lock:
+    fn = first_phase(fn)
+    if flatten_structs:
+      fn = flatten.apply(fn)
+    if not getattr(backend_config, 'tiered_compilation', False):
+      # the hot tier runs its own final loop optimizations  
+      fn = final_loop_optimizations.apply(fn)
+    return fn 
+
+def prepare_with(fn, args, first_phase, backend_config, flatten_structs = True):
+  """
+  Optimize and specialize a function for the given arguments and convert
+  them into what its compiled entry point expects
+  """
+  with compile_lock:
+    fn = optimize_with(fn, first_phase, backend_config, flatten_structs)
+    # arguments which the function never looks at don't get converted at all 
+    fn, kept = eliminate_unused_args(fn)
+    stats = current_fn_stats()
+    if stats is not None:
+      start = time.time()
+    args = prepare_args([args[i] for i in kept], fn.input_types)
+    if stats is not None:
+      stats.prepare_args_time += time.time() - start 
+    if parakeet_config.stride_specialization:
+      fn = specialize(fn, python_values = args)
+      # constant strides, shapes and small ints can make more arguments unused
+      fn, kept = eliminate_unused_args(fn)
+      if len(kept) < len(args):
+        args = tuple(args[i] for i in kept)
+    assert len(args) == len(fn.input_types)
+    return fn, args 
 
-  if stride_specialization:
-    fn = specialize(fn, python_values = args)
+def prepare(fn, args):
+  return prepare_with(fn, args, loopify, config)
+
+def run(fn, args):
+  fn, args = prepare(fn, args)
+  stats = current_fn_stats()
+  if config.tiered_compilation:
+    from tiered import tiered_fn 
+    c_fn = tiered_fn(fn, PyModuleCompiler)
+    if stats is not None:
+      return record_native_call(stats, c_fn, (args,))
+    return c_fn(args)
   compiled_fn = PyModuleCompiler().compile_entry(fn)
-  assert len(args) == len(fn.input_types)
+  if stats is not None:
+    return record_native_call(stats, compiled_fn.c_fn, args)
   result = compiled_fn.c_fn(*args)
-  return result
\ No newline at end of file
+  return result
+
+def compile_batch(calls):
+  """
+  Build the entry points for a list of (typed function, args) pairs as a
+  single extension module, so that later calls with arguments like these
+  don't need to run the C compiler
+  """
+  fns = [prepare(fn, args)[0] for (fn, args) in calls]
+  if config.tiered_compilation:
+    # the quick tier is what gets called first 
+    from tiered import quick_opt_flags 
+    opt_flags = quick_opt_flags()
+  else:
+    opt_flags = None 
+  return PyModuleCompiler().compile_entries(fns, opt_flags = opt_flags)
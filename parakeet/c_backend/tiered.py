@@ -0,0 +1,95 @@
+"""
+Tiered compilation: the first time a specialization gets called it's
+compiled without the final loop optimizations and at a low optimization
+level, so that cold functions come back quickly. Each specialization counts
+its calls and the time spent in them, and once it crosses either of the
+thresholds in config it gets rebuilt with loop unrolling and aggressive
+compiler flags. The rebuilt module replaces the quick one for all later
+calls.
+"""
+
+import threading
+import time
+
+from ..compile_lock import compile_lock
+from ..transforms.pipeline import hot_loop_optimizations
+from compile_util import compile_module, get_opt_flags
+import config
+import instrumentation 
+
+def quick_opt_flags():
+  return get_opt_flags(config.quick_opt_level)
+
+def hot_opt_flags():
+  return get_opt_flags(config.hot_opt_level) + list(config.hot_extra_flags)
+
+class TieredFn(object):
+  def __init__(self, fn, compiler_class):
+    self.fn = fn
+    self.compiler_class = compiler_class
+    self.compiled = compiler_class().compile_entry(fn, opt_flags = quick_opt_flags())
+    self.hot = False
+    self.calls = 0
+    self.total_time = 0.0
+    self.recompile_thread = None
+
+  def __call__(self, args):
+    if self.hot:
+      return self.compiled.c_fn(*args)
+    start = time.time()
+    result = self.compiled.c_fn(*args)
+    self.total_time += time.time() - start
+    self.calls += 1
+    if self.calls >= config.hot_call_count or \
+       self.total_time >= config.hot_total_time:
+      self.recompile()
+    return result
+
+  def recompile(self):
+    with compile_lock:
+      # several threads might cross the threshold at once
+      if self.hot:
+        return
+      self.hot = True
+      # the IR transformations and code generation share global state
+      # so they stay on this thread, only the C compiler runs in the background
+      hot_fn = hot_loop_optimizations.apply(self.fn)
+      module_args = self.compiler_class().entry_module_args(hot_fn)
+    module_args['opt_flags'] = hot_opt_flags()
+    if config.background_recompile:
+      self.recompile_thread = threading.Thread(target = self._compile_hot,
+                                               args = (module_args,))
+      self.recompile_thread.daemon = True
+      self.recompile_thread.start()
+    else:
+      self._compile_hot(module_args)
+
+  def _compile_hot(self, module_args):
+    try:
+      compiled = compile_module(**module_args)
+    except:
+      # keep running the quick version
+      if config.print_commands:
+        import traceback
+        traceback.print_exc()
+      return
+    instrumentation.register_module(compiled)
+    # swapping in the new module is a single attribute assignment,
+    # so concurrent callers see either the old one or the new one
+    self.compiled = compiled
+
+  def wait(self):
+    """
+    Block until the hot version (if one has been started) is ready
+    """
+    if self.recompile_thread is not None:
+      self.recompile_thread.join()
+
+_tiered_fns = {}
+def tiered_fn(fn, compiler_class):
+  key = fn.cache_key, compiler_class, config.instrument_regions
+  result = _tiered_fns.get(key)
+  if result is None:
+    # if another thread got here first, use its version 
+    result = _tiered_fns.setdefault(key, TieredFn(fn, compiler_class))
+  return result
@@ -0,0 +1,75 @@
+"""
+Type inference, the optimization pipeline and code generation all share
+global state (fresh names, the caches of phases and closure specializations,
+C struct declarations...) so they run while holding 'compile_lock'.
+The slow part of compiling, running the C compiler, happens outside of the
+lock so that different specializations can be built at the same time,
+and InFlight makes sure that concurrent first calls of the same
+specialization only build it once.
+
+Never wait on an InFlight while holding compile_lock, since whichever thread
+is doing the work may need the lock to finish it.
+"""
+
+import threading
+
+compile_lock = threading.RLock()
+
+class InFlight(object):
+  """
+  Deduplicate concurrent computations of the values in a cache: the first
+  thread to ask for a missing key computes it and any others wait for
+  its result
+  """
+
+  def __init__(self, cache):
+    self.cache = cache
+    self.pending = {}
+    self.mutex = threading.Lock()
+
+  def claim(self, key):
+    """
+    Start computing the value of a key unless it's already known or
+    another thread is working on it. Whoever gets True has to call finish.
+    """
+    with self.mutex:
+      if key in self.cache or key in self.pending:
+        return False
+      self.pending[key] = threading.Event()
+      return True
+
+  def finish(self, key, value = None, failed = False):
+    with self.mutex:
+      if not failed:
+        self.cache[key] = value
+      event = self.pending.pop(key)
+    event.set()
+
+  def wait(self, key):
+    """
+    Value of a key once nobody is working on it anymore,
+    or None if computing it failed
+    """
+    with self.mutex:
+      event = self.pending.get(key)
+    if event is not None:
+      event.wait()
+    return self.cache.get(key)
+
+  def get(self, key, compute):
+    value = self.cache.get(key)
+    if value is not None:
+      return value
+    while True:
+      if self.claim(key):
+        try:
+          value = compute()
+        except:
+          self.finish(key, failed = True)
+          raise
+        self.finish(key, value)
+        return value
+      value = self.wait(key)
+      if value is not None:
+        return value
+      # the other thread's attempt failed, so try again here
@@ -4,13 +4,22 @@
 #
 #  'c': sequential, use gcc or clang to compile
 #  'openmp': multi-threaded execution for array operations, requires gcc 4.4+
-#  'llvm': deprecated
+#  'llvm': compiles in-process with llvmlite, no C compiler needed
+#  'multiprocess': splits maps and reductions across worker processes 
+#                  which share their inputs and outputs through shared memory
+#  'stream': runs maps and reductions over inputs bigger than RAM 
+#            (like np.memmap arrays) one chunk at a time 
 #  'interp': interpreter, will be dreadfully slow
+#  'numpy': runs array operations over whole arrays with NumPy, no compile step
 #  'cuda': experimental GPU support
 #
 
 backend = 'openmp' 
 
+# translate each function into nested Python closures the first time the 
+# interpreter sees it, rather than walking the syntax tree on every call
+interp_compile_closures = True
+
 ######################################
 #        PARAKEET OPTIMIZATIONS      #
 ######################################
@@ -38,16 +47,47 @@ opt_copy_elimination = True
 # recompile functions for distinct patterns of unit strides
 stride_specialization = True 
 
+# ...and also for array dimensions and integer arguments no bigger than 
+# max_small_const, which become constants in the specialized function 
+# (so that loops over them can be unrolled)
+small_const_specialization = True 
+max_small_const = 8
+
+# stop specializing a function on small constants once it's been 
+# compiled for this many distinct shapes & values
+max_small_const_specializations = 8 
+
 # may dramatically increase compile time
 opt_loop_unrolling = False
 
-# suspiciously complex optimizations may introduce bugs 
-# TODO: comb through carefully 
-opt_scalar_replacement = False
+# keep array locations which a loop accumulates into in registers
+opt_scalar_replacement = True
+
+# after array indexing gets lowered to pointer offsets, advance each 
+# loop's offsets by a constant step instead of multiplying by the strides 
+opt_strength_reduction = True
     
 # run verifier after each transformation 
 opt_verify = True
 
+# only run cleanups (i.e. Simplify & DCE) after transforms which actually 
+# changed a function, and don't re-verify functions which haven't changed
+# since they were last verified 
+opt_track_changes = True
+
+
+######################################
+#              IR CACHE              #
+######################################
+
+# keep the optimized IR of each specialization in a disk cache keyed on 
+# the function's source, the values it refers to, the types of its inputs 
+# and the source of Parakeet itself, so that later processes can skip 
+# type inference and the optimization pipeline
+cache_ir = False 
+
+# where to keep the cached IR, defaults to ~/.parakeet/ir_cache 
+cache_ir_dir = None 
 
 #####################################
 #            DEBUG OUTPUT           #
@@ -85,6 +125,10 @@ print_escape_analysis = False
 # how long did each transform take?
 print_transform_timings = False
 
+# add up the time spent in the frontend, optimization pipeline,
+# code generation and C compiler (see profiling.compile_times) 
+collect_compile_times = False
+
 # print each transform's name when it runs
 print_transform_names = False
 
@@ -249,6 +249,14 @@ class CudaCompiler(MulticoreCompiler):
   def in_gpu(self):
     return self.gpu_depth > 0
   
+  def loop_body_attributes(self):
+    attributes = MulticoreCompiler.loop_body_attributes(self)
+    if self.in_gpu():
+      # passing any attributes skips the __device__ qualifier 
+      # which get_fn_name otherwise adds inside of kernels 
+      return ["__device__"] + (["__forceinline__"] if attributes else [])
+    return attributes
+  
   def get_fn_name(self, fn_expr, attributes = [], inline = True):
     if self.in_gpu() and not attributes:
       attributes = ["__device__"] 
@@ -9,9 +9,11 @@ from dsltools import NestedBlocks, ScopedDict
  
 from .. import config, names, prims, syntax
 
+from ..compile_lock import compile_lock
 from ..names import NameNotFound
 from ..ndtypes import Type
 from ..prims import Prim 
+from ..profiling import compile_timer
 from ..syntax import (Expr, 
                       Assign, If, ForLoop, Return,  
                       Var, PrimCall, Cast,  Select, 
@@ -962,9 +964,14 @@ def translate_function_source(source,
                               globals_dict, 
                               closure_vars = [],
                               closure_cells = [],
-                              filename = None):
+                              filename = None, 
+                              first_line = None):
   assert len(closure_vars) == len(closure_cells)
   syntax_tree = ast.parse(strip_leading_whitespace(source))
+  if first_line is not None:
+    # line numbers in the parsed source start from 1, 
+    # shift them to where the function is in its file
+    ast.increment_lineno(syntax_tree, first_line - 1)
 
   if isinstance(syntax_tree, (ast.Module, ast.Interactive)):
     assert len(syntax_tree.body) == 1
@@ -986,20 +993,33 @@ def translate_function_source(source,
 # untyped representation
 _known_python_functions = {}
 
+# ...and the name of each untyped function mapped back to the Python 
+# function it came from 
+_python_function_values = {}
+
+def python_function_value(untyped):
+  return _python_function_values.get(untyped.name)
+
 # keep track of which functions are being translated at this moment 
 # to check for recursive calls 
 _currently_processing = set([])
 
 
-import threading 
-def translate_function_value(fn, _lock = threading.RLock()):
+def translate_function_value(fn):
   """
   Prevent two threads from clobbering the recursion logic by both entering 
   the translation code
   """
-  with _lock: 
+  # functions which have already been translated don't need the lock,
+  # this path gets hit on every call which passes a function argument 
+  try:
+    return _known_python_functions[fn]
+  except (KeyError, TypeError):
+    pass 
+  with compile_lock: 
     return _translate_function_value(fn)
 
+@compile_timer('frontend')
 def _translate_function_value(fn):
   
   # if it's already a Parakeet function, just return it 
@@ -1073,7 +1093,8 @@ def _translate_function_value(fn):
                                         globals_dict,
                                         free_vars,
                                         closure_cells, 
-                                        filename = filename)
+                                        filename = filename, 
+                                        first_line = fn.func_code.co_firstlineno)
     except:
       _currently_processing.remove(fn)
       raise 
@@ -1082,6 +1103,7 @@ def _translate_function_value(fn):
   
     _currently_processing.remove(fn)              
     _known_python_functions[original_fn] = fundef
+    _python_function_values[fundef.name] = original_fn
      
   _known_python_functions[fn] = fundef 
   
@@ -1,15 +1,22 @@
 
-from .. import names 
+import time 
+
+from .. import names, profiling 
   
 from .. syntax import (Expr, Var, Const, Return, UntypedFn, FormalArgs, DelayUntilTyped,  
                        const, is_python_constant)
 
-from run_function import run_python_fn, run_untyped_fn 
+from run_function import run_python_fn, run_untyped_fn, warmup 
 
 class jit(object):
   def __init__(self, f):
     self.f = f
     self.fn = f
+    name = getattr(f, '__name__', str(f))
+    module = getattr(f, '__module__', None)
+    if module:
+      name = module + "." + name 
+    self.fn_stats = profiling.fn_stats(name)
     #import ast_conversion 
     #self.untyped = ast_conversion.translate_function_value(f)
 
@@ -19,7 +26,29 @@ class jit(object):
       del kwargs['_backend']
     else:
       backend_name = None
-    return run_python_fn(self.f, args, kwargs, backend = backend_name)
+    stats = self.fn_stats 
+    prev_stats = profiling.enter_call(stats)
+    start = time.time()
+    try:
+      return run_python_fn(self.f, args, kwargs, backend = backend_name)
+    finally:
+      stats.calls += 1
+      stats.total_time += time.time() - start 
+      profiling.exit_call(prev_stats)
+
+  def stats(self):
+    """
+    Counters for all the calls to this function so far, see profiling.FnStats
+    """
+    return self.fn_stats.as_dict()
+
+  def warmup(self, *arg_lists, **kwargs):
+    """
+    Compile this function for each of the given argument lists ahead of time,
+    all in one go (see run_function.warmup)
+    """
+    backend = kwargs.get('_backend')
+    return warmup([(self.f, args) for args in arg_lists], backend = backend)
 
 
 class macro(object):
@@ -2,7 +2,6 @@
 from dsltools.testing_helpers import eq
 from run_function import specialize 
 from ..transforms import Phase, Transform, CloneFunction
-from ..transforms.pipeline import loopify
 
 def transform_name(t):
   assert not isinstance(t, Phase)
@@ -43,13 +42,16 @@ def linearize_phases(typed_fn, phases):
     combined.extend(linearize_phase(typed_fn, phase))
   return combined 
          
-def get_transform_list(typed_fn, last_phase = loopify):
+def get_transform_list(typed_fn, last_phase = None):
+  if last_phase is None:
+    from ..transforms.pipeline import loopify 
+    last_phase = loopify 
   return linearize_phase(typed_fn, last_phase)  
 
 def find_broken_transform(fn, inputs, expected, 
                              print_transforms = True, 
                              print_functions = True, 
-                             last_phase = loopify):
+                             last_phase = None):
   from .. import interp 
   
 
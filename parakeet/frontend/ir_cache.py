@@ -0,0 +1,371 @@
+"""
+Disk cache for the optimized typed IR of each specialization, so that a
+fresh process can skip type inference and the long chain of optimization
+phases for functions it has already seen.
+
+Entries are keyed on:
+  - the function's code, along with the code and values of any Python
+    functions, constants and modules it refers to
+  - the types of its inputs (which includes the types of its nonlocals)
+  - the backend and all of Parakeet's config flags, including those of
+    the C backend
+  - a fingerprint of Parakeet's own source
+
+Names in the IR come from the global counters in names.py, which depend
+on everything else a process happened to translate before. So, when a
+function is written out its name is replaced by one derived from the cache
+key, and when IR is loaded back in all of its local variable names get
+registered with names.py so that later transforms can't create a
+conflicting name.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import types
+
+import numpy as np
+
+from .. import config, names, ndtypes, prims
+from ..ndtypes import (Type, ScalarT, ArrayT, TupleT, SliceT, FnT, ClosureT,
+                       PtrT, TypeValueT, make_array_type, make_tuple_type,
+                       make_slice_type, make_fn_type, make_closure_type)
+from ..ndtypes.ptr_type import ptr_type
+from ..syntax import TypedFn, UntypedFn, is_python_constant
+from ..transforms.phase import Phase
+
+_package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _package_fingerprint(_cache = []):
+  """
+  Any edit to Parakeet (its library functions, transforms, etc..)
+  invalidates the whole cache
+  """
+  if _cache:
+    return _cache[0]
+  h = hashlib.md5()
+  h.update(sys.version)
+  h.update(np.__version__)
+  for (dirpath, dirnames, filenames) in sorted(os.walk(_package_dir)):
+    dirnames.sort()
+    for filename in sorted(filenames):
+      if filename.endswith(".py"):
+        path = os.path.join(dirpath, filename)
+        stat = os.stat(path)
+        h.update("%s:%d:%d;" % (path, stat.st_mtime, stat.st_size))
+  _cache.append(h.hexdigest())
+  return _cache[0]
+
+def _config_fingerprint():
+  from ..c_backend import config as c_config
+  items = []
+  for module in (config, c_config):
+    for (k, v) in sorted(vars(module).iteritems()):
+      if not k.startswith("_") and isinstance(v, (bool, int, long, float, str, type(None))):
+        items.append((module.__name__, k, v))
+  return repr(items)
+
+def _is_parakeet_value(v):
+  module = getattr(v, '__module__', None)
+  return isinstance(module, str) and module.startswith('parakeet')
+
+def _code_names(code, result):
+  result.update(code.co_names)
+  for c in code.co_consts:
+    if isinstance(c, types.CodeType):
+      _code_names(c, result)
+  return result
+
+class SourceHasher(object):
+  """
+  Fingerprint of a Python function along with everything it refers to
+  which gets baked into its untyped representation
+  """
+  def __init__(self):
+    self.h = hashlib.md5()
+    self.visited = set([])
+
+  def update(self, s):
+    self.h.update(s)
+    self.h.update(";")
+
+  def visit_value(self, v, code_names = ()):
+    from decorators import jit, macro
+    if isinstance(v, (jit, macro)):
+      v = v.f
+    if isinstance(v, types.FunctionType):
+      self.visit_fn(v)
+    elif isinstance(v, types.ModuleType):
+      self.update("module:" + v.__name__)
+      # functions pulled out of user modules (i.e. "helpers.f(x)")
+      if not v.__name__.startswith(('numpy', 'parakeet', 'math', '__builtin__')):
+        for name in sorted(code_names):
+          if name in vars(v):
+            self.update(name)
+            self.visit_value(vars(v)[name])
+    elif is_python_constant(v) or isinstance(v, (str, np.dtype)):
+      self.update("const:%r:%s" % (v, type(v)))
+    elif isinstance(v, np.ndarray):
+      self.update("array:%s:%d" % (v.dtype, v.ndim))
+    else:
+      self.update("value:%s" % (type(v),))
+
+  def visit_fn(self, fn):
+    if fn in self.visited:
+      return
+    self.visited.add(fn)
+    if _is_parakeet_value(fn):
+      self.update("parakeet:%s.%s" % (fn.__module__, fn.__name__))
+      return
+    code = fn.func_code
+    self.update(repr((code.co_filename, code.co_firstlineno, code.co_argcount)))
+    self.visit_code(code)
+    if fn.func_defaults:
+      for v in fn.func_defaults:
+        self.visit_value(v)
+    code_names = _code_names(code, set([]))
+    for name in sorted(code_names):
+      if name in fn.func_globals:
+        self.update(name)
+        self.visit_value(fn.func_globals[name], code_names)
+    for (name, cell) in zip(code.co_freevars, fn.func_closure or ()):
+      self.update(name)
+      try:
+        self.visit_value(cell.cell_contents, code_names)
+      except ValueError:
+        # empty cell
+        self.update("empty")
+
+  def visit_code(self, code):
+    self.update(code.co_code)
+    self.update(repr(code.co_names + code.co_varnames))
+    for c in code.co_consts:
+      if isinstance(c, types.CodeType):
+        self.visit_code(c)
+      else:
+        self.update(repr(c))
+
+  def hexdigest(self):
+    return self.h.hexdigest()
+
+_source_fingerprints = {}
+def source_fingerprint(python_fn):
+  if python_fn not in _source_fingerprints:
+    hasher = SourceHasher()
+    hasher.visit_fn(python_fn)
+    _source_fingerprints[python_fn] = hasher.hexdigest()
+  return _source_fingerprints[python_fn]
+
+def cache_key(untyped, arg_types, backend):
+  """
+  Digest identifying a specialization across processes, or None if the
+  function didn't come directly from Python source
+  """
+  import ast_conversion
+  python_fn = ast_conversion.python_function_value(untyped)
+  if python_fn is None:
+    return None
+  linear_types = untyped.args.linearize_without_defaults(arg_types)
+  h = hashlib.md5()
+  for part in (_package_fingerprint(),
+               source_fingerprint(python_fn),
+               repr([str(t) for t in linear_types]),
+               repr(sorted(arg_types.keywords.keys())),
+               backend,
+               _config_fingerprint()):
+    h.update(part)
+    h.update(";")
+  return h.hexdigest()
+
+###########################################################################
+#
+#  Serialization
+#
+###########################################################################
+
+def _named_types(_cache = {}):
+  if not _cache:
+    for (k, v) in vars(ndtypes).iteritems():
+      if isinstance(v, Type) and not isinstance(v, type):
+        _cache.setdefault(id(v), k)
+  return _cache
+
+def _prims_by_name(_cache = {}):
+  if not _cache:
+    for p in prims.prim_lookup_by_value.itervalues():
+      _cache[p.name] = p
+  return _cache
+
+def _phases_by_name(_cache = {}):
+  if not _cache:
+    from ..transforms import pipeline
+    for v in vars(pipeline).itervalues():
+      if isinstance(v, Phase):
+        _cache[str(v)] = v
+  return _cache
+
+class IRPickler(pickle.Pickler):
+  """
+  Types, prims and phases are stored by description rather than by value
+  so that loading them gives back the canonical objects, which the rest
+  of Parakeet compares by identity.
+  """
+  dispatch = pickle.Pickler.dispatch.copy()
+
+  def __init__(self, file, key):
+    pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+    self.key = key
+    self.fn_names = {}
+    self.name_counts = {}
+
+  def stable_name(self, name):
+    if name not in self.fn_names:
+      base = "%s_%s" % (names.original(name).replace(".", "_"), self.key[:8])
+      count = self.name_counts.get(base, 0)
+      self.name_counts[base] = count + 1
+      self.fn_names[name] = base if count == 0 else "%s_%d" % (base, count)
+    return self.fn_names[name]
+
+  def save_typed_fn(self, fn):
+    name = self.stable_name(fn.name)
+    state = fn.__dict__.copy()
+    state['name'] = name
+    self.save_reduce(_new_typed_fn, (name,), state, obj = fn)
+  dispatch[TypedFn] = save_typed_fn
+
+  def persistent_id(self, obj):
+    if isinstance(obj, Type):
+      return self.type_id(obj)
+    elif isinstance(obj, prims.Prim):
+      return ('prim', obj.name)
+    elif isinstance(obj, Phase):
+      return ('phase', str(obj))
+    elif isinstance(obj, UntypedFn):
+      raise pickle.PicklingError("Can't cache IR which refers to untyped function %s" % obj.name)
+    return None
+
+  def type_id(self, t):
+    named = _named_types()
+    if id(t) in named:
+      return ('named_type', named[id(t)])
+    c = t.__class__
+    if c is ArrayT:
+      return ('array', t.elt_type, t.rank)
+    elif c is TupleT:
+      return ('tuple', t.elt_types)
+    elif c is SliceT:
+      return ('slice', t.start_type, t.stop_type, t.step_type)
+    elif c is FnT:
+      return ('fn', t.input_types, t.return_type)
+    elif c is ClosureT:
+      return ('closure', t.fn, t.arg_types)
+    elif c is PtrT:
+      return ('ptr', t.elt_type)
+    elif c is TypeValueT:
+      return ('type_value', t.type)
+    elif isinstance(t, ScalarT):
+      return ('scalar', t.dtype.str)
+    raise pickle.PicklingError("Can't cache IR containing type %s" % (t,))
+
+# functions created while loading, whose names need to be registered
+_loaded_fns = []
+
+def _new_typed_fn(name):
+  fn = TypedFn.__new__(TypedFn)
+  fn.name = name
+  _loaded_fns.append(fn)
+  return fn
+
+def _persistent_load(pid):
+  tag = pid[0]
+  if tag == 'named_type':
+    return getattr(ndtypes, pid[1])
+  elif tag == 'array':
+    return make_array_type(pid[1], pid[2])
+  elif tag == 'tuple':
+    return make_tuple_type(pid[1])
+  elif tag == 'slice':
+    return make_slice_type(pid[1], pid[2], pid[3])
+  elif tag == 'fn':
+    return make_fn_type(pid[1], pid[2])
+  elif tag == 'closure':
+    return make_closure_type(pid[1], pid[2])
+  elif tag == 'ptr':
+    return ptr_type(pid[1])
+  elif tag == 'type_value':
+    return TypeValueT(pid[1])
+  elif tag == 'scalar':
+    return ndtypes.from_dtype(np.dtype(pid[1]))
+  elif tag == 'prim':
+    return _prims_by_name()[pid[1]]
+  elif tag == 'phase':
+    return _phases_by_name()[pid[1]]
+  raise pickle.UnpicklingError("Unknown persistent id %s" % (pid,))
+
+def dumps(fn, key):
+  from cStringIO import StringIO
+  f = StringIO()
+  IRPickler(f, key).dump(fn)
+  return f.getvalue()
+
+def loads(s):
+  from cStringIO import StringIO
+  del _loaded_fns[:]
+  unpickler = pickle.Unpickler(StringIO(s))
+  unpickler.persistent_load = _persistent_load
+  try:
+    fn = unpickler.load()
+    for loaded in _loaded_fns:
+      names.register(loaded.name)
+      for name in loaded.type_env:
+        names.register(name)
+  finally:
+    del _loaded_fns[:]
+  return fn
+
+###########################################################################
+#
+#  Storage
+#
+###########################################################################
+
+def cache_dir():
+  path = config.cache_ir_dir
+  if path is None:
+    path = os.path.join(os.path.expanduser("~"), ".parakeet", "ir_cache")
+  if not os.path.exists(path):
+    os.makedirs(path)
+  return path
+
+# entries which have already been loaded (or stored) by this process
+_memory_cache = {}
+
+def load(key):
+  if key in _memory_cache:
+    return _memory_cache[key]
+  path = os.path.join(cache_dir(), key + ".ir")
+  if not os.path.exists(path):
+    return None
+  try:
+    with open(path, 'rb') as f:
+      fn = loads(f.read())
+  except Exception:
+    # stale or truncated entry, recompute it
+    return None
+  _memory_cache[key] = fn
+  return fn
+
+def store(key, fn):
+  _memory_cache[key] = fn
+  try:
+    s = dumps(fn, key)
+  except (pickle.PicklingError, TypeError, RuntimeError):
+    # some IR (i.e. referring to untyped functions) can't be serialized
+    return
+  dirname = cache_dir()
+  fd, tmp_path = tempfile.mkstemp(dir = dirname, suffix = ".tmp")
+  with os.fdopen(fd, 'wb') as f:
+    f.write(s)
+  os.rename(tmp_path, os.path.join(dirname, key + ".ir"))
@@ -1,9 +1,10 @@
 
 from .. import config, type_inference 
 from ..analysis import contains_loops 
-from ..ndtypes import type_conv, Type 
+from ..compile_lock import compile_lock 
+from ..ndtypes import as_ndarray, type_conv, ArrayT, Type 
+from ..profiling import compile_timer, current_fn_stats
 from ..syntax import UntypedFn, TypedFn, ActualArgs
-from ..transforms import pipeline
 
 def prepare_args(fn, args, kwargs):
   """
@@ -28,6 +29,7 @@ def prepare_args(fn, args, kwargs):
   return arg_values, arg_types
   
 
+@compile_timer('frontend')
 def specialize(untyped, args, kwargs = {}, optimize = True):
   """
   Translate, specialize and begin to optimize the given function for the types
@@ -40,22 +42,32 @@ def specialize(untyped, args, kwargs = {}, optimize = True):
   if not isinstance(untyped, UntypedFn):
     import ast_conversion
     untyped = ast_conversion.translate_function_value(untyped)
-       
-  arg_values, arg_types = prepare_args(untyped, args, kwargs)
   
-  # convert the awkward mix of positional, named, and starargs 
-  # into a positional sequence of arguments
-  linear_args = untyped.args.linearize_without_defaults(arg_values)
-  
-  # propagate types through function representation and all
-  # other functions it calls
-   
-  typed_fn = type_inference.specialize(untyped, arg_types)
-  if optimize: 
-    from .. transforms.pipeline import normalize 
-    # apply high level optimizations 
-    typed_fn = normalize.apply(typed_fn)
-  return typed_fn, linear_args 
+  with compile_lock:     
+    arg_values, arg_types = prepare_args(untyped, args, kwargs)
+    
+    # convert the awkward mix of positional, named, and starargs 
+    # into a positional sequence of arguments
+    linear_args = untyped.args.linearize_without_defaults(arg_values)
+    
+    # propagate types through function representation and all
+    # other functions it calls
+     
+    typed_fn = type_inference.specialize(untyped, arg_types)
+    if optimize: 
+      from .. transforms.pipeline import normalize 
+      # apply high level optimizations 
+      typed_fn = normalize.apply(typed_fn)
+    return typed_fn, linear_args 
+
+def array_args(fn, args):
+  """
+  The compiled backends convert their array arguments themselves, 
+  but the interpreter and NumPy backend need actual ndarrays, 
+  without the overloaded semantics of subclasses like np.matrix 
+  """
+  return [as_ndarray(arg, subok = False) if isinstance(t, ArrayT) else arg 
+          for (arg, t) in zip(args, fn.input_types)]
 
 def run_typed_fn(fn, args, backend = None):
   
@@ -69,6 +81,12 @@ def run_typed_fn(fn, args, backend = None):
   
   if backend is None:
     backend = config.backend
+  
+  stats = current_fn_stats()
+  if stats is not None:
+    # typed functions stay alive in the specialization cache, so their ids
+    # are stable 
+    stats.record_dispatch((id(fn), backend))
     
   if backend == 'c':
     from .. import c_backend
@@ -83,37 +101,118 @@ def run_typed_fn(fn, args, backend = None):
     return cuda_backend.run(fn, args)
   
   elif backend == 'llvm':
-    from ..llvm_backend.llvm_context import global_context
-    from ..llvm_backend import generic_value_to_python 
-    from ..llvm_backend import ctypes_to_generic_value, compile_fn 
-    lowered_fn = pipeline.lowering.apply(fn)
-    llvm_fn = compile_fn(lowered_fn).llvm_fn
-
-    ctypes_inputs = [t.from_python(v) 
-                   for (v,t) 
-                   in zip(args, expected_types)]
-    gv_inputs = [ctypes_to_generic_value(cv, t) 
-                 for (cv,t) 
-                 in zip(ctypes_inputs, expected_types)]
-    exec_engine = global_context.exec_engine
-    gv_return = exec_engine.run_function(llvm_fn, gv_inputs)
-    return generic_value_to_python(gv_return, fn.return_type)
+    from .. import llvm_backend 
+    return llvm_backend.run(fn, args)
+
+  elif backend == 'multiprocess':
+    from .. import multiprocess_backend 
+    return multiprocess_backend.run(fn, args)
+
+  elif backend == 'stream':
+    from .. import stream_backend 
+    return stream_backend.run(fn, args)
+
+  elif backend == 'numpy':
+    from .. import numpy_backend
+    return numpy_backend.run(fn, array_args(fn, args))
 
   elif backend == "interp":
     from .. import interp 
-    fn = pipeline.loopify(fn)
+    from ..transforms import pipeline 
+    with compile_lock:
+      fn = pipeline.loopify(fn)
+      if config.interp_compile_closures:
+        compiled = interp.compile_fn(fn)
+    args = array_args(fn, args)
+    if config.interp_compile_closures:
+      return compiled(args)
     return interp.eval_fn(fn, args)
   
   else:
     assert False, "Unknown backend %s" % backend 
 
+def optimize_for_backend(fn, backend):
+  """
+  Run the optimization phases which the given backend would apply
+  before preparing its arguments
+  """
+  from ..transforms import pipeline 
+  if backend == 'c' or backend == 'openmp':
+    from ..c_backend import config as c_config
+    from ..c_backend.run_function import optimize_with 
+    first_phase = pipeline.loopify if backend == 'c' else pipeline.after_indexify
+    return optimize_with(fn, first_phase, c_config)
+  elif backend == 'interp':
+    return pipeline.loopify(fn)
+  elif backend == 'numpy':
+    return pipeline.high_level_optimizations(fn)
+  else:
+    return fn 
+
+@compile_timer('frontend')
+def specialize_cached(untyped, args, kwargs, backend):
+  """
+  Like specialize but also runs the backend's optimizations, and keeps the
+  resulting IR in the on-disk cache 
+  """
+  import ir_cache
+  with compile_lock:
+    arg_values, arg_types = prepare_args(untyped, args, kwargs)
+    linear_args = untyped.args.linearize_without_defaults(arg_values)
+    key = ir_cache.cache_key(untyped, arg_types, backend)
+    if key is not None:
+      typed_fn = ir_cache.load(key)
+      if typed_fn is not None:
+        return typed_fn, linear_args
+    typed_fn, linear_args = specialize(untyped, args, kwargs)
+    typed_fn = optimize_for_backend(typed_fn, backend)
+    if key is not None:
+      ir_cache.store(key, typed_fn)
+    return typed_fn, linear_args 
+  
 def run_untyped_fn(fn, args, kwargs = None, backend = None):
   assert isinstance(fn, UntypedFn)
   if kwargs is None:
     kwargs = {}
-  typed_fn, linear_args = specialize(fn, args, kwargs)
+  if config.cache_ir:
+    if backend is None:
+      backend = config.backend
+    typed_fn, linear_args = specialize_cached(fn, args, kwargs, backend)
+  else:
+    typed_fn, linear_args = specialize(fn, args, kwargs)
   return run_typed_fn(typed_fn, linear_args, backend)
 
+def warmup(calls, backend = None):
+  """
+  Specialize and compile ahead of time for a list of (python function, args)
+  or (python function, args, kwargs) calls, without running them. The C and 
+  OpenMP backends build all the entry points as a single extension module.
+  Returns the number of specializations.  
+  """
+  if backend is None:
+    backend = config.backend
+  import ast_conversion
+  typed_calls = []
+  for call in calls:
+    fn, args = call[0], call[1]
+    kwargs = call[2] if len(call) > 2 else {}
+    untyped = ast_conversion.translate_function_value(fn)
+    if config.cache_ir:
+      typed_fn, linear_args = specialize_cached(untyped, args, kwargs, backend)
+    else:
+      typed_fn, linear_args = specialize(untyped, args, kwargs)
+    typed_calls.append((typed_fn, linear_args))
+  
+  if backend == 'c':
+    from .. import c_backend
+    c_backend.compile_batch(typed_calls)
+  elif backend == 'openmp':
+    from .. import openmp_backend 
+    openmp_backend.compile_batch(typed_calls)
+  # the other backends don't have a separate compile step worth batching,
+  # but they still get to skip type specialization later 
+  return len(typed_calls)
+
 def run_python_ast(fn_name, fn_args, fn_body, globals_dict, 
                      arg_values, kwarg_values = None, backend = None):
   """
@@ -3,7 +3,7 @@ import types
 
 
 from ..syntax import UntypedFn, TypedFn 
-from ..ndtypes import (type_conv, scalar_types, 
+from ..ndtypes import (type_conv, scalar_types, as_ndarray, is_array_like, 
                        make_array_type, ArrayT, 
                        make_tuple_type, TupleT, 
                        make_closure_type, ClosureT, 
@@ -28,12 +28,15 @@ def typeof_tuple(python_tuple):
 type_conv.register(types.TupleType, TupleT, typeof_tuple)
 
 def typeof_array(x):
-  x = np.asarray(x)
+  x = as_ndarray(x, copy_lists = False)
   elt_t = scalar_types.from_dtype(x.dtype)
   rank = len(x.shape)
   return make_array_type(elt_t, rank)
 
+# subclasses like np.memmap find this through their base class 
 type_conv.register(np.ndarray, ArrayT, typeof_array)
+# anything else with the array interface or the buffer protocol 
+type_conv.register_fallback(is_array_like, typeof_array)
 
 from .. import prims 
 type_conv.register((list, xrange), ArrayT, typeof_array)
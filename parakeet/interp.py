@@ -3,6 +3,7 @@ import numpy as np
 import types
 
 
+from compile_lock import compile_lock
 from frontend import ast_conversion
 from ndtypes import ScalarT, StructT,  type_conv     
 from syntax import (Expr, Var, Tuple, 
@@ -154,9 +155,14 @@ def eval_fn(fn, actuals):
         print "offset", offset 
         print "itemsize", bytes_per_elt
         
+      # empty views (i.e. border strips of a small array) may start
+      # past the end of their buffer, which NumPy refuses to construct
+      if any(d == 0 for d in shape):
+        return np.empty(shape, dtype = dtype)
+
       if isinstance(data, np.ndarray):
-        data = data.data 
- 
+        data = data.data
+
       return np.ndarray(shape = shape, 
                         offset = offset * bytes_per_elt, 
                         buffer = data, 
@@ -522,3 +528,495 @@ def run_python_fn(python_fn, args, kwds):
   all_positional = global_args + list(args)
   actuals = args.FormalArgs(all_positional, kwds)
   return eval_fn(untyped, actuals)
+
+
+###########################################################################
+#
+#  Closure compilation
+#
+#  eval_fn walks the syntax tree on every evaluation and re-creates its
+#  dispatch table for every expression it visits. For repeated calls (and
+#  especially for loops) it's much cheaper to translate each TypedFn once
+#  into a tree of nested Python closures which read and write variables in
+#  a flat list of slots.
+#
+###########################################################################
+
+class UnsupportedNode(Exception):
+  """
+  Raised when the closure compiler doesn't know how to translate a node,
+  in which case we fall back on the tree-walking evaluator
+  """
+  def __init__(self, node):
+    self.node = node
+
+  def __str__(self):
+    return "Closure compiler doesn't support %s" % (self.node.__class__.__name__,)
+
+class CompiledFn(object):
+  def __init__(self, fn, n_slots, arg_slots, body):
+    self.fn = fn
+    self.n_slots = n_slots
+    self.arg_slots = arg_slots
+    self.body = body
+
+  def __call__(self, actuals):
+    env = [None] * self.n_slots
+    for (slot, v) in zip(self.arg_slots, actuals):
+      env[slot] = v
+    result = self.body(env)
+    if result is not None:
+      return result[0]
+
+def _strides(numpy_array):
+  itemsize = numpy_array.dtype.itemsize
+  return tuple(stride / itemsize for stride in numpy_array.strides)
+
+def _ravel(x):
+  return np.ravel(x)
+
+def call_value(f, args):
+  """
+  Call a runtime function value, using the compiled representation of any
+  TypedFn it wraps
+  """
+  c = f.__class__
+  if c is ClosureVal:
+    fn = f.fn
+    if fn.__class__ is TypedFn:
+      return compile_fn(fn)(f.fixed_args + tuple(args))
+    return f(args)
+  elif c is TypedFn:
+    return compile_fn(f)(args)
+  return eval_fn(f, args)
+
+class ClosureCompiler(object):
+  def __init__(self):
+    self.slots = {}
+
+  def slot(self, name):
+    if name not in self.slots:
+      self.slots[name] = len(self.slots)
+    return self.slots[name]
+
+  def compile_callee(self, fn):
+    """
+    Compiled representation used when this compiler's code calls another
+    TypedFn. Subclasses override this to keep callees in the same backend.
+    """
+    return compile_fn(fn)
+
+  def call_value(self, f, args):
+    c = f.__class__
+    if c is ClosureVal and f.fn.__class__ is TypedFn:
+      return self.compile_callee(f.fn)(f.fixed_args + tuple(args))
+    elif c is TypedFn:
+      return self.compile_callee(f)(args)
+    return call_value(f, args)
+
+  def compile_exprs(self, exprs):
+    return tuple(self.compile_expr(e) for e in exprs)
+
+  def compile_expr(self, expr):
+    if hasattr(expr, 'wrapper'):
+      expr = expr.wrapper
+    method = getattr(self, "expr_" + expr.__class__.__name__, None)
+    if method is None:
+      raise UnsupportedNode(expr)
+    return method(expr)
+
+  def expr_Const(self, expr):
+    value = expr.value
+    if isinstance(value, types.FunctionType):
+      fundef = ast_conversion.translate_function_value(value)
+      value = ClosureVal(fundef, fundef.python_nonlocals())
+    return lambda env: value
+
+  def expr_Var(self, expr):
+    i = self.slot(expr.name)
+    return lambda env: env[i]
+
+  def expr_Strides(self, expr):
+    array = self.compile_expr(expr.array)
+    return lambda env: _strides(array(env))
+
+  def expr_Attribute(self, expr):
+    value = self.compile_expr(expr.value)
+    name = expr.name
+    if name == 'offset':
+      def offset(env):
+        x = value(env)
+        if x.base is None:
+          return 0
+        return (x.ctypes.data - x.base.ctypes.data) / x.dtype.itemsize
+      return offset
+    elif name == 'data':
+      return lambda env: _ravel(value(env))
+    elif name == 'strides':
+      return lambda env: _strides(value(env))
+    elif name == 'step':
+      def step(env):
+        s = getattr(value(env), 'step', 1)
+        return 1 if s is None else s
+      return step
+    if name.startswith('elt') and name[3:].isdigit():
+      field = int(name[3:])
+    elif name.isdigit():
+      field = int(name)
+    else:
+      return lambda env: getattr(value(env), name)
+    def attr(env):
+      x = value(env)
+      if isinstance(x, tuple):
+        return x[field]
+      return getattr(x, name)
+    return attr
+
+  def expr_Alloc(self, expr):
+    count = self.compile_expr(expr.count)
+    dtype = expr.elt_type.dtype
+    return lambda env: np.empty(shape = (count(env),), dtype = dtype)
+
+  def expr_AllocArray(self, expr):
+    shape = self.compile_expr(expr.shape)
+    assert isinstance(expr.elt_type, ScalarT), \
+      "Expected scalar element type for AllocArray, got %s" % (expr.elt_type,)
+    dtype = expr.elt_type.dtype
+    return lambda env: np.ndarray(shape = shape(env), dtype = dtype)
+
+  def expr_ArrayView(self, expr):
+    data = self.compile_expr(expr.data)
+    shape = self.compile_expr(expr.shape)
+    strides = self.compile_expr(expr.strides)
+    offset = self.compile_expr(expr.offset)
+    dtype = np.dtype(expr.type.elt_type.dtype)
+    itemsize = dtype.itemsize
+    def array_view(env):
+      s = shape(env)
+      if any(d == 0 for d in s):
+        return np.empty(s, dtype = dtype)
+      buf = data(env)
+      if isinstance(buf, np.ndarray):
+        buf = buf.data
+      return np.ndarray(shape = s,
+                        offset = offset(env) * itemsize,
+                        buffer = buf,
+                        strides = tuple(si * itemsize for si in strides(env)),
+                        dtype = dtype)
+    return array_view
+
+  def expr_Array(self, expr):
+    elts = self.compile_exprs(expr.elts)
+    return lambda env: np.array([elt(env) for elt in elts])
+
+  def expr_ConstArray(self, expr):
+    shape = self.compile_expr(expr.shape)
+    value = self.compile_expr(expr.value)
+    dtype = expr.value.type.dtype
+    return lambda env: np.ones(shape(env), dtype = dtype) * value(env)
+
+  def expr_ConstArrayLike(self, expr):
+    array = self.compile_expr(expr.array)
+    value = self.compile_expr(expr.value)
+    dtype = expr.value.type.elt_type.dtype
+    return lambda env: np.ones_like(array(env), dtype = dtype) * value(env)
+
+  def expr_TypeValue(self, expr):
+    t = expr.type_value
+    assert isinstance(t, ScalarT), \
+      "Parakeet only supports scalar types as values, not %s" % expr
+    dtype = t.dtype
+    return lambda env: dtype
+
+  def expr_Shape(self, expr):
+    array = self.compile_expr(expr.array)
+    return lambda env: np.shape(array(env))
+
+  def expr_Reshape(self, expr):
+    array = self.compile_expr(expr.array)
+    shape = self.compile_expr(expr.shape)
+    return lambda env: array(env).reshape(shape(env))
+
+  def expr_Index(self, expr):
+    array = self.compile_expr(expr.value)
+    index = self.compile_expr(expr.index)
+    return lambda env: array(env)[index(env)]
+
+  def expr_PrimCall(self, expr):
+    f = expr.prim.fn
+    args = self.compile_exprs(expr.args)
+    if len(args) == 1:
+      x, = args
+      return lambda env: f(x(env))
+    elif len(args) == 2:
+      x, y = args
+      return lambda env: f(x(env), y(env))
+    return lambda env: f(*[arg(env) for arg in args])
+
+  def expr_Slice(self, expr):
+    start = self.compile_expr(expr.start)
+    stop = self.compile_expr(expr.stop)
+    step = self.compile_expr(expr.step)
+    return lambda env: slice(start(env), stop(env), step(env))
+
+  def expr_Call(self, expr):
+    args = self.compile_exprs(expr.args)
+    if expr.fn.__class__ is TypedFn:
+      # direct calls can skip looking up the callee at runtime
+      callee = expr.fn
+      compile_callee = self.compile_callee
+      cell = []
+      def direct_call(env):
+        if not cell:
+          cell.append(compile_callee(callee))
+        return cell[0]([arg(env) for arg in args])
+      return direct_call
+    fn = self.compile_expr(expr.fn)
+    call = self.call_value
+    return lambda env: call(fn(env), [arg(env) for arg in args])
+
+  def expr_Closure(self, expr):
+    if isinstance(expr.fn, (UntypedFn, TypedFn)):
+      fundef = expr.fn
+    else:
+      assert isinstance(expr.fn, str)
+      fundef = UntypedFn.registry[expr.fn]
+    args = self.compile_exprs(expr.args)
+    return lambda env: ClosureVal(fundef, [arg(env) for arg in args])
+
+  def expr_UntypedFn(self, expr):
+    return lambda env: ClosureVal(expr, [])
+
+  def expr_TypedFn(self, expr):
+    return lambda env: ClosureVal(expr, [])
+
+  def expr_Cast(self, expr):
+    t = expr.type
+    assert isinstance(t, ScalarT)
+    convert = t.dtype.type
+    value = self.compile_expr(expr.value)
+    return lambda env: convert(value(env))
+
+  def expr_Select(self, expr):
+    cond = self.compile_expr(expr.cond)
+    true_value = self.compile_expr(expr.true_value)
+    false_value = self.compile_expr(expr.false_value)
+    return lambda env: true_value(env) if cond(env) else false_value(env)
+
+  def expr_Struct(self, expr):
+    assert isinstance(expr.type, StructT), \
+      "Expected %s : %s to be a struct" % (expr, expr.type)
+    ctor = expr.type.ctypes_repr
+    args = self.compile_exprs(expr.args)
+    return lambda env: ctor(*[arg(env) for arg in args])
+
+  def expr_Tuple(self, expr):
+    elts = self.compile_exprs(expr.elts)
+    if len(elts) == 2:
+      x, y = elts
+      return lambda env: (x(env), y(env))
+    return lambda env: tuple([elt(env) for elt in elts])
+
+  def expr_TupleProj(self, expr):
+    tup = self.compile_expr(expr.tuple)
+    index = expr.index
+    return lambda env: tup(env)[index]
+
+  def expr_ClosureElt(self, expr):
+    clos = self.compile_expr(expr.closure)
+    index = expr.index
+    return lambda env: clos(env).fixed_args[index]
+
+  def expr_Range(self, expr):
+    start = self.compile_expr(expr.start)
+    stop = self.compile_expr(expr.stop)
+    step = self.compile_expr(expr.step)
+    return lambda env: np.arange(start(env), stop(env), step(env))
+
+  def expr_Len(self, expr):
+    value = self.compile_expr(expr.value)
+    return lambda env: len(value(env))
+
+  def compile_merge(self, phi_nodes, left = True):
+    pairs = tuple((self.slot(name), self.compile_expr(values[0] if left else values[1]))
+                  for (name, values) in phi_nodes.iteritems())
+    if len(pairs) == 0:
+      return None
+    def merge(env):
+      # evaluate all the incoming values before assigning any of them
+      values = [value(env) for (_, value) in pairs]
+      for ((i, _), v) in zip(pairs, values):
+        env[i] = v
+    return merge
+
+  def compile_lhs(self, lhs):
+    """
+    Returns a function which takes an environment and a value to store
+    """
+    if lhs.__class__ is Var:
+      i = self.slot(lhs.name)
+      def assign_var(env, v):
+        env[i] = v
+      return assign_var
+    elif lhs.__class__ is Tuple:
+      elts = tuple(self.compile_lhs(elt) for elt in lhs.elts)
+      def assign_tuple(env, v):
+        for (elt, elt_value) in zip(elts, v):
+          elt(env, elt_value)
+      return assign_tuple
+    elif lhs.__class__ is Index:
+      array = self.compile_expr(lhs.value)
+      index = self.compile_expr(lhs.index)
+      def assign_index(env, v):
+        array(env)[index(env)] = v
+      return assign_index
+    raise UnsupportedNode(lhs)
+
+  def stmt_Return(self, stmt):
+    value = self.compile_expr(stmt.value)
+    return lambda env: (value(env),)
+
+  def stmt_Assign(self, stmt):
+    rhs = self.compile_expr(stmt.rhs)
+    if stmt.lhs.__class__ is Var:
+      i = self.slot(stmt.lhs.name)
+      def assign_var(env):
+        env[i] = rhs(env)
+      return assign_var
+    lhs = self.compile_lhs(stmt.lhs)
+    def assign(env):
+      lhs(env, rhs(env))
+    return assign
+
+  def stmt_ExprStmt(self, stmt):
+    value = self.compile_expr(stmt.value)
+    def run(env):
+      value(env)
+    return run
+
+  def stmt_Comment(self, stmt):
+    return None
+
+  def stmt_If(self, stmt):
+    cond = self.compile_expr(stmt.cond)
+    true = self.compile_block(stmt.true)
+    false = self.compile_block(stmt.false)
+    merge_left = self.compile_merge(stmt.merge, left = True)
+    merge_right = self.compile_merge(stmt.merge, left = False)
+    def run_if(env):
+      if cond(env):
+        result = true(env)
+        if result is not None: return result
+        if merge_left: merge_left(env)
+      else:
+        result = false(env)
+        if result is not None: return result
+        if merge_right: merge_right(env)
+    return run_if
+
+  def stmt_While(self, stmt):
+    cond = self.compile_expr(stmt.cond)
+    body = self.compile_block(stmt.body)
+    merge_left = self.compile_merge(stmt.merge, left = True)
+    merge_right = self.compile_merge(stmt.merge, left = False)
+    def run_while(env):
+      if merge_left: merge_left(env)
+      while cond(env):
+        result = body(env)
+        if result is not None: return result
+        if merge_right: merge_right(env)
+    return run_while
+
+  def stmt_ForLoop(self, stmt):
+    i = self.slot(stmt.var.name)
+    start = self.compile_expr(stmt.start)
+    stop = self.compile_expr(stmt.stop)
+    step = self.compile_expr(stmt.step)
+    body = self.compile_block(stmt.body)
+    merge_left = self.compile_merge(stmt.merge, left = True)
+    merge_right = self.compile_merge(stmt.merge, left = False)
+    def run_for(env):
+      lower, upper, incr = start(env), stop(env), step(env)
+      if merge_left: merge_left(env)
+      for idx in xrange(lower, upper, incr):
+        env[i] = idx
+        result = body(env)
+        if result is not None: return result
+        if merge_right: merge_right(env)
+    return run_for
+
+  def stmt_ParFor(self, stmt):
+    fn = self.compile_expr(stmt.fn)
+    bounds = self.compile_expr(stmt.bounds)
+    call_value = self.call_value
+    def run_parfor(env):
+      f = fn(env)
+      b = bounds(env)
+      if isinstance(b, (list, tuple)) and len(b) == 1:
+        b = b[0]
+      if isinstance(b, (int, long, np.integer)):
+        for idx in xrange(b):
+          call_value(f, (idx,))
+      else:
+        for idx in np.ndindex(b):
+          call_value(f, (idx,))
+    return run_parfor
+
+  def compile_stmt(self, stmt):
+    method = getattr(self, "stmt_" + stmt.__class__.__name__, None)
+    if method is None:
+      raise UnsupportedNode(stmt)
+    return method(stmt)
+
+  def compile_block(self, stmts):
+    compiled = [self.compile_stmt(stmt) for stmt in stmts]
+    compiled = tuple(s for s in compiled if s is not None)
+    if len(compiled) == 1:
+      return compiled[0]
+    def run_block(env):
+      for s in compiled:
+        result = s(env)
+        if result is not None:
+          return result
+    return run_block
+
+  def compile_fn(self, fn):
+    arg_slots = [self.slot(name) for name in fn.arg_names]
+    body = self.compile_block(fn.body)
+    return CompiledFn(fn, len(self.slots), arg_slots, body)
+
+class TreeWalkingFn(object):
+  """
+  Stand-in for a compiled function whose body contains constructs the
+  closure compiler doesn't support
+  """
+  def __init__(self, fn):
+    self.fn = fn
+
+  def __call__(self, actuals):
+    return eval_fn(self.fn, actuals)
+
+_compiled_fns = {}
+def compile_fn(fn):
+  """
+  Translate a (loopified) TypedFn into nested Python closures, cached by
+  the function's cache key
+  """
+  key = fn.cache_key
+  if key in _compiled_fns:
+    return _compiled_fns[key]
+  # functions called from the one being run get compiled lazily, while other 
+  # threads might be optimizing them 
+  with compile_lock:
+    if key in _compiled_fns:
+      return _compiled_fns[key]
+    try:
+      compiled = ClosureCompiler().compile_fn(fn)
+    except UnsupportedNode:
+      compiled = TreeWalkingFn(fn)
+    _compiled_fns[key] = compiled
+  return compiled
+
+def run_compiled(fn, actuals):
+  assert isinstance(fn, TypedFn), "Can only compile typed functions, got %s" % (fn,)
+  return compile_fn(fn)(actuals)
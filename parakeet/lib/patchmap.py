@@ -1,36 +1,118 @@
-import numpy as np 
-from .. frontend import jit 
-from adverbs import imap 
+import numpy as np
+from .. frontend import jit
+from adverbs import imap
 
 @jit
-def pmap1(f, x, w = 3):
+def stencil1(f, x, w = 3):
+  """
+  Window-map over a 1D array, split into an interior region where every
+  window has the same constant size (no clamping) and a thin peeled border
+  where windows get clipped to the array bounds
+  """
   n = x.shape[0]
-  def local_apply(i):
-    lower = __builtins__.max(i-w/2, 0)
-    upper = __builtins__.min(i+w/2+1, n)
-    elts = x[lower:upper]
-    return f(elts)
-  return imap(local_apply, n)
+  h = w / 2
+  k = 2 * h + 1
 
-@jit  
-def pmap2(f, x, width = (3,3)):
+  def border_apply(i):
+    lower = __builtins__.max(i-h, 0)
+    upper = __builtins__.min(i+h+1, n)
+    return f(x[lower:upper])
+
+  left_stop = __builtins__.min(h, n)
+  right_start = __builtins__.max(n - h, left_stop)
+  n_inner = right_start - left_stop
+
+  def interior_apply(i):
+    return f(x[i:i+k])
+  inner = imap(interior_apply, n_inner)
+
+  # f might return arrays, whose shape comes along with the interior's 
+  # (even when it's empty, since its allocation only infers the shape)
+  result = np.empty((n,) + inner.shape[1:], dtype = inner.dtype)
+  result[left_stop:right_start] = inner
+
+  def left_apply(i):
+    return border_apply(i)
+  result[:left_stop] = imap(left_apply, left_stop)
+
+  def right_apply(i):
+    return border_apply(i + right_start)
+  result[right_start:] = imap(right_apply, n - right_start)
+  return result
+
+@jit
+def stencil2(f, x, width = (3,3)):
   """
-  Patch-map where the function can accept both interior windows
-  and smaller border windows
+  Window-map over a 2D array which splits the domain into an interior region,
+  where every window has the same constant shape and is taken without any
+  bounds arithmetic, and four thin peeled border strips where windows get
+  clipped to the array bounds.
+
+  The interior is a single IndexMap, so it gets parallelized like any
+  other map (i.e. by the OpenMP backend).
   """
-  width_x, width_y = width 
+  width_x, width_y = width
   n_rows, n_cols = x.shape
   hx = width_x / 2
   hy = width_y / 2
-  
-  def local_apply((i,j)):
+  kx = 2 * hx + 1
+  ky = 2 * hy + 1
+
+  def border_apply((i,j)):
     lx = __builtins__.max(i-hx, 0)
     ux = __builtins__.min(i+hx+1, n_rows)
     ly = __builtins__.max(j-hy, 0)
     uy = __builtins__.min(j+hy+1, n_cols)
     return f(x[lx:ux, ly:uy])
-    
-  return imap(local_apply, x.shape)
+
+  top_stop = __builtins__.min(hx, n_rows)
+  bottom_start = __builtins__.max(n_rows - hx, top_stop)
+  left_stop = __builtins__.min(hy, n_cols)
+  right_start = __builtins__.max(n_cols - hy, left_stop)
+  n_inner_rows = bottom_start - top_stop
+  n_inner_cols = right_start - left_stop
+
+  # window (i,j) of the interior is centered on (i+hx, j+hy)
+  def interior_apply((i,j)):
+    return f(x[i:i+kx, j:j+ky])
+  inner = imap(interior_apply, (n_inner_rows, n_inner_cols))
+
+  # f might return arrays, whose shape comes along with the interior's 
+  # (even when it's empty, since its allocation only infers the shape)
+  result = np.empty((n_rows, n_cols) + inner.shape[2:], dtype = inner.dtype)
+  result[top_stop:bottom_start, left_stop:right_start] = inner
+
+  # full-width strips along the top and bottom
+  def top_apply((i,j)):
+    return border_apply((i,j))
+  result[:top_stop, :] = imap(top_apply, (top_stop, n_cols))
+
+  def bottom_apply((i,j)):
+    return border_apply((i + bottom_start, j))
+  result[bottom_start:, :] = imap(bottom_apply, (n_rows - bottom_start, n_cols))
+
+  # left and right strips only span the interior rows
+  def left_apply((i,j)):
+    return border_apply((i + top_stop, j))
+  result[top_stop:bottom_start, :left_stop] = imap(left_apply, (n_inner_rows, left_stop))
+
+  def right_apply((i,j)):
+    return border_apply((i + top_stop, j + right_start))
+  result[top_stop:bottom_start, right_start:] = \
+    imap(right_apply, (n_inner_rows, n_cols - right_start))
+  return result
+
+@jit
+def pmap1(f, x, w = 3):
+  return stencil1(f, x, w)
+
+@jit
+def pmap2(f, x, width = (3,3)):
+  """
+  Patch-map where the function can accept both interior windows
+  and smaller border windows
+  """
+  return stencil2(f, x, width)
     
 @jit  
 def pmap2_trim(f, x, width = (3,3), step = (1,1)):
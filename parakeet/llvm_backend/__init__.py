@@ -1,5 +1,2 @@
-from compiler import compile_fn
-from gv_helpers import ctypes_to_generic_value, generic_value_to_python, python_to_generic_value 
-from llvm_context import global_context 
-
-import llvm_context
\ No newline at end of file
+from llvm_context import global_context
+from run_function import compile_entry, run
@@ -1,54 +1,163 @@
+import llvmlite.ir as ir
 
-import llvm.core as llc 
-from llvm.core import Builder, ATTR_NO_CAPTURE #, Module 
-from llvm.core import Type as lltype
+from .. import config, prims, syntax
+from .. analysis.syntax_visitor import SyntaxVisitor
+from .. ndtypes import (BoolT, FloatT, SignedT, UnsignedT, ScalarT, NoneT, StructT,
+                        TupleT, ClosureT, PtrT, Float64, Int64, Bool,
+                        combine_type_list)
+from .. syntax import Var, Struct, Index, TypedFn, Attribute, Closure
 
-from .. import config, prims, syntax 
-from .. analysis import may_escape
-from .. ndtypes import BoolT, FloatT, SignedT, UnsignedT, ScalarT, NoneT, Float64
-from .. ndtypes import Int32, Int64, PtrT, Bool 
-from .. syntax import Var, Struct, Index, TypedFn, Attribute 
-
-import llvm_config 
-import llvm_context
+import llvm_config
 import llvm_convert
 import llvm_types
 import llvm_prims
-from llvm_helpers import const, int32, zero 
-from llvm_types import llvm_value_type, llvm_ref_type
-from parakeet.llvm_backend.llvm_convert import to_bit, from_bit
-
+import runtime
+from llvm_convert import to_bit, from_bit
+from llvm_helpers import const, int32, int64, zero
+from llvm_types import llvm_value_type, llvm_ref_type, arena_t, int64_t, ptr_int8_t
+
+class LocalStructs(SyntaxVisitor):
+  """
+  Find the structures which only ever get read field by field, so they can't
+  outlive the function and can live on its stack rather than the heap
+  """
+
+  def visit_fn(self, fn):
+    self.candidates = set([])
+    self.escaped = set([])
+    self.visit_block(fn.body)
+    return self.candidates.difference(self.escaped)
+
+  def visit_Assign(self, stmt):
+    if stmt.lhs.__class__ is Var:
+      if stmt.rhs.__class__ is Struct:
+        self.candidates.add(stmt.lhs.name)
+    else:
+      self.visit_lhs(stmt.lhs)
+    self.visit_expr(stmt.rhs)
+
+  def visit_Var(self, expr):
+    self.escaped.add(expr.name)
+
+  def visit_Attribute(self, expr):
+    if expr.value.__class__ is not Var:
+      self.visit_expr(expr.value)
+
+  def visit_merge_loop_start(self, phi_nodes):
+    self.visit_merge(phi_nodes)
+
+def fn_and_closure_args(fn_expr):
+  """
+  The function called by a Call or ParFor and an expression for each of
+  its closure arguments
+  """
+  if fn_expr.__class__ is TypedFn:
+    return fn_expr, []
+  elif fn_expr.__class__ is Closure:
+    return fn_expr.fn, list(fn_expr.args)
+  else:
+    closure_t = fn_expr.type
+    assert closure_t.__class__ is ClosureT, \
+      "Expected function or closure, got %s : %s" % (fn_expr, closure_t)
+    args = [Attribute(fn_expr, field_name, type = field_t)
+            for (field_name, field_t) in closure_t._fields_]
+    return closure_t.fn, args
+
+class ModuleCompiler(object):
+  """
+  Collects an entry function along with everything it calls into one
+  LLVM module, compiling each function at most once
+  """
+
+  def __init__(self, name):
+    self.module = ir.Module(name = name)
+    self.functions = {}
+    self.n_workers = 0
+
+    alloc_t = ir.FunctionType(ptr_int8_t, [arena_t, int64_t])
+    self.alloc_fn = ir.Function(self.module, alloc_t, runtime.alloc_name)
+    self.alloc_fn.attributes.add('nounwind')
+    self.alloc_fn.return_value.add_attribute('noalias')
+
+    self.worker_t = ir.FunctionType(ir.VoidType(), [ptr_int8_t, int64_t, int64_t])
+    parallel_for_t = ir.FunctionType(ir.VoidType(),
+                                     [self.worker_t.as_pointer(), ptr_int8_t, int64_t, int64_t])
+    self.parallel_for_fn = ir.Function(self.module, parallel_for_t, runtime.parallel_for_name)
+    self.parallel_for_fn.attributes.add('nounwind')
+
+  def declare(self, fundef, entry = False):
+    llvm_input_types = [arena_t] + [llvm_ref_type(t) for t in fundef.input_types]
+    llvm_output_type = llvm_ref_type(fundef.return_type)
+    llvm_fn_t = ir.FunctionType(llvm_output_type, llvm_input_types)
+    # every module goes into the same execution engine, so entry points
+    # need names which are unique across modules
+    name = self.module.name if entry else fundef.name
+    llvm_fn = ir.Function(self.module, llvm_fn_t, name)
+    if not entry:
+      # lets LLVM inline it and throw away the original
+      llvm_fn.linkage = 'internal'
+    llvm_fn.attributes.add('nounwind')
+    return llvm_fn
+
+  def compile_fn(self, fundef, entry = False):
+    key = fundef.cache_key
+    if key in self.functions:
+      return self.functions[key]
+    llvm_fn = self.declare(fundef, entry)
+    # register before compiling the body, for recursive functions
+    self.functions[key] = llvm_fn
+    if config.print_lowered_function:
+      print
+      print "=== Lowered function ==="
+      print
+      print repr(fundef)
+      print
+    compiler = Compiler(fundef, llvm_fn, self, parallel = entry)
+    compiler.compile_body(fundef.body)
+    return llvm_fn
+
+  def new_worker_fn(self, name):
+    self.n_workers += 1
+    worker = ir.Function(self.module, self.worker_t,
+                         "%s_worker%d" % (name, self.n_workers))
+    worker.linkage = 'internal'
+    worker.attributes.add('nounwind')
+    return worker
+
+def lowered(fn):
+  from ..transforms.pipeline import lowering
+  return lowering.apply(fn)
 
-_escape_analysis_cache = {}
 class Compiler(object):
-  def __init__(self, fundef, llvm_cxt = llvm_context.global_context):
+  def __init__(self, fundef, llvm_fn, module_compiler, parallel = False):
     self.parakeet_fundef = fundef
+    self.llvm_fn = llvm_fn
+    self.module_compiler = module_compiler
+    self.module = module_compiler.module
+    # only the entry function runs ParFors on several threads, the bodies
+    # of parallel loops (and anything they call) stay sequential
+    self.parallel = parallel and llvm_config.parallel
+
     if config.opt_stack_allocation:
-      self.may_escape = may_escape(fundef)
+      self.local_structs = LocalStructs().visit_fn(fundef)
     else:
-      self.may_escape = None
-    self.llvm_context = llvm_cxt
+      self.local_structs = set([])
+
     self.vars = {}
     self.initialized = set([])
-    # Initializes the variables dictionary and returns a builder object
-    llvm_input_types = map(llvm_ref_type, fundef.input_types)
-    llvm_output_type = llvm_ref_type(fundef.return_type)
-    llvm_fn_t = lltype.function(llvm_output_type, llvm_input_types)
-
-    self.llvm_fn = self.llvm_context.module.add_function(llvm_fn_t, fundef.name)
-
-    for arg in self.llvm_fn.args:
-      if not llvm_types.is_scalar(arg.type):
-        arg.add_attribute(ATTR_NO_CAPTURE)
-
-    self.llvm_fn.does_not_throw = True
 
+    # allocas all go into the entry block, so that mem2reg can turn them
+    # into registers and local structs don't grow the stack inside loops
     self.entry_block, self.entry_builder = self.new_block("entry")
+    self.body_block, self.body_builder = self.new_block("body")
+
+    self.arena = self.llvm_fn.args[0]
+    self.arena.name = "arena"
     self._init_vars(self.parakeet_fundef, self.entry_builder)
 
   def new_block(self, name):
     bb = self.llvm_fn.append_basic_block(name)
-    builder = Builder.new(bb)
+    builder = ir.IRBuilder(bb)
     return bb, builder
 
   def _init_vars(self, fundef, builder):
@@ -56,24 +165,46 @@ class Compiler(object):
     Create a mapping from variable names to stack locations, these will later be
     converted to SSA variables by the mem2reg pass.
     """
+    llvm_args = self.llvm_fn.args[1:]
     n_expected = len(fundef.arg_names)
-    n_compiled = len(self.llvm_fn.args)
+    n_compiled = len(llvm_args)
     assert n_compiled == n_expected, \
         "Expected %d args (%s) but compiled code had %d args (%s)" % \
-        (n_expected, fundef.arg_names, n_compiled, self.llvm_fn.args)
+        (n_expected, fundef.arg_names, n_compiled, llvm_args)
 
     for (name, t) in fundef.type_env.iteritems():
       if not name.startswith("$"):
         llvm_t = llvm_ref_type(t)
-        stack_val = builder.alloca(llvm_t, name)
+        stack_val = builder.alloca(llvm_t, name = name)
         self.vars[name] = stack_val
 
-    for llvm_arg, name in zip(self.llvm_fn.args, fundef.arg_names):
+    for llvm_arg, name in zip(llvm_args, fundef.arg_names):
       self.initialized.add(name)
       llvm_arg.name = name
       if name in self.vars:
         builder.store(llvm_arg, self.vars[name])
 
+  def heap_alloc(self, nbytes, llvm_ptr_t, builder, name = "heap_ptr"):
+    raw_ptr = builder.call(self.module_compiler.alloc_fn, [self.arena, nbytes])
+    return builder.bitcast(raw_ptr, llvm_ptr_t, name = name)
+
+  def sizeof(self, llvm_t, builder):
+    # the address of element 1 in an array starting at NULL
+    null = ir.Constant(llvm_t.as_pointer(), None)
+    end = builder.gep(null, [int32(1)])
+    return builder.ptrtoint(end, int64_t)
+
+  def new_struct(self, struct_t, builder, local = False, name = "struct"):
+    llvm_struct_t = llvm_types.struct_type(struct_t)
+    if local:
+      return self.entry_builder.alloca(llvm_struct_t, name = name + "_local_ptr")
+    else:
+      nbytes = self.sizeof(llvm_struct_t, builder)
+      return self.heap_alloc(nbytes, llvm_struct_t.as_pointer(), builder, name + "_ptr")
+
+  def field_ptr(self, llvm_struct, pos, builder, name = "field_ptr"):
+    return builder.gep(llvm_struct, [int32(0), int32(pos)], name = name)
+
   def attribute_lookup(self, struct, name, builder):
     """
     Helper for getting the address of an attribute lookup, used both when
@@ -83,9 +214,7 @@ class Compiler(object):
     struct_t = struct.type
     field_pos = struct_t.field_pos(name)
     field_type = struct_t.field_type(name)
-    indices = [int32(0), int32(field_pos)]
-    ptr_name = "%s_ptr" % name
-    ptr = builder.gep(llvm_struct, indices, ptr_name)
+    ptr = self.field_ptr(llvm_struct, field_pos, builder, "%s_ptr" % name)
     return ptr, field_type
 
   def compile_Var(self, expr, builder):
@@ -105,230 +234,251 @@ class Compiler(object):
           "Expected scalar constant but got %s" % expr.type
     return const(expr.value, expr.type)
 
+  def compile_UntypedFn(self, expr, builder):
+    # functions passed around as values only matter to type inference,
+    # so at runtime they're an empty closure (or a placeholder like None)
+    if isinstance(expr.type, StructT):
+      return self.new_struct(expr.type, builder, name = "fn")
+    return const(0, Int64)
+
   def compile_Cast(self, expr, builder):
     llvm_value = self.compile_expr(expr.value, builder)
     return llvm_convert.convert(llvm_value, expr.value.type, expr.type, builder)
 
   def compile_Struct(self, expr, builder, local = False):
     struct_t = expr.type
-    llvm_struct_t = llvm_value_type(struct_t)
-    name = expr.type.node_type()
-    if local:
-      struct_ptr = builder.alloca(llvm_struct_t, name + "_local_ptr")
-    else:
-      struct_ptr = builder.malloc(llvm_struct_t, name + "_ptr")
-
+    struct_ptr = self.new_struct(struct_t, builder, local, struct_t.node_type())
+    assert len(expr.args) == len(struct_t._fields_), \
+        "Expected %d fields for %s but got %d" % \
+        (len(struct_t._fields_), struct_t, len(expr.args))
     for (i, elt) in enumerate(expr.args):
       field_name, field_type = struct_t._fields_[i]
       assert elt.type == field_type, \
           "Mismatch between expected type %s and given %s for field '%s' " % \
           (field_type, elt.type, field_name)
-      elt_ptr = builder.gep(struct_ptr, [int32(0), int32(i)], "field%d_ptr" % i)
+      elt_ptr = self.field_ptr(struct_ptr, i, builder, "field%d_ptr" % i)
       llvm_elt = self.compile_expr(elt, builder)
       builder.store(llvm_elt, elt_ptr)
-
     return struct_ptr
 
   def compile_Alloc(self, expr, builder):
     elt_t = expr.elt_type
     llvm_elt_t = llvm_types.llvm_value_type(elt_t)
     n_elts = self.compile_expr(expr.count, builder)
-    return builder.malloc_array(llvm_elt_t, n_elts, "data_ptr")
+    n_elts = llvm_convert.convert(n_elts, expr.count.type, Int64, builder)
+    nbytes = builder.mul(n_elts, int64(elt_t.nbytes), "nbytes")
+    return self.heap_alloc(nbytes, llvm_elt_t.as_pointer(), builder, "data_ptr")
+
+  def compile_AllocArray(self, expr, builder):
+    array_t = expr.type
+    shape_t = array_t.shape_t
+    rank = array_t.rank
+    llvm_shape = self.compile_expr(expr.shape, builder)
+    dims = []
+    if isinstance(expr.shape.type, TupleT):
+      for i in xrange(rank):
+        dim_ptr = self.field_ptr(llvm_shape, i, builder)
+        dims.append(builder.load(dim_ptr, "dim%d" % i))
+    else:
+      dims.append(llvm_shape)
+    dims = [llvm_convert.convert(d, Int64, Int64, builder) for d in dims]
+
+    # row-major strides, measured in elements
+    strides = [None] * rank
+    size = int64(1)
+    for i in reversed(xrange(rank)):
+      strides[i] = size
+      size = builder.mul(size, dims[i], "size")
+
+    new_shape = self.new_struct(shape_t, builder, name = "shape")
+    new_strides = self.new_struct(shape_t, builder, name = "strides")
+    for i in xrange(rank):
+      builder.store(dims[i], self.field_ptr(new_shape, i, builder))
+      builder.store(strides[i], self.field_ptr(new_strides, i, builder))
+
+    llvm_elt_t = llvm_value_type(array_t.elt_type)
+    nbytes = builder.mul(size, int64(array_t.elt_type.nbytes), "nbytes")
+    data = self.heap_alloc(nbytes, llvm_elt_t.as_pointer(), builder, "data_ptr")
+    array = self.new_struct(array_t, builder, name = "array")
+    for (field_name, value) in [('data', data),
+                                ('shape', new_shape),
+                                ('strides', new_strides),
+                                ('offset', int64(0)),
+                                ('size', size)]:
+      ptr = self.field_ptr(array, array_t.field_pos(field_name), builder)
+      builder.store(value, ptr)
+    return array
 
   def compile_Index(self, expr, builder):
+    assert isinstance(expr.value.type, PtrT), \
+      "Expected indexing to be lowered into pointer arithmetic, got %s" % expr
     llvm_arr = self.compile_expr(expr.value, builder)
     llvm_index = self.compile_expr(expr.index, builder)
-    pointer = builder.gep(llvm_arr, [llvm_index], "elt_pointer")
-    elt = builder.load(pointer, "elt", align = 16) #, invariant = True)
-    return elt
-  
+    pointer = builder.gep(llvm_arr, [llvm_index], name = "elt_pointer")
+    return builder.load(pointer, "elt")
+
   def compile_Select(self, expr, builder):
     cond = self.compile_expr(expr.cond, builder)
     cond = llvm_convert.to_bit(cond, builder)
     trueval = self.compile_expr(expr.true_value, builder)
     falseval = self.compile_expr(expr.false_value, builder)
-    result =  builder.select(cond, trueval, falseval, "select_result")
-    return result 
-  
+    return builder.select(cond, trueval, falseval, "select_result")
+
   def compile_Attribute(self, expr, builder):
     field_ptr, _ = \
         self.attribute_lookup(expr.value, expr.name, builder)
-    field_value = builder.load(field_ptr, "%s_value" % expr.name)
-    return field_value
+    return builder.load(field_ptr, "%s_value" % expr.name)
 
-  def compile_TypedFn(self, expr, builder):
-    (target_fn, _, _) = compile_fn(expr)
-    return target_fn
+  def compile_NumCores(self, expr, builder):
+    return int64(num_threads() if self.parallel else 1)
 
   def compile_Call(self, expr, builder):
-    assert expr.fn.__class__ is TypedFn
-    typed_fundef = expr.fn
-    (target_fn, _, _) = compile_fn(typed_fundef)
-    arg_types = syntax.get_types(expr.args)
-    llvm_args = [self.compile_expr(arg, builder) for arg in expr.args]
-    assert len(arg_types) == len(llvm_args)
+    fn, closure_args = fn_and_closure_args(expr.fn)
+    target_fn = self.module_compiler.compile_fn(lowered(fn))
+    args = closure_args + list(expr.args)
+    llvm_args = [self.arena] + [self.compile_expr(arg, builder) for arg in args]
     return builder.call(target_fn, llvm_args, 'call_result')
 
   def cmp(self, prim, t, llvm_x, llvm_y, builder, result_name = None):
     if result_name is None:
       result_name = prim.name + "_result"
-
+    op = llvm_prims.comparison_ops[prim]
     if isinstance(t, FloatT):
-      cmp_op = llvm_prims.float_comparisons[prim]
-      return builder.fcmp(cmp_op, llvm_x, llvm_y, result_name)
+      return builder.fcmp_ordered(op, llvm_x, llvm_y, result_name)
     elif isinstance(t, SignedT):
-      cmp_op = llvm_prims.signed_int_comparisons[prim]
-      return builder.icmp(cmp_op, llvm_x, llvm_y, result_name)
+      return builder.icmp_signed(op, llvm_x, llvm_y, result_name)
     else:
-      assert isinstance(t, (BoolT, UnsignedT)), "Unexpected type for comparison %s: %s" % (prim, t)
-      cmp_op = llvm_prims.unsigned_int_comparisons[prim]
-      return builder.icmp(cmp_op, llvm_x, llvm_y, result_name)
+      assert isinstance(t, (BoolT, UnsignedT)), \
+        "Unexpected type for comparison %s: %s" % (prim, t)
+      return builder.icmp_unsigned(op, llvm_x, llvm_y, result_name)
 
-  
-  def lt(self, t, llvm_x, llvm_y, builder, result_name = None ):
+  def lt(self, t, llvm_x, llvm_y, builder, result_name = None):
     return self.cmp(prims.less, t, llvm_x, llvm_y, builder, result_name)
-  
-  def lte(self, t, llvm_x, llvm_y, builder, result_name = None ):
-    return self.cmp(prims.less_equal, t, llvm_x, llvm_y, builder, result_name)
-  
+
+  def gt(self, t, llvm_x, llvm_y, builder, result_name = None):
+    return self.cmp(prims.greater, t, llvm_x, llvm_y, builder, result_name)
+
   def neq(self, t, llvm_x, llvm_y, builder, result_name = None):
     return self.cmp(prims.not_equal, t, llvm_x, llvm_y, builder, result_name)
-  
-  def sub(self, t, x, y, builder, result_name = "sub"):
-    if isinstance(t, FloatT):
-      return builder.fsub(x, y, result_name)
-    else:
-      return builder.sub(x, y, result_name)
-    
-  
+
   def add(self, t, x, y, builder, result_name = "add"):
     if isinstance(t, FloatT):
       return builder.fadd(x, y, result_name)
     else:
       return builder.add(x, y, result_name)
-  
-  
-  def mul(self, t, x, y, builder, result_name = "mul"):
-    if isinstance(t, FloatT):
-      return builder.fmul(x, y, result_name)
-    else:
-      return builder.mul(x, y, result_name)
-  
-    
+
   def neg(self, x, builder):
-    if isinstance(x.type, llc.IntegerType):
+    if isinstance(x.type, ir.IntType):
       return builder.neg(x, "neg")
     else:
-      return builder.fsub(zero(x.type), x, "neg") 
-    
+      return builder.fsub(zero(x.type), x, "neg")
+
   def prim(self, prim, t, llvm_args, builder, result_name = None):
     if result_name is None:
       result_name = prim.name + "_result"
 
     if isinstance(prim, prims.Cmp):
       bit = self.cmp(prim, t, llvm_args[0], llvm_args[1], builder)
-      return llvm_convert.to_bool(bit,builder)
-    
+      return llvm_convert.to_bool(bit, builder)
+
     elif prim == prims.maximum:
       x, y = llvm_args
-      bit = self.cmp(prims.greater_equal, t, x, y, builder)
+      bit = self.cmp(prims.greater, t, x, y, builder)
       return builder.select(bit, x, y)
-    
+
     elif prim == prims.minimum:
-      x,y = llvm_args
-      bit = self.cmp(prims.less_equal, t, x, y, builder)
+      x, y = llvm_args
+      bit = self.cmp(prims.less, t, x, y, builder)
       return builder.select(bit, x, y)
-    
+
     elif prim == prims.negative:
-      if t == Bool: 
+      if t == Bool:
         bit = llvm_convert.to_bit(llvm_args[0], builder)
         negated = builder.not_(bit)
         return llvm_convert.to_bool(negated, builder)
       return self.neg(llvm_args[0], builder)
-    
-    # python's remainder is weird in that it preserve's the sign of 
-    # the second argument, whereas LLVM's srem/frem operators preserve
-    # the sign of the first 
-    elif prim == prims.mod:
-      x,y = llvm_args 
-      if isinstance(t, (UnsignedT, BoolT)):
-        return builder.urem(llvm_args[0], llvm_args[1], "modulo")
-      elif isinstance(t, SignedT): 
-        rem = builder.srem(x,y, "modulo")
-      else:
-        assert isinstance(t, FloatT)
-        rem = builder.frem(llvm_args[0], llvm_args[1], "modulo")
 
+    elif prim == prims.bitwise_not:
+      return builder.not_(llvm_args[0], result_name)
+
+    # python's remainder is weird in that it preserve's the sign of
+    # the second argument, whereas LLVM's srem operator preserves
+    # the sign of the first
+    elif prim == prims.mod and isinstance(t, SignedT):
+      x, y = llvm_args
+      rem = builder.srem(x, y, "modulo")
       y_is_negative = self.lt(t, y, zero(y.type), builder, "second_arg_negative")
       rem_is_negative = self.lt(t, rem, zero(rem.type), builder, "rem_is_negative")
       y_nonzero = self.neq(t, y, zero(y.type), builder, "second_arg_nonzero")
       rem_nonzero = self.neq(t, rem, zero(x.type), builder, "rem_nonzero")
       neither_zero = builder.and_(y_nonzero, rem_nonzero, "neither_zero")
       diff_signs = builder.xor(y_is_negative, rem_is_negative, "different_signs")
-      should_flip = builder.and_(neither_zero, diff_signs, "should_flip") 
+      should_flip = builder.and_(neither_zero, diff_signs, "should_flip")
       flipped_rem = self.add(t, y, rem, builder, "flipped_rem")
       return builder.select(should_flip, flipped_rem, rem)
 
-    elif prim == prims.power:
-      x,y = llvm_args
-       
-      if isinstance(t, FloatT):
-        new_t = t 
-      else:
-        new_t = Float64
-      x = llvm_convert.convert(x, t, new_t, builder)
-      y = llvm_convert.convert(y, t, new_t, builder)
-      llvm_op = llvm_prims.get_float_op(prim, new_t)
-      result = builder.call(llvm_op, [x,y])
-      return llvm_convert.convert(result, new_t, t, builder)
-        
-    elif isinstance(prim, prims.Arith) or isinstance(prim, prims.Bitwise):
+    elif isinstance(prim, (prims.Arith, prims.Bitwise)):
       if isinstance(t, FloatT):
         instr = llvm_prims.float_binops[prim]
+      elif isinstance(t, BoolT):
+        instr = llvm_prims.bool_binops[prim]
       elif isinstance(t, SignedT):
         instr = llvm_prims.signed_binops[prim]
-      elif isinstance(t, UnsignedT):
-        instr = llvm_prims.unsigned_binops[prim]
       else:
-        assert isinstance(t, BoolT)
-        instr = llvm_prims.bool_binops[prim]
+        assert isinstance(t, UnsignedT), "Unexpected type %s for %s" % (t, prim)
+        instr = llvm_prims.unsigned_binops[prim]
       op = getattr(builder, instr)
-      return op(name = result_name, *llvm_args)
+      return op(llvm_args[0], llvm_args[1], result_name)
 
     elif isinstance(prim, prims.Logical):
       if prim == prims.logical_and:
-        result = builder.and_(name = result_name, 
-                            lhs = to_bit(llvm_args[0], builder), 
-                            rhs = to_bit(llvm_args[1], builder))
-        return from_bit(result, t, builder)
+        result = builder.and_(to_bit(llvm_args[0], builder),
+                              to_bit(llvm_args[1], builder),
+                              result_name)
       elif prim == prims.logical_not:
-        result = builder.not_(to_bit(llvm_args[0], builder), name = result_name)
-        return from_bit(result, t, builder)
+        result = builder.not_(to_bit(llvm_args[0], builder), result_name)
       else:
         assert prim == prims.logical_or
-        result = builder.or_(lhs = to_bit(llvm_args[0], builder), 
-                           rhs = to_bit(llvm_args[1], builder), name = result_name)
-        return from_bit(result, t, builder)
-      
-    elif prim == prims.abs:
+        result = builder.or_(to_bit(llvm_args[0], builder),
+                             to_bit(llvm_args[1], builder),
+                             result_name)
+      return from_bit(result, Bool, builder)
+
+    elif prim == prims.abs and not isinstance(t, FloatT):
       x = llvm_args[0]
-      bit = self.cmp(prims.greater_equal, t,  x, zero(x.type), builder, "gt_zero")
+      bit = self.cmp(prims.greater_equal, t, x, zero(x.type), builder, "gt_zero")
       neg_value = self.neg(x, builder)
       return builder.select(bit, x, neg_value)
-    elif isinstance(prim, prims.Float): 
-      llvm_op = llvm_prims.get_float_op(prim, t)
-      return builder.call(llvm_op, llvm_args)
-    
+
+    elif isinstance(prim, (prims.Float, prims.Round)):
+      if isinstance(t, FloatT):
+        float_t = t
+      else:
+        float_t = Float64
+      args = [llvm_convert.convert(arg, t, float_t, builder) for arg in llvm_args]
+      llvm_op = llvm_prims.get_float_op(prim, float_t, self.module)
+      return builder.call(llvm_op, args)
+
     else:
       assert False, "UNSUPPORTED PRIMITIVE: %s" % prim
 
   def compile_PrimCall(self, expr, builder):
     args = expr.args
-    # type specialization should have made types of arguments uniform,
-    # so we only need to check the type of the first arg
+    # type specialization usually makes the types of arguments uniform,
+    # but anything it missed gets upcast here the way C would
     t = args[0].type
     llvm_args = [self.compile_expr(arg, builder) for arg in args]
-    return self.prim(expr.prim, t, llvm_args, builder)
+    if any(arg.type != t for arg in args[1:]):
+      t = combine_type_list([arg.type for arg in args])
+      llvm_args = [llvm_convert.convert(llvm_arg, arg.type, t, builder)
+                   for (llvm_arg, arg) in zip(llvm_args, args)]
+    result = self.prim(expr.prim, t, llvm_args, builder)
+    if isinstance(expr.prim, (prims.Float, prims.Round)) and \
+       not (expr.prim == prims.abs and not isinstance(t, FloatT)):
+      # math functions of integers get computed in double precision
+      result_t = t if isinstance(t, FloatT) else Float64
+      result = llvm_convert.convert(result, result_t, expr.type, builder)
+    return result
 
   def compile_expr(self, expr, builder):
     method_name = "compile_" + expr.node_type()
@@ -337,10 +487,9 @@ class Compiler(object):
   def compile_Assign(self, stmt, builder):
     rhs_t = stmt.rhs.type
     # special case for locally allocated structs
-    if self.may_escape is not None and \
-       stmt.lhs.__class__ is Var and \
+    if stmt.lhs.__class__ is Var and \
        stmt.rhs.__class__ is Struct and \
-       stmt.lhs.name  not in self.may_escape:
+       stmt.lhs.name in self.local_structs:
       value = self.compile_Struct(stmt.rhs, builder, local = True)
     else:
       value = self.compile_expr(stmt.rhs, builder)
@@ -356,8 +505,7 @@ class Compiler(object):
       lhs_t = ptr_t.elt_type
       base_ptr = self.compile_expr(stmt.lhs.value, builder)
       index = self.compile_expr(stmt.lhs.index, builder)
-      index = llvm_convert.from_signed(index, Int32, builder)
-      ref = builder.gep(base_ptr, [index], "elt_ptr")
+      ref = builder.gep(base_ptr, [index], name = "elt_ptr")
     else:
       assert stmt.lhs.__class__ is Attribute, \
           "Unexpected LHS: %s" % stmt.lhs
@@ -387,11 +535,40 @@ class Compiler(object):
       builder.store(value, ref)
 
   def compile_merge_right(self, phi_nodes, builder):
-    for name, (_, right) in phi_nodes.iteritems():
-      ref = self.vars[name]
+    # evaluate everything before storing, since the right hand sides
+    # may refer to the other merged variables
+    values = [(name, self.compile_expr(right, builder))
+              for name, (_, right) in phi_nodes.iteritems()]
+    for name, value in values:
       self.initialized.add(name)
-      value = self.compile_expr(right, builder)
-      builder.store(value, ref)
+      builder.store(value, self.vars[name])
+
+  def loop(self, builder, loop_var, start, stop, step, t, body_fn, step_sign = 1):
+    """
+    Emit a counting loop, calling body_fn with a builder positioned at the
+    start of the body. It should return the builder at the end of the body
+    and whether the body always returns.
+    """
+    builder.store(start, loop_var)
+    loop_bb, body_start_builder = self.new_block("loop_body")
+    after_bb, after_builder = self.new_block("after_loop")
+    if step_sign > 0:
+      enter_cond = self.lt(t, start, stop, builder, "enter_cond")
+    else:
+      enter_cond = self.gt(t, start, stop, builder, "enter_cond")
+    builder.cbranch(enter_cond, loop_bb, after_bb)
+
+    body_end_builder, body_always_returns = body_fn(body_start_builder)
+    if not body_always_returns:
+      counter_at_end = body_end_builder.load(loop_var)
+      incr = self.add(t, counter_at_end, step, body_end_builder, "incr_loop_var")
+      body_end_builder.store(incr, loop_var)
+      if step_sign > 0:
+        exit_cond = self.lt(t, incr, stop, body_end_builder, "exit_cond")
+      else:
+        exit_cond = self.gt(t, incr, stop, body_end_builder, "exit_cond")
+      body_end_builder.cbranch(exit_cond, loop_bb, after_bb)
+    return after_builder
 
   def compile_ForLoop(self, stmt, builder):
     # first compile the starting, boundary, and
@@ -402,45 +579,36 @@ class Compiler(object):
 
     # get the memory slot associated with the loop counter
     loop_var = self.vars[stmt.var.name]
-
-    builder.store(start, loop_var)
     self.initialized.add(stmt.var.name)
-
-    # ...and we'll need its Parakeet type later on
-    # for calls to 'cmp' and 'prim'
     loop_var_t = stmt.var.type
 
     # any phi-bound variables should be initialized to their
     # starting values
     self.compile_merge_left(stmt.merge, builder)
 
-    loop_bb, body_start_builder = self.new_block("loop_body")
-    after_bb, after_builder = self.new_block("after_loop")
-
-    # WARNING: Assuming loop is always increasing,
-    # only enter the loop if we're less than the stopping value
-    enter_cond = self.cmp(prims.less, loop_var_t,  start, stop,
-                          builder, "enter_cond")
-    builder.cbranch(enter_cond, loop_bb, after_bb)
-
-    # TODO: what should we do if the body always ends in a return statement?
-    body_end_builder, body_always_returns = \
-      self.compile_block(stmt.body, body_start_builder)
-
-    counter_at_end = body_end_builder.load(loop_var)
-    # increment the loop counter
-    incr = self.prim(prims.add, loop_var_t,
-                     [counter_at_end, step],
-                     body_end_builder,  "incr_loop_var")
-    body_end_builder.store(incr, loop_var)
-    self.compile_merge_right(stmt.merge, body_end_builder)
-
-    exit_cond = self.cmp(prims.less, loop_var_t, incr, stop,
-                         body_end_builder, "exit_cond")
-    body_end_builder.cbranch(exit_cond, loop_bb, after_bb)
-    # WARNING: what if the loop doesn't run? Should
-    # we still be returning 'body_always_returns'?
-    return after_builder, body_always_returns
+    def body(body_builder):
+      body_end_builder, always_returns = \
+        self.compile_block(stmt.body, body_builder)
+      if not always_returns:
+        self.compile_merge_right(stmt.merge, body_end_builder)
+      return body_end_builder, always_returns
+
+    if stmt.step.__class__ is syntax.Const:
+      step_sign = 1 if stmt.step.value >= 0 else -1
+      return self.loop(builder, loop_var, start, stop, step, loop_var_t, body, step_sign), False
+
+    # the direction of the loop isn't known until it runs
+    up_bb, up_builder = self.new_block("loop_up")
+    down_bb, down_builder = self.new_block("loop_down")
+    step_positive = self.cmp(prims.greater_equal, loop_var_t, step, zero(step.type),
+                             builder, "step_positive")
+    builder.cbranch(step_positive, up_bb, down_bb)
+    after_up = self.loop(up_builder, loop_var, start, stop, step, loop_var_t, body, 1)
+    after_down = self.loop(down_builder, loop_var, start, stop, step, loop_var_t, body, -1)
+    after_bb, after_builder = self.new_block("after_loops")
+    after_up.branch(after_bb)
+    after_down.branch(after_bb)
+    return after_builder, False
 
   def compile_While(self, stmt, builder):
     # current flow ----> loop --------> exit--> after
@@ -458,12 +626,10 @@ class Compiler(object):
     body_end_builder, body_always_returns = \
         self.compile_block(stmt.body, body_start_builder)
     if not body_always_returns:
-      exit_bb, exit_builder = self.new_block("loop_exit")
       self.compile_merge_right(stmt.merge, body_end_builder)
       repeat_cond = self.compile_expr(stmt.cond, body_end_builder)
       repeat_cond = llvm_convert.to_bit(repeat_cond, body_end_builder)
-      body_end_builder.cbranch(repeat_cond, loop_bb, exit_bb)
-      exit_builder.branch(after_bb)
+      body_end_builder.cbranch(repeat_cond, loop_bb, after_bb)
 
     return after_builder, False
 
@@ -495,24 +661,132 @@ class Compiler(object):
 
       builder.cbranch(cond, true_bb, false_bb)
 
-      # compile phi nodes as assignments and then branch
-      # to the continuation block
-      self.compile_merge_left(stmt.merge, after_true)
-      self.compile_merge_right(stmt.merge, after_false)
-
       # if both branches return then there is no point
       # making a new block for more code
-      # did both branches end in a return?
-      both_always_return = true_always_returns and false_always_returns
-      if both_always_return:
-        return None, True
+      if true_always_returns and false_always_returns:
+        return builder, True
+
+      # compile phi nodes as assignments and then branch
+      # to the continuation block
       after_bb, after_builder = self.new_block("if_after")
       if not true_always_returns:
+        self.compile_merge_left(stmt.merge, after_true)
         after_true.branch(after_bb)
       if not false_always_returns:
+        self.compile_merge_right(stmt.merge, after_false)
         after_false.branch(after_bb)
       return after_builder, False
 
+  def compile_ParFor(self, stmt, builder):
+    """
+    Move the body of the ParFor into a worker function which runs a range
+    of the outermost index, and get the runtime to split that range between
+    threads. The environment of the worker holds the arena, the closure
+    arguments and the bounds.
+    """
+    fn, closure_args = fn_and_closure_args(stmt.fn)
+    body_fn = self.module_compiler.compile_fn(lowered(fn))
+    llvm_closure_args = [self.compile_expr(arg, builder) for arg in closure_args]
+    bounds_t = stmt.bounds.type
+    llvm_bounds = self.compile_expr(stmt.bounds, builder)
+    if isinstance(bounds_t, TupleT):
+      bounds = [builder.load(self.field_ptr(llvm_bounds, i, builder), "bound%d" % i)
+                for i in xrange(len(bounds_t.elt_types))]
+      index_types = bounds_t.elt_types
+    else:
+      bounds = [llvm_bounds]
+      index_types = [bounds_t]
+    bounds = [llvm_convert.convert(b, t, Int64, builder)
+              for (b, t) in zip(bounds, index_types)]
+    # does the function take its indices as one tuple or separately?
+    tuple_index = len(fn.input_types) > 0 and \
+                  isinstance(fn.input_types[-1], TupleT) and \
+                  len(fn.input_types) == len(closure_args) + 1
+
+    env_types = [arena_t] + [a.type for a in llvm_closure_args] + [int64_t] * len(bounds)
+    env_t = ir.LiteralStructType(env_types)
+    env = self.entry_builder.alloca(env_t, name = "parfor_env")
+    for (i, value) in enumerate([self.arena] + llvm_closure_args + bounds):
+      builder.store(value, self.field_ptr(env, i, builder))
+
+    worker = self.module_compiler.new_worker_fn(self.parakeet_fundef.name)
+    self.build_worker(worker, env_t, body_fn, len(llvm_closure_args),
+                      index_types, tuple_index and bounds_t)
+
+    env_arg = builder.bitcast(env, ptr_int8_t)
+    n_outer = bounds[0]
+    threads = num_threads() if self.parallel else 1
+    if threads <= 1:
+      builder.call(worker, [env_arg, int64(0), n_outer])
+      return builder, False
+
+    total = n_outer
+    for b in bounds[1:]:
+      total = builder.mul(total, b, "total_iters")
+    enough_work = builder.icmp_signed('>=', total, int64(llvm_config.min_parallel_iters),
+                                      "enough_work")
+    parallel_bb, parallel_builder = self.new_block("parfor_parallel")
+    serial_bb, serial_builder = self.new_block("parfor_serial")
+    after_bb, after_builder = self.new_block("after_parfor")
+    builder.cbranch(enough_work, parallel_bb, serial_bb)
+    parallel_builder.call(self.module_compiler.parallel_for_fn,
+                          [worker, env_arg, n_outer, int64(threads)])
+    parallel_builder.branch(after_bb)
+    serial_builder.call(worker, [env_arg, int64(0), n_outer])
+    serial_builder.branch(after_bb)
+    return after_builder, False
+
+  def build_worker(self, worker, env_t, body_fn, n_closure_args, index_types, index_tuple_t):
+    entry_bb = worker.append_basic_block("entry")
+    builder = ir.IRBuilder(entry_bb)
+    env_arg, start, stop = worker.args
+    env = builder.bitcast(env_arg, env_t.as_pointer())
+    fields = [builder.load(self.field_ptr(env, i, builder))
+              for i in xrange(len(env_t.elements))]
+    arena = fields[0]
+    closure_args = fields[1:1 + n_closure_args]
+    bounds = fields[1 + n_closure_args:]
+    counters = [builder.alloca(int64_t, name = "i%d" % d) for d in xrange(len(bounds))]
+    if index_tuple_t:
+      index_tuple = builder.alloca(llvm_types.struct_type(index_tuple_t), name = "idx")
+
+    def call_body(body_builder):
+      indices = [body_builder.load(c) for c in counters]
+      indices = [llvm_convert.convert(idx, Int64, t, body_builder)
+                 for (idx, t) in zip(indices, index_types)]
+      if index_tuple_t:
+        for (d, idx) in enumerate(indices):
+          body_builder.store(idx, self.field_ptr(index_tuple, d, body_builder))
+        indices = [index_tuple]
+      body_builder.call(body_fn, [arena] + closure_args + indices)
+      return body_builder, False
+
+    # the outermost index runs over [start, stop), the others over their
+    # whole range
+    def nested(d):
+      def body(body_builder):
+        if d == len(bounds):
+          return call_body(body_builder)
+        after = self.worker_loop(worker, body_builder, counters[d],
+                                 int64(0), bounds[d], nested(d + 1))
+        return after, False
+      return body
+    after = self.worker_loop(worker, builder, counters[0], start, stop, nested(1))
+    after.ret_void()
+
+  def worker_loop(self, worker, builder, counter, start, stop, body_fn):
+    builder.store(start, counter)
+    loop_bb = worker.append_basic_block("loop_body")
+    after_bb = worker.append_basic_block("after_loop")
+    enter_cond = builder.icmp_signed('<', start, stop, "enter_cond")
+    builder.cbranch(enter_cond, loop_bb, after_bb)
+    body_end_builder, _ = body_fn(ir.IRBuilder(loop_bb))
+    incr = body_end_builder.add(body_end_builder.load(counter), int64(1), "incr")
+    body_end_builder.store(incr, counter)
+    exit_cond = body_end_builder.icmp_signed('<', incr, stop, "exit_cond")
+    body_end_builder.cbranch(exit_cond, loop_bb, after_bb)
+    return ir.IRBuilder(after_bb)
+
   def compile_Comment(self, stmt, builder):
     return builder, False
 
@@ -535,61 +809,16 @@ class Compiler(object):
     return builder, False
 
   def compile_body(self, body):
-    return self.compile_block(body, builder = self.entry_builder)
-  
-  
-import os
-from collections import namedtuple   
-CompiledFn = namedtuple('CompiledFn', ('llvm_fn', 'llvm_exec_engine', 'parakeet_fn')) 
-
-compiled_functions = {}
-def compile_fn(fundef):
-  key = fundef.cache_key 
-  if key in compiled_functions:
-    return compiled_functions[key]
-  
-  if config.print_lowered_function:
-    print
-    print "=== Lowered function ==="
-    print
-    print repr(fundef)
-    print
-
-  compiler = Compiler(fundef)
-  compiler.compile_body(fundef.body)
-  if llvm_config.print_unoptimized_llvm:
-    print "=== LLVM before optimizations =="
-    print
-    print compiler.llvm_context.module
-    print
-  compiler.llvm_context.run_passes(compiler.llvm_fn)
-
-  if config.print_generated_code:
-    print "=== LLVM after optimizations =="
-    print
-    print compiler.llvm_context.module
-    print
-
-  if llvm_config.print_x86:
-    print "=== Generated assembly =="
-    print
-    start_printing = False
-    w,r = os.popen2("llc")
-    w.write(str(compiler.llvm_context.module))
-    w.close()
-    assembly_str = r.read()
-    r.close()
-    for l in assembly_str.split('\n'):
-      if l.strip().startswith('.globl'):
-        if start_printing:
-          break
-        elif fundef.name in l:
-          start_printing = True
-      if start_printing:
-        print l
-
-  result = CompiledFn(compiler.llvm_fn,
-                      compiler.llvm_context.exec_engine, 
-                      fundef)
-  compiled_functions[key] = result
-  return result
+    self.compile_block(body, builder = self.body_builder)
+    self.entry_builder.branch(self.body_block)
+    # blocks which control flow can't reach the end of (i.e. after a loop
+    # whose body always returns) still need a terminator
+    for block in self.llvm_fn.blocks:
+      if not block.is_terminated:
+        ir.IRBuilder(block).unreachable()
+
+def num_threads():
+  if llvm_config.num_threads:
+    return llvm_config.num_threads
+  import multiprocessing
+  return multiprocessing.cpu_count()
@@ -1,5 +1,3 @@
-
-
 ######################################
 #        OPTIMIZER OPTIONS           #
 ######################################
@@ -7,12 +5,32 @@
 # run LLVM optimization passes
 llvm_optimize = True
 
-# number of times to run optimizations
-llvm_num_passes = 4
+# optimization level given to LLVM's pass manager builder and code generator
+llvm_opt_level = 3
+
+# let LLVM vectorize loops and straight-line code
+llvm_vectorize = True
+
+# generate code for the features of the host CPU (i.e. AVX) rather than
+# a generic x86-64 target
+llvm_native_cpu = True
 
 # run verifier over generated LLVM code?
 llvm_verify = True
 
+######################################
+#          PARALLEL LOOPS            #
+######################################
+
+# run the outermost ParFor statements of a function on several threads,
+# otherwise they get lowered to sequential loops like in the C backend
+parallel = True
+
+# number of threads used for each ParFor, None means one per core
+num_threads = None
+
+# ParFors with fewer iterations than this run on the calling thread
+min_parallel_iters = 1000
 
 ######################################
 #         PRINTING OPTIONS           #
@@ -25,5 +43,4 @@ print_x86 = False
 print_unoptimized_llvm = False
 
 # show LLVM bytecode after optimizations
-# print_optimized_llvm = False 
-
+print_optimized_llvm = False
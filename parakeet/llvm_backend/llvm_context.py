@@ -1,110 +1,82 @@
+import ctypes.util
+import threading
 
-import llvm.core as core
-import llvm.ee as ee
-import llvm.passes as passes
+import llvmlite.binding as llvm
 
-import llvm_config 
+import llvm_config
+import runtime
+from .. profiling import compile_timer
 
-class LLVM_Context:
-  """Combine a module, exec engine, and pass manager into a single object"""
+llvm.initialize()
+llvm.initialize_native_target()
+llvm.initialize_native_asmprinter()
 
-  _verify_passes = [
-    'preverify',
-    'domtree',
-    'verify'
-  ]
+# make sure math functions which aren't LLVM intrinsics can be found
+_libm = ctypes.util.find_library('m')
+if _libm:
+  llvm.load_library_permanently(_libm)
 
-  _opt_passes = [
-    'mem2reg',
-    'targetlibinfo',
-    'no-aa',
-    'basicaa',
-    'memdep',
-    'tbaa',
-    'instcombine',
-    'simplifycfg',
-    'basiccg',
-    'memdep',
-    'scalarrepl-ssa',
-    'sroa',
-    'domtree',
-    'early-cse',
-    'simplify-libcalls',
-    'lazy-value-info',
-    'correlated-propagation',
-    'simplifycfg',
-    'instcombine',
-    'reassociate',
-    'domtree',
-    'mem2reg',
-    'scev-aa',
-    'loops',
-    'loop-simplify',
-    'lcssa',
-    'loop-rotate',
-    'licm',
-    'lcssa',
-    'loop-unswitch',
-    'instcombine',
-    'scalar-evolution',
-    'loop-simplify',
-    'lcssa',
-    'indvars',
-    'loop-idiom',
-    'loop-deletion',
-    #'loop-vectorize',
-     'loop-unroll',
-    #'bb-vectorize',
-    'memdep',
-    'gvn',
-    'memdep',
-    'sccp',
-    'dse',
-    'adce',
-    'correlated-propagation',
-    'jump-threading',
-    'simplifycfg',
-    'instcombine',
-    'licm',
-  ]
+class LLVM_Context:
+  """
+  Combine a target machine, an in-memory execution engine and a pass
+  manager into a single object. Every compiled module gets added to the
+  same engine, so they can all call into the runtime module.
+  """
 
-  def __init__(self, module_name, 
+  def __init__(self,
                optimize = llvm_config.llvm_optimize,
                verify = llvm_config.llvm_verify):
-    self.module = core.Module.new(module_name)
-    self.engine_builder = ee.EngineBuilder.new(self.module)
-    self.engine_builder.force_jit()
-    opt_level = 3 if optimize else 0
-    if optimize:
-      self.engine_builder.opt(opt_level)
+    self.optimize = optimize
+    self.verify = verify
+    opt_level = llvm_config.llvm_opt_level if optimize else 0
+    target = llvm.Target.from_default_triple()
+    if llvm_config.llvm_native_cpu:
+      cpu = llvm.get_host_cpu_name()
+      features = llvm.get_host_cpu_features().flatten()
     else:
-      self.engine_builder.opt(opt_level)
-    self.exec_engine = self.engine_builder.create()
-    tm = ee.TargetMachine.new(opt = opt_level, cm=ee.CM_JITDEFAULT)
-    self.tm = tm 
-    _, fpm = passes.build_pass_managers(tm, 
-                                     opt = opt_level,
-                                     loop_vectorize = (opt_level > 0), 
-                                     mod = self.module, 
-                                     vectorize = (opt_level > 0), 
-                                     )
-    self.pass_manager = fpm 
-    # self.fpm = fpm 
-    for p in self._verify_passes:
-      self.pass_manager.add(p)
-    if optimize:
-      for p in (self._opt_passes + self._verify_passes):
-        self.pass_manager.add(p)
+      cpu = ''
+      features = ''
+    self.target_machine = target.create_target_machine(cpu = cpu,
+                                                       features = features,
+                                                       opt = opt_level,
+                                                       codemodel = 'jitdefault')
+    backing_module = llvm.parse_assembly("")
+    self.exec_engine = llvm.create_mcjit_compiler(backing_module,
+                                                  self.target_machine)
+
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = opt_level
+    pmb.inlining_threshold = 275 if optimize else 0
+    pmb.loop_vectorize = optimize and llvm_config.llvm_vectorize
+    pmb.slp_vectorize = optimize and llvm_config.llvm_vectorize
+    self.pass_manager = llvm.create_module_pass_manager()
+    self.target_machine.add_analysis_passes(self.pass_manager)
+    pmb.populate(self.pass_manager)
+
+    # MCJIT isn't safe to use from several threads at once
+    self.lock = threading.RLock()
+    self.add_module(runtime.source)
+
+  @compile_timer('llvm')
+  def add_module(self, source):
+    """
+    Parse, verify, optimize and generate machine code for a module
+    given as LLVM assembly, returns the optimized module
+    """
+    llvm_module = llvm.parse_assembly(source)
+    if self.verify:
+      llvm_module.verify()
+    with self.lock:
+      self.pass_manager.run(llvm_module)
+      self.exec_engine.add_module(llvm_module)
+      self.exec_engine.finalize_object()
+    return llvm_module
+
+  def function_address(self, name):
+    with self.lock:
+      return self.exec_engine.get_function_address(name)
+
+  def assembly(self, llvm_module):
+    return self.target_machine.emit_assembly(llvm_module)
 
-  def run_passes(self, llvm_fn, n_iters = llvm_config.llvm_num_passes):
-    for _ in xrange(n_iters):
-      self.pass_manager.run(llvm_fn)
-    #passmanagers = passes.build_pass_managers(
-    #        tm= self.tm , opt=3, inline_threshold=1000,
-    #        loop_vectorize=True, vectorize=True, fpm=False)
-    #for optname in self._opt_passes:
-    #  passmanagers.pm.add(optname)
-    #passmanagers.pm.add('loop-vectorize')
-    #passmanagers.pm.run(self.module)
-      
-global_context = LLVM_Context("module")
+global_context = LLVM_Context()
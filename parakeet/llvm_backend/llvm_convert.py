@@ -1,6 +1,4 @@
-
-import llvm.core as llcore
-import llvm_types
+import llvmlite.ir as ir
 
 from .. ndtypes import FloatT, SignedT, UnsignedT, BoolT, IntT
 from llvm_helpers import zero, one
@@ -11,15 +9,15 @@ def to_bit(llvm_value, builder):
 
   if llvm_t == int1_t:
     return llvm_value
-  if isinstance(llvm_t, llcore.IntegerType):
-    return builder.icmp(llcore.ICMP_NE, llvm_value, zero(llvm_t), "ne_zero")
+  if isinstance(llvm_t, ir.IntType):
+    return builder.icmp_unsigned('!=', llvm_value, zero(llvm_t), "ne_zero")
   else:
-    return builder.fcmp(llcore.FCMP_ONE, llvm_value, zero(llvm_t), "ne_zero")
+    # NaN counts as true, like in C
+    return builder.fcmp_unordered('!=', llvm_value, zero(llvm_t), "ne_zero")
 
 def from_bit(llvm_value, new_ptype, builder):
   llvm_t = llvm_value_type(new_ptype)
-  name = "%s.cast.%s" % (llvm_value.name, new_ptype)
-  return builder.select(llvm_value, one(llvm_t), zero(llvm_t), name)
+  return builder.select(llvm_value, one(llvm_t), zero(llvm_t), "from_bit")
 
 def to_bool(llvm_value, builder):
   """
@@ -34,10 +32,10 @@ def from_float(llvm_value, new_ptype, builder):
   """Convert from an LLVM float value to some other LLVM scalar type"""
 
   dest_llvm_type = llvm_value_type(new_ptype)
-  dest_name = "%s.cast_%s" % (llvm_value.name, new_ptype)
+  dest_name = "cast_%s" % new_ptype
 
   if isinstance(new_ptype, FloatT):
-    if llvm_types.nbytes(llvm_value.type) <= new_ptype.nbytes:
+    if nbytes(llvm_value.type) <= new_ptype.nbytes:
       return builder.fpext(llvm_value, dest_llvm_type, dest_name)
     else:
       return builder.fptrunc(llvm_value, dest_llvm_type, dest_name)
@@ -48,48 +46,43 @@ def from_float(llvm_value, new_ptype, builder):
   else:
     return to_bool(llvm_value, builder)
 
-def from_signed(llvm_value, new_ptype, builder):
-  """Convert from an LLVM float value to some other LLVM scalar type"""
-
+def resize_int(llvm_value, new_ptype, builder, signed):
   dest_llvm_type = llvm_value_type(new_ptype)
-  dest_name = "%s.cast_%s" % (llvm_value.name, new_ptype)
+  dest_name = "cast_%s" % new_ptype
+  old_nbytes = llvm_value.type.width / 8
+  if old_nbytes == new_ptype.nbytes:
+    return llvm_value
+  elif old_nbytes < new_ptype.nbytes:
+    if signed:
+      return builder.sext(llvm_value, dest_llvm_type, dest_name)
+    else:
+      return builder.zext(llvm_value, dest_llvm_type, dest_name)
+  else:
+    return builder.trunc(llvm_value, dest_llvm_type, dest_name)
+
+def from_signed(llvm_value, new_ptype, builder):
+  """Convert from an LLVM signed int value to some other LLVM scalar type"""
 
   if isinstance(new_ptype, FloatT):
-    return builder.sitofp(llvm_value, dest_llvm_type, dest_name)
+    dest_llvm_type = llvm_value_type(new_ptype)
+    return builder.sitofp(llvm_value, dest_llvm_type, "cast_%s" % new_ptype)
   elif isinstance(new_ptype, BoolT):
     return to_bool(llvm_value, builder)
   else:
     assert isinstance(new_ptype, IntT)
-    nbits = llvm_value.type.width
-    nbytes = nbits / 8
-
-    if nbytes == new_ptype.nbytes:
-      return builder.bitcast(llvm_value, dest_llvm_type, dest_name)
-    elif nbytes < new_ptype.nbytes:
-      return builder.zext(llvm_value, dest_llvm_type, dest_name)
-    else:
-      return builder.trunc(llvm_value, dest_llvm_type, dest_name)
+    return resize_int(llvm_value, new_ptype, builder, signed = True)
 
 def from_unsigned(llvm_value, new_ptype, builder):
-  """Convert from an LLVM float value to some other LLVM scalar type"""
-
-  dest_llvm_type = llvm_value_type(new_ptype)
-  dest_name = "%s.cast_%s" % (llvm_value.name, new_ptype)
+  """Convert from an LLVM unsigned int value to some other LLVM scalar type"""
 
   if isinstance(new_ptype, FloatT):
-    return builder.uitofp(llvm_value, dest_llvm_type, dest_name)
+    dest_llvm_type = llvm_value_type(new_ptype)
+    return builder.uitofp(llvm_value, dest_llvm_type, "cast_%s" % new_ptype)
   elif isinstance(new_ptype, BoolT):
     return to_bool(llvm_value, builder)
   else:
     assert isinstance(new_ptype, IntT)
-    nbytes = llvm_value.type.width / 8
-
-    if nbytes == new_ptype.nbytes:
-      return builder.bitcast(llvm_value, dest_llvm_type, dest_name)
-    elif nbytes < new_ptype.nbytes:
-      return builder.zext(llvm_value, dest_llvm_type, dest_name)
-    else:
-      return builder.trunc(llvm_value, dest_llvm_type, dest_name)
+    return resize_int(llvm_value, new_ptype, builder, signed = False)
 
 def convert(llvm_value, old_ptype, new_ptype, builder):
   """
@@ -0,0 +1,274 @@
+"""
+Calling compiled LLVM code straight from Python through ctypes, without
+building an extension module. Arguments get converted into the structures
+described by each type's ctypes_repr and results get read back out of
+them. Arrays go both ways without copying their data: an array allocated by
+compiled code gets wrapped by NumPy and freed once NumPy is done with it.
+"""
+
+import bisect
+import ctypes
+import itertools
+
+import numpy as np
+
+from .. import config
+from ..c_backend.run_function import prepare_with
+from ..compile_lock import compile_lock, InFlight
+from ..ndtypes import (ScalarT, BoolT, FloatT, NoneT, ArrayT, TupleT, SliceT,
+                       ClosureT, TypeValueT, StructT)
+from ..profiling import current_fn_stats, record_native_call
+from ..transforms.pipeline import (loopify, after_indexify, lowering,
+                                   lowering_keep_parfor)
+
+import llvm_config
+import runtime
+from compiler import ModuleCompiler, num_threads
+from llvm_context import global_context
+
+_libc = ctypes.CDLL(None)
+_free = _libc.free
+_free.argtypes = [ctypes.c_void_p]
+_free.restype = None
+
+def ctypes_type(t):
+  """Type of an argument or result in the signature of a compiled function"""
+  if isinstance(t, BoolT):
+    return ctypes.c_int8
+  elif isinstance(t, ScalarT):
+    return t.ctypes_repr
+  elif isinstance(t, NoneT):
+    return ctypes.c_int64
+  elif isinstance(t, TypeValueT):
+    return ctypes.c_int32
+  else:
+    assert isinstance(t, StructT), "Can't pass %s to compiled LLVM code" % t
+    return ctypes.c_void_p
+
+def to_ctypes(value, t):
+  """
+  Convert a value returned by prepare_arg into what a compiled function
+  expects for that type: scalars stay Python values, structures become
+  pointers to their ctypes representation
+  """
+  if isinstance(t, BoolT):
+    return 1 if value else 0
+  elif isinstance(t, FloatT):
+    return float(value)
+  elif isinstance(t, ScalarT):
+    return int(value)
+  elif isinstance(t, (NoneT, TypeValueT)):
+    return 0
+  return ctypes.pointer(to_struct(value, t))
+
+def to_struct(value, t):
+  if isinstance(t, ArrayT):
+    shape_repr = t.shape_t.ctypes_repr
+    itemsize = value.dtype.itemsize
+    shape = shape_repr(*value.shape)
+    strides = shape_repr(*[s // itemsize for s in value.strides])
+    data = ctypes.cast(value.__array_interface__['data'][0], t.ptr_t.ctypes_repr)
+    return t.ctypes_repr(data, ctypes.pointer(shape), ctypes.pointer(strides),
+                         0, value.size)
+  elif isinstance(t, SliceT):
+    fields = [getattr(value, name) for (name, _) in t._fields_]
+  elif isinstance(t, ClosureT):
+    # prepare_arg turns closures into the tuple of their arguments
+    fields = value
+  else:
+    assert isinstance(t, TupleT), "Can't pass %s to compiled LLVM code" % t
+    fields = value
+  converted = []
+  for (field_value, (_, field_t)) in zip(fields, t._fields_):
+    if isinstance(field_t, StructT):
+      converted.append(ctypes.pointer(to_struct(field_value, field_t)))
+    else:
+      converted.append(to_ctypes(field_value, field_t))
+  return t.ctypes_repr(*converted)
+
+class Block(object):
+  """Memory allocated by compiled code, which gets freed along with this object"""
+
+  __slots__ = ['address']
+
+  def __init__(self, address):
+    self.address = address
+
+  def __del__(self):
+    _free(self.address)
+
+class ArrayMemory(object):
+  """
+  Exposes memory to NumPy through the array interface, while keeping alive
+  whatever owns that memory
+  """
+
+  def __init__(self, interface, owner):
+    self.__array_interface__ = interface
+    self.owner = owner
+
+_header_size = runtime.header_bytes
+
+def arena_blocks(head):
+  """(data address, size) of every block on the arena's list"""
+  blocks = []
+  while head:
+    size = ctypes.c_int64.from_address(head + 8).value
+    blocks.append((head + _header_size, size))
+    head = ctypes.c_void_p.from_address(head).value
+  blocks.sort()
+  return blocks
+
+class ResultConverter(object):
+  """
+  Reads the result of a call back into Python, adopting any blocks which
+  hold the data of returned arrays and freeing the rest
+  """
+
+  def __init__(self, head, inputs):
+    self.blocks = arena_blocks(head) if head else []
+    self.starts = [start for (start, _) in self.blocks]
+    self.adopted = {}
+    self.inputs = inputs
+
+  def owner(self, address):
+    i = bisect.bisect_right(self.starts, address) - 1
+    if i >= 0:
+      start, size = self.blocks[i]
+      if address <= start + size:
+        block = self.adopted.get(start)
+        if block is None:
+          block = Block(start - _header_size)
+          self.adopted[start] = block
+        return block
+    # not allocated by the call, so it has to be the data of an input
+    return self.inputs
+
+  def free_rest(self):
+    for (start, _) in self.blocks:
+      if start not in self.adopted:
+        _free(start - _header_size)
+
+  def to_python(self, value, t):
+    if isinstance(t, BoolT):
+      return bool(value)
+    elif isinstance(t, ScalarT):
+      return value
+    elif isinstance(t, NoneT):
+      return None
+    elif isinstance(t, TypeValueT):
+      return t.type
+    return self.struct_to_python(value, t)
+
+  def field_values(self, address, t):
+    struct = t.ctypes_repr.from_address(address)
+    values = []
+    for (name, field_t) in t._fields_:
+      field = getattr(struct, name)
+      if isinstance(field_t, StructT):
+        field = ctypes.cast(field, ctypes.c_void_p).value
+      values.append(self.to_python(field, field_t))
+    return values
+
+  def struct_to_python(self, address, t):
+    if isinstance(t, ArrayT):
+      struct = t.ctypes_repr.from_address(address)
+      shape = tuple(self.field_values(ctypes.addressof(struct.shape.contents), t.shape_t))
+      itemsize = t.elt_type.nbytes
+      strides = tuple(s * itemsize for s in
+                      self.field_values(ctypes.addressof(struct.strides.contents), t.strides_t))
+      data = ctypes.cast(struct.data, ctypes.c_void_p).value
+      interface = {'shape' : shape,
+                   'typestr' : t.elt_type.dtype.str,
+                   'data' : (data + struct.offset * itemsize, False),
+                   'strides' : strides,
+                   'version' : 3}
+      return np.asarray(ArrayMemory(interface, self.owner(data)))
+    values = self.field_values(address, t)
+    if isinstance(t, SliceT):
+      return slice(*values)
+    elif isinstance(t, TupleT):
+      return tuple(values)
+    assert False, "Can't return %s from compiled LLVM code" % t
+
+_module_names = itertools.count()
+
+class CompiledFn(object):
+  def __init__(self, fn_name, c_fn, parakeet_fn, llvm_module):
+    self.fn_name = fn_name
+    self.c_fn = c_fn
+    self.parakeet_fn = parakeet_fn
+    self.llvm_module = llvm_module
+    self.input_types = parakeet_fn.input_types
+    self.return_type = parakeet_fn.return_type
+
+  def __call__(self, *args):
+    arena = ctypes.c_void_p(None)
+    ctypes_args = [to_ctypes(arg, t) for (arg, t) in zip(args, self.input_types)]
+    # ctypes releases the GIL for the duration of the call
+    result = self.c_fn(ctypes.byref(arena), *ctypes_args)
+    converter = ResultConverter(arena.value, args)
+    try:
+      return converter.to_python(result, self.return_type)
+    finally:
+      converter.free_rest()
+
+_compiled_entries = {}
+_entries_in_flight = InFlight(_compiled_entries)
+
+def compile_entry(fn):
+  key = (fn.cache_key, llvm_config.parallel, num_threads())
+  return _entries_in_flight.get(key, lambda: _compile_entry(fn))
+
+def _compile_entry(fn):
+  # generating IR touches shared state, but the LLVM context has its own lock
+  # for optimizing and generating machine code
+  with compile_lock:
+    name = "parakeet_entry_%d" % _module_names.next()
+    module_compiler = ModuleCompiler(name)
+    module_compiler.compile_fn(fn, entry = True)
+    source = str(module_compiler.module)
+  if llvm_config.print_unoptimized_llvm:
+    print "=== LLVM before optimizations =="
+    print
+    print source
+    print
+  llvm_module = global_context.add_module(source)
+  if config.print_generated_code or llvm_config.print_optimized_llvm:
+    print "=== LLVM after optimizations =="
+    print
+    print llvm_module
+    print
+  if llvm_config.print_x86:
+    print "=== Generated assembly =="
+    print
+    print global_context.assembly(llvm_module)
+  address = global_context.function_address(name)
+  signature = ctypes.CFUNCTYPE(ctypes_type(fn.return_type),
+                               ctypes.c_void_p,
+                               *[ctypes_type(t) for t in fn.input_types])
+  return CompiledFn(name, signature(address), fn, llvm_module)
+
+def prepare(fn, args):
+  """
+  Optimize, specialize and lower a function for the given arguments
+  and convert them into what its compiled entry point expects
+  """
+  with compile_lock:
+    if llvm_config.parallel:
+      fn, args = prepare_with(fn, args, after_indexify, llvm_config,
+                              flatten_structs = False)
+      fn = lowering_keep_parfor.apply(fn)
+    else:
+      fn, args = prepare_with(fn, args, loopify, llvm_config,
+                              flatten_structs = False)
+      fn = lowering.apply(fn)
+    return fn, args
+
+def run(fn, args):
+  fn, args = prepare(fn, args)
+  compiled_fn = compile_entry(fn)
+  stats = current_fn_stats()
+  if stats is not None:
+    return record_native_call(stats, compiled_fn, args)
+  return compiled_fn(*args)
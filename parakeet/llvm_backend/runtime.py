@@ -0,0 +1,271 @@
+"""
+Support code for compiled functions, written directly in LLVM assembly so
+that it doesn't need a C compiler. It gets added to the execution engine
+once and every compiled module links against it.
+
+Memory
+  Compiled code allocates with parakeet_alloc, which pushes every block
+  onto a list whose head lives with the caller (the "arena"). Each block
+  starts with a 16 byte header of (next block, size in bytes). After a call
+  returns, whatever the result doesn't refer to gets freed.
+
+Parallel loops
+  parakeet_parallel_for splits the range [0, n) into one chunk per thread
+  and hands them to a pool of worker threads, which are started the first
+  time they're needed and then stay parked on a condition variable between
+  loops (so a ParFor inside a sequential loop doesn't start new threads on
+  every iteration). The calling thread takes chunks too, and waits until
+  every worker is done with the loop. Only one loop uses the pool at a
+  time: nested parallel loops, and those which other threads start while
+  the pool is busy, run on their calling thread.
+"""
+
+alloc_name = "parakeet_alloc"
+parallel_for_name = "parakeet_parallel_for"
+
+# size of the header before the data of each allocated block
+header_bytes = 16
+
+source = r"""
+declare noalias i8* @malloc(i64) nounwind
+declare i32 @getpid() nounwind
+declare i32 @pthread_create(i64*, i8*, i8* (i8*)*, i8*) nounwind
+declare i32 @pthread_detach(i64) nounwind
+declare i32 @pthread_mutex_init(i8*, i8*) nounwind
+declare i32 @pthread_mutex_lock(i8*) nounwind
+declare i32 @pthread_mutex_unlock(i8*) nounwind
+declare i32 @pthread_cond_init(i8*, i8*) nounwind
+declare i32 @pthread_cond_wait(i8*, i8*) nounwind
+declare i32 @pthread_cond_signal(i8*) nounwind
+declare i32 @pthread_cond_broadcast(i8*) nounwind
+
+define i8* @%(alloc)s(i8** %%arena, i64 %%nbytes) nounwind {
+entry:
+  %%total = add i64 %%nbytes, %(header)d
+  %%block = call i8* @malloc(i64 %%total)
+  %%next_ptr = bitcast i8* %%block to i8**
+  %%size_raw = getelementptr i8, i8* %%block, i64 8
+  %%size_ptr = bitcast i8* %%size_raw to i64*
+  store i64 %%nbytes, i64* %%size_ptr
+  br label %%push
+
+push:
+  ; several threads of a parallel loop may allocate at the same time
+  %%head = load atomic i8*, i8** %%arena monotonic, align 8
+  store i8* %%head, i8** %%next_ptr
+  %%swapped = cmpxchg i8** %%arena, i8* %%head, i8* %%block seq_cst monotonic
+  %%ok = extractvalue { i8*, i1 } %%swapped, 1
+  br i1 %%ok, label %%done, label %%push
+
+done:
+  %%data = getelementptr i8, i8* %%block, i64 %(header)d
+  ret i8* %%data
+}
+
+; the pool's mutex and condition variables, with room for any pthreads ABI
+@parakeet_pool_mutex = internal global [128 x i8] zeroinitializer, align 16
+@parakeet_pool_work = internal global [128 x i8] zeroinitializer, align 16
+@parakeet_pool_done = internal global [128 x i8] zeroinitializer, align 16
+; process which started the workers (they don't survive a fork)
+@parakeet_pool_pid = internal global i32 0
+@parakeet_pool_size = internal global i64 0
+@parakeet_pool_busy = internal global i32 0
+@parakeet_pool_generation = internal global i64 0
+; workers which haven't finished with the current loop
+@parakeet_pool_active = internal global i64 0
+@parakeet_job_fn = internal global void (i8*, i64, i64)* null
+@parakeet_job_env = internal global i8* null
+@parakeet_job_n = internal global i64 0
+@parakeet_job_chunk = internal global i64 0
+@parakeet_job_n_chunks = internal global i64 0
+@parakeet_job_next = internal global i64 0
+
+define internal void @parakeet_run_chunks() nounwind {
+entry:
+  %%fn = load void (i8*, i64, i64)*, void (i8*, i64, i64)** @parakeet_job_fn
+  %%env = load i8*, i8** @parakeet_job_env
+  %%n = load i64, i64* @parakeet_job_n
+  %%chunk = load i64, i64* @parakeet_job_chunk
+  %%n_chunks = load i64, i64* @parakeet_job_n_chunks
+  br label %%claim
+
+claim:
+  %%c = atomicrmw add i64* @parakeet_job_next, i64 1 seq_cst
+  %%more = icmp slt i64 %%c, %%n_chunks
+  br i1 %%more, label %%run, label %%done
+
+run:
+  %%lo = mul i64 %%c, %%chunk
+  %%lo_plus = add i64 %%lo, %%chunk
+  %%past_end = icmp sgt i64 %%lo_plus, %%n
+  %%hi = select i1 %%past_end, i64 %%n, i64 %%lo_plus
+  call void %%fn(i8* %%env, i64 %%lo, i64 %%hi)
+  br label %%claim
+
+done:
+  ret void
+}
+
+define internal i8* @parakeet_worker(i8* %%arg) nounwind {
+entry:
+  %%pool_mutex = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_mutex, i64 0, i64 0
+  %%pool_work = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_work, i64 0, i64 0
+  %%pool_done = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_done, i64 0, i64 0
+  ; the generation when this worker was started, so it doesn't miss the
+  ; loop which it was started for
+  %%seen = alloca i64
+  %%first_seen = ptrtoint i8* %%arg to i64
+  store i64 %%first_seen, i64* %%seen
+  call i32 @pthread_mutex_lock(i8* %%pool_mutex)
+  br label %%wait_check
+
+wait_check:
+  %%generation = load i64, i64* @parakeet_pool_generation
+  %%last = load i64, i64* %%seen
+  %%no_loop = icmp eq i64 %%generation, %%last
+  br i1 %%no_loop, label %%wait, label %%work
+
+wait:
+  call i32 @pthread_cond_wait(i8* %%pool_work, i8* %%pool_mutex)
+  br label %%wait_check
+
+work:
+  store i64 %%generation, i64* %%seen
+  call i32 @pthread_mutex_unlock(i8* %%pool_mutex)
+  call void @parakeet_run_chunks()
+  call i32 @pthread_mutex_lock(i8* %%pool_mutex)
+  %%active = load i64, i64* @parakeet_pool_active
+  %%remaining = add i64 %%active, -1
+  store i64 %%remaining, i64* @parakeet_pool_active
+  %%last_one = icmp eq i64 %%remaining, 0
+  br i1 %%last_one, label %%wake_caller, label %%wait_check
+
+wake_caller:
+  call i32 @pthread_cond_signal(i8* %%pool_done)
+  br label %%wait_check
+}
+
+; start workers until there are 'wanted' of them (or no more threads can
+; be created), only called by whoever holds parakeet_pool_busy
+define internal i64 @parakeet_pool_start(i64 %%wanted) nounwind {
+entry:
+  %%thread_id = alloca i64
+  %%pool_mutex = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_mutex, i64 0, i64 0
+  %%pool_work = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_work, i64 0, i64 0
+  %%pool_done = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_done, i64 0, i64 0
+  %%pid = call i32 @getpid()
+  %%pool_pid = load i32, i32* @parakeet_pool_pid
+  %%same_process = icmp eq i32 %%pid, %%pool_pid
+  br i1 %%same_process, label %%grow_check, label %%init
+
+init:
+  call i32 @pthread_mutex_init(i8* %%pool_mutex, i8* null)
+  call i32 @pthread_cond_init(i8* %%pool_work, i8* null)
+  call i32 @pthread_cond_init(i8* %%pool_done, i8* null)
+  store i64 0, i64* @parakeet_pool_size
+  store i32 %%pid, i32* @parakeet_pool_pid
+  br label %%grow_check
+
+grow_check:
+  %%size = load i64, i64* @parakeet_pool_size
+  %%enough = icmp sge i64 %%size, %%wanted
+  br i1 %%enough, label %%done, label %%grow
+
+grow:
+  %%generation = load i64, i64* @parakeet_pool_generation
+  %%generation_arg = inttoptr i64 %%generation to i8*
+  %%status = call i32 @pthread_create(i64* %%thread_id, i8* null, i8* (i8*)* @parakeet_worker, i8* %%generation_arg)
+  %%created = icmp eq i32 %%status, 0
+  br i1 %%created, label %%detach, label %%done
+
+detach:
+  %%id = load i64, i64* %%thread_id
+  call i32 @pthread_detach(i64 %%id)
+  %%new_size = add i64 %%size, 1
+  store i64 %%new_size, i64* @parakeet_pool_size
+  br label %%grow_check
+
+done:
+  %%final_size = load i64, i64* @parakeet_pool_size
+  ret i64 %%final_size
+}
+
+define void @%(parallel_for)s(void (i8*, i64, i64)* %%fn, i8* %%env, i64 %%n, i64 %%n_threads) nounwind {
+entry:
+  %%pool_mutex = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_mutex, i64 0, i64 0
+  %%pool_work = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_work, i64 0, i64 0
+  %%pool_done = getelementptr [128 x i8], [128 x i8]* @parakeet_pool_done, i64 0, i64 0
+  %%any_work = icmp sgt i64 %%n, 0
+  br i1 %%any_work, label %%check_threads, label %%exit
+
+check_threads:
+  %%several = icmp sgt i64 %%n_threads, 1
+  br i1 %%several, label %%claim_pool, label %%serial
+
+claim_pool:
+  ; nested parallel loops, and those of other threads while the pool is
+  ; busy, run on the calling thread
+  %%claimed = cmpxchg i32* @parakeet_pool_busy, i32 0, i32 1 seq_cst monotonic
+  %%got_pool = extractvalue { i32, i1 } %%claimed, 1
+  br i1 %%got_pool, label %%start_pool, label %%serial
+
+start_pool:
+  %%wanted = add i64 %%n_threads, -1
+  %%n_workers = call i64 @parakeet_pool_start(i64 %%wanted)
+  %%no_workers = icmp eq i64 %%n_workers, 0
+  br i1 %%no_workers, label %%release_serial, label %%split
+
+split:
+  ; chunk = ceil(n / n_threads), and only as many chunks as that needs
+  %%threads_minus_one = add i64 %%n_threads, -1
+  %%n_plus = add i64 %%n, %%threads_minus_one
+  %%chunk = sdiv i64 %%n_plus, %%n_threads
+  %%chunk_minus_one = add i64 %%chunk, -1
+  %%n_chunks_plus = add i64 %%n, %%chunk_minus_one
+  %%n_chunks = sdiv i64 %%n_chunks_plus, %%chunk
+  call i32 @pthread_mutex_lock(i8* %%pool_mutex)
+  store void (i8*, i64, i64)* %%fn, void (i8*, i64, i64)** @parakeet_job_fn
+  store i8* %%env, i8** @parakeet_job_env
+  store i64 %%n, i64* @parakeet_job_n
+  store i64 %%chunk, i64* @parakeet_job_chunk
+  store i64 %%n_chunks, i64* @parakeet_job_n_chunks
+  store i64 0, i64* @parakeet_job_next
+  store i64 %%n_workers, i64* @parakeet_pool_active
+  %%generation = load i64, i64* @parakeet_pool_generation
+  %%next_generation = add i64 %%generation, 1
+  store i64 %%next_generation, i64* @parakeet_pool_generation
+  call i32 @pthread_cond_broadcast(i8* %%pool_work)
+  call i32 @pthread_mutex_unlock(i8* %%pool_mutex)
+  ; the calling thread takes chunks like any worker
+  call void @parakeet_run_chunks()
+  call i32 @pthread_mutex_lock(i8* %%pool_mutex)
+  br label %%wait_check
+
+wait_check:
+  %%active = load i64, i64* @parakeet_pool_active
+  %%all_done = icmp eq i64 %%active, 0
+  br i1 %%all_done, label %%finish, label %%wait
+
+wait:
+  call i32 @pthread_cond_wait(i8* %%pool_done, i8* %%pool_mutex)
+  br label %%wait_check
+
+finish:
+  call i32 @pthread_mutex_unlock(i8* %%pool_mutex)
+  store atomic i32 0, i32* @parakeet_pool_busy release, align 4
+  br label %%exit
+
+release_serial:
+  store atomic i32 0, i32* @parakeet_pool_busy release, align 4
+  br label %%serial
+
+serial:
+  call void %%fn(i8* %%env, i64 0, i64 %%n)
+  br label %%exit
+
+exit:
+  ret void
+}
+""" % {'alloc' : alloc_name,
+       'parallel_for' : parallel_for_name,
+       'header' : header_bytes}
@@ -0,0 +1,3 @@
+from run_function import run
+from shared_memory import shared_array, shared_empty
+from worker_pool import WorkerCrashed, WorkerError
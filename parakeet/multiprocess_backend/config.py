@@ -0,0 +1,15 @@
+# how many worker processes to split the outermost loop across,
+# None means one per CPU 
+num_workers = None
+
+# calls whose outermost dimension is shorter than this just run in the 
+# parent process, since shipping them to the workers costs more than it saves 
+min_shard_size = 10000
+
+# backend used for calls which can't be split up (and for combining the 
+# partial results of reductions), should be 'c' or 'openmp'
+fallback_backend = 'openmp'
+
+# directory where shared memory segments live, None means /dev/shm 
+# if it exists and is writable, and otherwise the temp directory 
+shm_dir = None
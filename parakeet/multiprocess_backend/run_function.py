@@ -0,0 +1,186 @@
+import atexit
+import multiprocessing
+import os
+
+import numpy as np
+
+from .. import names
+from ..analysis import (cached_shard_plan, init_is_idempotent, preallocated_result_shape, 
+                        shard_length, use_count)
+from ..c_backend import PyModuleCompiler
+from ..c_backend import run_function as c_run
+from ..c_backend.compile_util import compile_module
+from ..compile_lock import compile_lock, InFlight
+from ..ndtypes import make_fn_type, NoneType
+from ..syntax import Assign, ForLoop, If, Index, Return, Var, While
+from ..syntax.helpers import none, slice_none
+
+from shared_memory import adopt, describe, find_segment, shared_array, shared_empty, unlink
+from worker_pool import get_pool
+import config
+
+def run_locally(fn, args):
+  if config.fallback_backend == 'c':
+    from .. import c_backend
+    return c_backend.run(fn, args)
+  else:
+    from .. import openmp_backend
+    return openmp_backend.run(fn, args)
+
+# compiled entry points whose shared objects the workers load
+_shared_entries = {}
+_shared_in_flight = InFlight(_shared_entries)
+
+def compile_shared(fn):
+  """
+  Like PyModuleCompiler.compile_entry but keeps the shared object around
+  so that the worker processes can load it
+  """
+  compiler = PyModuleCompiler()
+  def compile():
+    with compile_lock:
+      module_args = compiler.entry_module_args(fn)
+    return compile_module(keep_shared_file = True, **module_args)
+  return _shared_in_flight.get(compiler.entry_cache_key(fn), compile)
+
+@atexit.register
+def _remove_shared_objects():
+  for compiled in _shared_entries.values():
+    try:
+      os.remove(compiled.shared_filename)
+    except OSError:
+      pass
+
+def returns_only_at_end(stmts, outer = True):
+  for (i, stmt) in enumerate(stmts):
+    c = stmt.__class__
+    if c is Return:
+      if not outer or i != len(stmts) - 1:
+        return False
+    elif c is If:
+      if not (returns_only_at_end(stmt.true, False) and 
+              returns_only_at_end(stmt.false, False)):
+        return False
+    elif c in (While, ForLoop):
+      if not returns_only_at_end(stmt.body, False):
+        return False
+  return True
+
+# typed function's cache key -> its output passing version or None
+_output_fns = {}
+
+def output_passing_fn(fn):
+  """
+  Copy of an elementwise map which takes the array its result should go into
+  as an extra argument, and writes it there directly instead of allocating
+  and returning it. None if the function's result isn't simply the map.
+  """
+  from ..transforms.clone_function import CloneFunction
+  from ..transforms.pipeline import high_level_optimizations
+  with compile_lock:
+    key = fn.cache_key
+    if key in _output_fns:
+      return _output_fns[key]
+    new_fn = CloneFunction(rename = True).apply(high_level_optimizations(fn))
+    result_t = new_fn.return_type
+    out = Var(names.fresh("out"), type = result_t)
+    # indexify writes a map which gets assigned to out[:] straight into out
+    write_out = Index(out, slice_none, type = result_t)
+    value = new_fn.body[-1].value
+    if not returns_only_at_end(new_fn.body) or \
+       (isinstance(value, Var) and use_count(new_fn).get(value.name) != 1):
+      new_fn = None
+    elif isinstance(value, Var):
+      # returned_adverb already checked that it's only assigned once
+      stmt = [stmt for stmt in new_fn.body
+              if isinstance(stmt, Assign) and isinstance(stmt.lhs, Var) and 
+                 stmt.lhs.name == value.name][0]
+      stmt.lhs = write_out
+      new_fn.body[-1] = Return(none)
+    else:
+      new_fn.body[-1:] = [Assign(write_out, value), Return(none)]
+    if new_fn is not None:
+      new_fn.arg_names = tuple(new_fn.arg_names) + (out.name,)
+      new_fn.input_types = new_fn.input_types + (result_t,)
+      new_fn.return_type = NoneType
+      new_fn.type = make_fn_type(new_fn.input_types, NoneType)
+      new_fn.type_env[out.name] = result_t
+    _output_fns[key] = new_fn
+    return new_fn
+
+def shard_bounds(n, num_shards):
+  step, extra = divmod(n, num_shards)
+  bounds = []
+  start = 0
+  for i in xrange(num_shards):
+    stop = start + step + (1 if i < extra else 0)
+    bounds.append((start, stop))
+    start = stop
+  return bounds
+
+def num_workers():
+  if config.num_workers is not None:
+    return config.num_workers
+  return multiprocessing.cpu_count()
+
+def run(fn, args):
+  """
+  Split the outermost dimension of a map or reduction across the worker
+  processes, or just run it locally if that isn't possible or worthwhile
+  """
+  plan = cached_shard_plan(fn)
+  workers = num_workers()
+  if plan is None or workers < 2:
+    return run_locally(fn, args)
+  args = list(args)
+  for i in plan.sliced:
+    args[i] = np.asarray(args[i])
+  n = shard_length(plan, args)
+  if n is None or n < max(config.min_shard_size, 2) or \
+     (plan.kind == 'reduce' and not init_is_idempotent(plan, run_locally)):
+    return run_locally(fn, args)
+
+  bounds = shard_bounds(n, min(workers, n))
+  temp_paths = []
+  try:
+    for i in plan.sliced:
+      if find_segment(args[i]) is None:
+        args[i] = shared_array(args[i])
+        temp_paths.append(find_segment(args[i])[0])
+    out = None
+    shard_fn = fn
+    out_shape = preallocated_result_shape(plan, fn, args)
+    if out_shape is not None:
+      shard_fn = output_passing_fn(fn)
+      if shard_fn is None:
+        shard_fn = fn
+      else:
+        # the compiled code of each shard writes straight into the result
+        out = shared_empty(out_shape, fn.return_type.elt_type.dtype)
+    tasks = []
+    memo = {}
+    for (start, stop) in bounds:
+      shard_args = list(args)
+      for i in plan.sliced:
+        shard_args[i] = args[i][start:stop]
+      if out is not None:
+        shard_args.append(out[start:stop])
+      prepared_fn, prepared_args = c_run.prepare(shard_fn, shard_args)
+      compiled = compile_shared(prepared_fn)
+      tasks.append((compiled.shared_filename,
+                    compiled.fn_name,
+                    describe(prepared_args, temp_paths, memo)))
+    results = get_pool(workers).run(tasks)
+  finally:
+    for path in temp_paths:
+      unlink(path)
+
+  if plan.kind == 'map':
+    if out is not None:
+      return out
+    return np.concatenate([adopt(desc) for desc in results])
+  partials = [adopt(desc) for desc in results]
+  acc = partials[0]
+  for partial in partials[1:]:
+    acc = run_locally(plan.combine, [acc, partial])
+  return acc
@@ -0,0 +1,185 @@
+"""
+Arrays backed by files in shared memory (/dev/shm on Linux), which the
+worker processes map directly instead of receiving pickled copies.
+Arguments and results cross the process boundary as small descriptors
+naming a segment along with the offset, dtype, shape and strides
+of an array inside it.
+"""
+
+import atexit
+import mmap
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+import config
+
+def segment_dir():
+  if config.shm_dir is not None:
+    return config.shm_dir
+  if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+    return "/dev/shm"
+  return tempfile.gettempdir()
+
+# id of each segment's byte array -> (weak reference to that array, filename)
+_segments = {}
+
+# files of the segments which this process created and still has to unlink
+_owned = set()
+
+def unlink(path):
+  _owned.discard(path)
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+def _forget(key, path, owned):
+  def callback(_):
+    _segments.pop(key, None)
+    if owned:
+      unlink(path)
+  return callback
+
+def map_segment(path, nbytes = None, owned = False):
+  """
+  Map a segment file as an array of bytes, creating it if its size is given.
+  The mapping stays alive for as long as any view of the returned array,
+  and if this process owns the segment then its file gets removed along
+  with the last view.
+  """
+  if nbytes is not None:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+    # mmap doesn't accept empty files
+    os.ftruncate(fd, max(nbytes, 1))
+  else:
+    fd = os.open(path, os.O_RDWR)
+  try:
+    size = os.fstat(fd).st_size
+    buf = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+  finally:
+    os.close(fd)
+  data = np.frombuffer(buf, dtype = np.uint8)
+  key = id(data)
+  _segments[key] = (weakref.ref(data, _forget(key, path, owned)), path)
+  if owned:
+    _owned.add(path)
+  return data
+
+def new_segment(nbytes, owned = True):
+  fd, path = tempfile.mkstemp(prefix = "parakeet-", dir = segment_dir())
+  os.close(fd)
+  return map_segment(path, nbytes, owned = owned), path
+
+def shared_empty(shape, dtype = np.float64):
+  """
+  Allocate an uninitialized array in shared memory, which the multiprocess
+  backend can hand to its workers without copying it
+  """
+  dtype = np.dtype(dtype)
+  if not isinstance(shape, tuple):
+    shape = (shape,)
+  nbytes = int(np.prod(shape)) * dtype.itemsize
+  data, _ = new_segment(nbytes)
+  return data[:nbytes].view(dtype).reshape(shape)
+
+def shared_array(x):
+  """
+  Copy an array (or anything np.asarray accepts) into shared memory
+  """
+  x = np.asarray(x)
+  result = shared_empty(x.shape, x.dtype)
+  result[...] = x
+  return result
+
+def find_segment(x):
+  """
+  Filename and offset of the segment holding an array's data,
+  or None if it's ordinary process memory
+  """
+  base = x
+  while isinstance(base, np.ndarray):
+    entry = _segments.get(id(base))
+    if entry is not None and entry[0]() is base:
+      start = base.__array_interface__['data'][0]
+      return entry[1], x.__array_interface__['data'][0] - start
+    base = base.base
+  return None
+
+def describe(value, temp_paths, memo = None):
+  """
+  Descriptor of an argument which a worker can attach to. Arrays outside of
+  shared memory get copied into new segments, whose files are added to
+  temp_paths for the caller to unlink when the workers are done with them.
+  """
+  if memo is None:
+    memo = {}
+  if isinstance(value, np.ndarray):
+    location = find_segment(value)
+    if location is None:
+      copy = memo.get(id(value))
+      if copy is None:
+        copy = shared_array(value)
+        memo[id(value)] = copy
+        temp_paths.append(find_segment(copy)[0])
+      value = copy
+      location = find_segment(value)
+    path, offset = location
+    return ('array', path, offset, value.dtype.str, value.shape, value.strides)
+  elif isinstance(value, tuple):
+    return ('tuple', [describe(elt, temp_paths, memo) for elt in value])
+  else:
+    return ('value', value)
+
+def attach(desc, mapped = None):
+  """
+  Rebuild the value from a descriptor, mapping each segment only once
+  """
+  if mapped is None:
+    mapped = {}
+  kind = desc[0]
+  if kind == 'array':
+    _, path, offset, dtype, shape, strides = desc
+    data = mapped.get(path)
+    if data is None:
+      data = map_segment(path)
+      mapped[path] = data
+    return np.ndarray(shape, dtype = np.dtype(dtype), buffer = data,
+                      offset = offset, strides = strides)
+  elif kind == 'tuple':
+    return tuple(attach(elt, mapped) for elt in desc[1])
+  else:
+    return desc[1]
+
+def export(value):
+  """
+  Descriptor of a result computed in a worker: arrays get copied into
+  new segments which the receiving process takes ownership of
+  """
+  if isinstance(value, np.ndarray):
+    data, path = new_segment(value.nbytes, owned = False)
+    copy = data[:value.nbytes].view(value.dtype).reshape(value.shape)
+    copy[...] = value
+    return ('array', path, 0, value.dtype.str, value.shape, copy.strides)
+  elif isinstance(value, tuple):
+    return ('tuple', [export(elt) for elt in value])
+  else:
+    return ('value', value)
+
+def adopt(desc):
+  """
+  Attach to a result exported by a worker and take over its segments,
+  whose files can go right away since the mapping outlives them
+  """
+  mapped = {}
+  value = attach(desc, mapped)
+  for path in mapped:
+    unlink(path)
+  return value
+
+@atexit.register
+def _remove_segments():
+  for path in list(_owned):
+    unlink(path)
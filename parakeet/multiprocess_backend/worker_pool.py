@@ -0,0 +1,152 @@
+"""
+A persistent pool of worker processes, each of which loads compiled
+extension modules by filename and calls their entry points on arguments
+mapped from shared memory. A worker dying (say from a segfault in
+generated code) only fails the call it was working on, and the pool
+starts a replacement for it.
+"""
+
+import atexit
+import imp
+import multiprocessing
+import threading
+import traceback
+
+from shared_memory import attach, export
+
+class WorkerCrashed(Exception):
+  def __init__(self, exitcode):
+    self.exitcode = exitcode
+    Exception.__init__(self, "Worker process died with exit code %s" % exitcode)
+
+class WorkerError(RuntimeError):
+  def __init__(self, worker_traceback):
+    self.worker_traceback = worker_traceback
+    RuntimeError.__init__(self, "Error in worker process:\n" + worker_traceback)
+
+def worker_loop(conn):
+  # extension modules which this worker has already loaded
+  modules = {}
+  while True:
+    try:
+      task = conn.recv()
+    except (EOFError, IOError):
+      return
+    if task is None:
+      return
+    try:
+      shared_filename, fn_name, arg_descs = task
+      key = (shared_filename, fn_name)
+      if key not in modules:
+        modules[key] = imp.load_dynamic(fn_name, shared_filename)
+      c_fn = getattr(modules[key], fn_name)
+      mapped = {}
+      args = attach(arg_descs, mapped)
+      # functions which write their result into a shared output argument 
+      # just return None 
+      result = c_fn(*args)
+      reply = ('ok', export(result))
+      del args, result, mapped
+    except Exception:
+      reply = ('error', traceback.format_exc())
+    conn.send(reply)
+
+class WorkerPool(object):
+  def __init__(self, num_workers):
+    self.num_workers = num_workers
+    self.workers = [None] * num_workers
+    self.lock = threading.Lock()
+
+  def start_worker(self, i):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target = worker_loop, args = (child_conn,))
+    process.daemon = True
+    process.start()
+    child_conn.close()
+    self.workers[i] = (process, parent_conn)
+
+  def stop_worker(self, i):
+    if self.workers[i] is None:
+      return
+    process, conn = self.workers[i]
+    self.workers[i] = None
+    if process.is_alive():
+      try:
+        conn.send(None)
+      except IOError:
+        pass
+      process.join(1.0)
+      if process.is_alive():
+        process.terminate()
+        process.join()
+    conn.close()
+
+  def shutdown(self):
+    with self.lock:
+      for i in xrange(self.num_workers):
+        self.stop_worker(i)
+
+  def wait_for(self, i):
+    process, conn = self.workers[i]
+    while not conn.poll(0.05):
+      if not process.is_alive():
+        # anything it managed to send before dying is still readable
+        if conn.poll():
+          break
+        exitcode = process.exitcode
+        self.stop_worker(i)
+        return ('crashed', exitcode)
+    try:
+      return conn.recv()
+    except (EOFError, IOError):
+      exitcode = process.exitcode
+      self.stop_worker(i)
+      return ('crashed', exitcode)
+
+  def run(self, tasks):
+    """
+    Run each task on a different worker and return their results,
+    waiting for all of them to finish even if some fail
+    """
+    assert len(tasks) <= self.num_workers
+    with self.lock:
+      replies = [None] * len(tasks)
+      for (i, task) in enumerate(tasks):
+        if self.workers[i] is None or not self.workers[i][0].is_alive():
+          self.stop_worker(i)
+          self.start_worker(i)
+        process, conn = self.workers[i]
+        try:
+          conn.send(task)
+        except IOError:
+          process.join(1.0)
+          self.stop_worker(i)
+          replies[i] = ('crashed', process.exitcode)
+      for i in xrange(len(tasks)):
+        if replies[i] is None:
+          replies[i] = self.wait_for(i)
+    results = []
+    for (status, value) in replies:
+      if status == 'crashed':
+        raise WorkerCrashed(value)
+      elif status == 'error':
+        raise WorkerError(value)
+      results.append(value)
+    return results
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(num_workers):
+  global _pool
+  with _pool_lock:
+    if _pool is None or _pool.num_workers != num_workers:
+      if _pool is not None:
+        _pool.shutdown()
+      _pool = WorkerPool(num_workers)
+    return _pool
+
+@atexit.register
+def _shutdown_pool():
+  if _pool is not None:
+    _pool.shutdown()
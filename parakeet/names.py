@@ -54,6 +54,21 @@ def refresh(unique_name):
     # it wasn't really an SSA name but keep going anyway 
     return fresh(unique_name)
   
+def register(ssa_name):
+  """
+  Make sure fresh names never collide with a name which wasn't created by 
+  this process (i.e. one from IR loaded off disk)
+  """
+  if ssa_name in original_names:
+    return 
+  base, _, version = ssa_name.rpartition('.')
+  if base and version.isdigit():
+    version = int(version)
+  else:
+    base, version = ssa_name, 1
+  versions[base] = max(versions.get(base, 0), version)
+  original_names[ssa_name] = base 
+
 def add_prefix(prefix, name):
   base = original(name)
   return fresh(prefix + base)
\ No newline at end of file
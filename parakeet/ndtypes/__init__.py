@@ -29,6 +29,8 @@ from slice_type import SliceT, make_slice_type
 
 from tuple_type import TupleT, make_tuple_type, empty_tuple_t, repeat_tuple
 
+from array_conversion import as_ndarray, is_array_like
+
 import dtypes
 import type_conv   
 from type_conv import typeof
@@ -0,0 +1,75 @@
+import array 
+import collections
+import operator
+import numpy as np
+
+def has_array_interface(x):
+  return hasattr(x, '__array_interface__') or hasattr(x, '__array_struct__')
+
+def has_buffer_interface(x):
+  if isinstance(x, array.array):
+    # only has the old buffer interface, but at least it knows its element type 
+    return True 
+  elif isinstance(x, basestring):
+    # strings expose their bytes but aren't arrays as far as Parakeet cares
+    return False
+  try:
+    memoryview(x)
+    return True
+  except TypeError:
+    return False
+
+def is_array_like(x):
+  return isinstance(x, np.ndarray) or has_array_interface(x) or has_buffer_interface(x)
+
+# id of a flat list -> (that list, a copy of its elements, the array made from it)
+# for the most recent lists which got converted
+_list_arrays = collections.OrderedDict()
+max_cached_lists = 16
+
+def list_to_array(x, copy = True):
+  """
+  Convert a list into an array, remembering the result so that passing the
+  same unchanged list again only costs a scan of its elements instead of a
+  conversion. Unless copy is False every caller gets its own array,
+  since compiled code is free to write into its arguments.
+  """
+  key = id(x)
+  cached = _list_arrays.get(key)
+  # the elements of a flat list are immutable scalars, so the list hasn't
+  # changed if it still holds the very same objects
+  if cached is not None and cached[0] is x and len(cached[1]) == len(x) and \
+     all(map(operator.is_, cached[1], x)):
+    array = cached[2]
+  else:
+    array = np.asarray(x)
+    if array.ndim != 1 or array.dtype == np.object_:
+      # nested lists could change without the outer one changing
+      return array
+    _list_arrays.pop(key, None)
+    _list_arrays[key] = (x, list(x), array)
+    while len(_list_arrays) > max_cached_lists:
+      _list_arrays.popitem(last = False)
+  return array.copy() if copy else array
+
+def as_ndarray(x, copy_lists = True, subok = True):
+  """
+  View a value as an ndarray without copying its data whenever that's
+  possible: ndarray subclasses (like np.memmap) are passed through as is
+  unless subok is False, in which case they get viewed as plain ndarrays,
+  and objects with the array interface or the buffer protocol get wrapped
+  around their existing memory
+  """
+  if isinstance(x, np.ndarray):
+    if not subok and type(x) is not np.ndarray:
+      return x.view(np.ndarray)
+    return x
+  elif isinstance(x, list):
+    return list_to_array(x, copy = copy_lists)
+  elif has_array_interface(x):
+    return np.asarray(x)
+  elif isinstance(x, array.array):
+    return np.frombuffer(x, dtype = x.typecode)
+  elif has_buffer_interface(x):
+    return np.asarray(memoryview(x))
+  return np.asarray(x)
@@ -86,7 +86,7 @@ class ArrayT(StructT):
       idx = idx.type
 
     if idx.__class__ is TupleT:
-      indices = idx.elt_types
+      indices = list(idx.elt_types)
     else:
       indices = [idx]
 
@@ -68,7 +68,6 @@ class ClosureT(StructT, ImmutableT):
     closure_arg_types = map(type_conv.typeof, closure_args)
 
     closure_t = make_closure_type(untyped_fundef, closure_arg_types)
-    closure_id = id_of_closure_type(closure_t)
 
     def field_value(closure_arg):
       obj = type_conv.from_python(closure_arg)
@@ -79,7 +78,7 @@ class ClosureT(StructT, ImmutableT):
         return obj
 
     converted_args = [field_value(closure_arg) for closure_arg in closure_args]
-    return closure_t.ctypes_repr(closure_id, *converted_args)
+    return closure_t.ctypes_repr(*converted_args)
 
 
   def to_python(self, parakeet_fn):
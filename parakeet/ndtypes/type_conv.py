@@ -1,7 +1,13 @@
 
+import inspect 
+
 _type_mapping = {}
 _typeof_functions = {}
 
+# (accepts python value?, typeof function) for values whose type and base 
+# classes are all unregistered, like objects exposing the buffer protocol
+_typeof_fallbacks = []
+
 # python type -> (python value -> internal value) 
 _from_python_fns = {}
 # class of ndtype -> (internal value -> python value)
@@ -34,6 +40,32 @@ def register(python_types,
       _from_python_fns[python_type] = from_python     
      
   
+def register_fallback(accepts, typeof):
+  """
+  Use the given typeof function for values of unregistered types 
+  for which accepts returns True
+  """
+  _typeof_fallbacks.append((accepts, typeof))
+
+def find_typeof_function(python_value):
+  """
+  Look for a registered base class of the value's type, then try the 
+  fallbacks, and remember whatever was found for the type itself
+  """
+  python_type = type(python_value)
+  for base in inspect.getmro(python_type)[1:]:
+    if base in _typeof_functions:
+      typeof = _typeof_functions[base]
+      break 
+  else:
+    for (accepts, typeof) in _typeof_fallbacks:
+      if accepts(python_value):
+        break 
+    else:
+      return None 
+  _typeof_functions[python_type] = typeof 
+  return typeof
+
 def equiv_type(python_type):
   assert python_type in _type_mapping, \
       "No type mapping found for %s" % python_type
@@ -41,9 +73,12 @@ def equiv_type(python_type):
 
 def typeof(python_value):
   python_type = type(python_value)
-  assert python_type in _typeof_functions, \
-      "Don't know how to convert value %s : %s" % (python_value, python_type)
-  return _typeof_functions[python_type](python_value)
+  typeof_fn = _typeof_functions.get(python_type)
+  if typeof_fn is None:
+    typeof_fn = find_typeof_function(python_value)
+    assert typeof_fn is not None, \
+        "Don't know how to convert value %s : %s" % (python_value, python_type)
+  return typeof_fn(python_value)
 
 def from_python(python_value):
   """
@@ -0,0 +1,2 @@
+from numpy_compiler import NumpyCompiler, compile_fn
+from run_function import run
@@ -0,0 +1,533 @@
+import itertools
+import numpy as np
+
+from .. import interp
+from ..interp import ClosureCompiler, UnsupportedNode
+from ..ndtypes import ArrayT, IntT, NoneType, ScalarT, TupleT
+from ..syntax import (Assign, Attribute, Call, Cast, Comment, Const,
+                      Expr, Index, Map, PrimCall, Return, Select,
+                      Tuple, TupleProj, TypedFn, Var)
+from ..syntax.helpers import get_fn, get_closure_args, is_identity_fn, unwrap_constant
+from ..transforms import pipeline
+
+# binary ufuncs which are associative and commutative, so a Reduce or Scan
+# with one of them as its combiner can be handed to ufunc.reduce/accumulate
+reducible_ufuncs = set([np.add, np.multiply,
+                        np.maximum, np.minimum,
+                        np.logical_and, np.logical_or,
+                        np.bitwise_and, np.bitwise_or, np.bitwise_xor])
+
+def _scalar_or_scalar_tuple(t):
+  if isinstance(t, ScalarT):
+    return True
+  return isinstance(t, TupleT) and all(isinstance(elt_t, ScalarT) for elt_t in t.elt_types)
+
+class ElementwiseCheck(object):
+  """
+  A function is elementwise if it's straight-line code over scalars (and
+  tuples of scalars) which only reads arrays by indexing them with scalars.
+  Calling such a function on whole arrays, with NumPy broadcasting the
+  scalar operations, gives the same result as calling it on each element.
+  """
+  def __init__(self):
+    self.seen = set([])
+
+  def visit_fn(self, fn):
+    if fn.cache_key in self.seen:
+      return True
+    self.seen.add(fn.cache_key)
+    if not all(_scalar_or_scalar_tuple(t) or isinstance(t, ArrayT)
+               for t in fn.input_types):
+      return False
+    if not _scalar_or_scalar_tuple(fn.return_type):
+      return False
+    # arrays can be captured by a closure but can't be an element
+    if any(isinstance(t, ArrayT) for t in fn.input_types[-1:]):
+      return False
+    body = [stmt for stmt in fn.body if stmt.__class__ is not Comment]
+    if len(body) == 0 or body[-1].__class__ is not Return:
+      return False
+    for stmt in body[:-1]:
+      if stmt.__class__ is not Assign or not self.visit_lhs(stmt.lhs):
+        return False
+      if not self.visit_expr(stmt.rhs):
+        return False
+    return self.visit_expr(body[-1].value)
+
+  def visit_lhs(self, lhs):
+    if lhs.__class__ is Var:
+      return True
+    elif lhs.__class__ is Tuple:
+      return all(self.visit_lhs(elt) for elt in lhs.elts)
+    return False
+
+  def visit_index(self, index):
+    if index.__class__ is Tuple:
+      return all(self.visit_index(elt) for elt in index.elts)
+    if isinstance(index.type, TupleT):
+      return all(isinstance(t, IntT) for t in index.type.elt_types) and \
+        self.visit_expr(index)
+    return isinstance(index.type, IntT) and self.visit_expr(index)
+
+  def visit_expr(self, expr):
+    c = expr.__class__
+    if c is Index:
+      return expr.value.__class__ is Var and \
+        isinstance(expr.value.type, ArrayT) and \
+        isinstance(expr.type, ScalarT) and \
+        self.visit_index(expr.index)
+    if not _scalar_or_scalar_tuple(expr.type):
+      return False
+    if c is Const or c is Var:
+      return True
+    elif c is PrimCall:
+      return isinstance(expr.prim.fn, np.ufunc) and \
+        all(self.visit_expr(arg) for arg in expr.args)
+    elif c is Select:
+      return self.visit_expr(expr.cond) and \
+        self.visit_expr(expr.true_value) and \
+        self.visit_expr(expr.false_value)
+    elif c is Cast:
+      return self.visit_expr(expr.value)
+    elif c is Tuple:
+      return all(self.visit_expr(elt) for elt in expr.elts)
+    elif c is TupleProj:
+      return self.visit_expr(expr.tuple)
+    elif c is Attribute:
+      return isinstance(expr.value.type, TupleT) and self.visit_expr(expr.value)
+    elif c is Call:
+      return expr.fn.__class__ is TypedFn and \
+        all(self.visit_expr(arg) for arg in expr.args) and \
+        self.visit_fn(expr.fn)
+    return False
+
+_elementwise_cache = {}
+def is_elementwise(fn):
+  key = fn.cache_key
+  if key not in _elementwise_cache:
+    _elementwise_cache[key] = ElementwiseCheck().visit_fn(fn)
+  return _elementwise_cache[key]
+
+def find_ufunc(fn):
+  """
+  If the function just combines its two inputs with a reducible ufunc
+  (either directly or by mapping it elementwise over two arrays), return
+  that ufunc, otherwise None
+  """
+  if len(fn.arg_names) != 2 or len(fn.body) != 1 or \
+     fn.body[0].__class__ is not Return:
+    return None
+  value = fn.body[0].value
+  if value.__class__ is PrimCall:
+    f = value.prim.fn
+    args = value.args
+  elif value.__class__ is Map and value.fn.__class__ is TypedFn:
+    f = find_ufunc(value.fn)
+    args = value.args
+  else:
+    return None
+  if f not in reducible_ufuncs or len(args) != 2 or \
+     not all(arg.__class__ is Var for arg in args):
+    return None
+  if set(arg.name for arg in args) != set(fn.arg_names):
+    return None
+  return f
+
+def find_combine_ufunc(combine):
+  if len(get_closure_args(combine)) > 0:
+    return None
+  return find_ufunc(get_fn(combine))
+
+def _axis(expr):
+  axis = expr.axis
+  if isinstance(axis, Expr):
+    axis = unwrap_constant(axis)
+  if isinstance(axis, tuple):
+    if len(axis) != 1:
+      raise UnsupportedNode(expr)
+    axis = axis[0]
+  return axis
+
+def _rank(t):
+  return t.rank if isinstance(t, ArrayT) else 0
+
+def _slice_along(x, axis, i):
+  if axis == 0:
+    return x[i]
+  return x[(slice(None),) * axis + (i,)]
+
+def _fill(result, shape, dtype):
+  """
+  Vectorized functions may return something smaller than the iteration
+  space (i.e. a constant), broadcast it to the full result
+  """
+  if isinstance(result, np.ndarray) and result.shape == shape:
+    if result.dtype == dtype:
+      return result
+    return result.astype(dtype)
+  output = np.empty(shape, dtype = dtype)
+  output[...] = result
+  return output
+
+def _stack(results, shape, dtype, rank = None):
+  if len(results) == 0 and rank is not None:
+    # there's no element to take the shape of, but its dimensions still 
+    # have to broadcast against wherever the (empty) result goes 
+    return np.empty(shape + (1,) * (rank - len(shape)), dtype = dtype)
+  output = np.array(results, dtype = dtype)
+  return output.reshape(shape + output.shape[1:])
+
+class NumpyCompiler(ClosureCompiler):
+  """
+  Closure compiler for the high-level typed IR: instead of lowering
+  adverbs into loops, run them over whole arrays with NumPy ufuncs,
+  ufunc.reduce/accumulate and broadcasting. Adverbs whose functions aren't
+  elementwise fall back on Python loops around their compiled function.
+  """
+  def compile_callee(self, fn):
+    return compile_fn(fn)
+
+  def expr_Slice(self, expr):
+    start = self.compile_expr(expr.start)
+    stop = self.compile_expr(expr.stop)
+    step = self.compile_expr(expr.step)
+    def make_slice(env):
+      stop_value = stop(env)
+      step_value = step(env)
+      # negative indices have already been normalized, so a negative stop
+      # with a negative step means "run past the start of the array"
+      if step_value is not None and step_value < 0 and \
+         stop_value is not None and stop_value < 0:
+        stop_value = None
+      return slice(start(env), stop_value, step_value)
+    return make_slice
+
+  def expr_Ravel(self, expr):
+    array = self.compile_expr(expr.array)
+    return lambda env: np.ravel(array(env))
+
+  def expr_Transpose(self, expr):
+    array = self.compile_expr(expr.array)
+    return lambda env: np.transpose(array(env))
+
+  def compile_adverb_fn(self, expr_fn):
+    """
+    Returns the TypedFn underneath an adverb's function argument along with
+    compiled expressions for its closure arguments
+    """
+    fn = get_fn(expr_fn)
+    closure_args = self.compile_exprs(get_closure_args(expr_fn))
+    return fn, closure_args
+
+  def check_adverb(self, expr):
+    if getattr(expr, 'output', None) is not None:
+      raise UnsupportedNode(expr)
+    if getattr(expr, 'start_index', None) is not None:
+      raise UnsupportedNode(expr)
+
+  def expr_Map(self, expr):
+    self.check_adverb(expr)
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    args = self.compile_exprs(expr.args)
+    ranks = [_rank(arg.type) for arg in expr.args]
+    max_rank = max(ranks)
+    array_positions = [i for (i, r) in enumerate(ranks) if r > 0]
+    if max_rank == 0:
+      f = self.compile_callee(fn)
+      return lambda env: f([c(env) for c in closure_args] + [a(env) for a in args])
+    dtype = expr.type.elt_type.dtype
+    axis = _axis(expr)
+    first = array_positions[0]
+    if is_elementwise(fn) and all(ranks[i] == max_rank for i in array_positions):
+      vector_fn = compile_vector_fn(fn)
+      def map_vectorized(env):
+        values = [a(env) for a in args]
+        result = vector_fn([c(env) for c in closure_args] + values)
+        return _fill(result, values[first].shape, dtype)
+      return map_vectorized
+    elif axis is None:
+      raise UnsupportedNode(expr)
+    f = self.compile_callee(fn)
+    def map_loop(env):
+      fixed = [c(env) for c in closure_args]
+      values = [a(env) for a in args]
+      n = values[first].shape[axis]
+      results = []
+      for i in xrange(n):
+        elts = list(values)
+        for j in array_positions:
+          elts[j] = _slice_along(values[j], axis, i)
+        results.append(f(fixed + elts))
+      return _stack(results, (n,), dtype)
+    return map_loop
+
+  def expr_OuterMap(self, expr):
+    self.check_adverb(expr)
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    args = self.compile_exprs(expr.args)
+    ranks = [_rank(arg.type) for arg in expr.args]
+    if any(r == 0 for r in ranks):
+      raise UnsupportedNode(expr)
+    dtype = expr.type.elt_type.dtype
+    axis = _axis(expr)
+    if is_elementwise(fn):
+      # give each argument its own block of dimensions and let
+      # broadcasting build the cartesian product
+      n_dims = sum(ranks)
+      def outer_vectorized(env):
+        values = []
+        shape = ()
+        before = 0
+        for (a, r) in zip(args, ranks):
+          x = a(env)
+          after = n_dims - before - r
+          values.append(x.reshape((1,) * before + x.shape + (1,) * after))
+          shape += x.shape
+          before += r
+        result = vector_fn([c(env) for c in closure_args] + values)
+        return _fill(result, shape, dtype)
+      vector_fn = compile_vector_fn(fn)
+      return outer_vectorized
+    elif axis is None:
+      raise UnsupportedNode(expr)
+    f = self.compile_callee(fn)
+    def outer_loop(env):
+      fixed = [c(env) for c in closure_args]
+      values = [a(env) for a in args]
+      counts = tuple(x.shape[axis] for x in values)
+      results = []
+      for idx in itertools.product(*[xrange(n) for n in counts]):
+        elts = [_slice_along(x, axis, i) for (x, i) in zip(values, idx)]
+        results.append(f(fixed + elts))
+      return _stack(results, counts, dtype)
+    return outer_loop
+
+  def compile_mapped(self, expr):
+    """
+    For Reduce and Scan, returns a function which applies the map_fn to
+    whole arrays, or None if that can't be vectorized
+    """
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    args = self.compile_exprs(expr.args)
+    ranks = [_rank(arg.type) for arg in expr.args]
+    if len(args) == 1 and len(closure_args) == 0 and is_identity_fn(fn):
+      x, = args
+      return x
+    if ranks[0] == 0 or any(r != ranks[0] for r in ranks):
+      return None
+    if not is_elementwise(fn):
+      return None
+    vector_fn = compile_vector_fn(fn)
+    def mapped(env):
+      values = [a(env) for a in args]
+      result = vector_fn([c(env) for c in closure_args] + values)
+      return _fill(result, values[0].shape, np.asarray(result).dtype)
+    return mapped
+
+  def compile_init(self, expr):
+    if expr.init is None or expr.init.type is NoneType:
+      return None
+    return self.compile_expr(expr.init)
+
+  def compile_fold(self, expr, emit_all):
+    """
+    Shared loop fallback for Reduce and Scan
+    """
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    combine = self.compile_expr(expr.combine)
+    init = self.compile_init(expr)
+    args = self.compile_exprs(expr.args)
+    array_positions = [i for (i, arg) in enumerate(expr.args)
+                       if isinstance(arg.type, ArrayT)]
+    if len(array_positions) == 0:
+      raise UnsupportedNode(expr)
+    first = array_positions[0]
+    axis = _axis(expr)
+    f = self.compile_callee(fn)
+    call = self.call_value
+    if emit_all:
+      emit = self.compile_expr(expr.emit)
+      dtype = expr.type.elt_type.dtype
+    def fold(env):
+      fixed = [c(env) for c in closure_args]
+      values = [a(env) for a in args]
+      fold_axis = axis
+      if fold_axis is None:
+        values = [np.ravel(values[j]) if j in array_positions else values[j]
+                  for j in xrange(len(values))]
+        fold_axis = 0
+      combine_fn = combine(env)
+      acc = None if init is None else init(env)
+      n = values[first].shape[fold_axis]
+      if emit_all:
+        emit_fn = emit(env)
+        results = []
+      for i in xrange(n):
+        elts = list(values)
+        for j in array_positions:
+          elts[j] = _slice_along(values[j], fold_axis, i)
+        elt = f(fixed + elts)
+        acc = elt if acc is None else call(combine_fn, [acc, elt])
+        if emit_all:
+          results.append(call(emit_fn, [acc]))
+      if emit_all:
+        return _stack(results, (n,), dtype)
+      return acc
+    return fold
+
+  def expr_Reduce(self, expr):
+    self.check_adverb(expr)
+    ufunc = find_combine_ufunc(expr.combine)
+    mapped = self.compile_mapped(expr) if ufunc is not None else None
+    if mapped is None:
+      return self.compile_fold(expr, emit_all = False)
+    axis = _axis(expr)
+    init = self.compile_init(expr)
+    t = expr.type
+    dtype = t.elt_type.dtype if isinstance(t, ArrayT) else t.dtype
+    def reduce_vectorized(env):
+      x = mapped(env)
+      if axis is None:
+        x = np.ravel(x)
+        reduce_axis = 0
+      else:
+        reduce_axis = axis
+      if init is not None and x.shape[reduce_axis] == 0:
+        # ufuncs like maximum have no identity to start reducing an empty 
+        # array from, so the result is just the initial value 
+        result_shape = list(x.shape)
+        del result_shape[reduce_axis]
+        result = np.empty(result_shape, dtype = dtype)
+        result[...] = init(env)
+        if len(result_shape) == 0:
+          result = result[()]
+      else:
+        result = ufunc.reduce(x, axis = reduce_axis, dtype = dtype)
+        if init is not None:
+          result = ufunc(init(env), result)
+      return _fill(result, np.shape(result), dtype) if isinstance(t, ArrayT) \
+        else t.dtype.type(result)
+    return reduce_vectorized
+
+  def expr_Scan(self, expr):
+    self.check_adverb(expr)
+    ufunc = find_combine_ufunc(expr.combine)
+    mapped = None
+    if ufunc is not None and len(get_closure_args(expr.emit)) == 0 and \
+       is_identity_fn(get_fn(expr.emit)):
+      mapped = self.compile_mapped(expr)
+    if mapped is None:
+      return self.compile_fold(expr, emit_all = True)
+    axis = _axis(expr)
+    init = self.compile_init(expr)
+    dtype = expr.type.elt_type.dtype
+    def scan_vectorized(env):
+      x = mapped(env)
+      if axis is None:
+        result = ufunc.accumulate(np.ravel(x), axis = 0, dtype = dtype)
+      else:
+        result = ufunc.accumulate(x, axis = axis, dtype = dtype)
+      if init is not None:
+        result = ufunc(init(env), result)
+      return _fill(result, result.shape, dtype)
+    return scan_vectorized
+
+  def compile_index_space(self, expr, fn):
+    """
+    Returns a function from the environment to the shape of an index
+    adverb's iteration space and a function which builds whole arrays of
+    indices in the form the adverb's function expects them
+    """
+    shape = self.compile_expr(expr.shape)
+    tuple_indices = isinstance(fn.input_types[-1], TupleT)
+    def get_shape(env):
+      s = shape(env)
+      if not isinstance(s, tuple):
+        s = (s,)
+      return s
+    def indices(s):
+      if tuple_indices:
+        return tuple(np.indices(s))
+      return np.arange(s[0])
+    return get_shape, indices
+
+  def expr_IndexMap(self, expr):
+    self.check_adverb(expr)
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    get_shape, indices = self.compile_index_space(expr, fn)
+    dtype = expr.type.elt_type.dtype
+    if is_elementwise(fn):
+      vector_fn = compile_vector_fn(fn)
+      def index_map_vectorized(env):
+        s = get_shape(env)
+        result = vector_fn([c(env) for c in closure_args] + [indices(s)])
+        return _fill(result, s, dtype)
+      return index_map_vectorized
+    f = self.compile_callee(fn)
+    tuple_indices = isinstance(fn.input_types[-1], TupleT)
+    def index_map_loop(env):
+      fixed = [c(env) for c in closure_args]
+      s = get_shape(env)
+      if tuple_indices:
+        results = [f(fixed + [idx]) for idx in np.ndindex(s)]
+      else:
+        results = [f(fixed + [i]) for i in xrange(s[0])]
+      return _stack(results, s, dtype, expr.type.rank)
+    return index_map_loop
+
+  def expr_IndexReduce(self, expr):
+    self.check_adverb(expr)
+    fn, closure_args = self.compile_adverb_fn(expr.fn)
+    ufunc = find_combine_ufunc(expr.combine)
+    if ufunc is None or not is_elementwise(fn) or \
+       not isinstance(expr.type, ScalarT):
+      raise UnsupportedNode(expr)
+    get_shape, indices = self.compile_index_space(expr, fn)
+    init = self.compile_init(expr)
+    vector_fn = compile_vector_fn(fn)
+    dtype = expr.type.dtype
+    def index_reduce_vectorized(env):
+      s = get_shape(env)
+      values = vector_fn([c(env) for c in closure_args] + [indices(s)])
+      result = ufunc.reduce(np.ravel(_fill(values, s, dtype)), dtype = dtype)
+      if init is not None:
+        result = ufunc(init(env), result)
+      return dtype.type(result)
+    return index_reduce_vectorized
+
+class VectorCompiler(NumpyCompiler):
+  """
+  Compiles elementwise functions so they can be called on whole arrays,
+  the only constructs which need to change are conditionals
+  """
+  def compile_callee(self, fn):
+    return compile_vector_fn(fn)
+
+  def expr_Select(self, expr):
+    cond = self.compile_expr(expr.cond)
+    true_value = self.compile_expr(expr.true_value)
+    false_value = self.compile_expr(expr.false_value)
+    return lambda env: np.where(cond(env), true_value(env), false_value(env))
+
+_vector_fns = {}
+def compile_vector_fn(fn):
+  key = fn.cache_key
+  if key not in _vector_fns:
+    _vector_fns[key] = VectorCompiler().compile_fn(fn)
+  return _vector_fns[key]
+
+_compiled_fns = {}
+def compile_fn(fn):
+  """
+  Compile a TypedFn from the high-level IR, if it uses anything the NumPy
+  backend can't handle then lower it to loops and use the interpreter
+  """
+  key = fn.cache_key
+  if key in _compiled_fns:
+    return _compiled_fns[key]
+  try:
+    compiled = NumpyCompiler().compile_fn(fn)
+  except UnsupportedNode:
+    compiled = interp.compile_fn(pipeline.loopify(fn))
+  _compiled_fns[key] = compiled
+  return compiled
@@ -0,0 +1,10 @@
+from ..compile_lock import compile_lock
+from ..transforms.pipeline import high_level_optimizations
+
+from numpy_compiler import compile_fn
+
+def run(fn, args):
+  with compile_lock:
+    fn = high_level_optimizations(fn)
+    compiled = compile_fn(fn)
+  return compiled(args)
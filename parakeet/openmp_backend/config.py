@@ -1,2 +1,6 @@
 collapse_nested_loops = True
 schedule = 'static'
+
+# force the C compiler to inline the functions called for each 
+# iteration of a ParFor, IndexReduce or IndexScan into the loop nest 
+inline_loop_bodies = True
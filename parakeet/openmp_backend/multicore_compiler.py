@@ -2,8 +2,10 @@ import multiprocessing
 
 from ..syntax import Expr, Tuple
 from ..syntax.helpers import get_fn, return_type
-from ..ndtypes import ScalarT, TupleT, ArrayT
+from ..ndtypes import ScalarT, TupleT, ArrayT, PtrT
 from ..c_backend import PyModuleCompiler
+from ..c_backend import config as c_config 
+from ..transforms.flattening import flatten_types
 
 import config 
 
@@ -16,7 +18,11 @@ class MulticoreCompiler(PyModuleCompiler):
   
   @property 
   def cache_key(self):
-    return self.__class__, self.depth > 0
+    return self.__class__, self.depth > 0, c_config.nogil, config.inline_loop_bodies
+  
+  def entry_cache_key(self, parakeet_fn, opt_flags = None):
+    return PyModuleCompiler.entry_cache_key(self, parakeet_fn, opt_flags) + \
+      (config.inline_loop_bodies,)
   
   _loop_var_names = ["i","j","k","l","a","b","c","ii","jj","kk","ll","aa","bb","cc"] 
   def loop_vars(self, count, init_value = "0"):
@@ -61,6 +67,47 @@ class MulticoreCompiler(PyModuleCompiler):
     return fn_name, closure_args, input_types
     
   
+  def loop_body_attributes(self):
+    """
+    Attributes for the functions which get called on every iteration of a loop nest. 
+    They're already static inline, but the C compiler only inlines them if it 
+    decides they're small enough and otherwise can't vectorize or hoist anything
+    across the call. 
+    """
+    if config.inline_loop_bodies:
+      return ["__attribute__((always_inline))"]
+    return []
+  
+  def combine_args(self, input_types, closure_args, values, value_types):
+    """
+    Arguments for calling a reduction's combiner, which (once it's been flattened) 
+    takes the fields of the accumulator and element as separate scalars 
+    """
+    arg_types = tuple(input_types[len(closure_args):])
+    if arg_types == tuple(value_types):
+      return tuple(closure_args) + tuple(values)
+    assert arg_types == flatten_types(value_types), \
+      "Combiner expects arguments of type %s but got values of type %s" % \
+      (arg_types, value_types)
+    fields = []
+    for (value, t) in zip(values, value_types):
+      fields.extend(self.flat_fields(value, t))
+    return tuple(closure_args) + tuple(fields)
+  
+  def flat_fields(self, value, t):
+    """
+    C expressions for the scalar fields of a value, in the same order
+    as flatten_type
+    """
+    if isinstance(t, TupleT):
+      fields = []
+      for (i, elt_t) in enumerate(t.elt_types):
+        fields.extend(self.flat_fields("%s.elt%d" % (value, i), elt_t))
+      return fields
+    assert isinstance(t, (ScalarT, PtrT)), \
+      "Can't pass value %s of type %s as separate scalars" % (value, t)
+    return [value]
+  
   def build_loop_body(self, fn_expr, loop_vars, target_name = None):
     """
     Inside a loop nest, construct an index tuple, call the given function, 
@@ -68,7 +115,8 @@ class MulticoreCompiler(PyModuleCompiler):
     Returns the string representation of the loop body and the set of
     private variables it uses. 
     """
-    fn_name, closure_args, input_types = self.get_fn_info(fn_expr)
+    fn_name, closure_args, input_types = \
+      self.get_fn_info(fn_expr, attributes = self.loop_body_attributes())
 
     private_vars = [loop_var for loop_var in loop_vars] 
     last_input_type = input_types[-1]
@@ -103,10 +151,18 @@ class MulticoreCompiler(PyModuleCompiler):
   def exit_parfor(self):
     self.depth -= 1
 
+  def trip_count(self, bounds):
+    return " * ".join("((int64_t) %s)" % bound for bound in bounds)
+  
   def visit_ParFor(self, stmt):
     bounds = self.tuple_to_var_list(stmt.bounds)
     n_vars = len(bounds)
     loop_vars = self.loop_vars(n_vars)
+    if c_config.instrument_regions:
+      region = self.enter_region("ParFor", stmt.source_info)
+      exit_region = "\n" + self.exit_region(region, self.trip_count(bounds))
+    else:
+      exit_region = ""
     
     self.enter_parfor()
     body, private_vars = self.build_loop_body(stmt.fn, loop_vars)
@@ -114,9 +170,12 @@ class MulticoreCompiler(PyModuleCompiler):
     self.exit_parfor()
     
     if self.depth == 0:  
-      release_gil = "\nPy_BEGIN_ALLOW_THREADS\n"
-      acquire_gil = "\nPy_END_ALLOW_THREADS\n" 
-      
+      if self.holding_gil:
+        release_gil = "\nPy_BEGIN_ALLOW_THREADS\n"
+        acquire_gil = "\nPy_END_ALLOW_THREADS\n" 
+      else:
+        # already released for the whole function body 
+        release_gil = acquire_gil = "\n"
       
       if config.collapse_nested_loops:
         omp = "#pragma omp parallel for private(%s) schedule(%s)" % \
@@ -126,9 +185,9 @@ class MulticoreCompiler(PyModuleCompiler):
       else:
         omp = "#pragma omp parallel for private(%s) schedule(%s)" % \
           (private_vars[0], config.schedule)
-      return release_gil + omp + loops + acquire_gil    
+      return release_gil + omp + loops + acquire_gil + exit_region    
     else:
-      return loops 
+      return loops + exit_region 
      
   def visit_IndexReduce(self, expr):
     """
@@ -136,18 +195,25 @@ class MulticoreCompiler(PyModuleCompiler):
     """
     bounds = self.tuple_to_var_list(expr.shape)
     n_vars = len(bounds)
-    combine_name, combine_closure_args, _ = self.get_fn_info(expr.combine)
+    combine_name, combine_closure_args, combine_input_types = \
+      self.get_fn_info(expr.combine, attributes = self.loop_body_attributes())
     loop_vars = self.loop_vars(n_vars)
     assert expr.init is not None, "Accumulator required but not given"
     
-    
-    elt = self.fresh_var(return_type(expr.fn), "elt")
+    elt_t = return_type(expr.fn)
+    elt = self.fresh_var(elt_t, "elt")
 
     body, _ = self.build_loop_body(expr.fn, loop_vars, target_name = elt)
     acc = self.fresh_var(expr.type, "acc", self.visit_expr(expr.init))
-    combine_arg_str = ", ".join(tuple(combine_closure_args) + (acc, elt))
+    combine_args = self.combine_args(combine_input_types, combine_closure_args, 
+                                     (acc, elt), (expr.type, elt_t))
+    combine_arg_str = ", ".join(combine_args)
     body += "\n%s = %s(%s);\n" % (acc, combine_name, combine_arg_str)
+    if c_config.instrument_regions:
+      region = self.enter_region("IndexReduce", expr.source_info)
     self.append(self.build_loops(loop_vars, bounds, body))
+    if c_config.instrument_regions:
+      self.append(self.exit_region(region, self.trip_count(bounds)))
     return acc 
     
   def visit_IndexScan(self, expr):
@@ -159,7 +225,8 @@ class MulticoreCompiler(PyModuleCompiler):
     bounds = self.tuple_to_var_list(expr.shape)
     n_vars = len(bounds)
     
-    combine_name, combine_closure_args, _ = self.get_fn_info(expr.combine)
+    combine_name, combine_closure_args, combine_input_types = \
+      self.get_fn_info(expr.combine, attributes = self.loop_body_attributes())
     loop_vars = self.loop_vars(n_vars)
     
     
@@ -172,9 +239,12 @@ class MulticoreCompiler(PyModuleCompiler):
     elt = self.fresh_var(elt_t, "elt")
     body, _ = self.build_loop_body(expr.fn, loop_vars, target_name = elt)
     acc = self.fresh_var(expr.init.type, "acc", self.visit_expr(expr.init))
-    combine_arg_str = ", ".join(tuple(combine_closure_args) + (acc, elt))
+    combine_args = self.combine_args(combine_input_types, combine_closure_args, 
+                                     (acc, elt), (expr.init.type, elt_t))
+    combine_arg_str = ", ".join(combine_args)
     body += "\n%s = %s(%s);\n" % (acc, combine_name, combine_arg_str)
-    emit_name, emit_closure_args, _ = self.get_fn_info(expr.emit)
+    emit_name, emit_closure_args, _ = \
+      self.get_fn_info(expr.emit, attributes = self.loop_body_attributes())
     body += "\n"
     emit_args = tuple(emit_closure_args) + (acc,)
     emit_args_str = ", ".join(emit_args)
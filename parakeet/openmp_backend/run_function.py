@@ -1,22 +1,38 @@
-from .. import config 
-
-from ..c_backend.prepare_args import prepare_args  
-from ..transforms.pipeline import after_indexify, final_loop_optimizations, flatten  
-from ..transforms.stride_specialization import specialize
+from ..c_backend import config as c_config 
+from ..c_backend.run_function import prepare_with
+from ..profiling import current_fn_stats, record_native_call
+from ..transforms.pipeline import after_indexify
 
 from multicore_compiler import MulticoreCompiler 
 
+def prepare(fn, args):
+  return prepare_with(fn, args, after_indexify, c_config)
+
 def run(fn, args):
-  args = prepare_args(args, fn.input_types)
-  fn = after_indexify(fn)
-  # TODO: finish debuggin flattening 
-  # fn = flatten(fn) 
-  fn = final_loop_optimizations.apply(fn)
-  if config.stride_specialization:
-    fn = specialize(fn, python_values = args)
+  fn, args = prepare(fn, args)
+  stats = current_fn_stats()
+  if c_config.tiered_compilation:
+    from ..c_backend.tiered import tiered_fn 
+    c_fn = tiered_fn(fn, MulticoreCompiler)
+    if stats is not None:
+      return record_native_call(stats, c_fn, (args,))
+    return c_fn(args)
       
   compiled_fn = MulticoreCompiler().compile_entry(fn)
- 
-  assert len(args) == len(fn.input_types)
+  if stats is not None:
+    return record_native_call(stats, compiled_fn.c_fn, args)
   result = compiled_fn.c_fn(*args)
-  return result
\ No newline at end of file
+  return result
+
+def compile_batch(calls):
+  """
+  Build the entry points for a list of (typed function, args) pairs as a
+  single extension module, see c_backend.compile_batch
+  """
+  fns = [prepare(fn, args)[0] for (fn, args) in calls]
+  if c_config.tiered_compilation:
+    from ..c_backend.tiered import quick_opt_flags 
+    opt_flags = quick_opt_flags()
+  else:
+    opt_flags = None 
+  return MulticoreCompiler().compile_entries(fns, opt_flags = opt_flags)
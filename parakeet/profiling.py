@@ -0,0 +1,211 @@
+"""
+Counters for how jit functions behave at runtime, and where the time 
+spent compiling them goes. 
+
+Every jit function has a FnStats object which counts its calls, how often 
+they were dispatched to an existing specialization, and how the time of each 
+call splits between compiled code and Python. The stats of all functions 
+(along with the compile times below) can be read with 'stats_snapshot'.
+
+When config.collect_compile_times is on, the functions wrapped with
+'compile_timer' add their running time to a category:
+
+  frontend -- translating Python functions and type specialization
+  pipeline -- running optimization phases
+  codegen  -- generating C source
+  gcc      -- running the C compiler and loading the module it produces
+  llvm     -- optimizing and generating machine code with the LLVM backend
+
+Time is only counted towards the innermost category, so running the C
+compiler from inside a phase doesn't count towards both.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+import config
+
+compile_times = {}
+
+_local = threading.local()
+
+def _timer_stack():
+  stack = getattr(_local, 'stack', None)
+  if stack is None:
+    stack = []
+    _local.stack = stack
+  return stack
+
+def _add_time(category, t):
+  compile_times[category] = compile_times.get(category, 0.0) + t
+
+def start_timer(category):
+  stack = _timer_stack()
+  now = time.time()
+  if stack:
+    # pause whatever the enclosing timer was measuring
+    outer = stack[-1]
+    _add_time(outer[0], now - outer[1])
+  stack.append([category, now])
+
+def stop_timer():
+  stack = _timer_stack()
+  now = time.time()
+  category, start = stack.pop()
+  _add_time(category, now - start)
+  if stack:
+    stack[-1][1] = now
+
+def compile_timer(category):
+  """
+  Decorator which counts the time spent in a function towards
+  the given category
+  """
+  def decorator(fn):
+    def timed_fn(*args, **kwargs):
+      if not config.collect_compile_times:
+        return fn(*args, **kwargs)
+      start_timer(category)
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        stop_timer()
+    timed_fn.__name__ = fn.__name__
+    timed_fn.__doc__ = fn.__doc__
+    return timed_fn
+  return decorator
+
+def compile_time_snapshot():
+  return dict(compile_times)
+
+def reset_compile_times():
+  compile_times.clear()
+
+class FnStats(object):
+  """
+  Counters for a single jit function. Native time is spent inside the 
+  compiled entry function (which includes unboxing its arguments and 
+  boxing the result), everything else counts as Python overhead. 
+  """
+  __slots__ = ['name', 'calls', 'dispatch_hits', 'dispatch_misses', 
+               'specialization_keys', 'total_time', 'native_time', 
+               'prepare_args_time', 'bytes_allocated']
+  
+  def __init__(self, name):
+    self.name = name 
+    self.reset()
+    
+  def reset(self):
+    self.calls = 0
+    self.dispatch_hits = 0 
+    self.dispatch_misses = 0
+    self.specialization_keys = set([])
+    self.total_time = 0.0
+    self.native_time = 0.0 
+    self.prepare_args_time = 0.0
+    self.bytes_allocated = 0 
+    
+  def record_dispatch(self, key):
+    if key in self.specialization_keys:
+      self.dispatch_hits += 1
+    else:
+      self.dispatch_misses += 1
+      self.specialization_keys.add(key)
+      
+  def as_dict(self):
+    return {'calls' : self.calls, 
+            'dispatch_hits' : self.dispatch_hits, 
+            'dispatch_misses' : self.dispatch_misses, 
+            'specializations' : len(self.specialization_keys), 
+            'total_time' : self.total_time, 
+            'native_time' : self.native_time, 
+            'python_overhead' : max(self.total_time - self.native_time, 0.0),
+            'prepare_args_time' : self.prepare_args_time, 
+            'bytes_allocated' : self.bytes_allocated}
+  
+  def __str__(self):
+    return "FnStats(%s, %s)" % (self.name, self.as_dict())
+  
+  def __repr__(self):
+    return str(self)
+
+_fn_stats = {}
+
+def fn_stats(name):
+  """
+  The stats object for a function, jit wrappers of functions with the 
+  same qualified name share one 
+  """
+  stats = _fn_stats.get(name)
+  if stats is None:
+    stats = FnStats(name)
+    _fn_stats[name] = stats 
+  return stats 
+
+def current_fn_stats():
+  """
+  Stats of the jit function currently being called on this thread, 
+  or None if Parakeet was called some other way
+  """
+  return getattr(_local, 'fn_stats', None)
+
+def enter_call(stats):
+  """
+  Make the given stats current for this thread, returns whatever 
+  was current before so it can be restored by exit_call
+  """
+  prev = getattr(_local, 'fn_stats', None)
+  _local.fn_stats = stats 
+  return prev 
+
+def exit_call(prev):
+  _local.fn_stats = prev 
+  
+def returned_bytes(value):
+  """
+  Size of the arrays returned by compiled code which it allocated itself, 
+  rather than views of its inputs
+  """
+  if isinstance(value, np.ndarray):
+    return value.nbytes if value.base is None else 0 
+  elif isinstance(value, tuple):
+    return sum(returned_bytes(elt) for elt in value)
+  return 0
+
+def record_native_call(stats, c_fn, args):
+  start = time.time()
+  result = c_fn(*args)
+  stats.native_time += time.time() - start 
+  stats.bytes_allocated += returned_bytes(result)
+  return result 
+
+def stats_snapshot():
+  """
+  Current stats of every jit function which has been called along with 
+  the compile times, as a dictionary which can be serialized to JSON 
+  """
+  functions = {}
+  for name, stats in _fn_stats.items():
+    if stats.calls > 0:
+      functions[name] = stats.as_dict()
+  return {'functions' : functions, 
+          'compile_times' : compile_time_snapshot()}
+
+def region_profile(reset = False):
+  """
+  Time and trip counts of the loops and allocations in compiled code, 
+  only collected while c_backend.config.instrument_regions is on 
+  """
+  import sys 
+  if 'parakeet.c_backend.instrumentation' not in sys.modules:
+    # nothing could have been instrumented yet 
+    return []
+  from c_backend import instrumentation 
+  return instrumentation.region_profile(reset)
+
+def reset_stats():
+  for stats in _fn_stats.values():
+    stats.reset()
+  reset_compile_times()
@@ -0,0 +1 @@
+from run_function import run
@@ -0,0 +1,20 @@
+# how many bytes of the streamed inputs each call of the kernel covers,
+# small enough that a chunk and the one being prefetched fit in RAM 
+chunk_bytes = 64 * 2 ** 20
+
+# copy the next chunk of each input into a buffer on a separate thread
+# while the kernel works on the current one (the compiled code releases 
+# the GIL, see c_backend.config.nogil). Otherwise the kernel reads straight 
+# from the inputs and relies on the OS's readahead.  
+prefetch = True
+
+# backend which runs the kernel on each chunk and which runs functions that
+# can't be streamed at all, should be 'c' or 'openmp'
+kernel_backend = 'openmp'
+
+# results bigger than this go into a memory-mapped temporary file 
+# rather than RAM 
+result_memmap_bytes = 2 ** 30 
+
+# directory for those files, None means the default temp directory 
+result_dir = None
@@ -0,0 +1,127 @@
+"""
+Run maps and reductions over inputs which don't fit in memory (like
+np.memmap arrays of files) one chunk of their outermost dimension
+at a time, calling the same compiled kernel on every chunk.
+"""
+
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from ..analysis import (cached_shard_plan, init_is_idempotent, preallocated_result_shape,
+                        shard_length)
+import config
+
+def run_kernel(fn, args):
+  if config.kernel_backend == 'c':
+    from .. import c_backend
+    return c_backend.run(fn, args)
+  else:
+    from .. import openmp_backend
+    return openmp_backend.run(fn, args)
+
+def chunk_bounds(n, rows):
+  return [(start, min(start + rows, n)) for start in xrange(0, n, rows)]
+
+def allocate_result(shape, dtype):
+  dtype = np.dtype(dtype)
+  nbytes = int(np.prod(shape)) * dtype.itemsize
+  if nbytes <= config.result_memmap_bytes:
+    return np.empty(shape, dtype = dtype)
+  fd, path = tempfile.mkstemp(prefix = "parakeet-", suffix = ".dat", dir = config.result_dir)
+  os.close(fd)
+  result = np.memmap(path, dtype = dtype, mode = 'w+', shape = shape)
+  # the mapping keeps the file's contents alive after its name is gone
+  os.remove(path)
+  return result
+
+class Prefetcher(object):
+  """
+  Double buffering for the streamed inputs: one set of buffers holds the
+  chunk the kernel is working on while a thread fills the other
+  """
+
+  def __init__(self, inputs, rows):
+    self.inputs = inputs
+    self.buffers = [[np.empty((rows,) + x.shape[1:], dtype = x.dtype) for x in inputs]
+                    for _ in xrange(2)]
+    self.thread = None
+    self.error = None
+
+  def load(self, slot, start, stop):
+    try:
+      for (buf, x) in zip(self.buffers[slot], self.inputs):
+        buf[:stop - start] = x[start:stop]
+    except Exception, e:
+      self.error = e
+
+  def start(self, slot, start, stop):
+    self.thread = threading.Thread(target = self.load, args = (slot, start, stop))
+    self.thread.daemon = True
+    self.thread.start()
+
+  def wait(self, slot, start, stop):
+    self.thread.join()
+    self.thread = None
+    if self.error is not None:
+      raise self.error
+    return [buf[:stop - start] for buf in self.buffers[slot]]
+
+def run(fn, args):
+  """
+  Stream the outermost dimension of a map or reduction through the kernel
+  in chunks of about config.chunk_bytes, or just run the kernel on
+  everything at once if the function can't be split up that way
+  """
+  plan = cached_shard_plan(fn)
+  if plan is None:
+    return run_kernel(fn, args)
+  args = list(args)
+  for i in plan.sliced:
+    if not isinstance(args[i], np.ndarray):
+      args[i] = np.asarray(args[i])
+  n = shard_length(plan, args)
+  if n is None or (plan.kind == 'reduce' and not init_is_idempotent(plan, run_kernel)):
+    return run_kernel(fn, args)
+  row_bytes = sum(args[i][:1].nbytes for i in plan.sliced)
+  rows = max(1, config.chunk_bytes // max(row_bytes, 1))
+  if rows >= n:
+    return run_kernel(fn, args)
+
+  out = None
+  out_shape = preallocated_result_shape(plan, fn, args)
+  if out_shape is not None:
+    out = allocate_result(out_shape, fn.return_type.elt_type.dtype)
+  inputs = [args[i] for i in plan.sliced]
+  prefetcher = Prefetcher(inputs, rows) if config.prefetch else None
+  bounds = chunk_bounds(n, rows)
+  if prefetcher is not None:
+    prefetcher.start(0, *bounds[0])
+  pieces = []
+  acc = None
+  for (k, (start, stop)) in enumerate(bounds):
+    if prefetcher is not None:
+      chunks = prefetcher.wait(k % 2, start, stop)
+      if k + 1 < len(bounds):
+        prefetcher.start((k + 1) % 2, *bounds[k + 1])
+    else:
+      chunks = [x[start:stop] for x in inputs]
+    chunk_args = list(args)
+    for (i, chunk) in zip(plan.sliced, chunks):
+      chunk_args[i] = chunk
+    result = run_kernel(fn, chunk_args)
+    if out is not None:
+      out[start:stop] = result
+    elif plan.kind == 'map':
+      pieces.append(result)
+    elif acc is None:
+      acc = result
+    else:
+      acc = run_kernel(plan.combine, [acc, result])
+  if plan.kind == 'reduce':
+    return acc
+  elif out is not None:
+    return out
+  return np.concatenate(pieces)
@@ -1,4 +1,4 @@
-from dsltools import Node 
+from node import Node
 from expr import Expr
   
 
@@ -19,12 +19,15 @@ class Accumulative(Expr):
   'combine' function to merge the accumulators resulting from parallel
   sub-computations.
   """
+  # mixin, its members get slots in the adverbs which inherit it 
+  __slots__ = ()
   _members = ['combine', 'init']
   
 class HasEmit(Expr):
   """
   Common base class for Scan, IndexScan, and whatever other sorts of scans can be dreamed up
   """
+  __slots__ = ()
   _members = ['emit']
   
   
@@ -154,6 +157,7 @@ class IndexFilterReduce(FilterReduce):
   pass 
 
 class Tiled(object):
+  __slots__ = ()
   _members = ['axes', 'fixed_tile_size']
 
   def __repr__(self):
@@ -5,6 +5,8 @@ class ArrayExpr(SeqExpr):
   Common base class for first-order array operations 
   that don't change the underlying data 
   """
+  __slots__ = ('array',)
+
   def __init__(self, array, type = None, source_info = None):
     self.array = array 
     self.type = type 
@@ -14,6 +16,8 @@ class ArrayExpr(SeqExpr):
     yield self.array 
 
 class Array(ArrayExpr):
+  __slots__ = ('elts',)
+
   def __init__(self, elts, type = None, source_info = None):
     self.elts = tuple(elts) 
     self.type = type 
@@ -26,6 +30,8 @@ class Array(ArrayExpr):
     return hash(self.elts)
 
 class Slice(ArrayExpr):
+  __slots__ = ('start', 'stop', 'step')
+
   def __init__(self, start, stop, step, type = None, source_info = None):
     self.start = start 
     self.stop = stop 
@@ -58,6 +64,8 @@ class Slice(ArrayExpr):
     return hash((self.start, self.stop, self.step))
 
 class ConstArray(ArrayExpr):
+  __slots__ = ('shape',)
+
   def __init__(self, shape, value, type = None, source_info = None):
     self.shape = shape 
     self.value = value 
@@ -73,6 +81,7 @@ class ConstArrayLike(ArrayExpr):
   Create an array with the same shape as the first arg, but with all values set
   to the second arg
   """
+  __slots__ = ()
 
   def __init__(self, array, value, type = None, source_info = None):
     self.array = array 
@@ -85,6 +94,8 @@ class ConstArrayLike(ArrayExpr):
     yield self.value   
 
 class Range(ArrayExpr):
+  __slots__ = ('start', 'stop', 'step')
+
   def __init__(self, start, stop, step, type = None, source_info = None):
     self.start = start 
     self.stop = stop 
@@ -103,6 +114,8 @@ class Range(ArrayExpr):
 
 class AllocArray(ArrayExpr):
   """Allocate an unfilled array of the given shape and type"""
+  __slots__ = ('shape', 'elt_type')
+
   def __init__(self, shape, elt_type, type = None, source_info = None):
     # TODO: support a 'fill' field 
     self.shape = shape 
@@ -119,6 +132,8 @@ class AllocArray(ArrayExpr):
 
 class ArrayView(ArrayExpr):
   """Create a new view on already allocated underlying data"""
+  __slots__ = ('data', 'shape', 'strides', 'offset', 'size')
+
   def __init__(self, data, shape, strides, offset, size, type = None, source_info = None):
     self.data = data 
     self.shape = shape 
@@ -136,6 +151,8 @@ class ArrayView(ArrayExpr):
     yield self.size
 
 class Ravel(ArrayExpr):
+  __slots__ = ()
+
   def children(self):
     return (self.array,)
 
@@ -143,6 +160,8 @@ class Ravel(ArrayExpr):
     return "Ravel(%s)" % self.array 
 
 class Reshape(ArrayExpr):
+  __slots__ = ('shape',)
+
   def __init__(self, array, shape, type = None, source_info = None):
     self.array = array 
     self.shape = shape 
@@ -158,16 +177,21 @@ class Reshape(ArrayExpr):
     return "Reshape(%s, %s)" % (self.array, self.shape)
 
 class Shape(ArrayExpr):
+  __slots__ = ()
   
   def __str__(self):
     return "Shape(%s)" % self.array 
   
 class Strides(ArrayExpr):
+  __slots__ = ()
+
   def __str__(self):
     return "Strides(%s)" % self.array 
   
     
 class Transpose(ArrayExpr):
+  __slots__ = ()
+
   def children(self):
     yield self.array
   
@@ -175,6 +199,8 @@ class Transpose(ArrayExpr):
     return "%s.T" % self.array 
   
 class Tile(ArrayExpr):
+  __slots__ = ('reps',)
+
   def __init__(self, array, reps, type = None, source_info = None):
     self.array = array 
     self.reps = reps 
@@ -3,13 +3,29 @@ from dsltools import Node
 from .. ndtypes import NoneT
 
 class Expr(object):
-  # _members = ['type', 'source_info']
-  
+  # subclasses declare __slots__ for their own fields, 
+  # including 'type' and 'source_info' 
+  __slots__ = ()
     
   @classmethod
   def node_type(cls):
     return cls.__name__
   
+  @classmethod 
+  def fields(cls):
+    """
+    Names of all the attributes which make up this kind of node, 
+    computed once per class from the __slots__ of its ancestors
+    """
+    if '_fields' not in cls.__dict__:
+      fields = []
+      for c in reversed(cls.__mro__):
+        for name in c.__dict__.get('__slots__', ()):
+          if name not in fields:
+            fields.append(name)
+      cls._fields = tuple(fields)
+    return cls._fields
+  
   def children(self):
     for v in self.itervalues():
       if v and isinstance(v, Expr):
@@ -35,6 +51,8 @@ class Expr(object):
     return hash(elts)
    
 class Const(Expr):
+  __slots__ = ('value', 'type', 'source_info')
+
   def __init__(self, value, type = None, source_info = None):
     self.value = value 
     self.type = type 
@@ -69,6 +87,8 @@ class Const(Expr):
            self.type != other.type
 
 class Var(Expr):
+  __slots__ = ('name', 'type', 'source_info')
+
   def __init__(self, name, type = None, source_info = None):
     assert name is not None 
     self.name = name
@@ -113,6 +133,8 @@ class Var(Expr):
     return ()
 
 class Attribute(Expr):
+  __slots__ = ('value', 'name', 'type', 'source_info')
+
   def __init__(self, value, name, type = None, source_info = None):
     self.value = value 
     self.name = name 
@@ -136,6 +158,8 @@ class Attribute(Expr):
 
 class Closure(Expr):
   """Create a closure which points to a global fn with a list of partial args"""
+  __slots__ = ('fn', 'args', 'type', 'source_info')
+
   def __init__(self, fn, args, type = None, source_info = None):
     self.fn = fn 
     self.args = args 
@@ -162,6 +186,8 @@ class Closure(Expr):
     return hash((self.fn, tuple(self.args)))
 
 class Call(Expr):
+  __slots__ = ('fn', 'args', 'type', 'source_info')
+
   def __init__(self, fn, args, type = None, source_info = None):
     self.fn = fn 
     self.args = args 
@@ -195,6 +221,8 @@ class PrimCall(Expr):
   """
   Call a primitive function, the "prim" field should be a prims.Prim object
   """
+  __slots__ = ('prim', 'args', 'type', 'source_info')
+
   def __init__(self, prim, args, type = None, source_info = None):
     self.prim = prim 
     self.args = args 
@@ -260,6 +288,8 @@ class PrimCall(Expr):
 
 
 class ClosureElt(Expr):
+  __slots__ = ('closure', 'index', 'type', 'source_info')
+
   def __init__(self, closure, index, type = None, source_info = None):
     self.closure = closure 
     self.index = index 
@@ -276,6 +306,8 @@ class ClosureElt(Expr):
     return hash((self.closure, self.index))
 
 class Cast(Expr):
+  __slots__ = ('value', 'type', 'source_info')
+
   def __init__(self, value, type, source_info = None):
     self.value = value 
     self.type = type 
@@ -291,6 +323,8 @@ class Cast(Expr):
     return "Cast(%s : %s)" % (self.value, self.type) 
 
 class Select(Expr):
+  __slots__ = ('cond', 'true_value', 'false_value', 'type', 'source_info')
+
   def __init__(self, cond, true_value, false_value, type = None, source_info = None):
     self.cond = cond 
     self.true_value = true_value 
@@ -1,6 +1,8 @@
 from seq_expr import SeqExpr 
 
 class List(SeqExpr):
+  __slots__ = ('elts',)
+
   def __init__(self, elts, type = None, source_info = None):
     self.elts = tuple(elts)
     self.type = type 
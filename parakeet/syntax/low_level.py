@@ -6,6 +6,7 @@ class Struct(Expr):
   Eventually all non-scalar data should be transformed to be created with this
   syntax node, signifying explicit struct allocation
   """
+  __slots__ = ('args', 'type', 'source_info')
 
   def __init__(self, args, type = None, source_info = None):
     self.args = tuple(args)
@@ -25,6 +26,7 @@ class Struct(Expr):
 
 class Alloc(Expr):
   """Allocates a block of data, returns a pointer"""
+  __slots__ = ('elt_type', 'count', 'type', 'source_info')
   
   def __init__(self, elt_type, count, type = None, source_info = None):
     self.elt_type = elt_type 
@@ -43,6 +45,8 @@ class Alloc(Expr):
 
 class Free(Expr):
   """Free a manually allocated block of memory"""
+  __slots__ = ('value', 'type', 'source_info')
+
   def __init__(self, value, type = None, source_info = None):
     self.value = value 
     self.type = type 
@@ -58,6 +62,7 @@ class Free(Expr):
     return hash(self.value)
   
 class NumCores(Expr):
+  __slots__ = ('type', 'source_info')
   
   """
   Degree of available parallelism, 
@@ -88,6 +93,8 @@ class SourceExpr(Expr):
   should only be used from within a backend that knows what
   the target code should look like 
   """
+  __slots__ = ('text', 'type', 'source_info')
+
   def __init__(self, text, type = None, source_info = None):
     self.text = text 
     self.type = type 
@@ -102,6 +109,8 @@ class SourceStmt(Stmt):
   should only be used from within a backend that knows what
   the target code should look like 
   """
+  _members = ['text', 'type']
+
   def __init__(self, text, type = None, source_info = None):
     self.text = text 
     self.type = type 
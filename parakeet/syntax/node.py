@@ -0,0 +1,136 @@
+"""
+Base class for statements and adverbs.
+
+This follows the same protocol as dsltools.Node (a class-level list of
+'_members' which get filled by positional or keyword arguments), but
+every member is stored in a __slots__ entry instead of an instance
+dictionary. The metaclass works out which slots each class needs
+and precomputes the full tuple of field names, so that walking over
+a node's members doesn't require any dictionary lookups.
+
+Mixin classes which contribute '_members' but aren't themselves Nodes
+(i.e. Accumulative or Tiled) should declare an empty __slots__,
+their members then get slots in the Node classes which inherit them.
+"""
+
+import copy
+
+def _declared_slots(klass):
+  slots = set([])
+  for c in klass.__mro__:
+    slots.update(c.__dict__.get('__slots__', ()))
+  return slots
+
+class NodeMeta(type):
+  def __new__(mcs, name, bases, dct):
+    if '__slots__' not in dct:
+      slotted = set([])
+      for base in bases:
+        slotted.update(_declared_slots(base))
+      new_members = list(dct.get('_members', []))
+      for base in bases:
+        for c in base.__mro__:
+          new_members.extend(getattr(c, '_members', []))
+      slots = []
+      for member in new_members:
+        if member not in slotted and member not in slots:
+          slots.append(member)
+      dct['__slots__'] = tuple(slots)
+    klass = type.__new__(mcs, name, bases, dct)
+
+    # same ordering as dsltools.Node.members, which determines
+    # how positional arguments get assigned
+    fields = []
+    for c in klass.__mro__:
+      for member in c.__dict__.get('_members', []):
+        if member not in fields:
+          fields.append(member)
+    klass._fields = tuple(fields)
+    klass._node_inits = tuple(c.__dict__['node_init']
+                              for c in reversed(klass.__mro__)
+                              if 'node_init' in c.__dict__)
+    return klass
+
+class Node(object):
+  __metaclass__ = NodeMeta
+  __slots__ = ()
+
+  @classmethod
+  def members(klass):
+    return klass._fields
+
+  def iteritems(self):
+    for k in self._fields:
+      yield (k, getattr(self, k, None))
+
+  def itervalues(self):
+    for k in self._fields:
+      yield getattr(self, k, None)
+
+  def items(self):
+    return list(self.iteritems())
+
+  def __init__(self, *args, **kw):
+    fields = self._fields
+    n_args = len(args)
+    n_fields = len(fields)
+    if n_args == n_fields:
+      assert len(kw) == 0
+      for (k,v) in zip(fields, args):
+        setattr(self, k, v)
+    elif n_args < n_fields:
+      for (k,v) in kw.iteritems():
+        assert k in fields, \
+          "Keyword argument '%s' not recognized for %s: %s" % \
+          (k, self.node_type(), fields)
+      for (i, k) in enumerate(fields):
+        if i < n_args:
+          setattr(self, k, args[i])
+        else:
+          setattr(self, k, kw.get(k))
+    else:
+      raise Exception('Too many arguments for %s, expected %s' % \
+                      (self.__class__.__name__, fields))
+    for node_init in self._node_inits:
+      node_init(self)
+
+  def __hash__(self):
+    hash_values = []
+    for v in self.itervalues():
+      if isinstance(v, (list, tuple)):
+        v = tuple(v)
+      hash_values.append(v)
+    return hash(tuple(hash_values))
+
+  def eq_members(self, other):
+    for (k,v) in self.iteritems():
+      if not hasattr(other, k):
+        return False
+      if getattr(other, k) != v:
+        return False
+    return True
+
+  def __eq__(self, other):
+    return other.__class__ is self.__class__ and self.eq_members(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  @classmethod
+  def node_type(cls):
+    return cls.__name__
+
+  def clone(self, **kwds):
+    cloned = copy.deepcopy(self)
+    for (k,v) in kwds.iteritems():
+      setattr(cloned, k, v)
+    return cloned
+
+  def __str__(self):
+    member_strings = []
+    for (k,v) in self.iteritems():
+      member_strings.append("%s = %s" % (k, v))
+    return "%s(%s)" % (self.node_type(), ", ".join(member_strings))
+
+  def __repr__(self):
+    return self.__str__()
@@ -1,5 +1,5 @@
 from expr import Expr 
-from dsltools import Node
+from node import Node
 
 class Stmt(Node):
   _members = ['source_info']
@@ -1,4 +1,5 @@
 import sys
+import threading
 import time 
 import numpy as np
 
@@ -36,7 +37,7 @@ def expect(fn, args, expected, msg = None, valid_types = None):
 
   untyped_fn = translate_function_value(fn)
   
-  available_backends = ['interp', 'c', 'openmp']
+  available_backends = ['interp', 'numpy', 'c', 'openmp']
 
   #import cuda_backend 
   #if cuda_backend.device_info.has_gpu():
@@ -72,6 +73,46 @@ def expect(fn, args, expected, msg = None, valid_types = None):
       assert type(result) in valid_types, \
         "Expected result to have type in %s but got %s" % (valid_types, type(result))
   
+def expect_same(fn, *args):
+  """
+  Every backend has to agree with running fn as ordinary Python, which gets
+  its own copies of any array arguments in case fn modifies them
+  """
+  expect(fn, list(args), fn(*_copy_list(args)))
+
+def count_calls(module, name, thunk):
+  """
+  Call thunk while counting how often the function module.name gets called
+  (from any thread), return thunk's result along with the count
+  """
+  count = [0]
+  lock = threading.Lock()
+  original = getattr(module, name)
+  def counting(*args, **kwargs):
+    with lock:
+      count[0] += 1
+    return original(*args, **kwargs)
+  setattr(module, name, counting)
+  try:
+    result = thunk()
+  finally:
+    setattr(module, name, original)
+  return result, count[0]
+
+def with_config(module, thunk, **settings):
+  """
+  Call thunk with the given attributes of a config module temporarily set
+  to new values, restore the old ones afterward and return thunk's result
+  """
+  old_values = dict((name, getattr(module, name)) for name in settings)
+  for (name, value) in settings.iteritems():
+    setattr(module, name, value)
+  try:
+    return thunk()
+  finally:
+    for (name, value) in old_values.iteritems():
+      setattr(module, name, value)
+
 def expect_each(parakeet_fn, python_fn, inputs):
   for x in inputs:
     expect(parakeet_fn, [x], python_fn(x))
@@ -98,8 +98,10 @@ class CloneFunction(Transform):
    
     else:
       args = {}  
-      for k,v in expr.__dict__.iteritems():
-        args[k] = self.transform_if_expr(v)
+      for k in c.fields():
+        # skip slots which were never filled in (i.e. DelayUntilTyped.type)
+        if hasattr(expr, k):
+          args[k] = self.transform_if_expr(getattr(expr, k))
       return c(**args)
   
   def transform_Assign(self, stmt):
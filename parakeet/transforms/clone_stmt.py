@@ -57,7 +57,14 @@ class CloneStmt(CloneFunction):
     return Assign(new_lhs, new_rhs)
 
   def transform_Var(self, expr):
-    return self.rename_dict.get(expr.name, expr)
+    new_var = self.rename_dict.get(expr.name, expr)
+    return Var(new_var.name, type = new_var.type)
+
+  def _transform_expr(self, expr):
+    # CloneFunction copies variables without going through transform_Var 
+    if expr.__class__ is Var:
+      return self.transform_Var(expr)
+    return CloneFunction._transform_expr(self, expr)
 
   def transform_ForLoop(self, stmt):
     new_var = self.rename_var(stmt.var)
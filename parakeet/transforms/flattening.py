@@ -179,10 +179,22 @@ class BuildFlatFn(Builder):
     c = stmt.lhs.__class__
     rhs = self.flatten_expr(stmt.rhs)
 
-    if c is Var:
-      
-      lhs_vars = self.flatten_lhs_var(stmt.lhs)
-      self.var_expansions[stmt.lhs.name] = lhs_vars 
+    if c is Var or c is Tuple:
+      if c is Var:
+        lhs_vars = self.flatten_lhs_var(stmt.lhs)
+        self.var_expansions[stmt.lhs.name] = lhs_vars 
+      else:
+        # functions which were already flattened and then inlined 
+        # fake multiple assignment with tuple literals
+        lhs_vars = []
+        for elt in stmt.lhs.elts:
+          assert elt.__class__ is Var, "Unexpected LHS %s in %s" % (elt, stmt)
+          elt_vars = self.flatten_lhs_var(elt)
+          self.var_expansions[elt.name] = elt_vars
+          lhs_vars.extend(elt_vars)
+      if isinstance(rhs, (list, tuple)) and len(rhs) == 1 and len(lhs_vars) > 1:
+        # a single expression (i.e. a reduction) computing all the fields at once
+        rhs = rhs[0]
       if isinstance(rhs, Expr):
         if len(lhs_vars) == 1:
           return [Assign(lhs_vars[0], rhs)]
@@ -202,7 +214,7 @@ class BuildFlatFn(Builder):
     elif c is Index:
       array_t = stmt.lhs.value.type 
       if isinstance(array_t, PtrT):
-        return stmt  
+        return [Assign(stmt.lhs, rhs[0])]
       indices = self.flatten_expr(stmt.lhs.index)
       values = self.flatten_expr(stmt.lhs.value)
       data = get_field_elts(array_t, values, 'data')[0]
@@ -216,9 +228,9 @@ class BuildFlatFn(Builder):
       for idx, stride in zip(indices, strides):
         offset = self.add(offset, self.mul(idx, stride))
 
-      stmt.lhs = self.index(data, offset, temp=False)
-      stmt.rhs = rhs[0]
-      return [stmt]
+      # build a new statement rather than updating the old one, since nested 
+      # functions get flattened without being copied first 
+      return [Assign(self.index(data, offset, temp=False), rhs[0])]
     else:
       assert False, "LHS not supported in flattening: %s" % stmt 
   
@@ -289,7 +301,11 @@ class BuildFlatFn(Builder):
   
   def flatten_stmt(self, stmt):
     method_name = "flatten_%s" % stmt.__class__.__name__
-    return getattr(self, method_name)(stmt)
+    result = getattr(self, method_name)(stmt)
+    if isinstance(result, Stmt) and getattr(result, 'source_info', None) is None:
+      # keep the source locations around for profiling and error messages 
+      result.source_info = stmt.source_info 
+    return result
   
   #######################
   #
@@ -678,12 +694,7 @@ class Flatten(Transform):
   def transform_block(self, stmts):
     return stmts
     
-  def pre_apply(self, old_fn, _cache = {}):
-
-    key = old_fn.cache_key
-    if key  in _cache:
-      return _cache[key]
-    
+  def pre_apply(self, old_fn):
     flat_fn = build_flat_fn(old_fn)
     
     flat_fn.created_by = old_fn.created_by
@@ -698,7 +709,5 @@ class Flatten(Transform):
     boxed_result = self.box(old_fn.return_type, unboxed_elts)
     self.return_(boxed_result)
     old_fn.body = self.blocks.pop()
-    _cache[key] = old_fn
-    _cache[flat_fn.cache_key] = flat_fn 
     return old_fn
   
\ No newline at end of file
@@ -69,9 +69,14 @@ class Find_LICM_Candidates(SyntaxVisitor):
     pass
 
   def visit_ForLoop(self, stmt):
+    # the bounds only get evaluated once, before the loop starts, 
+    # so using them doesn't make anything inside the loop volatile 
+    self.visit_expr(stmt.start)
+    self.visit_expr(stmt.stop)
+    self.visit_expr(stmt.step)
     self.volatile_vars.push(stmt.merge.keys())
     self.volatile_vars.add(stmt.var.name)
-    SyntaxVisitor.visit_ForLoop(self, stmt)
+    self.visit_block(stmt.body)
     if self.does_block_return(stmt.body):
       self.block_contains_return()
     volatile_in_scope = self.volatile_vars.pop()
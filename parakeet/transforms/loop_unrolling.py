@@ -1,4 +1,5 @@
 from .. import syntax
+from .. ndtypes import IntT 
 from .. syntax import Const, ForLoop, Var
 from .. syntax.helpers import const_int
 from ..transforms import CloneStmt 
@@ -12,9 +13,12 @@ def safediv(m,n):
 class LoopUnrolling(LoopTransform):
   def __init__(self, unroll_factor = 4,
                       max_static_unrolling = 8,
-                      max_block_size = 50):
+                      max_block_size = 50, 
+                      static_only = False):
     LoopTransform.__init__(self)
     self.unroll_factor = unroll_factor
+    # only fully unroll loops whose bounds are constants
+    self.static_only = static_only 
     if max_static_unrolling is not None:
     # should we unroll static loops more than ones with unknown iters?
       self.max_static_unrolling = max_static_unrolling
@@ -76,10 +80,20 @@ class LoopUnrolling(LoopTransform):
     # number of iterations of loop iterations is not generally known
     if start.__class__ is Const and \
        stop.__class__ is Const and \
-       step.__class__ is Const:
+       step.__class__ is Const and \
+       isinstance(stmt.var.type, IntT):
       niters = safediv(stop.value - start.value, step.value)
-      if niters <= self.max_static_unrolling:
+      if niters <= 0:
+        # loop never runs, so its outputs are just their initial values
+        for (old_name, (input_value, _)) in stmt.merge.iteritems():
+          self.assign(Var(old_name, type = input_value.type), input_value)
+        return None 
+      elif niters <= self.max_static_unrolling:
         unroll_factor = niters
+      elif self.static_only:
+        return stmt 
+    elif self.static_only:
+      return stmt 
 
     # push the unrolled body onto the stack
     self.blocks.push()
@@ -7,8 +7,8 @@
 from .. import  syntax
 
 from .. ndtypes import (ScalarT, ArrayT, make_array_type, TupleT, 
-                        Int32, Int64,  ptr_type, PtrT, closure_type)  
-from .. syntax import Struct, Assign, Const, Index, Attribute, Var, Tuple, Alloc  
+                        Int32, Int64,  ptr_type, PtrT)  
+from .. syntax import Struct, Assign, Const, Index, Attribute, Var, Tuple, Alloc, Closure
 from .. syntax.helpers import const_int, const_tuple, zero
 from transform import Transform
 
@@ -48,18 +48,25 @@ class LowerStructs(Transform):
   def transform_Closure(self, expr):
     _ = self.transform_expr(expr.fn)
     closure_args = self.transform_expr_list(expr.args)
-    closure_id = closure_type.id_of_closure_type(expr.type)
-    closure_id_node = Const(closure_id, type = Int64)
-    return Struct([closure_id_node] + closure_args, type = expr.type)
+    # the function is part of the closure's type, so only its 
+    # arguments need to be stored 
+    return Struct(closure_args, type = expr.type)
 
   def transform_ClosureElt(self, expr):
     new_closure = self.transform_expr(expr.closure)
     assert isinstance(expr.index, int)
-    # first field is always the closure ID, so we have to
-    # index 1 higher
-    field_name, field_type = new_closure.type._fields_[expr.index + 1]
+    field_name, field_type = new_closure.type._fields_[expr.index]
     return Attribute(new_closure, field_name, type = field_type)
 
+  def transform_ParFor(self, stmt):
+    # keep the closure intact, whoever runs the ParFor needs to know which 
+    # function it's calling
+    fn = stmt.fn 
+    if fn.__class__ is Closure:
+      fn.args = self.transform_expr_list(fn.args)
+    stmt.bounds = self.transform_expr(stmt.bounds)
+    return stmt 
+
   def array_view(self, data, shape, strides, offset, nelts):
     """Helper function used by multiple array-related transformations"""
 
@@ -1,4 +1,7 @@
 from .. import config
+from .. analysis import verify
+from .. analysis.fingerprint import fingerprint
+from .. profiling import compile_timer
 
 from .. syntax import TypedFn
 from clone_function import CloneFunction
@@ -9,28 +12,65 @@ name_stack = []
 def apply_transforms(fn, transforms, 
                        cleanup = [], 
                        phase_name = None, 
-                       transform_history = None):
+                       transform_history = None, 
+                       fn_fingerprint = None):
+  """
+  Run each transform in sequence, along with the cleanup transforms after
+  each one. 
+  
+  If config.opt_track_changes is set then the function gets fingerprinted
+  after every transform, and the cleanups and verifier only run when
+  the fingerprint differs from the previous one. The caller can pass in
+  a fingerprint of the input function if it already has one. 
+  """
   if len(transforms) == 0:
     return fn 
   if phase_name: name_stack.append("{" + phase_name + " :: " + fn.name +  "}")
+  
+  track_changes = config.opt_track_changes 
+  last_fingerprint = fn_fingerprint 
   for T in transforms:
     t = T() if type(T) == type else T
     
+    verify_after = False 
     if isinstance(t, Transform):
       name_stack.append(str(t))
       if config.print_transform_names:
         print "-- %s" % ("->".join(name_stack),)
-      
+      if track_changes and t.verify:
+        # verify here instead, only if the function changed 
+        verify_after = True 
+        t.verify = False 
     elif isinstance(t, Phase) and t.should_skip(fn) and not t.depends_on:
       continue 
-
-    fn = t.apply(fn)
+    
+    try:
+      fn = t.apply(fn)
+    finally:
+      if verify_after: t.verify = True 
 
     assert fn is not None, "%s transformed fn into None" % T
 
     if isinstance(t, Transform): name_stack.pop()
-
-    if len(cleanup) > 0:
+    
+    if not (verify_after or len(cleanup) > 0):
+      # nested phases clean up and verify their own transforms
+      last_fingerprint = None 
+    elif track_changes:
+      new_fingerprint = fingerprint(fn)
+      if last_fingerprint is None or new_fingerprint != last_fingerprint:
+        if verify_after:
+          try:
+            verify(fn, new_fingerprint)
+          except:
+            print "ERROR after running %s on %s" % (t, fn)
+            raise 
+        if len(cleanup) > 0:
+          fn = apply_transforms(fn, cleanup, [], phase_name = "cleanup", 
+                                fn_fingerprint = new_fingerprint)
+          new_fingerprint = fingerprint(fn)
+      last_fingerprint = new_fingerprint 
+    else:
       fn = apply_transforms(fn, cleanup, [], phase_name = "cleanup")
     
     if transform_history is not None:
@@ -125,24 +165,37 @@ class Phase(object):
   def needs_cleanup(self, fn):
     return not (self.should_skip(fn) or self.is_cached(fn)) 
     
+  @compile_timer('pipeline')
   def apply(self, fn, run_dependencies = True):
     
     original_key = fn.cache_key
     if original_key in self.cache:
       return self.cache[original_key]
+    
+    # functions which already went through this phase somewhere else 
+    # (i.e. were loaded from the IR cache) don't need to be copied again
+    if self.memoize and self in fn.transform_history:
+      return fn 
 
     if self.depends_on and run_dependencies:
       fn = apply_transforms(fn, self.depends_on)
     
     
     if self.copy:
-      fn = CloneFunction(parent_transform = self, rename = self.rename).apply(fn)
+      cloner = CloneFunction(parent_transform = self, rename = self.rename)
+      # a copy is structurally identical to a function which has already 
+      # been verified, so only check functions once they actually change 
+      if config.opt_track_changes: cloner.verify = False 
+      fn = cloner.apply(fn)
       if fn.cache_key  in self.cache:
         "Warning: Typed function %s (key = %s) already registered, encountered while cloning before %s" % \
         (fn.name, fn.cache_key, self)
     
     if self.recursive:
-      fn = RecursiveApply(self).apply(fn)
+      recursive_apply = RecursiveApply(self)
+      # any functions which got transformed are verified by RecursiveApply 
+      if config.opt_track_changes: recursive_apply.verify = False 
+      fn = recursive_apply.apply(fn)
     
       
     if not self.should_skip(fn):
@@ -1,6 +1,6 @@
 from .. import config 
 from ..analysis import (contains_adverbs, contains_calls, contains_loops, 
-                        contains_structs)
+                        contains_scans, contains_structs)
 
 from combine_nested_maps import CombineNestedMaps 
 from copy_elimination import CopyElimination
@@ -30,6 +30,7 @@ from scalar_replacement import ScalarReplacement
 from shape_elim import ShapeElimination
 from simplify import Simplify
 from specialize_fn_args import SpecializeFnArgs
+from strength_reduction import StrengthReduction
 
 ####################################
 #                                  #
@@ -154,11 +155,19 @@ after_indexify = Phase([copy_elim, Simplify, DCE,
                        memoize = True)
 
 
+def should_flatten(fn):
+  # scans build their output arrays inside the backend, 
+  # so they still need a boxed array to write into 
+  return contains_structs(fn) and not contains_scans(fn)
+
+# nested functions get flat versions of their own while their callers 
+# are being flattened, so there's no need to recurse into them here 
 flatten = Phase([Flatten, inline_opt, Simplify, DCE ], name="Flatten", 
                 depends_on=after_indexify,
-                run_if = contains_structs,  
+                run_if = should_flatten,  
                 copy=True, 
-                memoize = True)
+                memoize = True, 
+                recursive = False)
 
 ####################
 #                  #
@@ -219,9 +228,18 @@ loopify = Phase([lower_adverbs,
 
 
 
+# carry the offsets of array accesses between loop iterations 
+# instead of recomputing them from the strides 
+strength_reduction = Phase(StrengthReduction, 
+                           config_param = 'opt_strength_reduction', 
+                           run_if = contains_loops, 
+                           memoize = False, 
+                           name = "StrengthReduction")
+
 lowering = Phase([
                     LowerIndexing,
                     licm,
+                    strength_reduction, 
                     LowerStructs,
                  ],
                  depends_on = loopify,
@@ -230,6 +248,22 @@ lowering = Phase([
                  name = "Lowering", 
                  cleanup = [Simplify, DCE])
 
+# like lowering, but the outermost ParFor statements are left in place 
+# (with their bodies lowered on demand) so a backend can run them in parallel
+lowering_keep_parfor = Phase([
+                               lower_adverbs, 
+                               LowerIndexing,
+                               licm,
+                               strength_reduction, 
+                               LowerStructs,
+                             ], 
+                             depends_on = after_indexify,
+                             memoize = True, 
+                             copy = True,
+                             recursive = False, 
+                             name = "LoweringKeepParFor", 
+                             cleanup = [Simplify, DCE])
+
 ############################
 #                          #
 #  FINAL LOOP OPTIMIZATINS #
@@ -259,4 +293,19 @@ final_loop_optimizations = Phase([
                            copy = False, 
                            memoize = True,\
                            name = "FinalLoopOptimizations"
-                           )
\ No newline at end of file
+                           )
+# rebuild of a function which tiered compilation found to be hot, 
+# unrolls loops regardless of config.opt_loop_unrolling 
+hot_loop_optimizations = Phase([
+                                 licm, 
+                                 Phase([LoopUnrolling, licm], 
+                                       run_if = contains_loops, 
+                                       name = "HotUnroll"), 
+                                 load_elim, 
+                                 scalar_repl, 
+                                 Simplify
+                               ], 
+                               cleanup = [Simplify, DCE], 
+                               copy = True, 
+                               memoize = True, 
+                               name = "HotLoopOptimizations")
@@ -1,121 +1,232 @@
-from .. syntax import Assign, Index, Var
+from ..analysis.collect_vars import (collect_binding_names, collect_var_names,
+                                     collect_var_names_list)
+from ..analysis.escape_analysis import EscapeAnalysis
+from ..ndtypes import ScalarT
+from ..syntax import Assign, Const, ExprStmt, If, Index, Tuple, Var
+from ..syntax.helpers import zero
 
-from loop_transform import LoopTransform 
+from loop_transform import LoopTransform
 
 
 class ScalarReplacement(LoopTransform):
   """
-  When a loop reads and writes to a non-varying memory location, 
-  we can keep the value of that location in a register and write 
-  it to the heap after the loop completes. 
-  
+  When a loop reads and writes to a non-varying memory location,
+  we can keep the value of that location in a register and write
+  it to the heap after the loop completes.
+
   Transform code like this:
-      for i in low .. high: 
+      for i in low .. high:
         z = x[const]
         q = z ** 2
-        x[const] = q + i 
-  into 
-      z_in = x[const]
+        x[const] = q + i
+  into
+      if low < high:
+        z_in = x[const]
       for i in low .. high:
         (header)
           z_loop = phi(z_in, z_out)
-        (body) 
+        (body)
           q = z_loop ** 2
-          z_out = q + i 
-      x[const] = z_loop   
+          z_out = q + i
+      if low < high:
+        x[const] = z_loop
+
+  This is only safe if nothing else in the loop can touch that location,
+  so every mention of the array (or of anything which may alias it)
+  in the loop has to be one of the replaced reads and writes, all at
+  the same index (or at distinct constant indices). The loads and stores are skipped when the loop doesn't
+  run at all, since the location might not even be in bounds then.
   """
-  
-  
-  
-  def preload_reads(self, reads):
-    scalar_vars = {}
-    for (array_name, index_set) in reads.iteritems():
-      t = self.type_env[array_name]
-      for index_expr in index_set:
-        scalar = self.index(Var(array_name, type = t), index_expr, 
-                            temp = True, name = "scalar_repl_input")
-       
-        scalar_vars[(array_name, index_expr)] = scalar
-    return scalar_vars
+
+  def pre_apply(self, fn):
+    # earlier passes may have added variables since the cached
+    # escape analysis of this function was computed
+    analysis = EscapeAnalysis()
+    analysis.visit_fn(fn)
+    self.may_alias = analysis.may_alias
+
+  def aliases(self, name):
+    return self.may_alias.get(name, set([name]))
+
+  def bound_names(self, stmts, names):
+    for stmt in stmts:
+      if stmt.__class__ is Assign:
+        names.update(collect_binding_names(stmt.lhs))
+      elif stmt.__class__ is If:
+        self.bound_names(stmt.true, names)
+        self.bound_names(stmt.false, names)
+        names.update(stmt.merge.iterkeys())
+    return names
+
+  def mentioned_names(self, stmts, names):
+    """
+    Every occurrence of a variable in the given statements,
+    including inside of branches
+    """
+    for stmt in stmts:
+      if stmt.__class__ is Assign:
+        names.extend(collect_var_names_list(stmt.lhs))
+        names.extend(collect_var_names_list(stmt.rhs))
+      elif stmt.__class__ is ExprStmt:
+        names.extend(collect_var_names_list(stmt.value))
+      elif stmt.__class__ is If:
+        names.extend(collect_var_names_list(stmt.cond))
+        self.mentioned_names(stmt.true, names)
+        self.mentioned_names(stmt.false, names)
+        for (left, right) in stmt.merge.itervalues():
+          names.extend(collect_var_names_list(left))
+          names.extend(collect_var_names_list(right))
+    return names
+
+  def is_constant_index(self, index_expr):
+    if index_expr.__class__ is Tuple:
+      return all(self.is_constant_index(elt) for elt in index_expr.elts)
+    return index_expr.__class__ is Const and index_expr.value >= 0
+
+  def replaceable_locations(self, stmt):
+    """
+    Map each array which can be kept in registers to the set of
+    (loop invariant) indices it's accessed at
+    """
+    # anything assigned in the loop might differ between iterations
+    bound = self.bound_names(stmt.body, set([stmt.var.name]))
+    bound.update(stmt.merge.iterkeys())
+
+    locations = {}
+    # how often each array appears as the array of a replaceable access
+    accesses = {}
+    rejected = set([])
+    for body_stmt in stmt.body:
+      if body_stmt.__class__ is not Assign:
+        continue
+      for expr in (body_stmt.lhs, body_stmt.rhs):
+        if expr.__class__ is not Index or expr.value.__class__ is not Var:
+          continue
+        name = expr.value.name
+        accesses[name] = accesses.get(name, 0) + 1
+        if not isinstance(expr.type, ScalarT) or \
+           len(collect_var_names(expr.index).intersection(bound)) > 0:
+          rejected.add(name)
+        elif expr is body_stmt.lhs and body_stmt.rhs.type != expr.type:
+          rejected.add(name)
+        else:
+          locations.setdefault(name, set([])).add(expr.index)
+
+    mentions = {}
+    for name in self.mentioned_names(stmt.body, []):
+      mentions[name] = mentions.get(name, 0) + 1
+
+    safe = {}
+    for (name, index_set) in locations.iteritems():
+      if name in rejected:
+        continue
+      # different index expressions could still be the same location
+      # unless they're distinct constants
+      if len(index_set) > 1 and \
+         not all(self.is_constant_index(idx) for idx in index_set):
+        continue
+      # the array can't be used other than through these accesses,
+      # and nothing that may alias it can show up in the loop at all
+      if mentions.get(name, 0) != accesses[name]:
+        continue
+      if any(alias in mentions for alias in self.aliases(name) if alias != name):
+        continue
+      safe[name] = index_set
+    return safe
+
+  def loop_runs(self, stmt):
+    """
+    Condition which is true when the loop has at least one iteration,
+    or None if the direction of the loop isn't known
+    """
+    if stmt.step.__class__ is not Const:
+      return None
+    elif stmt.step.value > 0:
+      return self.lt(stmt.start, stmt.stop)
+    elif stmt.step.value < 0:
+      return self.gt(stmt.start, stmt.stop)
+    return None
+
+  def preload(self, array_var, index_expr, cond):
+    location = self.index(array_var, index_expr, temp = False)
+    elt_t = location.type
+    scalar = self.fresh_var(elt_t, "scalar_repl_input")
+    if cond.__class__ is Const and cond.value:
+      self.assign(scalar, location)
+    else:
+      def load(input_var):
+        self.assign(input_var, location)
+      def skip(input_var):
+        self.assign(input_var, zero(elt_t))
+      self.if_(cond, load, skip, result_vars = [scalar])
+    return scalar
+
+  def store(self, array_var, index_expr, value, cond):
+    lhs = self.index(array_var, index_expr, temp = False)
+    if cond.__class__ is Const and cond.value:
+      self.assign(lhs, value)
+    else:
+      self.if_(cond, lambda: self.assign(lhs, value), lambda: None)
 
   def replace_indexing(self, loop_body, loop_scalars):
     """
-    Given a map from (array_name, index_expr) pairs to 
+    Given a map from (array_name, index_expr) pairs to
     scalar variables, replace reads/writes with scalars
     """
     final_scalars = loop_scalars.copy()
     for stmt in loop_body:
-      if stmt.__class__ is not Assign: 
-        continue 
+      if stmt.__class__ is not Assign:
+        continue
       if stmt.rhs.__class__ is Index:
         key = stmt.rhs.value.name, stmt.rhs.index
         if key in final_scalars:
-          stmt.rhs = final_scalars[key]  
+          stmt.rhs = final_scalars[key]
       if stmt.lhs.__class__ is Index:
         key = stmt.lhs.value.name, stmt.lhs.index
         if key in final_scalars:
           new_var = self.fresh_var(stmt.lhs.type, "scalar_repl_out")
           stmt.lhs = new_var
-          final_scalars[key] = new_var  
+          final_scalars[key] = new_var
     return final_scalars
-  
-  
+
   def transform_ForLoop(self, stmt):
-    
-    if self.is_simple_block(stmt.body):
-      loop_vars = set([stmt.var.name])
-      loop_vars.update(stmt.merge.keys())
-      # gather all the variables whose values change between loop iters
-      self.collect_loop_vars(loop_vars, stmt.body)
-      # full set of array reads & writes 
-      reads, writes = self.collect_memory_accesses(stmt.body)
-      
-      # which arrays are written to at loop-dependent locations? 
-      unsafe = set([])
-      for (name, write_indices) in writes.iteritems():
-        if self.any_loop_vars(loop_vars, write_indices):
-          unsafe.add(name)
-      safe_writes = dict([(k,v) for (k,v) in writes.items() 
-                          if k not in unsafe])
-      
-      safe_reads = dict([(k,v) for (k,v) in reads.items() 
-                         if k not in unsafe and not self.any_loop_vars(loop_vars, v)])
-
-      
-      safe_locations = {}
-      all_keys = set(safe_writes.keys()).union(set(safe_reads.keys()))
-      for name in all_keys:
-        index_set = safe_reads.get(name, set([])).union(safe_writes.get(name, set([])))
-        safe_locations[name] = index_set 
-      # move all safe/loop-invariant reads into registers at the top of the loop
-      # I'm also including the writes (by passing safe_locations instead of safe_reads)
-      # so that they become loop-carried accumulator values, otherwise where else would
-      # they get their initial values?
-      input_scalars = self.preload_reads(safe_locations)
-
-      
-      # need to rename the scalars so they have an SSA variable for the beginning of the loop
-      loop_scalars = {}
-      for ( (name,index_expr), input_var) in input_scalars.iteritems():
-        loop_var = self.fresh_var(input_var.type, "scalar_repl_acc")
-        loop_scalars[(name, index_expr)] = loop_var
-      
-      
-      # propagate register names for all writes 
-      final_scalars = self.replace_indexing(stmt.body, loop_scalars)
-      
-      for (key, final_var) in final_scalars.iteritems():
-        loop_var = loop_scalars[key]
-        input_var = input_scalars[key]
-        stmt.merge[loop_var.name] = (input_var, final_var)
-      
-      self.blocks.append(stmt)
-      # write out the results back to memeory 
-      for ( (array_name, index_expr), loop_var) in loop_scalars.iteritems():
-        array_type = self.type_env[array_name]
-        lhs = self.index(Var(array_name, type = array_type), index_expr, temp = False)
-        self.assign(lhs, loop_var) 
-      return None
-    else:     
+    if not self.is_simple_block(stmt.body):
       stmt.body = self.transform_block(stmt.body)
-      return stmt 
\ No newline at end of file
+      return stmt
+
+    safe_locations = self.replaceable_locations(stmt)
+    if len(safe_locations) == 0:
+      return stmt
+    cond = self.loop_runs(stmt)
+    if cond is None:
+      return stmt
+    if cond.__class__ is Const and not cond.value:
+      # the loop never runs
+      return stmt
+
+    # move all the safe locations into registers before the loop,
+    # including the ones which only get written so that
+    # they have initial values as loop-carried accumulators
+    input_scalars = {}
+    loop_scalars = {}
+    for (name, index_set) in safe_locations.iteritems():
+      array_var = Var(name, type = self.type_env[name])
+      for index_expr in index_set:
+        input_var = self.preload(array_var, index_expr, cond)
+        input_scalars[(name, index_expr)] = input_var
+        # SSA variable for the value at the start of each iteration
+        loop_scalars[(name, index_expr)] = \
+          self.fresh_var(input_var.type, "scalar_repl_acc")
+
+    # propagate register names for all writes
+    final_scalars = self.replace_indexing(stmt.body, loop_scalars)
+    for (key, final_var) in final_scalars.iteritems():
+      loop_var = loop_scalars[key]
+      stmt.merge[loop_var.name] = (input_scalars[key], final_var)
+    self.blocks.append(stmt)
+
+    # write the results back to memory
+    for ((name, index_expr), loop_var) in loop_scalars.iteritems():
+      array_var = Var(name, type = self.type_env[name])
+      self.store(array_var, index_expr, loop_var, cond)
+    return None
@@ -781,11 +781,16 @@ class Simplify(Transform):
           self.blocks.append(Assign(var, input_value))
         return None
       elif stmt.start.value + stmt.step.value >= stmt.stop.value:
-        for (var_name, (input_value, _)) in stmt.merge.iteritems():
-          var = Var(var_name, input_value.type)
-          self.blocks.append(Assign(var, input_value))
+        # inside the body the loop-carried variables are still their 
+        # initial values, they only take on the outputs after the loop 
+        initial_values = dict((var_name, input_value) 
+                              for (var_name, (input_value, _)) 
+                              in stmt.merge.iteritems())
         self.assign(stmt.var, stmt.start)
-        self.blocks.top().extend(stmt.body)
+        self.blocks.top().extend(subst.subst_stmt_list(stmt.body, initial_values))
+        for (var_name, (_, output_value)) in stmt.merge.iteritems():
+          var = Var(var_name, output_value.type)
+          self.blocks.append(Assign(var, subst.subst_expr(output_value, initial_values)))
         return None
     return stmt
 
@@ -0,0 +1,179 @@
+from .. import prims
+from ..analysis.collect_vars import collect_binding_names
+from ..analysis.syntax_visitor import SyntaxVisitor
+from ..ndtypes import IntT
+from ..syntax import Assign, Const, ForLoop, If, PrimCall, Var, While
+from ..syntax.helpers import one_i64, zero_i64
+
+from loop_transform import LoopTransform
+
+def bound_names(stmts, names):
+  for stmt in stmts:
+    c = stmt.__class__
+    if c is Assign:
+      names.update(collect_binding_names(stmt.lhs))
+    elif c is If:
+      bound_names(stmt.true, names)
+      bound_names(stmt.false, names)
+      names.update(stmt.merge.iterkeys())
+    elif c is ForLoop:
+      names.add(stmt.var.name)
+      bound_names(stmt.body, names)
+      names.update(stmt.merge.iterkeys())
+    elif c is While:
+      bound_names(stmt.body, names)
+      names.update(stmt.merge.iterkeys())
+  return names
+
+class UsedNames(SyntaxVisitor):
+  """
+  Variables read anywhere in a block, including the initial
+  values of nested loops' phi nodes
+  """
+  def __init__(self):
+    SyntaxVisitor.__init__(self)
+    self.names = set([])
+
+  def visit_Var(self, expr):
+    self.names.add(expr.name)
+
+  def visit_lhs_Var(self, lhs):
+    pass
+
+  def visit_merge_loop_start(self, phi_nodes):
+    self.visit_merge(phi_nodes)
+
+class StrengthReduction(LoopTransform):
+  """
+  Integer values which are affine in a loop's index, like the element offsets
+  which LowerIndexing computes for every array access, get carried from one
+  iteration to the next and advanced by a loop invariant step instead of being
+  recomputed with multiplications:
+
+      for j in start .. stop by step:
+        a = stride * j
+        offset = base + a
+        x = data[offset]
+
+  becomes
+
+      for j in start .. stop by step:
+        (header)
+          offset_iv = phi(stride * start + base, offset_next)
+        (body)
+          offset = offset_iv
+          x = data[offset]
+          offset_next = offset_iv + stride * step
+
+  Since the offsets of an outer loop feed into the initial values of the inner
+  loop's phi nodes, every loop level of a nest ends up with one running offset
+  per array.
+  """
+
+  def pre_apply(self, fn):
+    pass
+
+  def is_invariant(self, expr, bound):
+    if expr.__class__ is Const:
+      return isinstance(expr.type, IntT)
+    return expr.__class__ is Var and isinstance(expr.type, IntT) and expr.name not in bound
+
+  def affine_form(self, expr, forms, bound):
+    """
+    If expr is (coef * loop_var + offset) for loop invariant coef and offset,
+    return the pair (coef, offset) along with whether any of the coefficients
+    along the way needed a multiplication, otherwise return None
+    """
+    if expr.__class__ is not PrimCall or len(expr.args) != 2 or \
+       not isinstance(expr.type, IntT):
+      return None
+    x, y = expr.args
+    x_form = forms.get(x.name) if x.__class__ is Var else None
+    y_form = forms.get(y.name) if y.__class__ is Var else None
+    if x_form is None and y_form is None:
+      return None
+    if x_form is None and not self.is_invariant(x, bound):
+      return None
+    if y_form is None and not self.is_invariant(y, bound):
+      return None
+
+    p = expr.prim
+    if p == prims.add:
+      if x_form is not None and y_form is not None:
+        return (self.add(x_form[0], y_form[0], "iv_coef"),
+                self.add(x_form[1], y_form[1], "iv_offset"),
+                x_form[2] or y_form[2])
+      elif x_form is not None:
+        return (x_form[0], self.add(x_form[1], y, "iv_offset"), x_form[2])
+      else:
+        return (y_form[0], self.add(x, y_form[1], "iv_offset"), y_form[2])
+    elif p == prims.subtract:
+      if x_form is not None and y_form is not None:
+        return (self.sub(x_form[0], y_form[0], "iv_coef"),
+                self.sub(x_form[1], y_form[1], "iv_offset"),
+                x_form[2] or y_form[2])
+      elif x_form is not None:
+        return (x_form[0], self.sub(x_form[1], y, "iv_offset"), x_form[2])
+    elif p == prims.multiply:
+      if x_form is not None and y_form is not None:
+        # quadratic in the loop index
+        return None
+      elif x_form is not None:
+        form, factor = x_form, y
+      else:
+        form, factor = y_form, x
+      scaled = factor.__class__ is not Const or factor.value != 1
+      return (self.mul(form[0], factor, "iv_coef"),
+              self.mul(form[1], factor, "iv_offset"),
+              form[2] or scaled)
+    return None
+
+  def transform_ForLoop(self, stmt):
+    # inner loops first, since the initial values of their running offsets
+    # are computed in this loop's body
+    stmt.body = self.transform_block(stmt.body)
+    if not isinstance(stmt.var.type, IntT):
+      return stmt
+
+    bound = bound_names(stmt.body, set([stmt.var.name]))
+    bound.update(stmt.merge.iterkeys())
+    forms = {stmt.var.name : (one_i64, zero_i64, False)}
+    definitions = {}
+    order = []
+    for body_stmt in stmt.body:
+      if body_stmt.__class__ is not Assign or body_stmt.lhs.__class__ is not Var:
+        continue
+      form = self.affine_form(body_stmt.rhs, forms, bound)
+      if form is not None:
+        name = body_stmt.lhs.name
+        forms[name] = form
+        definitions[name] = body_stmt
+        order.append(name)
+    if len(order) == 0:
+      return stmt
+
+    # only bother carrying the values which get used by something
+    # other than the computation of another affine value
+    used = UsedNames()
+    for body_stmt in stmt.body:
+      if body_stmt.__class__ is Assign and body_stmt.lhs.__class__ is Var and \
+         body_stmt.lhs.name in definitions:
+        continue
+      used.visit_stmt(body_stmt)
+    used.visit_merge(stmt.merge)
+
+    for name in order:
+      coef, offset, scaled = forms[name]
+      if not scaled or name not in used.names:
+        continue
+      definition = definitions[name]
+      t = definition.lhs.type
+      init = self.add(self.mul(coef, stmt.start, "iv_start"), offset, "iv_init")
+      step = self.mul(coef, stmt.step, "iv_step")
+      init, step = self.cast(init, t), self.cast(step, t)
+      iv = self.fresh_var(t, "iv")
+      iv_next = self.fresh_var(t, "iv_next")
+      definition.rhs = iv
+      stmt.body.append(Assign(iv_next, PrimCall(prims.add, [iv, step], type = t)))
+      stmt.merge[iv.name] = (init, iv_next)
+    return stmt
@@ -1,7 +1,11 @@
+from .. import config
 from .. analysis.find_constant_strides import FindConstantStrides, Const, Array, Struct, Tuple
-from .. analysis.find_constant_strides import from_python_list, from_internal_repr
-from .. syntax.helpers import const_int, const 
+from .. analysis.find_constant_strides import from_python_list, from_internal_repr, unknown
+from .. ndtypes import ScalarT
+from .. syntax import Const as ConstExpr
+from .. syntax.helpers import const_int, const
 from dead_code_elim import DCE
+from loop_unrolling import LoopUnrolling
 from phase import Phase
 from simplify import Simplify
 from transform import Transform
@@ -9,66 +13,133 @@ from transform import Transform
 class StrideSpecializer(Transform):
   def __init__(self, abstract_inputs):
     Transform.__init__(self)
-    self.abstract_inputs = abstract_inputs 
-  
+    self.abstract_inputs = abstract_inputs
+
   def pre_apply(self, fn):
-    analysis = FindConstantStrides(fn, self.abstract_inputs)
-    analysis.visit_fn(fn)
-    self.env = analysis.env
+    self.analysis = FindConstantStrides(fn, self.abstract_inputs)
+    self.analysis.visit_fn(fn)
+    self.env = self.analysis.env
+
+  def to_const(self, value, t):
+    if isinstance(t, ScalarT):
+      return ConstExpr(value, type = t)
+    return const(value)
 
-  
   def transform_Var(self, expr):
     if expr.name in self.env:
       value = self.env[expr.name]
       if value.__class__ is Const:
-        result = const(value.value)
-        return result 
+        return self.to_const(value.value, expr.type)
     return expr
-  
+
+  def transform_TupleProj(self, expr):
+    # shapes often get used directly without being bound to a variable,
+    # i.e. as the bounds of a loop
+    value = self.analysis.visit_expr(expr)
+    if value.__class__ is Const:
+      return self.to_const(value.value, expr.type)
+    return Transform.transform_TupleProj(self, expr)
+
   def transform_lhs(self, lhs):
     return lhs
-  
+
 def has_unit_stride(abstract_value):
   c = abstract_value.__class__
   if c is Array:
     return has_unit_stride(abstract_value.strides)
   elif c is Struct:
-    return any(has_unit_stride(field_val) 
-               for field_val 
+    return any(has_unit_stride(field_val)
+               for field_val
                in abstract_value.fields.itervalues())
   elif c is Tuple:
-    return any(has_unit_stride(elt) 
+    return any(has_unit_stride(elt)
                for elt in abstract_value.elts)
   elif c is Const:
     return abstract_value.value == 1
   else:
     return False
-  
+
+def has_small_const(abstract_value):
+  c = abstract_value.__class__
+  if c is Array:
+    return has_small_const(abstract_value.shape)
+  elif c is Struct:
+    return any(has_small_const(field_val)
+               for field_val
+               in abstract_value.fields.itervalues())
+  elif c is Tuple:
+    return any(has_small_const(elt)
+               for elt in abstract_value.elts)
+  else:
+    return c is Const
+
+def without_small_consts(abstract_value):
+  c = abstract_value.__class__
+  if c is Array:
+    return Array(abstract_value.strides)
+  elif c is Struct:
+    return Struct(dict((name, without_small_consts(field_val))
+                       for (name, field_val)
+                       in abstract_value.fields.iteritems()))
+  elif c is Tuple:
+    return Tuple([without_small_consts(elt) for elt in abstract_value.elts])
+  elif c is Const:
+    return unknown
+  else:
+    return abstract_value
+
 _cache = {}
+# how many distinct small constant specializations each function has
+_small_const_counts = {}
+
 def specialize(fn, python_values, types = None):
   if types is None:
     abstract_values = from_python_list(python_values)
   else:
-    # if types are given, assume that the values 
-    # are already converted to Parakeet's internal runtime 
-    # representation 
+    # if types are given, assume that the values
+    # are already converted to Parakeet's internal runtime
+    # representation
     abstract_values = []
     for (t, internal_value) in zip(types, python_values):
       abstract_values.append(from_internal_repr(t, internal_value))
-  
+
+  # looking up the specialization for these abstract values is the only
+  # check which runs on every call, since each cache entry only gets used
+  # for inputs with the same strides, small dimensions and small ints
   key = (fn.cache_key, tuple(abstract_values))
   if key in _cache:
     return _cache[key]
-  elif any(has_unit_stride(v) for v in abstract_values):
-    specializer = StrideSpecializer(abstract_values)
 
-    transforms = Phase([specializer, Simplify, DCE],
-                        memoize = False, copy = True, 
-                        name = "StrideSpecialization for %s" % abstract_values, 
+  original_key = key
+  small_consts = any(has_small_const(v) for v in abstract_values)
+  if small_consts:
+    n_specialized = _small_const_counts.get(fn.cache_key, 0)
+    if n_specialized >= config.max_small_const_specializations:
+      # this function gets called with too many different shapes or
+      # values, fall back on just specializing for strides
+      small_consts = False
+      abstract_values = [without_small_consts(v) for v in abstract_values]
+      key = (fn.cache_key, tuple(abstract_values))
+      if key in _cache:
+        _cache[original_key] = _cache[key]
+        return _cache[key]
+    else:
+      _small_const_counts[fn.cache_key] = n_specialized + 1
+
+  if small_consts or any(has_unit_stride(v) for v in abstract_values):
+    specializer = StrideSpecializer(abstract_values)
+    transforms = [specializer, Simplify, DCE]
+    if small_consts:
+      # loops over small constant dimensions can be unrolled completely
+      transforms.extend([LoopUnrolling(static_only = True), Simplify, DCE])
+    transforms = Phase(transforms,
+                        memoize = False, copy = True,
+                        name = "StrideSpecialization for %s" % abstract_values,
                         recursive = False)
     new_fn = transforms.apply(fn)
 
   else:
     new_fn = fn
   _cache[key] = new_fn
-  return new_fn
\ No newline at end of file
+  _cache[original_key] = new_fn
+  return new_fn
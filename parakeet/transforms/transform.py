@@ -454,9 +454,19 @@ class Transform(Builder):
     if self.reverse: stmts = reversed(stmts)
     
     for old_stmt in stmts:
+      source_info = old_stmt.source_info
+      if source_info is not None:
+        n_before = len(self.blocks.current())
       new_stmt = self.transform_stmt(old_stmt)
       if new_stmt is not None:
         self.blocks.append_to_current(new_stmt)
+      if source_info is not None:
+        # statements generated from this one (including any which
+        # got inserted before it) keep pointing at its source line 
+        current = self.blocks.current()
+        for i in xrange(n_before, len(current)):
+          if current[i].source_info is None:
+            current[i].source_info = source_info
     new_block = self.blocks.pop()
     if self.reverse: new_block.reverse()
     return new_block
@@ -0,0 +1,60 @@
+from .. analysis.use_analysis import use_count
+from .. ndtypes import make_fn_type
+from phase import Phase
+from transform import Transform
+
+class UnusedArgElim(Transform):
+  """
+  Drop the arguments of an entry function which never get used in its body,
+  so the caller doesn't have to convert and pass them on every call.
+  Only makes sense for functions called directly from Python, since
+  nested calls inside the IR still pass the full argument list.
+  """
+
+  def pre_apply(self, fn):
+    self.use_counts = use_count(fn)
+
+  def transform_block(self, stmts):
+    # nothing in the body changes
+    return stmts
+
+  def post_apply(self, fn):
+    kept_names = []
+    kept_types = []
+    for name, t in zip(fn.arg_names, fn.input_types):
+      # every argument counts as one use, just by being bound
+      if self.use_counts.get(name, 0) > 1:
+        kept_names.append(name)
+        kept_types.append(t)
+    if len(kept_names) < len(fn.arg_names):
+      fn.arg_names = kept_names
+      fn.input_types = tuple(kept_types)
+      fn.type = make_fn_type(fn.input_types, fn.return_type)
+    return fn
+
+unused_arg_elim = Phase([UnusedArgElim],
+                        copy = True,
+                        memoize = True,
+                        recursive = False,
+                        name = "UnusedArgElim")
+
+# for each function, which of its original argument positions survive
+_kept_positions = {}
+
+def eliminate_unused_args(fn):
+  """
+  Returns a version of the function without its unused arguments along
+  with the positions of the original arguments which it still expects
+  """
+  key = fn.cache_key
+  if key in _kept_positions:
+    return _kept_positions[key]
+  new_fn = unused_arg_elim.apply(fn)
+  if len(new_fn.arg_names) == len(fn.arg_names):
+    new_fn = fn
+  kept_names = set(new_fn.arg_names)
+  kept = tuple(i for (i, name) in enumerate(fn.arg_names) if name in kept_names)
+  result = (new_fn, kept)
+  _kept_positions[key] = result
+  _kept_positions[new_fn.cache_key] = (new_fn, tuple(range(len(new_fn.arg_names))))
+  return result
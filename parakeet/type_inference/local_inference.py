@@ -45,7 +45,17 @@ class LocalTypeInference(Transform):
   def transform_Index(self, expr):
     value = self.transform_expr(expr.value)
     index = self.transform_expr(expr.index)
-    if isinstance(value.type, TupleT):
+    if isinstance(value.type, TupleT) and index.__class__ is Slice:
+      # slicing with constant bounds (i.e. x.shape[1:]) picks out a 
+      # subset of the tuple's elements
+      bounds = (index.start, index.stop, index.step)
+      assert all(b.__class__ is Const for b in bounds), \
+        "Tuple slices need constant bounds, got %s" % (index,)
+      elt_types = value.type.elt_types
+      positions = range(len(elt_types))[slice(*[b.value for b in bounds])]
+      elts = tuple(TupleProj(value, i, type = elt_types[i]) for i in positions)
+      return Tuple(elts, type = make_tuple_type(get_types(elts)))
+    elif isinstance(value.type, TupleT):
       assert isinstance(index.type, IntT)
       assert index.__class__  is Const
       i = index.value
@@ -0,0 +1,89 @@
+import array
+import os
+import tempfile
+import numpy as np
+
+from parakeet import jit, typeof
+from parakeet.ndtypes import as_ndarray, make_array_type, Float64, UInt8
+from parakeet.ndtypes.array_conversion import list_to_array
+from parakeet.testing_helpers import eq, expect, run_local_tests
+
+def double(x):
+  return x * 2
+
+def test_memmap():
+  fd, path = tempfile.mkstemp()
+  os.close(fd)
+  try:
+    m = np.memmap(path, dtype = 'float64', mode = 'w+', shape = (10,))
+    m[:] = np.arange(10.0)
+    assert typeof(m) == make_array_type(Float64, 1)
+    expect(double, [m], np.arange(10.0) * 2)
+  finally:
+    del m
+    os.remove(path)
+
+def first_row(x):
+  return x[0]
+
+def test_matrix():
+  m = np.matrix([[1.0, 2.0], [3.0, 4.0]])
+  expect(double, [m], np.array([[2.0, 4.0], [6.0, 8.0]]))
+  # indexing has to follow the function's types rather than np.matrix's rules
+  expect(first_row, [m], np.array([1.0, 2.0]))
+  for backend in ('numpy', 'interp', 'c'):
+    row = jit(first_row)(m, _backend = backend)
+    assert type(row) is np.ndarray and row.shape == (2,), (backend, row)
+
+def test_buffer_protocol():
+  b = bytearray("abc")
+  assert typeof(b) == make_array_type(UInt8, 1)
+  expect(double, [b], np.array([97, 98, 99], dtype = 'uint8') * 2)
+  a = array.array('d', [1.0, 2.5])
+  expect(double, [a], np.array([2.0, 5.0]))
+
+class ArrayInterface(object):
+  def __init__(self, x):
+    self.x = x
+    self.__array_interface__ = x.__array_interface__
+
+def test_array_interface():
+  x = np.arange(6.0).reshape((2, 3))
+  expect(double, [ArrayInterface(x)], x * 2)
+
+def set_first(x):
+  x[0] = 100
+
+def test_no_copies():
+  # writes through the converted arguments land in the original memory
+  for backend in ('c', 'interp'):
+    b = bytearray("abc")
+    jit(set_first)(b, _backend = backend)
+    assert b[0] == 100
+    a = array.array('i', [1, 2, 3])
+    jit(set_first)(a, _backend = backend)
+    assert a[0] == 100
+    x = np.arange(4.0)
+    jit(set_first)(ArrayInterface(x), _backend = backend)
+    assert x[0] == 100
+
+def test_list_cache():
+  xs = [1.0, 2.0, 3.0]
+  first = list_to_array(xs, copy = False)
+  assert list_to_array(xs, copy = False) is first
+  # callers get their own copies unless they promise not to write
+  assert list_to_array(xs) is not first
+  assert eq(list_to_array(xs), first)
+  xs[1] = 5.0
+  changed = list_to_array(xs, copy = False)
+  assert changed is not first
+  assert eq(changed, [1.0, 5.0, 3.0])
+  xs.append(4.0)
+  assert eq(as_ndarray(xs), [1.0, 5.0, 3.0, 4.0])
+  # writes by compiled code don't leak into later calls
+  ys = [1, 2, 3]
+  jit(set_first)(ys, _backend = 'c')
+  assert eq(jit(double)(ys, _backend = 'c'), [2, 4, 6])
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from parakeet.c_backend import PyModuleCompiler, instrumentation
+from parakeet.openmp_backend import MulticoreCompiler
+from parakeet.testing_helpers import eq, run_local_tests
+
+def scale_add(x, y):
+  return x * y + 1
+
+def total(x):
+  return np.sum(x)
+
+def run_warmup(backend, compiler_class):
+  cache = PyModuleCompiler._entry_compile_cache
+  before = set(cache.keys())
+  x = np.arange(10.0)
+  m = np.ones((3, 4))
+  n = parakeet.warmup([(scale_add, [x, 2.0]),
+                       (scale_add, [m, 3.0]),
+                       (total, [x])], backend = backend)
+  assert n == 3
+  new_keys = [k for k in cache.keys() if k not in before and k[1] is compiler_class]
+  assert len(new_keys) == 3, new_keys
+  # all the entries live in the same extension module
+  modules = set(id(cache[k].module) for k in new_keys)
+  assert len(modules) == 1, "Expected one module, got %d" % len(modules)
+  assert eq(jit(scale_add)(x, 2.0, _backend = backend), x * 2.0 + 1)
+  assert eq(jit(scale_add)(m, 3.0, _backend = backend), m * 3.0 + 1)
+  assert eq(jit(total)(x, _backend = backend), np.sum(x))
+  assert len(cache) == len(before) + 3, "Calls after warmup shouldn't compile anything"
+
+def test_warmup_c():
+  run_warmup('c', PyModuleCompiler)
+
+def test_warmup_openmp():
+  run_warmup('openmp', MulticoreCompiler)
+
+def test_jit_warmup():
+  f = jit(total)
+  x = np.arange(7)
+  assert f.warmup([x], [x * 1.5], _backend = 'c') == 2
+  assert eq(f(x, _backend = 'c'), np.sum(x))
+
+def offset_sum(x):
+  return np.sum(x) + 3
+
+def test_failed_batch_releases_entries():
+  def fail(compiled):
+    raise RuntimeError("can't register module")
+  old_register = instrumentation.register_module
+  x = np.arange(5.0)
+  try:
+    instrumentation.register_module = fail
+    try:
+      parakeet.warmup([(offset_sum, [x])], backend = 'c')
+      assert False, "Expected warmup to fail"
+    except RuntimeError:
+      pass
+  finally:
+    instrumentation.register_module = old_register
+  # the entry which failed to load has to be compiled again instead of
+  # leaving later callers waiting for it
+  results = []
+  t = threading.Thread(target = lambda: results.append(jit(offset_sum)(x, _backend = 'c')))
+  t.daemon = True
+  t.start()
+  t.join(300)
+  assert not t.is_alive(), "Compiling after a failed batch got stuck"
+  assert eq(results[0], np.sum(x) + 3)
+
+if __name__ == '__main__':
+  run_local_tests()
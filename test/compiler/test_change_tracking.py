@@ -0,0 +1,59 @@
+import numpy as np
+
+from parakeet import config, jit, specialize
+from parakeet.analysis.fingerprint import fingerprint
+from parakeet.syntax import Const
+from parakeet.transforms import Transform
+from parakeet.transforms.clone_function import CloneFunction
+from parakeet.transforms.phase import apply_transforms
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def f(x, y):
+  z = x * 2.0
+  return z + y
+
+def typed_f():
+  typed_fn, _ = specialize(f, [np.arange(10.0), 1.0])
+  return typed_fn
+
+def test_fingerprint_of_copy():
+  fn = typed_f()
+  assert fingerprint(fn) == fingerprint(CloneFunction().apply(fn))
+
+def test_fingerprint_changes():
+  fn = CloneFunction().apply(typed_f())
+  before = fingerprint(fn)
+  ret = fn.body[-1].value
+  ret.args = (ret.args[0], Const(3.0, type = ret.args[1].type))
+  assert fingerprint(fn) != before
+
+class NoOp(Transform):
+  pass
+
+class CountRuns(Transform):
+  count = 0
+  def pre_apply(self, fn):
+    CountRuns.count += 1
+
+def test_skip_cleanup_after_noop():
+  fn = typed_f()
+  def count_cleanups(track_changes):
+    CountRuns.count = 0
+    with_config(config, 
+                lambda: apply_transforms(fn, [NoOp, NoOp, NoOp], cleanup = [CountRuns]), 
+                opt_track_changes = track_changes)
+    return CountRuns.count
+  # only cleaned up once, after the first transform
+  n = count_cleanups(True)
+  assert n == 1, "Expected 1 cleanup, got %d" % n
+  n = count_cleanups(False)
+  assert n == 3, "Expected 3 cleanups, got %d" % n
+
+def test_same_result():
+  x = np.arange(10.0)
+  for track_changes in (True, False):
+    result = with_config(config, lambda: jit(f)(x, 1.0), opt_track_changes = track_changes)
+    assert eq(result, f(x, 1.0))
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,58 @@
+import imp
+import os
+import time
+
+import numpy as np
+
+from parakeet import config, jit, profiling
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def add_scaled(x, y, alpha):
+  return x + alpha * y
+
+def test_compile_times():
+  profiling.reset_compile_times()
+  x = np.arange(10.0)
+  start = time.time()
+  result = with_config(config, lambda: jit(add_scaled)(x, x, 3.0, _backend = 'c'), 
+                       collect_compile_times = True)
+  elapsed = time.time() - start
+  assert eq(result, x + 3.0 * x)
+  times = profiling.compile_time_snapshot()
+  for category in ('frontend', 'pipeline', 'codegen', 'gcc'):
+    assert times.get(category, 0) > 0, "No time recorded for %s: %s" % (category, times)
+  # nested timers don't count the same time twice
+  assert sum(times.values()) <= elapsed, \
+    "Compile times %s add up to more than the %.4fs elapsed" % (times, elapsed)
+
+def test_compile_times_off():
+  profiling.reset_compile_times()
+  x = np.arange(10)
+  result = with_config(config, lambda: jit(add_scaled)(x, x, 2), 
+                       collect_compile_times = False)
+  assert eq(result, x + 2 * x)
+  assert profiling.compile_time_snapshot() == {}
+
+def load_run_suite():
+  filename = os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "run_suite.py")
+  return imp.load_source("run_suite", os.path.abspath(filename))
+
+def fake_result(t, compile_time):
+  return {'min' : t, 'median' : t, 'mean' : t, 'first_call' : compile_time,
+          'compile' : {'total' : compile_time}}
+
+def test_find_regressions():
+  run_suite = load_run_suite()
+  baseline = {'a/c' : fake_result(1.0, 0.5),
+              'b/c' : fake_result(1.0, 0.5),
+              'c/c' : fake_result(1.0, 0.5)}
+  results = {'a/c' : fake_result(1.05, 0.5),
+             'b/c' : fake_result(1.5, 0.5),
+             'c/c' : {'error' : 'crashed'},
+             'd/c' : fake_result(1.0, 0.5)}
+  regressions = run_suite.find_regressions(results, baseline, threshold = 0.1)
+  assert [(key, name) for (key, name, _, _) in regressions] == \
+    [('b/c', 'min'), ('c/c', 'error')], regressions
+
+if __name__ == '__main__':
+  run_local_tests()
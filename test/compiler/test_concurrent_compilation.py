@@ -0,0 +1,107 @@
+import threading
+import numpy as np
+
+from parakeet import interp, jit
+from parakeet.c_backend import pymodule_compiler
+from parakeet.compile_lock import compile_lock, InFlight
+from parakeet.testing_helpers import count_calls, eq, run_local_tests
+
+def run_threads(target, n):
+  start = threading.Event()
+  errors = []
+  def run(i):
+    start.wait()
+    try:
+      target(i)
+    except Exception, e:
+      errors.append(e)
+  threads = [threading.Thread(target = run, args = (i,)) for i in xrange(n)]
+  for t in threads:
+    t.start()
+  start.set()
+  for t in threads:
+    t.join()
+  assert not errors, errors
+
+def count_modules(fn):
+  """
+  Run fn while counting how many extension modules get built
+  """
+  _, count = count_calls(pymodule_compiler, 'compile_module', fn)
+  return count
+
+def cube_plus(x, y):
+  return x * x * x + y
+
+def test_same_signature():
+  f = jit(cube_plus)
+  x = np.arange(17.0)
+  results = [None] * 6
+  def call(i):
+    results[i] = f(x, 3.0, _backend = 'c')
+  n = count_modules(lambda: run_threads(call, len(results)))
+  assert n == 1, "Expected one module for one signature, got %d" % n
+  for result in results:
+    assert eq(result, x * x * x + 3.0)
+
+def square_minus(x, y):
+  return x * x - y
+
+def test_different_signatures():
+  f = jit(square_minus)
+  inputs = [np.arange(5, dtype = 'int32'),
+            np.arange(5, dtype = 'int64'),
+            np.arange(5.0),
+            np.arange(5.0, dtype = 'float32'),
+            np.ones((2, 3))]
+  results = [None] * len(inputs)
+  def call(i):
+    results[i] = f(inputs[i], 1, _backend = 'c')
+  n = count_modules(lambda: run_threads(call, len(inputs)))
+  assert n == len(inputs), "Expected %d modules, got %d" % (len(inputs), n)
+  for (x, result) in zip(inputs, results):
+    assert eq(result, x * x - 1)
+
+def row_norms(x):
+  return np.array([np.sqrt(np.sum(row * row)) for row in x])
+
+def test_interp_runs_without_lock():
+  f = jit(row_norms)
+  x = np.arange(12.0).reshape((3, 4))
+  lock_free = []
+  def try_lock():
+    if compile_lock.acquire(False):
+      compile_lock.release()
+      lock_free.append(True)
+    else:
+      lock_free.append(False)
+  original_call = interp.CompiledFn.__call__
+  def checked_call(self, actuals):
+    # the lock is reentrant, so ask from a different thread
+    t = threading.Thread(target = try_lock)
+    t.start()
+    t.join()
+    return original_call(self, actuals)
+  interp.CompiledFn.__call__ = checked_call
+  try:
+    result = f(x, _backend = 'interp')
+  finally:
+    interp.CompiledFn.__call__ = original_call
+  assert eq(result, row_norms(x))
+  assert len(lock_free) > 0 and all(lock_free), lock_free
+
+def test_in_flight_retry():
+  in_flight = InFlight({})
+  def fail():
+    raise RuntimeError("compile failed")
+  try:
+    in_flight.get('k', fail)
+    assert False, "Expected failure to propagate"
+  except RuntimeError:
+    pass
+  # a failed attempt doesn't leave the key stuck
+  assert in_flight.get('k', lambda: 3) == 3
+  assert in_flight.get('k', fail) == 3
+
+if __name__ == '__main__':
+  run_local_tests()
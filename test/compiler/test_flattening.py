@@ -0,0 +1,76 @@
+import numpy as np
+
+from parakeet import specialize
+from parakeet.analysis import contains_structs
+from parakeet.ndtypes import Float64, Int64, PtrT, ScalarT, make_tuple_type
+from parakeet.openmp_backend.multicore_compiler import MulticoreCompiler
+from parakeet.syntax import ParFor
+from parakeet.testing_helpers import expect, run_local_tests
+from parakeet.transforms import pipeline
+
+def parfor_fns(fn):
+  return [stmt.fn.fn for stmt in fn.body if isinstance(stmt, ParFor)]
+
+def flat_parfor_fns(fn, args):
+  typed_fn, _ = specialize(fn, args)
+  return parfor_fns(pipeline.flatten.apply(typed_fn))
+
+def row_sums(x):
+  return np.array([np.sum(row) for row in x])
+
+def test_parfor_fns_take_scalars():
+  x = np.arange(60.0).reshape((6, 10))
+  fns = flat_parfor_fns(row_sums, [x])
+  assert len(fns) > 0
+  for fn in fns:
+    assert all(isinstance(t, (ScalarT, PtrT)) for t in fn.input_types), fn
+    assert not contains_structs(fn), fn
+
+def test_row_sums():
+  x = np.arange(60.0).reshape((6, 10))
+  expect(row_sums, [x], row_sums(x))
+  expect(row_sums, [x[:, ::3]], row_sums(x[:, ::3]))
+  expect(row_sums, [x.T], row_sums(x.T))
+
+def dot_rows(x, y):
+  return np.array([np.dot(x[i], y[i]) for i in xrange(len(x))])
+
+def test_dot_rows():
+  x = np.arange(12.0).reshape((4, 3))
+  y = np.cos(x)
+  expect(dot_rows, [x, y], dot_rows(x, y))
+  expect(dot_rows, [x, y[::-1]], dot_rows(x, y[::-1]))
+
+def count_positive(x):
+  total = 0
+  for i in xrange(len(x)):
+    if x[i] > 0:
+      total += 1
+  return total
+
+def test_loop_with_branch():
+  x = np.sin(np.arange(50.0))
+  expect(count_positive, [x], count_positive(x))
+
+def test_combine_args_flattened_single_elt_tuple():
+  pair_t = make_tuple_type((Float64,))
+  args = MulticoreCompiler().combine_args((Float64, Float64), [], 
+                                          ("acc", "elt"), (pair_t, pair_t))
+  assert args == ("acc.elt0", "elt.elt0"), args
+
+def test_combine_args_flattened_nested_tuple():
+  inner_t = make_tuple_type((Int64, Float64))
+  acc_t = make_tuple_type((Float64, inner_t))
+  input_types = (Int64, Float64, Int64, Float64, Float64)
+  args = MulticoreCompiler().combine_args(input_types, ["c"], 
+                                          ("acc", "elt"), (acc_t, Float64))
+  assert args == ("c", "acc.elt0", "acc.elt1.elt0", "acc.elt1.elt1", "elt"), args
+
+def test_combine_args_unflattened():
+  pair_t = make_tuple_type((Float64,))
+  args = MulticoreCompiler().combine_args((pair_t, pair_t), [], 
+                                          ("acc", "elt"), (pair_t, pair_t))
+  assert args == ("acc", "elt"), args
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from parakeet import specialize
+from parakeet.openmp_backend import config as openmp_config
+from parakeet.openmp_backend.multicore_compiler import MulticoreCompiler
+from parakeet.openmp_backend.run_function import prepare
+from parakeet.testing_helpers import expect, run_local_tests, with_config
+
+def helper_source(fn, args):
+  """
+  Source of the C functions which the entry point of fn calls
+  """
+  typed_fn, linear_args = specialize(fn, args)
+  typed_fn, _ = prepare(typed_fn, linear_args)
+  compiler = MulticoreCompiler()
+  compiler.compile_entry(typed_fn)
+  return "\n".join(compiler.extra_functions.itervalues())
+
+def scale_add(x, y):
+  return x * 2.0 + y
+
+def row_sums(x):
+  return np.array([np.sum(row) for row in x])
+
+def test_always_inline():
+  x = np.arange(12.0).reshape((3, 4))
+  assert "always_inline" in helper_source(scale_add, [x, x])
+  assert "always_inline" in helper_source(row_sums, [x])
+
+def test_inlining_disabled():
+  x = np.arange(20.0).reshape((4, 5))
+  def check():
+    assert "always_inline" not in helper_source(row_sums, [x])
+    expect(row_sums, [x], row_sums(x))
+  with_config(openmp_config, check, inline_loop_bodies = False)
+
+def test_results():
+  x = np.arange(20.0).reshape((4, 5))
+  expect(scale_add, [x, x.T.copy().T], scale_add(x, x))
+  expect(row_sums, [x], row_sums(x))
+  expect(row_sums, [x[:, ::2]], row_sums(x[:, ::2]))
+
+if __name__ == '__main__':
+  run_local_tests()
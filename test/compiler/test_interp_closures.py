@@ -0,0 +1,56 @@
+import numpy as np
+
+from parakeet import config, interp, specialize
+from parakeet.transforms.pipeline import loopify
+from parakeet.testing_helpers import eq, expect, run_local_tests, with_config
+
+def loopify_fn(fn, args):
+  typed_fn, linear_args = specialize(fn, args)
+  return loopify(typed_fn), linear_args
+
+def nested_loops(x):
+  total = 0.0
+  for i in range(x.shape[0]):
+    for j in range(x.shape[1]):
+      if x[i,j] > 0:
+        total += x[i,j] * i
+      else:
+        total -= j
+  return total
+
+def early_return(n):
+  i = 0
+  while i < n:
+    if i * i > 50:
+      return i
+    i += 1
+  return -1
+
+def update_array(x):
+  y = x.copy()
+  for i in range(len(y)):
+    y[i] = y[i] + i
+  return y
+
+def test_compiled_matches_tree_walker():
+  for (fn, args) in [(nested_loops, [np.random.randn(7,5)]),
+                     (early_return, [100]),
+                     (early_return, [3]),
+                     (update_array, [np.arange(10.0)])]:
+    loopy_fn, linear_args = loopify_fn(fn, args)
+    expected = interp.eval_fn(loopy_fn, linear_args)
+    result = interp.run_compiled(loopy_fn, linear_args)
+    assert eq(result, expected), \
+      "Expected %s but got %s for %s" % (expected, result, fn.__name__)
+
+def test_compiled_fn_cached():
+  loopy_fn, _ = loopify_fn(nested_loops, [np.random.randn(3,3)])
+  assert interp.compile_fn(loopy_fn) is interp.compile_fn(loopy_fn)
+
+def test_tree_walker_backend():
+  x = np.random.randn(4,3)
+  with_config(config, lambda: expect(nested_loops, [x], nested_loops(x)), 
+              interp_compile_closures = False)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,67 @@
+import shutil
+import tempfile
+import numpy as np
+
+import parakeet
+from parakeet import config, names, specialize, type_inference
+from parakeet.c_backend import config as c_config
+from parakeet.frontend import ir_cache
+from parakeet.frontend.run_function import optimize_for_backend
+from parakeet.testing_helpers import count_calls, eq, run_local_tests, with_config
+from parakeet.transforms import pipeline
+
+def axpy(a, x, y):
+  return parakeet.each(lambda xi, yi: a * xi + yi, x, y)
+
+x = np.arange(10.0)
+y = np.ones(10)
+
+def test_roundtrip():
+  typed_fn, linear_args = specialize(axpy, [2.0, x, y])
+  typed_fn = optimize_for_backend(typed_fn, 'c')
+  loaded = ir_cache.loads(ir_cache.dumps(typed_fn, "0" * 32))
+  assert loaded is not typed_fn
+  assert loaded.name != typed_fn.name
+  assert loaded.input_types == typed_fn.input_types
+  assert loaded.return_type is typed_fn.return_type
+  for name in loaded.type_env:
+    assert names.fresh(names.original(name)) not in loaded.type_env
+  result = parakeet.run_typed_fn(loaded, linear_args, backend = 'c')
+  assert eq(result, 2.0 * x + y)
+
+def test_same_phases_as_backend():
+  typed_fn, _ = specialize(axpy, [2.0, x, y])
+  optimized = optimize_for_backend(typed_fn, 'c')
+  assert pipeline.final_loop_optimizations in optimized.transform_history
+  # the quick tier leaves out the final loop optimizations (which change
+  # functions in place, so this needs a specialization of its own)
+  typed_fn, _ = specialize(axpy, [2, x, y])
+  quick = with_config(c_config, lambda: optimize_for_backend(typed_fn, 'c'), 
+                      tiered_compilation = True)
+  assert pipeline.final_loop_optimizations not in quick.transform_history
+
+def test_key_includes_backend_config():
+  untyped = parakeet.frontend.ast_conversion.translate_function_value(axpy)
+  _, arg_types = parakeet.frontend.run_function.prepare_args(untyped, [2.0, x, y], {})
+  key = ir_cache.cache_key(untyped, arg_types, 'c')
+  other_key = with_config(c_config, lambda: ir_cache.cache_key(untyped, arg_types, 'c'), 
+                          tiered_compilation = not c_config.tiered_compilation)
+  assert other_key != key
+
+def test_cached_across_runs():
+  cache_dir = tempfile.mkdtemp()
+  def check():
+    assert eq(parakeet.run_python_fn(axpy, [3.0, x, y]), 3.0 * x + y)
+    # forget everything that's in memory, so the IR has to come from disk
+    ir_cache._memory_cache.clear()
+    result, n_specialized = count_calls(type_inference, 'specialize',
+      lambda: parakeet.run_python_fn(axpy, [3.0, x, y]))
+    assert eq(result, 3.0 * x + y)
+    assert n_specialized == 0, "Expected IR to be loaded from disk"
+  try:
+    with_config(config, check, cache_ir = True, cache_ir_dir = cache_dir)
+  finally:
+    shutil.rmtree(cache_dir)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,48 @@
+import numpy as np
+
+import parakeet
+from parakeet import prims, specialize
+from parakeet.syntax import (Assign, Const, Map, PrimCall, Range, Reduce,
+                             Var, TiledReduce)
+from parakeet.transforms.clone_function import CloneFunction
+from parakeet.testing_helpers import run_local_tests
+
+def test_no_instance_dicts():
+  x = Var("x")
+  stmt = Assign(x, PrimCall(prims.add, (x, Const(1))))
+  for node in (x, stmt, stmt.rhs, Range(Const(0), x, Const(1)),
+               Map(fn = x, args = (x,), axis = Const(0))):
+    assert not hasattr(node, '__dict__'), \
+      "Expected %s to not have an instance dictionary" % node.node_type()
+
+def test_fields():
+  assert Assign.members() == ('lhs', 'rhs', 'source_info')
+  assert Range.fields() == \
+    ('value', 'type', 'source_info', 'array', 'start', 'stop', 'step')
+  assert Reduce._fields == \
+    ('args', 'axis', 'fn', 'output', 'type', 'source_info', 'combine', 'init')
+  assert TiledReduce._fields[:2] == ('axes', 'fixed_tile_size')
+
+def test_positional_and_keyword_init():
+  x = Var("x")
+  stmt = Assign(x, Const(1))
+  assert stmt.lhs is x and stmt.rhs == Const(1) and stmt.source_info is None
+  stmt = Assign(x, rhs = Const(2))
+  assert stmt.rhs == Const(2)
+  assert stmt == Assign(Var("x"), Const(2))
+  assert hash(stmt) == hash(Assign(Var("x"), Const(2)))
+
+def mean_sq(x):
+  return parakeet.reduce(lambda a, b: a + b, x * x) / x.shape[0]
+
+def test_clone():
+  typed_fn, _ = specialize(mean_sq, [np.arange(10.0)])
+  cloned = CloneFunction().apply(typed_fn)
+  assert cloned is not typed_fn
+  assert len(cloned.body) == len(typed_fn.body)
+  for (s1, s2) in zip(typed_fn.body, cloned.body):
+    assert s1 is not s2
+    assert str(s1) == str(s2)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import parakeet
+from parakeet.c_backend import compile_util, config as c_config
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def imported_after(stmt):
+  script = "import sys; %s; print ' '.join(sorted(sys.modules.keys()))" % stmt
+  env = os.environ.copy()
+  root = os.path.dirname(os.path.dirname(parakeet.__file__))
+  env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+  output = subprocess.check_output([sys.executable, "-c", script], env = env)
+  return set(output.split())
+
+def test_import_parakeet_is_lazy():
+  modules = imported_after("import parakeet")
+  for name in ('parakeet.transforms.pipeline',
+               'parakeet.c_backend',
+               'parakeet.openmp_backend',
+               'numpy.distutils',
+               'distutils.sysconfig'):
+    assert name not in modules, "Didn't expect 'import parakeet' to load %s" % name
+
+def test_toolchain_cache_roundtrip():
+  fd, filename = tempfile.mkstemp(suffix = ".json")
+  os.close(fd)
+  os.remove(filename)
+  def load_toolchain():
+    return with_config(c_config, compile_util.load_toolchain, 
+                       toolchain_cache_file = filename)
+  try:
+    probed = load_toolchain()
+    with open(filename) as f:
+      saved = json.load(f)
+    assert saved['key'] == compile_util.toolchain_cache_key()
+    assert saved['toolchain'] == probed
+    assert load_toolchain() == probed
+
+    # entries saved by a different interpreter get probed again
+    saved['key'] = 'stale'
+    saved['toolchain']['shared_extension'] = '.wrong'
+    with open(filename, 'w') as f:
+      json.dump(saved, f)
+    assert load_toolchain()['shared_extension'] == probed['shared_extension']
+  finally:
+    if os.path.exists(filename):
+      os.remove(filename)
+
+def add1(x):
+  return x + 1
+
+def test_compile_after_lazy_probe():
+  x = np.arange(5)
+  assert eq(parakeet.jit(add1)(x), x + 1)
+
+if __name__ == '__main__':
+  run_local_tests()
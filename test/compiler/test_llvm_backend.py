@@ -0,0 +1,109 @@
+import gc
+import os
+import numpy as np
+
+import parakeet
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+try:
+  import llvmlite
+  from parakeet import llvm_backend
+  from parakeet.llvm_backend import llvm_config
+except ImportError:
+  llvm_backend = None
+
+def run_llvm(fn, args):
+  return parakeet.run_python_fn(fn, args, backend = 'llvm')
+
+def count_down(n):
+  total = 0
+  while n > 0:
+    total += n
+    n -= 1
+  return total
+
+def test_scalar_loop():
+  if llvm_backend is None:
+    return
+  assert run_llvm(count_down, [100]) == 5050
+
+def add_one(x):
+  return x + 1
+
+def test_returned_array_owns_memory():
+  if llvm_backend is None:
+    return
+  x = np.arange(200.0)
+  y = run_llvm(add_one, [x])
+  assert eq(y, x + 1)
+  # the result's data was allocated by compiled code and has to outlive
+  # the call which produced it
+  gc.collect()
+  assert eq(y.copy(), x + 1)
+
+def first_row(x):
+  return x[0]
+
+def test_returned_view_of_input():
+  if llvm_backend is None:
+    return
+  x = np.arange(12.0).reshape(3, 4)
+  y = run_llvm(first_row, [x])
+  assert eq(y, x[0])
+
+def min_and_max(x):
+  return np.min(x), np.max(x)
+
+def test_tuple_result():
+  if llvm_backend is None:
+    return
+  x = np.random.randn(50)
+  assert run_llvm(min_and_max, [x]) == (np.min(x), np.max(x))
+
+def hypot(x, y):
+  return np.sqrt(x * x + y * y)
+
+def test_parallel_map():
+  if llvm_backend is None:
+    return
+  x = np.random.randn(101, 7)
+  y = np.random.randn(101, 7)
+  result = with_config(llvm_config, lambda: run_llvm(hypot, [x, y]), 
+                       num_threads = 3, min_parallel_iters = 1)
+  assert eq(result, np.sqrt(x * x + y * y))
+
+def smooth(x, steps):
+  for _ in range(steps):
+    x = parakeet.each(lambda v: v * 0.5 + 1.0, x)
+  return x
+
+def n_os_threads():
+  return len(os.listdir('/proc/self/task'))
+
+def test_thread_pool_reused():
+  if llvm_backend is None:
+    return
+  def check():
+    x = np.arange(300.0)
+    expected = x
+    for _ in range(50):
+      expected = expected * 0.5 + 1.0
+    assert eq(run_llvm(smooth, [x, 1]), x * 0.5 + 1.0)
+    if not os.path.exists('/proc/self/task'):
+      return
+    # the workers started by the first loop stay around for the next ones
+    before = n_os_threads()
+    assert before >= 3, "Expected two parked workers, found %d threads" % before
+    assert eq(run_llvm(smooth, [x, 50]), expected)
+    assert n_os_threads() == before
+  with_config(llvm_config, check, num_threads = 3, min_parallel_iters = 1)
+
+def test_serial_map():
+  if llvm_backend is None:
+    return
+  x = np.random.randn(20, 3)
+  result = with_config(llvm_config, lambda: run_llvm(hypot, [x, x]), parallel = False)
+  assert eq(result, np.sqrt(2 * x * x))
+
+if __name__ == '__main__':
+  run_local_tests()
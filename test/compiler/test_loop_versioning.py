@@ -0,0 +1,83 @@
+import numpy as np
+
+from parakeet import specialize
+from parakeet.c_backend.loop_versioning import versioning_plan
+from parakeet.syntax import ForLoop
+from parakeet.testing_helpers import expect_same, run_local_tests
+from parakeet.transforms import pipeline
+
+def plans(fn, args):
+  typed_fn, _ = specialize(fn, args)
+  lowered = pipeline.final_loop_optimizations.apply(pipeline.loopify(typed_fn))
+  return [versioning_plan(stmt) for stmt in lowered.body if isinstance(stmt, ForLoop)]
+
+def add_2d(x, y):
+  z = np.empty_like(x)
+  for i in xrange(x.shape[0]):
+    for j in xrange(x.shape[1]):
+      z[i, j] = x[i, j] + y[i, j]
+  return z
+
+def test_add_2d_layouts():
+  x = np.arange(600.0).reshape((20, 30))
+  y = np.cos(x)
+  expect_same(add_2d, x, y)
+  # not contiguous along the last dimension
+  expect_same(add_2d, x[:, ::2], y[:, ::2])
+  expect_same(add_2d, x.T, y.T)
+  # negative outer strides are fine as long as the rows are contiguous
+  expect_same(add_2d, x[::-1], y[::-1])
+
+def test_add_2d_plan():
+  x = np.arange(600.0).reshape((20, 30))
+  [plan] = plans(add_2d, [x, x])
+  assert plan is not None
+  assert len(plan.arrays) == 3
+  assert len(plan.written) == 1
+
+def copy_into(src, dst):
+  for i in xrange(len(src)):
+    dst[i] = src[i]
+
+def shift_right(x):
+  copy_into(x[:-1], x[1:])
+  return x
+
+def test_overlapping_views():
+  # every element has to see the previous iteration's write
+  expect_same(shift_right, np.arange(100.0))
+
+def add_into(x, y, out):
+  for i in xrange(len(x)):
+    out[i] = x[i] + y[i] * out[i]
+  return out
+
+def add_into_self(x):
+  return add_into(x, x, x)
+
+def test_aliased_args():
+  x = np.arange(50.0)
+  expect_same(add_into, x, 2 * x, np.ones(50))
+  expect_same(add_into_self, x)
+
+def add_next(x, y):
+  for i in xrange(len(x) - 1):
+    y[i] = x[i] + x[i + 1]
+  return y
+
+def add_const_offset(x, y, k):
+  for i in xrange(len(y)):
+    y[i] = x[i] + x[k]
+  return y
+
+def test_indices_in_bounds():
+  x = np.arange(40.0)
+  expect_same(add_next, x, np.zeros(40))
+  expect_same(add_const_offset, x, np.zeros(40), 39)
+  # i + 1 gets computed inside the loop so it can't be checked up front
+  assert plans(add_next, [x, np.zeros(40)]) == [None]
+  [plan] = plans(add_const_offset, [x, np.zeros(40), 39])
+  assert plan is not None
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,132 @@
+import os
+import signal
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from parakeet import multiprocess_backend
+from parakeet.multiprocess_backend import config as mp_config
+from parakeet.multiprocess_backend import shared_array, shared_empty
+from parakeet.multiprocess_backend import run_function as mp_run
+from parakeet.multiprocess_backend import worker_pool
+from parakeet.multiprocess_backend.shared_memory import find_segment
+from parakeet.testing_helpers import count_calls, eq, run_local_tests
+
+old_settings = {}
+
+def setup():
+  # a small pool and small shards so that little test arrays get split up
+  old_settings['num_workers'] = mp_config.num_workers
+  old_settings['min_shard_size'] = mp_config.min_shard_size
+  mp_config.num_workers = 3
+  mp_config.min_shard_size = 4
+
+def teardown():
+  mp_config.num_workers = old_settings['num_workers']
+  mp_config.min_shard_size = old_settings['min_shard_size']
+
+def count_local_runs(fn):
+  """
+  Run fn while counting how many calls didn't get split across the workers
+  """
+  return count_calls(mp_run, 'run_locally', fn)
+
+def scale_add(x, y):
+  return x * y + 1
+
+def test_elementwise_map():
+  x = np.arange(20.0)
+  result, local = count_local_runs(lambda: jit(scale_add)(x, 3.0, _backend = 'multiprocess'))
+  assert local == 0
+  assert eq(result, x * 3.0 + 1)
+  # elementwise results come back in shared memory
+  assert find_segment(result) is not None
+
+def test_output_passing():
+  x = np.arange(20.0)
+  typed_fn, _ = parakeet.specialize(scale_add, [x, 3.0])
+  out_fn = mp_run.output_passing_fn(typed_fn)
+  assert out_fn is not None
+  assert out_fn.input_types == typed_fn.input_types + (typed_fn.return_type,)
+  out = np.zeros_like(x)
+  assert parakeet.run_typed_fn(out_fn, [x, 3.0, out], backend = 'c') is None
+  assert eq(out, x * 3.0 + 1)
+
+def test_elementwise_map_2d():
+  x = np.arange(30.0).reshape((10, 3))
+  assert eq(jit(scale_add)(x, 2, _backend = 'multiprocess'), x * 2 + 1)
+
+def row_sums(x, y):
+  return [np.sum(row) + y for row in x]
+
+def test_map_rows():
+  x = np.arange(40.0).reshape((8, 5))
+  assert eq(jit(row_sums)(x, 1.0, _backend = 'multiprocess'), x.sum(axis = 1) + 1.0)
+
+def total(x):
+  return np.sum(x)
+
+def test_reduction():
+  x = np.arange(1000)
+  f = jit(total)
+  # the first call also checks that the reduction's init can be repeated
+  f(x, _backend = 'multiprocess')
+  result, local = count_local_runs(lambda: f(x, _backend = 'multiprocess'))
+  # only the combine steps run in this process
+  assert local == 2, "Expected 2 combines, got %d" % local
+  assert eq(result, np.sum(x))
+  m = np.arange(60.0).reshape((12, 5))
+  assert eq(jit(total)(m, _backend = 'multiprocess'), np.sum(m))
+
+def sum_plus_five(x):
+  return parakeet.reduce(parakeet.add, x, init = 5)
+
+def test_non_idempotent_init():
+  # starting every shard from 5 would count it more than once
+  x = np.arange(100)
+  assert eq(jit(sum_plus_five)(x, _backend = 'multiprocess'), np.sum(x) + 5)
+
+def add_first(x):
+  return x + x[0]
+
+def test_fallback():
+  x = np.arange(2.0, 30.0)
+  # x[0] would mean something else in each shard
+  result, local = count_local_runs(lambda: jit(add_first)(x, _backend = 'multiprocess'))
+  assert local == 1
+  assert eq(result, x + x[0])
+  small = np.arange(3.0)
+  assert eq(jit(scale_add)(small, 2.0, _backend = 'multiprocess'), small * 2.0 + 1)
+
+def test_shared_inputs():
+  x = shared_array(np.arange(50.0))
+  assert find_segment(x) is not None
+  assert eq(jit(scale_add)(x, 0.5, _backend = 'multiprocess'), x * 0.5 + 1)
+  y = shared_empty((4, 6), dtype = 'int32')
+  y[:] = 7
+  assert eq(jit(total)(y, _backend = 'multiprocess'), 7 * 24)
+
+def test_worker_crash():
+  x = np.arange(20.0)
+  f = jit(scale_add)
+  f(x, 1.0, _backend = 'multiprocess')
+  pool = worker_pool.get_pool(mp_run.num_workers())
+  process, _ = pool.workers[0]
+  os.kill(process.pid, signal.SIGKILL)
+  process.join()
+  # the dead worker gets replaced
+  assert eq(f(x, 1.0, _backend = 'multiprocess'), x + 1)
+  task = ("/nonexistent/module.so", "f", ('tuple', []))
+  try:
+    pool.run([task])
+    assert False, "Expected WorkerError"
+  except multiprocess_backend.WorkerError, e:
+    assert "ImportError" in e.worker_traceback
+  assert eq(f(x, 1.0, _backend = 'multiprocess'), x + 1)
+
+if __name__ == '__main__':
+  setup()
+  try:
+    run_local_tests()
+  finally:
+    teardown()
@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+
+from parakeet import jit, specialize
+from parakeet.c_backend import PyModuleCompiler, config as c_config
+from parakeet.c_backend import run_function as c_run
+from parakeet.openmp_backend import MulticoreCompiler
+from parakeet.openmp_backend import run_function as openmp_run
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def sum_sq(x):
+  total = 0.0
+  for i in xrange(len(x)):
+    total += x[i] * x[i]
+  return total
+
+def entry_source(backend, compiler_class, fn, args, nogil):
+  def compile_entry():
+    typed_fn, linear_args = specialize(fn, args)
+    prepared_fn, _ = backend.prepare(typed_fn, linear_args)
+    return compiler_class().compile_entry(prepared_fn).src
+  return with_config(c_config, compile_entry, nogil = nogil)
+
+def test_nogil_source():
+  x = np.arange(10.0)
+  src = entry_source(c_run, PyModuleCompiler, sum_sq, [x], True)
+  assert "PyEval_SaveThread" in src
+  assert "PyEval_RestoreThread" in src
+  src = entry_source(c_run, PyModuleCompiler, sum_sq, [x], False)
+  assert "PyEval_SaveThread" not in src
+
+def add_one(x):
+  return x + 1
+
+def test_nogil_parfor():
+  x = np.arange(10.0)
+  # the whole body already runs without the GIL,
+  # so the parallel loop mustn't release it again
+  src = entry_source(openmp_run, MulticoreCompiler, add_one, [x], True)
+  assert "PyEval_SaveThread" in src
+  assert "Py_BEGIN_ALLOW_THREADS" not in src
+  src = entry_source(openmp_run, MulticoreCompiler, add_one, [x], False)
+  assert "Py_BEGIN_ALLOW_THREADS" in src
+
+def test_threads():
+  f = jit(sum_sq)
+  inputs = [np.arange(n, dtype = 'float64') for n in xrange(1000, 1008)]
+  # specialize and compile before any threads start
+  expected = [f(x, _backend = 'c') for x in inputs]
+  results = [None] * len(inputs)
+  def run(i):
+    for _ in xrange(20):
+      results[i] = f(inputs[i], _backend = 'c')
+  threads = [threading.Thread(target = run, args = (i,)) for i in xrange(len(inputs))]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  for (result, exp) in zip(results, expected):
+    assert eq(result, exp)
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,82 @@
+import numpy as np
+
+import parakeet
+from parakeet import numpy_backend, specialize
+from parakeet.transforms.pipeline import high_level_optimizations
+from parakeet.testing_helpers import expect, run_local_tests
+
+def high_level_fn(fn, args):
+  typed_fn, linear_args = specialize(fn, args)
+  return high_level_optimizations(typed_fn), linear_args
+
+def run_numpy(fn, args):
+  return parakeet.run_python_fn(fn, args, backend = 'numpy')
+
+x = np.random.randn(9, 7)
+
+def scaled_sum(x, y):
+  return x * 2 + y
+
+def test_elementwise_map():
+  high_level, _ = high_level_fn(scaled_sum, [x, x])
+  # the whole function should stay in the NumPy backend
+  assert numpy_backend.compile_fn(high_level).fn is high_level
+  expect(scaled_sum, [x, x], x * 2 + x)
+
+def row_sums(x):
+  return parakeet.each(lambda row: np.sum(row), x)
+
+def test_map_over_rows():
+  expect(row_sums, [x], np.sum(x, axis = 1))
+
+def differences(x, y):
+  return parakeet.allpairs(lambda a, b: a - b, x, y)
+
+def test_outer_map():
+  a = np.arange(5.0)
+  b = np.arange(3.0)
+  expect(differences, [a, b], a[:, np.newaxis] - b[np.newaxis, :])
+
+def running_max(x):
+  return parakeet.scan(lambda acc, elt: np.maximum(acc, elt), x, init = 0.0)
+
+def test_scan():
+  v = np.random.randn(20)
+  expected = np.maximum.accumulate(np.maximum(v, 0.0))
+  assert np.allclose(run_numpy(running_max, [v]), expected)
+
+def column_means(x):
+  return np.mean(x, axis = 0)
+
+def test_reduce_axis():
+  expect(column_means, [x], np.mean(x, axis = 0))
+
+def max_or_default(x):
+  return parakeet.reduce(np.maximum, x, init = -1.0)
+
+def test_reduce_empty_with_init():
+  # np.maximum has no identity, so this can't be left to ufunc.reduce 
+  expect(max_or_default, [np.array([])], -1.0)
+  assert run_numpy(max_or_default, [np.array([])]) == -1.0
+  expect(max_or_default, [np.zeros((0, 3))], -1.0)
+  expect(max_or_default, [np.arange(4.0)], 3.0)
+
+def weighted_indices(x):
+  return parakeet.imap(lambda (i,j): i + j * x[i,j], x.shape)
+
+def test_index_map():
+  i, j = np.indices(x.shape)
+  expect(weighted_indices, [x], i + j * x)
+
+def loop_sum(x):
+  total = 0.0
+  for i in range(len(x)):
+    total += x[i]
+  return total
+
+def test_loop_fallback():
+  v = np.arange(10.0)
+  assert run_numpy(loop_sum, [v]) == 45.0
+
+if __name__ == '__main__':
+  run_local_tests()
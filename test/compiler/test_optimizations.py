@@ -147,6 +147,28 @@ def test_copy_elimination():
   assert n_loops <= n_expected, \
       "Too many loops generated! Expected at most 2, got %d" % n_loops
 
+
+def sum_sq(x):
+  total = 0.0
+  for i in xrange(len(x)):
+    total += x[i] * x[i]
+  return total
+
+def test_loop_unrolling():
+  from parakeet import interp
+  from parakeet.transforms import CloneFunction
+  from parakeet.transforms.loop_unrolling import LoopUnrolling
+  from parakeet.transforms.pipeline import loopify
+  for n in (0, 3, 4, 10):
+    x = np.arange(float(n))
+    typed_fn, _ = parakeet.specialize(sum_sq, [x])
+    unrolled = LoopUnrolling().apply(CloneFunction().apply(loopify(typed_fn)))
+    n_loops = len([stmt for stmt in unrolled.body 
+                   if isinstance(stmt, syntax.ForLoop)])
+    assert n_loops == 2, \
+      "Expected unrolled loop and cleanup loop, got %d loops" % n_loops
+    result = interp.eval_fn(unrolled, [x])
+    assert result == sum_sq(x), "Expected %s but got %s" % (sum_sq(x), result)
   
 if __name__ == '__main__':
   run_local_tests()
@@ -0,0 +1,64 @@
+import inspect
+
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from parakeet.c_backend import config as c_config
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def loop_sum(x):
+  total = 0.0
+  for i in xrange(len(x)):
+    total += x[i]
+  return total
+
+def scaled_rows(x, y):
+  z = x * 2.0
+  return np.dot(z, y)
+
+def line_of(fn, text):
+  lines, first_line = inspect.getsourcelines(fn)
+  for i, line in enumerate(lines):
+    if text in line:
+      return first_line + i
+  assert False, "Couldn't find %s in source of %s" % (text, fn)
+
+def profile_of(fn, args, backend):
+  parakeet.region_profile(reset = True)
+  result = with_config(c_config, lambda: jit(fn)(*args, _backend = backend), 
+                       instrument_regions = True)
+  return result, parakeet.region_profile()
+
+def test_loop_region():
+  x = np.arange(100.0)
+  result, profile = profile_of(loop_sum, [x], 'c')
+  assert eq(result, loop_sum(x))
+  loops = [r for r in profile if r['kind'] == 'ForLoop']
+  assert len(loops) == 1, profile
+  loop = loops[0]
+  assert loop['calls'] == 1 and loop['trips'] == 100, loop
+  assert loop['function'] == 'loop_sum'
+  assert loop['line'] == line_of(loop_sum, "for i in xrange"), loop
+  assert loop['total_time'] >= 0
+
+def test_parfor_regions():
+  x = np.random.randn(20, 30)
+  y = np.random.randn(30, 10)
+  result, profile = profile_of(scaled_rows, [x, y], 'openmp')
+  assert eq(result, scaled_rows(x, y))
+  kinds = set(r['kind'] for r in profile)
+  assert 'ParFor' in kinds, profile
+  assert 'Alloc' in kinds, profile
+  allocs = [r for r in profile if r['kind'] == 'Alloc']
+  assert sum(r['trips'] for r in allocs) >= result.nbytes, allocs
+
+def test_uninstrumented():
+  x = np.arange(10.0)
+  parakeet.region_profile(reset = True)
+  result = with_config(c_config, lambda: jit(loop_sum)(x), instrument_regions = False)
+  assert eq(result, loop_sum(x))
+  assert parakeet.region_profile() == []
+
+if __name__ == '__main__':
+  run_local_tests()
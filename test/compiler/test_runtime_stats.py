@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from parakeet.testing_helpers import eq, run_local_tests
+
+def scale(x, alpha):
+  return x * alpha
+
+def test_fn_stats():
+  f = jit(scale)
+  f.fn_stats.reset()
+  x = np.arange(100.0)
+  for _ in xrange(3):
+    assert eq(f(x, 2.0, _backend = 'c'), x * 2.0)
+  assert eq(f(np.arange(10), 2, _backend = 'c'), np.arange(10) * 2)
+  stats = f.stats()
+  assert stats['calls'] == 4, stats
+  assert stats['dispatch_misses'] == 2, stats
+  assert stats['dispatch_hits'] == 2, stats
+  assert stats['specializations'] == 2, stats
+  assert 0 < stats['native_time'] <= stats['total_time'], stats
+  assert stats['python_overhead'] >= stats['prepare_args_time'] > 0, stats
+  assert stats['bytes_allocated'] == 3 * x.nbytes + np.arange(10).nbytes, stats
+
+def first_row(x):
+  return x[0]
+
+def test_views_not_counted():
+  f = jit(first_row)
+  f.fn_stats.reset()
+  x = np.ones((3, 4))
+  assert eq(f(x, _backend = 'c'), x[0])
+  assert f.stats()['bytes_allocated'] == 0, f.stats()
+
+def test_stats_snapshot():
+  f = jit(scale)
+  f(np.arange(3.0), 3.0)
+  snapshot = parakeet.stats_snapshot()
+  name = __name__ + ".scale"
+  assert name in snapshot['functions'], snapshot['functions'].keys()
+  assert snapshot['functions'][name]['calls'] > 0
+  # has to be something a metrics pipeline can serialize
+  json.dumps(snapshot)
+  parakeet.reset_stats()
+  assert name not in parakeet.stats_snapshot()['functions']
+
+if __name__ == '__main__':
+  run_local_tests()
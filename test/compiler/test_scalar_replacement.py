@@ -0,0 +1,114 @@
+import numpy as np
+
+from parakeet import config, specialize
+from parakeet.syntax import ForLoop
+from parakeet.testing_helpers import expect_same, run_local_tests
+from parakeet.transforms import pipeline
+
+def count_replaced(fn, args):
+  typed_fn, _ = specialize(fn, args)
+  lowered = pipeline.final_loop_optimizations.apply(pipeline.loopify(typed_fn))
+  loops = [stmt for stmt in lowered.body if isinstance(stmt, ForLoop)]
+  return sum(len([name for name in loop.merge if name.startswith("scalar_repl_acc")])
+             for loop in loops)
+
+def sum_and_squares(x):
+  acc = np.zeros(3)
+  for i in xrange(len(x)):
+    acc[0] += x[i]
+    acc[2] += x[i] * x[i]
+  return acc
+
+def test_accumulators():
+  x = np.arange(10.0)
+  expect_same(sum_and_squares, x)
+  expect_same(sum_and_squares, x[:0])
+  assert count_replaced(sum_and_squares, [x]) == 2
+
+def accumulate_at(x, k):
+  acc = np.zeros(4)
+  for i in xrange(len(x)):
+    acc[k] += x[i]
+  return acc
+
+def test_empty_loop_out_of_bounds():
+  # the location is never touched when the loop doesn't run
+  expect_same(accumulate_at, np.arange(5.0), 2)
+  expect_same(accumulate_at, np.arange(0.0), 10 ** 9)
+
+def accumulate_into_arg(x, y):
+  for i in xrange(len(x)):
+    y[1] += x[i]
+  return y
+
+def accumulate_into_self(x):
+  return accumulate_into_arg(x, x)
+
+def test_aliased_args():
+  x = np.arange(6.0)
+  expect_same(accumulate_into_arg, x, np.zeros(3))
+  # x and y might be the same array, so y[1] has to stay in memory
+  assert count_replaced(accumulate_into_arg, [x, np.zeros(3)]) == 0
+  expect_same(accumulate_into_self, x)
+
+def reset_in_branch(x):
+  acc = np.zeros(2)
+  for i in xrange(len(x)):
+    acc[0] += x[i]
+    if x[i] > 2:
+      acc[0] = 0.0
+  return acc
+
+def test_write_in_branch():
+  expect_same(reset_in_branch, np.arange(6.0))
+
+def varying_read(x):
+  acc = np.zeros(len(x))
+  for i in xrange(len(x)):
+    acc[0] += acc[i] + x[i]
+    acc[i] = 1.0
+  return acc
+
+def test_varying_read():
+  expect_same(varying_read, np.arange(5.0))
+
+def same_location(x, j, k):
+  acc = np.zeros(3)
+  for i in xrange(len(x)):
+    acc[j] += x[i]
+    acc[k] *= 2
+  return acc
+
+def test_maybe_same_location():
+  x = np.arange(1.0, 5.0)
+  expect_same(same_location, x, 1, 1)
+  expect_same(same_location, x, 0, 2)
+
+def row_accumulate(x, c):
+  acc = np.zeros((3, 4))
+  for i in xrange(len(x)):
+    for j in xrange(4):
+      acc[c, j] += x[i]
+  for i in xrange(3):
+    acc[i, 1] += 1
+  return acc
+
+def test_tuple_indices():
+  expect_same(row_accumulate, np.arange(5.0), 1)
+
+def view_in_loop(x):
+  acc = np.zeros(3)
+  tail = acc[1:]
+  for i in xrange(len(x)):
+    acc[1] += x[i]
+    tail[0] += 1
+  return acc
+
+def test_view_alias():
+  expect_same(view_in_loop, np.arange(4.0))
+
+def test_enabled_by_default():
+  assert config.opt_scalar_replacement
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,83 @@
+import numpy as np
+
+from parakeet import config, jit
+from parakeet.analysis.find_constant_strides import Const, from_python
+from parakeet.syntax import ForLoop
+from parakeet.transforms import stride_specialization
+from parakeet.testing_helpers import expect, run_local_tests, with_config
+
+def norms(x):
+  n, d = x.shape
+  out = np.zeros(n)
+  for i in xrange(n):
+    total = 0.0
+    for j in xrange(d):
+      total += x[i,j] * x[i,j]
+    out[i] = total
+  return out
+
+def test_norms():
+  for shape in [(10, 3), (4, 4), (3, 1), (0, 3), (5, 0), (6, 20)]:
+    x = np.random.randn(*shape)
+    expect(norms, [x], (x*x).sum(axis = 1))
+
+def count_loops(stmts):
+  count = 0
+  for stmt in stmts:
+    if stmt.__class__ is ForLoop:
+      count += 1 + count_loops(stmt.body)
+  return count
+
+def specialized_versions(name):
+  return [fn for fn in stride_specialization._cache.itervalues()
+          if fn.name.startswith(name)]
+
+def test_inner_loop_unrolled():
+  x = np.random.randn(10, 3)
+  jit(norms)(x, _backend = 'c')
+  loop_counts = [count_loops(fn.body) for fn in specialized_versions("norms")]
+  # the zeros loop and the outer loop are left, the loop over the 3
+  # columns gets unrolled
+  assert 2 in loop_counts, "Expected inner loop to be unrolled, got %s" % loop_counts
+
+def sum_first(x, k):
+  total = 0.0
+  for i in xrange(k):
+    total += x[i]
+  return total
+
+def test_small_int_args():
+  x = np.arange(20.0)
+  for k in [0, 1, 3, 8, 9, 20]:
+    expect(sum_first, [x, k], x[:k].sum())
+
+def test_abstract_values():
+  x = np.zeros((3, 100))
+  abstract_x = from_python(x)
+  assert abstract_x.shape.elts[0] == Const(3)
+  assert abstract_x.shape.elts[1].__class__ is not Const
+  assert from_python(4) == Const(4)
+  assert from_python(4000).__class__ is not Const
+  assert from_python(True).__class__ is not Const
+
+def prod_first(x, k):
+  total = 1.0
+  for i in xrange(k):
+    total *= x[i]
+  return total
+
+def test_max_specializations():
+  x = np.arange(1.0, 10.0)
+  f = jit(prod_first)
+  def run(k):
+    return with_config(config, lambda: f(x, k, _backend = 'c'), 
+                       max_small_const_specializations = 2)
+  for k in xrange(8):
+    result = run(k)
+    assert result == np.prod(x[:k]), \
+      "Expected %s but got %s for k = %d" % (np.prod(x[:k]), result, k)
+  n_versions = len(set(id(fn) for fn in specialized_versions("prod_first")))
+  assert n_versions <= 3, "Expected at most 3 versions, got %d" % n_versions
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import numpy as np
+
+from parakeet import jit
+from parakeet.stream_backend import config as stream_config
+from parakeet.stream_backend import run_function as stream_run
+from parakeet.testing_helpers import count_calls, eq, run_local_tests, with_config
+
+old_chunk_bytes = [None]
+
+def setup():
+  # small chunks so that little test arrays get split up
+  old_chunk_bytes[0] = stream_config.chunk_bytes
+  stream_config.chunk_bytes = 256
+
+def teardown():
+  stream_config.chunk_bytes = old_chunk_bytes[0]
+
+def memmap_of(x):
+  fd, path = tempfile.mkstemp(suffix = ".dat")
+  os.close(fd)
+  m = np.memmap(path, dtype = x.dtype, mode = 'w+', shape = x.shape)
+  m[:] = x
+  m.flush()
+  os.remove(path)
+  return m
+
+def count_kernel_calls(fn):
+  return count_calls(stream_run, 'run_kernel', fn)
+
+def scale_add(x, y):
+  return x * y + 1
+
+def run_both_ways(fn, *args):
+  """
+  Results with and without the prefetch thread
+  """
+  run = lambda: jit(fn)(*args, _backend = 'stream')
+  return [with_config(stream_config, run, prefetch = prefetch) 
+          for prefetch in (True, False)]
+
+def test_elementwise_memmap():
+  x = memmap_of(np.arange(1000.0))
+  for result in run_both_ways(scale_add, x, 3.0):
+    assert eq(result, x * 3.0 + 1)
+  result, calls = count_kernel_calls(lambda: jit(scale_add)(x, 3.0, _backend = 'stream'))
+  # 32 rows of 8 bytes per chunk
+  assert calls == 32, "Expected 32 chunks, got %d" % calls
+
+def test_elementwise_2d():
+  x = memmap_of(np.arange(300.0).reshape((30, 10)))
+  for result in run_both_ways(scale_add, x, 2):
+    assert eq(result, x * 2 + 1)
+
+def row_sums(x, y):
+  return [np.sum(row) * y for row in x]
+
+def test_map_rows():
+  x = memmap_of(np.arange(500, dtype = 'int32').reshape((50, 10)))
+  for result in run_both_ways(row_sums, x, 2):
+    assert eq(result, x.sum(axis = 1) * 2)
+
+def total(x):
+  return np.sum(x)
+
+def test_reduction():
+  x = memmap_of(np.arange(999, dtype = 'int64'))
+  for result in run_both_ways(total, x):
+    assert eq(result, np.sum(x))
+  m = memmap_of(np.arange(400.0).reshape((40, 10)))
+  for result in run_both_ways(total, m):
+    assert eq(result, np.sum(m))
+
+def add_first(x):
+  return x + x[0]
+
+def test_fallback():
+  x = memmap_of(np.arange(3.0, 200.0))
+  result, calls = count_kernel_calls(lambda: jit(add_first)(x, _backend = 'stream'))
+  assert calls == 1
+  assert eq(result, x + x[0])
+
+def test_memmap_result():
+  x = np.arange(200.0)
+  result = with_config(stream_config, lambda: jit(scale_add)(x, 0.5, _backend = 'stream'), 
+                       result_memmap_bytes = 100)
+  assert isinstance(result, np.memmap)
+  assert eq(result, x * 0.5 + 1)
+
+if __name__ == '__main__':
+  setup()
+  try:
+    run_local_tests()
+  finally:
+    teardown()
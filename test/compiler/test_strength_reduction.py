@@ -0,0 +1,63 @@
+import numpy as np
+
+import parakeet
+from parakeet import prims, specialize
+from parakeet.syntax import ForLoop, PrimCall
+from parakeet.testing_helpers import eq, run_local_tests
+from parakeet.transforms import pipeline
+
+try:
+  import llvmlite
+  from parakeet import llvm_backend
+except ImportError:
+  llvm_backend = None
+
+def innermost_loop(stmts):
+  for stmt in stmts:
+    if isinstance(stmt, ForLoop):
+      return innermost_loop(stmt.body) or stmt
+  return None
+
+def count_multiplies(fn, args):
+  typed_fn, _ = specialize(fn, args)
+  loop = innermost_loop(pipeline.lowering.apply(typed_fn).body)
+  return len([stmt for stmt in loop.body
+              if isinstance(stmt.rhs, PrimCall) and stmt.rhs.prim == prims.multiply])
+
+def add_2d(x, y):
+  z = np.empty_like(x)
+  for i in xrange(x.shape[0]):
+    for j in xrange(x.shape[1]):
+      z[i, j] = x[i, j] + y[i, j]
+  return z
+
+def test_no_multiplies_in_inner_loop():
+  x = np.arange(600.0).reshape((20, 30))
+  assert count_multiplies(add_2d, [x, x]) == 0
+
+def shifted_products(x, y):
+  total = 0.0
+  for i in xrange(1, len(x) - 1):
+    total += x[i - 1] * y[i + 1]
+  return total
+
+def every_third(x):
+  total = 0.0
+  for i in xrange(len(x) - 1, -1, -3):
+    total += x[i]
+  return total
+
+def test_llvm_results():
+  if llvm_backend is None:
+    return
+  x = np.arange(600.0).reshape((20, 30))
+  y = np.cos(x)
+  for (a, b) in [(x, y), (x[:, ::2], y[:, 1::2]), (x.T, y.T), (x[::-1], y[::-1, ::-1])]:
+    assert eq(parakeet.run_python_fn(add_2d, [a, b], backend = 'llvm'), a + b)
+  v = np.arange(50.0)
+  assert eq(parakeet.run_python_fn(shifted_products, [v, v[::-1]], backend = 'llvm'),
+            shifted_products(v, v[::-1]))
+  assert eq(parakeet.run_python_fn(every_third, [v[::2]], backend = 'llvm'), every_third(v[::2]))
+
+if __name__ == '__main__':
+  run_local_tests()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from parakeet import jit
+from parakeet.c_backend import config as c_config
+from parakeet.c_backend import tiered
+from parakeet.transforms.pipeline import hot_loop_optimizations
+from parakeet.testing_helpers import eq, run_local_tests, with_config
+
+def sum_sq(x):
+  total = 0.0
+  for i in xrange(len(x)):
+    total += x[i] * x[i]
+  return total
+
+def run_tiered(backend, background):
+  tiered._tiered_fns.clear()
+  x = np.arange(20.0)
+  expected = sum_sq(x)
+  f = jit(sum_sq)
+  def check():
+    assert eq(f(x, _backend = backend), expected)
+    assert len(tiered._tiered_fns) == 1
+    tiered_fn = tiered._tiered_fns.values()[0]
+    quick = tiered_fn.compiled
+    for _ in xrange(5):
+      assert eq(f(x, _backend = backend), expected)
+    assert tiered_fn.hot
+    assert tiered_fn.calls == 3, "Expected 3 counted calls, got %d" % tiered_fn.calls
+    tiered_fn.wait()
+    assert tiered_fn.compiled is not quick, "Expected hot version to replace quick one"
+    assert eq(f(x, _backend = backend), expected)
+    hot_fn = hot_loop_optimizations.apply(tiered_fn.fn)
+    assert hot_loop_optimizations in hot_fn.transform_history
+  with_config(c_config, check, tiered_compilation = True, hot_call_count = 3, 
+              background_recompile = background)
+
+def test_tiered_c():
+  run_tiered('c', background = False)
+
+def test_tiered_c_background():
+  run_tiered('c', background = True)
+
+def test_tiered_openmp():
+  run_tiered('openmp', background = True)
+
+def test_opt_flags():
+  assert c_config.quick_opt_level in tiered.quick_opt_flags()
+  hot_flags = tiered.hot_opt_flags()
+  assert c_config.hot_opt_level in hot_flags
+  for flag in c_config.hot_extra_flags:
+    assert flag in hot_flags
+
+if __name__ == '__main__':
+  run_local_tests()
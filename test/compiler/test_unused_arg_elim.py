@@ -0,0 +1,64 @@
+import numpy as np
+
+from parakeet import jit
+from parakeet.c_backend import prepare_args
+from parakeet.transforms import unused_arg_elim
+from parakeet.testing_helpers import expect, run_local_tests
+
+def ignores_y(x, y, z):
+  return x + z
+
+def test_unused_arg_result():
+  x = np.arange(10.0)
+  expect(ignores_y, [x, np.ones(3), 2.0], x + 2.0)
+
+def test_unused_arg_dropped():
+  x = np.arange(10.0)
+  jit(ignores_y)(x, np.ones(3), 2.0, _backend = 'c')
+  versions = [fn for (fn, _) in unused_arg_elim._kept_positions.itervalues()
+              if fn.name.startswith("ignores_y")]
+  assert len(versions) > 0
+  for fn in versions:
+    assert len(fn.arg_names) == 2, \
+      "Expected unused argument to be dropped, got %s" % (fn.arg_names,)
+
+def apply_fn(f, x):
+  return f(x)
+
+def make_adder(offset):
+  def add_offset(x):
+    return x + offset
+  return add_offset
+
+def test_fn_arg():
+  x = np.arange(10.0)
+  for backend in ('c', 'openmp'):
+    assert np.allclose(jit(apply_fn)(make_adder(3.0), x, _backend = backend), x + 3.0)
+
+def cached_closure_args(python_fn):
+  cache = prepare_args._closure_args_cache
+  return [value for (name, value) in cache.iteritems()
+          if name.startswith(python_fn.__name__)]
+
+def test_closure_args_cached():
+  prepare_args._closure_args_cache.clear()
+  f = jit(apply_fn)
+  x = np.arange(10.0)
+  y = np.ones(10)
+  add_y = make_adder(y)
+  assert np.allclose(f(add_y, x, _backend = 'c'), x + y)
+  entries = cached_closure_args(add_y)
+  assert len(entries) == 1, "Expected cached closure args, got %s" % entries
+  prepared = entries[0][1]
+  assert np.allclose(f(add_y, x, _backend = 'c'), x + y)
+  assert cached_closure_args(add_y)[0][1] is prepared
+
+  # lists get copied into arrays so they might be stale by the next call
+  offsets = range(10)
+  add_list = make_adder(offsets)
+  assert np.allclose(f(add_list, x, _backend = 'c'), x + offsets)
+  offsets[0] = 5
+  assert np.allclose(f(add_list, x, _backend = 'c'), x + offsets)
+
+if __name__ == '__main__':
+  run_local_tests()
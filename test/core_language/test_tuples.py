@@ -57,6 +57,17 @@ def tuple_indexing(t):
 def test_tuple_indexing():
   all_tuples(tuple_indexing, unpack_args = False)
 
+def trailing_dims(x):
+  return x.shape[1:]
+
+def every_other(t):
+  return t[::2]
+
+def test_tuple_slicing():
+  expect(trailing_dims, [np.zeros((2, 3, 4))], (3, 4))
+  expect(trailing_dims, [np.zeros(5)], ())
+  expect(every_other, [(1, 2.0, 3, 4.0)], (1, 3))
+
 def or_elts((b1,b2)):
   if b1 or b2:
     return 1
@@ -0,0 +1,89 @@
+import numpy as np
+
+import parakeet
+from parakeet import jit
+from parakeet.testing_helpers import expect, run_local_tests
+
+def weighted_sum(window):
+  m,n = window.shape
+  total = 0.0
+  for i in range(m):
+    for j in range(n):
+      total += window[i,j] * (i + 1) * (j + 2)
+  return total
+
+def clamped_windows(f, x, width):
+  """
+  Python reference which clamps every window to the array bounds
+  """
+  m,n = x.shape
+  hx = width[0] / 2
+  hy = width[1] / 2
+  return np.array([[f(x[max(i-hx,0):i+hx+1, max(j-hy,0):j+hy+1])
+                    for j in xrange(n)]
+                    for i in xrange(m)])
+
+def stencil_weighted_sum(x, width):
+  return parakeet.stencil2(weighted_sum, x, width)
+
+def test_stencil2_shapes():
+  for shape in [(1,1), (2,7), (8,3), (10,10)]:
+    x = np.random.randn(*shape)
+    for width in [(1,1), (3,3), (5,3), (7,7)]:
+      expect(stencil_weighted_sum, [x, width],
+             clamped_windows(weighted_sum, x, width))
+
+def stencil_window_shape(x):
+  def window_size(w):
+    return w.shape[0] * 10 + w.shape[1]
+  return parakeet.stencil2(window_size, x, (3,5))
+
+def test_stencil2_border_windows():
+  x = np.zeros((4,6))
+  expected = np.array([[23, 24, 25, 25, 24, 23],
+                       [33, 34, 35, 35, 34, 33],
+                       [33, 34, 35, 35, 34, 33],
+                       [23, 24, 25, 25, 24, 23]])
+  expect(stencil_window_shape, [x], expected)
+
+def stencil1_sum(x, w):
+  return parakeet.stencil1(np.sum, x, w)
+
+def test_stencil1():
+  x = np.arange(7.0)
+  for w in [1, 3, 5, 9]:
+    expected = np.array([x[max(i-w/2,0):i+w/2+1].sum() for i in xrange(len(x))])
+    expect(stencil1_sum, [x, w], expected)
+
+def corners(window):
+  m,n = window.shape
+  return np.array([window[0,0], window[m-1,n-1]])
+
+def pmap2_corners(x):
+  return parakeet.pmap2(corners, x)
+
+def test_pmap2_vector_valued():
+  x = np.arange(20.0).reshape((4,5))
+  expect(pmap2_corners, [x], clamped_windows(corners, x, (3,3)))
+
+def ends(window):
+  return np.array([window[0], window[len(window)-1]])
+
+def pmap1_ends(x):
+  return parakeet.pmap1(ends, x)
+
+def test_pmap1_vector_valued():
+  x = np.arange(7.0)
+  expected = np.array([ends(x[max(i-1,0):i+2]) for i in xrange(len(x))])
+  expect(pmap1_ends, [x], expected)
+
+def test_vector_valued_empty_regions():
+  # the shape of f's results can't come from a window which doesn't exist
+  expect(pmap1_ends, [np.zeros(0)], np.zeros((0, 2)))
+  expect(pmap1_ends, [np.arange(2.0)], np.array([[0.0, 1.0], [0.0, 1.0]]))
+  expect(pmap2_corners, [np.zeros((0, 3))], np.zeros((0, 3, 2)))
+  x = np.arange(2.0).reshape((1, 2))
+  expect(pmap2_corners, [x], clamped_windows(corners, x, (3,3)))
+
+if __name__ == '__main__':
+  run_local_tests()